@@ -0,0 +1,221 @@
+"""
+answer_cache.py
+
+Cache a due livelli per le risposte di Mark.
+
+1. **Domanda esatta** – chiave = testo normalizzato (minuscole, senza
+   punteggiatura né spazi multipli).  Un hit salta classificazione, parsing,
+   SQL e LLM.
+2. **Intento** – chiave = tupla `(function_used, company, table, column,
+   time_type, time_value)` ricavata dal parsing.  Domande diverse con lo
+   stesso intento ("utile netto Apple 2023" / "Apple net income FY2023")
+   riusano il valore SQL e la risposta già formattata.
+
+Scadenza
+--------
+Ogni voce ricorda la versione delle tabelle da cui dipende
+(`scripts.db.data_version`): quando `update_mark_db.py` scrive nuove righe in
+`history`, `info`, … le voci relative vengono invalidate alla lettura
+successiva.  In più vale un TTL massimo (`MARK_CACHE_TTL`, secondi) che copre
+le risposte testuali, che non dipendono da tabelle SQL.
+
+Le metriche di hit‑rate per namespace sono disponibili con `stats()`.
+
+API pubblico
+------------
+get_answer_cache() -> AnswerCache
+normalize_question(question) -> str
+intent_key(numerical_payload) -> tuple | None
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from scripts.db.data_version import tables_version
+from scripts.tracing import annotate
+
+__all__ = ["AnswerCache", "get_answer_cache", "normalize_question", "intent_key"]
+
+# --------------------------------------------------------------------------- #
+#  Configurazione
+# --------------------------------------------------------------------------- #
+
+DEFAULT_TTL = float(os.getenv("MARK_CACHE_TTL", 24 * 3600))
+MAX_ENTRIES = int(os.getenv("MARK_CACHE_MAX_ENTRIES", 2048))
+
+_RE_PUNCT = re.compile(r"[^\w\s]")
+_RE_SPACES = re.compile(r"\s+")
+
+
+# --------------------------------------------------------------------------- #
+#  Chiavi
+# --------------------------------------------------------------------------- #
+
+def normalize_question(question: str) -> str:
+    """'  Qual è il Net Income di Apple?? ' → 'qual è il net income di apple'."""
+    q = unicodedata.normalize("NFKC", question).lower()
+    q = _RE_PUNCT.sub(" ", q)
+    return _RE_SPACES.sub(" ", q).strip()
+
+
+def intent_key(payload: Dict[str, Any]) -> Optional[Tuple[Hashable, ...]]:
+    """
+    Chiave d'intento per un payload numerico (parsed di value/avg query).
+
+    Returns
+    -------
+    tuple | None
+        None se mancano company/table/column.
+    """
+    company = payload.get("company")
+    table = payload.get("table")
+    column = payload.get("column")
+    if not (company and table and column):
+        return None
+    time_type = payload.get("time_type")
+    time_value = payload.get("time_value")
+    if time_type is None and "period" in payload:     # schema di parse_avg_query
+        time_type, time_value = "period", payload["period"]
+    function_used = payload.get("function_used", "answer_value_query")
+    aggregate = payload.get("aggregate")
+    if aggregate and aggregate != "avg":               # max, cagr, p90… (aggregate_query)
+        function_used = f"{function_used}:{aggregate}"
+    return (
+        function_used,
+        str(company).upper(),
+        table,
+        column,
+        time_type or "latest",
+        json.dumps(time_value, sort_keys=True, default=str),
+    )
+
+
+# --------------------------------------------------------------------------- #
+#  Cache
+# --------------------------------------------------------------------------- #
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    tables: Tuple[str, ...]
+    versions: Tuple[int, ...]
+
+
+@dataclass
+class _Stats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    puts: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "puts": self.puts,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+@dataclass
+class AnswerCache:
+    """LRU per namespace con TTL e invalidazione per versione di tabella."""
+
+    ttl: float = DEFAULT_TTL
+    max_entries: int = MAX_ENTRIES
+    _data: Dict[str, "OrderedDict[Hashable, _Entry]"] = field(default_factory=dict)
+    _stats: Dict[str, _Stats] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def get(self, namespace: str, key: Optional[Hashable]) -> Any:
+        """Valore in cache o None (miss, scaduto o tabelle aggiornate)."""
+        if key is None:
+            return None
+        value = self._lookup(namespace, key)
+        annotate(**{f"cache_{namespace}": value is not None})   # hit/miss sullo span corrente
+        return value
+
+    def _lookup(self, namespace: str, key: Hashable) -> Any:
+        with self._lock:
+            bucket = self._data.setdefault(namespace, OrderedDict())
+            stats = self._stats.setdefault(namespace, _Stats())
+            entry = bucket.get(key)
+            if entry is None:
+                stats.misses += 1
+                return None
+            if time.time() > entry.expires_at or tables_version(entry.tables) != entry.versions:
+                del bucket[key]
+                stats.expired += 1
+                stats.misses += 1
+                return None
+            bucket.move_to_end(key)
+            stats.hits += 1
+            return entry.value
+
+    def put(
+        self,
+        namespace: str,
+        key: Optional[Hashable],
+        value: Any,
+        tables: Iterable[str] = (),
+        ttl: Optional[float] = None,
+    ) -> None:
+        """
+        Salva `value`.
+
+        Parameters
+        ----------
+        tables : iterable[str]
+            Tabelle SQL da cui dipende il valore: la voce scade quando
+            l'ETL ne aggiorna una.
+        ttl : float | None
+            Override del TTL di default (secondi).
+        """
+        if key is None or value is None:
+            return
+        tables = tuple(sorted(set(tables)))
+        entry = _Entry(
+            value=value,
+            expires_at=time.time() + (self.ttl if ttl is None else ttl),
+            tables=tables,
+            versions=tables_version(tables),
+        )
+        with self._lock:
+            bucket = self._data.setdefault(namespace, OrderedDict())
+            bucket[key] = entry
+            bucket.move_to_end(key)
+            while len(bucket) > self.max_entries:
+                bucket.popitem(last=False)
+            self._stats.setdefault(namespace, _Stats()).puts += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss/hit‑rate per namespace + dimensione corrente."""
+        with self._lock:
+            return {
+                ns: {**st.as_dict(), "size": len(self._data.get(ns, ()))}
+                for ns, st in self._stats.items()
+            }
+
+
+_cache = AnswerCache()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Istanza condivisa a livello di processo."""
+    return _cache
@@ -52,6 +52,13 @@ _KNOWN_PATTERNS: Dict[str, str] = {
     ),
 }
 
+# Un'unica regex con un gruppo per pattern: una sola scansione della domanda
+# (usata anche dal pre‑router di ask_mark, vedi `scripts.pre_router`)
+IDENTITY_PATTERN = re.compile(
+    "|".join(f"(?P<k{i}>{pattern})" for i, pattern in enumerate(_KNOWN_PATTERNS))
+)
+_REPLIES = list(_KNOWN_PATTERNS.values())
+
 _DEFAULT_RESPONSE = (
     "Sono Mark, il tuo assistente AI per l'analisi finanziaria. "
     "Posso aiutarti con dati numerici su aziende quotate e riassunti dai loro documenti ufficiali. "
@@ -77,10 +84,9 @@ def answer_question(question: str) -> str:
     str
         Risposta pronta da mostrare.
     """
-    q = question.lower()
-    for pattern, reply in _KNOWN_PATTERNS.items():
-        if re.search(pattern, q):
-            return reply
+    match = IDENTITY_PATTERN.search(question.lower())
+    if match:
+        return _REPLIES[int(match.lastgroup[1:])]
     return _DEFAULT_RESPONSE
 
 
@@ -12,33 +12,46 @@ Schema di output
     "table": <str>,
     "column": <str>,
     "period": <str>,
-    "function_used": "answer_value_query" | "answer_avg_query"
+    "aggregate": <str>,            # solo per medie/aggregati: avg, max, cagr, p90…
+    "function_used": "answer_value_query" | "answer_avg_query" | "answer_aggregate_query"
 }
+
+Le domande su un intervallo passano da `parse_avg_query`; se l'aggregato
+richiesto non è la media (massimo, mediana, CAGR…) la query è eseguita da
+`aggregate_query`.
+
+Le domande puntuali risolte dal parser deterministico (`fast_parse_num_query`)
+non passano dalla scelta LLM della funzione: `_choose_function` è chiamata
+solo quando il fast path fallisce.
 """
 
 from __future__ import annotations
 
 import os
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
-from dotenv import load_dotenv
-import os
-from openai import OpenAI
+from scripts.llm_provider import achat, chat
+from scripts.answer_cache import get_answer_cache, intent_key
+from scripts.tracing import annotate, traced
 
 # DB helpers
-from scripts.db.parse_num_query import parse_numerical_question
-from scripts.db.value_query import answer_value_query
-from scripts.db.parse_avg_query import parse_avg_question
-from scripts.db.avg_query import answer_avg_query
+from scripts.db.fast_parse_num_query import fast_parse_numerical_question
+from scripts.db.parse_num_query import parse_numerical_question, parse_numerical_question_async
+from scripts.db.value_query import answer_value_query, answer_value_query_async
+from scripts.db.parse_avg_query import parse_avg_question, parse_avg_question_async
+from scripts.db.avg_query import answer_avg_query, answer_avg_query_async
+from scripts.db.aggregate_query import (
+    answer_aggregate_query,
+    answer_aggregate_query_async,
+    detect_aggregate,
+    normalize_aggregate,
+)
 
 # --------------------------------------------------------------------------- #
 #  OpenAI setup
 # --------------------------------------------------------------------------- #
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 MODEL_NAME = "gpt-4o-mini"
 TEMPERATURE = 0.0
 
@@ -48,7 +61,9 @@ _CHOOSE_FUNC_SYSTEM = (
     "• Usa 'answer_value_query' se l'utente chiede un singolo valore puntuale, "
     "come 'net debt di Apple nel 2023'.\n"
     "• Usa 'answer_avg_query' se l'utente chiede una media su un intervallo, "
-    "come 'ricavi medi di Apple negli ultimi 5 anni'.\n\n"
+    "come 'ricavi medi di Apple negli ultimi 5 anni', o un altro aggregato su un "
+    "intervallo (massimo, minimo, somma, mediana, deviazione standard, percentile, "
+    "CAGR), come 'prezzo massimo di NVDA nel 2021'.\n\n"
     "Rispondi SOLO con una delle due stringhe: 'answer_value_query' oppure "
     "'answer_avg_query'. Nessuna spiegazione."
 )
@@ -58,6 +73,64 @@ _CHOOSE_FUNC_SYSTEM = (
 #  Internal helpers
 # --------------------------------------------------------------------------- #
 
+def _choose_request(question: str) -> Dict[str, Any]:
+    """Argomenti ChatCompletion per la scelta della funzione."""
+    return {
+        "model": MODEL_NAME,
+        "temperature": TEMPERATURE,
+        "messages": [
+            {"role": "system", "content": _CHOOSE_FUNC_SYSTEM},
+            {"role": "user", "content": question.strip()}
+        ],
+    }
+
+
+def _interpret_choice(content: str) -> str:
+    choice = content.strip()
+    if choice not in {"answer_value_query", "answer_avg_query"}:
+        raise ValueError(f"Scelta non valida: {choice}")
+    return choice
+
+
+def _heuristic_choice(question: str) -> str:
+    """Fallback euristico rapido se il modello non risponde."""
+    q_low = question.lower()
+    if any(w in q_low for w in ["media", "average", "mean"]) or detect_aggregate(question):
+        return "answer_avg_query"
+    return "answer_value_query"
+
+
+def _fast_plan(question: str) -> Dict[str, Any] | None:
+    """
+    Parsing deterministico senza LLM: se la domanda non chiede medie o altri
+    aggregati e il fast path la risolve, la scelta della funzione è già nota
+    (answer_value_query) e `_choose_function` non serve.
+    """
+    if _heuristic_choice(question) != "answer_value_query":
+        return None
+    parsed = fast_parse_numerical_question(question)
+    annotate(fast_plan=bool(parsed))
+    return parsed or None
+
+
+def _route_aggregate(question: str, chosen: str) -> str:
+    """Un aggregato esplicito («massimo», «CAGR»…) richiede il parser delle medie."""
+    if chosen == "answer_value_query" and detect_aggregate(question) not in (None, "avg"):
+        return "answer_avg_query"
+    return chosen
+
+
+def _apply_aggregate(question: str, chosen: str, parsed: Dict[str, Any]) -> str:
+    """Fissa `parsed['aggregate']` e sceglie aggregate_query se non è una media."""
+    if chosen != "answer_avg_query":
+        return chosen
+    parsed["aggregate"] = (
+        normalize_aggregate(parsed.get("aggregate")) or detect_aggregate(question) or "avg"
+    )
+    return "answer_avg_query" if parsed["aggregate"] == "avg" else "answer_aggregate_query"
+
+
+@traced()
 def _choose_function(question: str) -> str:
     """
     Decide se usare answer_value_query o answer_avg_query.
@@ -73,31 +146,82 @@ def _choose_function(question: str) -> str:
         'answer_value_query' o 'answer_avg_query'
     """
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            temperature=TEMPERATURE,
-            messages=[
-                {"role": "system", "content": _CHOOSE_FUNC_SYSTEM},
-                {"role": "user", "content": question.strip()}
-            ]
-        )
-        choice = response.choices[0].message.content.strip()
-        if choice not in {"answer_value_query", "answer_avg_query"}:
-            raise ValueError(f"Scelta non valida: {choice}")
-        return choice
+        response = chat("choose", site="answer_num_query", **_choose_request(question))
+        return _interpret_choice(response.choices[0].message.content)
     except Exception as exc:  # noqa: BLE001
         logging.error("❌ Errore nella scelta della funzione: %s", exc, exc_info=True)
-        # Fallback euristico rapido
-        q_low = question.lower()
-        if any(w in q_low for w in ["media", "average", "mean"]):
-            return "answer_avg_query"
-        return "answer_value_query"
+        return _heuristic_choice(question)
+
+
+@traced("answer_num_query._choose_function")
+async def _choose_function_async(question: str) -> str:
+    """Versione async di `_choose_function`."""
+    try:
+        response = await achat("choose", site="answer_num_query", **_choose_request(question))
+        return _interpret_choice(response.choices[0].message.content)
+    except Exception as exc:  # noqa: BLE001
+        logging.error("❌ Errore nella scelta della funzione: %s", exc, exc_info=True)
+        return _heuristic_choice(question)
+
+
+def _finalize(parsed: Dict[str, Any], chosen: str, result: Any) -> Dict[str, Any]:
+    annotate(function_used=chosen, table=parsed.get("table"), column=parsed.get("column"))
+    if result is None:
+        raise ValueError("Nessun dato trovato nel database.")
+    parsed["result"] = result
+    parsed["function_used"] = chosen
+    return parsed
+
+
+_RUNNERS = {
+    "answer_value_query": answer_value_query,
+    "answer_avg_query": answer_avg_query,
+    "answer_aggregate_query": answer_aggregate_query,
+}
+_ASYNC_RUNNERS = {
+    "answer_value_query": answer_value_query_async,
+    "answer_avg_query": answer_avg_query_async,
+    "answer_aggregate_query": answer_aggregate_query_async,
+}
 
 
 # --------------------------------------------------------------------------- #
 #  Public API
 # --------------------------------------------------------------------------- #
 
+@traced()
+def plan_question(question: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Scelta della funzione + parsing, senza eseguire SQL.
+
+    Returns
+    -------
+    (chosen, parsed)
+        'answer_value_query' | 'answer_avg_query' | 'answer_aggregate_query'
+        e il dizionario del parser.  Usato dal batch (`ask_mark_batch`) per
+        raggruppare le query.
+
+    Il fast path deterministico è provato per primo: la chiamata LLM di
+    `_choose_function` parte solo se non risolve la domanda.
+    """
+    parsed = _fast_plan(question)
+    if parsed:
+        return "answer_value_query", parsed
+
+    chosen = _route_aggregate(question, _choose_function(question))
+
+    if chosen == "answer_avg_query":
+        parsed = parse_avg_question(question)
+        if not parsed:
+            raise ValueError("Impossibile interpretare la domanda sulla media.")
+    else:  # answer_value_query
+        parsed = parse_numerical_question(question)
+        if not parsed:
+            raise ValueError("Impossibile interpretare la domanda numerica.")
+    return _apply_aggregate(question, chosen, parsed), parsed
+
+
+@traced("answer_num_query.answer_question")
 def answer_question(question: str) -> Dict[str, Any]:
     """
     Elabora la domanda numerica e restituisce un dizionario strutturato.
@@ -112,26 +236,48 @@ def answer_question(question: str) -> Dict[str, Any]:
     dict
         Dizionario secondo lo schema definito in testa al file.
     """
-    chosen = _choose_function(question)
+    chosen, parsed = plan_question(question)
+    run_query = _RUNNERS[chosen]
 
-    if chosen == "answer_avg_query":
-        parsed = parse_avg_question(question)
-        if not parsed:
-            raise ValueError("Impossibile interpretare la domanda sulla media.")
-        result = answer_avg_query(parsed)
+    # Stesso intento già calcolato e tabella non aggiornata dall'ETL → niente SQL
+    cache = get_answer_cache()
+    key = intent_key({**parsed, "function_used": chosen})
+    result = cache.get("value", key)
+    if result is None:
+        result = run_query(parsed)
+        cache.put("value", key, result, tables=[parsed.get("table", "")])
+
+    return _finalize(parsed, chosen, result)
 
-    else:  # answer_value_query
-        parsed = parse_numerical_question(question)
-        if not parsed:
-            raise ValueError("Impossibile interpretare la domanda numerica.")
-        result = answer_value_query(parsed)
 
+@traced("answer_num_query.answer_question")
+async def answer_question_async(question: str) -> Dict[str, Any]:
+    """Versione async di `answer_question`: stesso schema di output."""
+    chosen, parsed = "answer_value_query", _fast_plan(question)
+    if not parsed:
+        chosen = _route_aggregate(question, await _choose_function_async(question))
+
+        if chosen == "answer_avg_query":
+            parsed = await parse_avg_question_async(question)
+            if not parsed:
+                raise ValueError("Impossibile interpretare la domanda sulla media.")
+
+        else:  # answer_value_query
+            parsed = await parse_numerical_question_async(question)
+            if not parsed:
+                raise ValueError("Impossibile interpretare la domanda numerica.")
+
+    chosen = _apply_aggregate(question, chosen, parsed)
+    run_query = _ASYNC_RUNNERS[chosen]
+
+    cache = get_answer_cache()
+    key = intent_key({**parsed, "function_used": chosen})
+    result = cache.get("value", key)
     if result is None:
-        raise ValueError("Nessun dato trovato nel database.")
+        result = await run_query(parsed)
+        cache.put("value", key, result, tables=[parsed.get("table", "")])
 
-    parsed["result"] = result
-    parsed["function_used"] = chosen
-    return parsed
+    return _finalize(parsed, chosen, result)
 
 
 # --------------------------------------------------------------------------- #
@@ -0,0 +1,198 @@
+"""
+answer_renderer.py
+
+Rendering a template delle risposte numeriche, senza chiamata LLM.
+
+Per un risultato di `answer_num_query` (un numero, un'azienda, una metrica,
+un periodo) la frase è sempre la stessa: la componiamo qui, localizzata
+(it / en) e con unità e scala da `number_format`, in microsecondi invece che
+in un round trip a gpt-4o-mini.  La descrizione della metrica viene da
+`METRIC_METADATA`.
+
+API pubblico
+------------
+detect_language(question) -> "it" | "en"
+render_numerical(question, payload, lang=None) -> str
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Optional
+
+from scripts.db.metadata_cache import metric_for_column
+from scripts.number_format import aggregate_kind, format_period, format_value
+
+__all__ = ["detect_language", "render_numerical"]
+
+# --------------------------------------------------------------------------- #
+#  Lingua
+# --------------------------------------------------------------------------- #
+
+_IT_WORDS = {
+    "qual", "quale", "quali", "quanto", "quanti", "quanta", "cosa", "com", "come",
+    "di", "del", "della", "dei", "delle", "nel", "nella", "negli", "nei", "dal",
+    "al", "tra", "fra", "ultimo", "ultimi", "anni", "anno", "media",
+    "medio", "utile", "ricavi", "fatturato", "è", "sono", "stato", "stata", "mi",
+    "dimmi", "dammi", "per", "con", "azioni", "prezzo", "debito",
+}
+_EN_WORDS = {
+    "what", "which", "how", "much", "many", "is", "was", "were", "the", "of", "in",
+    "for", "from", "to", "between", "last", "latest", "years", "year", "average",
+    "mean", "revenue", "income", "price", "debt", "shares", "tell", "me", "give",
+}
+_RE_WORD = re.compile(r"[a-zàèéìòù]+")
+_RE_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def detect_language(question: str) -> str:
+    """
+    Lingua della domanda per parole funzionali; a parità vince l'inglese.
+
+    >>> detect_language("Qual è il net income di Apple nel 2023?")
+    'it'
+    """
+    words = _RE_WORD.findall(question.lower())
+    it_score = sum(w in _IT_WORDS for w in words)
+    en_score = sum(w in _EN_WORDS for w in words)
+    return "it" if it_score > en_score else "en"
+
+
+# --------------------------------------------------------------------------- #
+#  Template
+# --------------------------------------------------------------------------- #
+
+_TEMPLATES = {
+    "en": {
+        "point": "{company}'s {metric} {period} was **{value}**.",
+        "latest": "{company}'s latest {metric} is **{value}**.",
+        "range": "{company}'s latest {metric} {period} is **{value}**.",
+        "average": "{company}'s average {metric} {period} was **{value}**.",
+        "aggregate": "{company}'s {label} {metric} {period} was **{value}**.",
+        "definition": "_{metric}_: {description}",
+    },
+    "it": {
+        "point": "Il valore di {metric} per {company} {period} è **{value}**.",
+        "latest": "L'ultimo valore di {metric} per {company} è **{value}**.",
+        "range": "L'ultimo valore di {metric} per {company} {period} è **{value}**.",
+        "average": "La media di {metric} per {company} {period} è **{value}**.",
+        "aggregate": "{label} di {metric} per {company} {period}: **{value}**.",
+        "definition": "_{metric}_: {description}",
+    },
+}
+
+# Etichetta dell'aggregato per lingua (i percentili "pNN" sono composti a parte)
+_AGGREGATE_LABELS = {
+    "en": {"min": "minimum", "max": "maximum", "sum": "total", "count": "number of observations of",
+           "median": "median", "stddev": "standard deviation of", "first": "first",
+           "last": "last", "cagr": "compound annual growth rate (CAGR) of",
+           "percentile": "{n}th percentile"},
+    "it": {"min": "Il minimo", "max": "Il massimo", "sum": "La somma", "count": "Il numero di osservazioni",
+           "median": "La mediana", "stddev": "La deviazione standard", "first": "Il primo valore",
+           "last": "L'ultimo valore", "cagr": "Il tasso di crescita annuo composto (CAGR)",
+           "percentile": "Il {n}° percentile"},
+}
+
+# Preposizione del periodo per (lingua, time_type)
+_PERIOD_PREFIX = {
+    "en": {"date": "on", "range": "over", "period": "over", "default": "in"},
+    "it": {"date": "il", "range": "nel periodo", "period": "nel periodo", "default": "nel"},
+}
+_ALL_AVAILABLE = {"en": "over all available data", "it": "su tutti i dati disponibili"}
+
+
+def _metric_label(column: str) -> str:
+    """'Net_Income' → 'net income', 'profitMargins' → 'profit margins', 'trailingPE' → 'trailing PE'."""
+    words = _RE_CAMEL.sub(" ", column).replace("_", " ").split()
+    return " ".join(w if w.isupper() else w.lower() for w in words)
+
+
+def _period_phrase(payload: Dict[str, Any], lang: str) -> str:
+    """'2023' → 'in 2023' / 'nel 2023'; range e medie → 'over 2019–2023'."""
+    label = format_period(payload)
+    if label == "all available":
+        return _ALL_AVAILABLE[lang]
+    time_type = payload.get("time_type") or ("period" if "period" in payload else "")
+    if time_type == "period" and "–" not in label and "," not in label:
+        time_type = "default"          # media su un solo anno
+    prefixes = _PERIOD_PREFIX[lang]
+    return f"{prefixes.get(time_type, prefixes['default'])} {label}"
+
+
+def _aggregate_label(aggregate: str, lang: str) -> str:
+    """'max' → 'maximum' / 'Il massimo'; 'p90' → '90th percentile' / 'Il 90° percentile'."""
+    labels = _AGGREGATE_LABELS[lang]
+    if aggregate.startswith("p") and aggregate[1:].isdigit():
+        return labels["percentile"].format(n=aggregate[1:])
+    return labels.get(aggregate, aggregate)
+
+
+def render_numerical(question: str, payload: Dict[str, Any], lang: Optional[str] = None) -> str:
+    """
+    Frase finale per un payload numerico.
+
+    Parameters
+    ----------
+    question : str
+        Domanda originale (solo per scegliere la lingua).
+    payload : dict
+        Output di `answer_num_query.answer_question`.
+    lang : str | None
+        'it' / 'en'; None → `detect_language(question)`.
+
+    Returns
+    -------
+    str
+        Es. "AAPL's net income in 2023 was **$97.00B**."
+
+    Examples
+    --------
+    >>> render_numerical("", {"company": "KO", "table": "info", "column": "dividendYield",
+    ...                       "result": 0.44, "time_type": "latest"}).splitlines()[0]
+    "KO's latest dividend yield is **0.44%**."
+    >>> render_numerical("", {"company": "KO", "table": "info", "column": "fiveYearAvgDividendYield",
+    ...                       "result": 0.59, "time_type": "latest"}).splitlines()[0]
+    "KO's latest five year avg dividend yield is **0.59%**."
+    >>> render_numerical("", {"company": "KO", "table": "sustainability", "column": "percentile",
+    ...                       "result": 12.5, "time_type": "latest"}).splitlines()[0]
+    "KO's latest percentile is **12.50%**."
+    >>> render_numerical("", {"company": "KO", "table": "info", "column": "profitMargins",
+    ...                       "result": 0.2253, "time_type": "latest"}).splitlines()[0]
+    "KO's latest profit margins is **22.53%**."
+    >>> render_numerical("", {"company": "AAPL", "table": "financials", "column": "Total_Revenue",
+    ...                       "result": 383285000000, "time_type": "range",
+    ...                       "time_value": {"from": "2020", "to": "2023"}}).splitlines()[0]
+    "AAPL's latest total revenue over 2020–2023 is **$383.29B**."
+    """
+    lang = lang if lang in _TEMPLATES else detect_language(question)
+    templates = _TEMPLATES[lang]
+    table = payload.get("table", "")
+    column = payload.get("column", "")
+    meta = metric_for_column(table, column) or {}
+    metric = _metric_label(column)
+
+    fields = {
+        "company": str(payload.get("company", "")).upper(),
+        "metric": metric,
+        "value": format_value(payload.get("result"), table, column, locale=lang,
+                              kind=aggregate_kind(payload.get("aggregate"))),
+    }
+    if payload.get("function_used") == "answer_aggregate_query":
+        text = templates["aggregate"].format(
+            label=_aggregate_label(payload.get("aggregate") or "avg", lang),
+            period=_period_phrase(payload, lang), **fields,
+        )
+    elif payload.get("function_used") == "answer_avg_query":
+        text = templates["average"].format(period=_period_phrase(payload, lang), **fields)
+    elif format_period(payload) == "latest":
+        text = templates["latest"].format(**fields)
+    elif payload.get("time_type") == "range":
+        # value_query restituisce una sola riga: la più recente dell'intervallo
+        text = templates["range"].format(period=_period_phrase(payload, lang), **fields)
+    else:
+        text = templates["point"].format(period=_period_phrase(payload, lang), **fields)
+
+    description = meta.get("description")
+    if description:
+        text += "\n\n" + templates["definition"].format(metric=metric, description=description)
+    return text
@@ -18,40 +18,31 @@ answer_question(query: str) -> dict
         ],
         "source_docs": ["AAPL_10-K_2023_part-17.txt", ...]
     }
+answer_question_async(query: str) -> dict   (coroutine, stesso schema)
 """
 
 from __future__ import annotations
 
+import asyncio
+import contextvars
 import os
 from pathlib import Path
 from typing import List, Dict, Any
 
 # Import relativo: retriever è nello stesso package "scripts"
-from .retriever import retrieve_chunks_by_company
-
-# --------------------------------------------------------------------------- #
-#  Token counter (fallback a word-based se tiktoken non disponibile)
-# --------------------------------------------------------------------------- #
-
-try:
-    import tiktoken
-
-    _enc = tiktoken.encoding_for_model("gpt-4")
-
-    def count_tokens(text: str) -> int:  # noqa: D401
-        """Conta token con tiktoken."""
-        return len(_enc.encode(text))
-
-except ImportError:  # pragma: no cover
-
-    def count_tokens(text: str) -> int:  # noqa: D401
-        """Fallback: conta parole."""
-        return len(text.split())
+from .retriever import retrieve_chunks_by_company, retrieve_chunks_by_company_async
+from .db.company_resolver import get_resolver
+from .tokens import count_tokens  # tiktoken, fallback a word-based
+from .tracing import annotate, traced
 
 
 _TOKEN_BUDGET = 2000          # limite hard per tutti i chunk
 _MAX_CHUNKS   = 6             # cap sul numero di chunk ritornati
 
+# Cartella dei chunk (override per il benchmark e2e)
+_CHUNKS_DIR = Path(os.getenv("MARK_CHUNKS_DIR",
+                             Path(__file__).resolve().parent.parent / "data" / "chunks"))
+
 # --------------------------------------------------------------------------- #
 #  Funzione principale
 # --------------------------------------------------------------------------- #
@@ -64,37 +55,23 @@ def _read_chunk_file(fname: str) -> str:
     Parameters
     ----------
     fname : str
-        Nome file relativo dentro data/chunks/.
+        Nome file relativo dentro data/chunks/ (o `MARK_CHUNKS_DIR`).
 
     Returns
     -------
     str
         Testo del chunk o stringa vuota se il file non esiste.
     """
-    base_dir = Path(__file__).resolve().parent.parent  # project root
-    path = base_dir / "data" / "chunks" / fname
+    path = _CHUNKS_DIR / fname
     try:
         return path.read_text(encoding="utf-8")
     except FileNotFoundError:
         return ""
 
 
-def answer_question(query: str) -> Dict[str, Any]:
-    """
-    Recupera i chunk di testo rilevanti per `query`.
-
-    Returns
-    -------
-    dict
-        Dizionario conforme allo schema richiesto da llm_wrapper.
-    """
-    # 1. Retrieve metadati chunks (semantica, niente filtro ticker)
-    meta_chunks = retrieve_chunks_by_company(
-        query,
-        tickers=None,
-        total_k=_MAX_CHUNKS
-    )
-
+@traced()
+def _select_chunks(meta_chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Legge i chunk recuperati entro `_TOKEN_BUDGET` e costruisce il payload."""
     if not meta_chunks:  # nessun match
         return {
             "chunks": [],
@@ -137,6 +114,7 @@ def answer_question(query: str) -> Dict[str, Any]:
         else:
             print(f"  • {c['filename']}  |  tokens={token_len}")
     print("-" * 60)
+    annotate(chunks=len(selected_chunks), chunk_tokens=total_tokens)
     
     return {
         "chunks": selected_chunks,
@@ -144,5 +122,49 @@ def answer_question(query: str) -> Dict[str, Any]:
     }
 
 
+@traced()
+def answer_question(query: str) -> Dict[str, Any]:
+    """
+    Recupera i chunk di testo rilevanti per `query`.
+
+    Returns
+    -------
+    dict
+        Dizionario conforme allo schema richiesto da llm_wrapper.
+    """
+    # 1. Retrieve metadati chunks, filtrati per le aziende citate (se note)
+    tickers = get_resolver().find_tickers(query) or None
+    meta_chunks = retrieve_chunks_by_company(
+        query,
+        tickers=tickers,
+        total_k=_MAX_CHUNKS
+    )
+    if tickers and not meta_chunks:
+        # Nessun chunk di quelle aziende tra i top risultati: ricerca libera
+        meta_chunks = retrieve_chunks_by_company(query, tickers=None, total_k=_MAX_CHUNKS)
+
+    return _select_chunks(meta_chunks)
+
+
+@traced("answer_text_query.answer_question")
+async def answer_question_async(query: str) -> Dict[str, Any]:
+    """
+    Versione async di `answer_question`: retrieval con
+    `retrieve_chunks_by_company_async`, lettura dei file nel thread pool.
+    """
+    tickers = get_resolver().find_tickers(query) or None
+    meta_chunks = await retrieve_chunks_by_company_async(
+        query,
+        tickers=tickers,
+        total_k=_MAX_CHUNKS
+    )
+    if tickers and not meta_chunks:
+        meta_chunks = await retrieve_chunks_by_company_async(query, tickers=None, total_k=_MAX_CHUNKS)
+
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(None, ctx.run, _select_chunks, meta_chunks)
+
+
 # Alias legacy (se altrove era usato ask_mark)
-ask_mark = answer_question
\ No newline at end of file
+ask_mark = answer_question
\ No newline at end of file
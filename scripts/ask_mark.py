@@ -11,11 +11,28 @@ Interactive mode:
 One‑liner:
     $ python ask_mark.py "Qual è il net income di Apple nel 2023?"
 
+LLM explanation for numerical answers (default: template, no LLM call):
+    $ python ask_mark.py --explain "Qual è il net income di Apple nel 2023?"
+
+Batch mode (CSV / JSONL file of questions, see `scripts/ask_mark_batch.py`):
+    $ python ask_mark.py --batch domande.csv -o risposte.jsonl
+
 The script:
 1. Acquisisce la domanda dell’utente (CLI o `input()`).
-2. La passa a `classify_question.classify_question`.
-3. Passa il risultato a `llm_wrapper.format_answer`.
-4. Stampa la risposta formattata.
+2. Risponde subito a identità / saluti / aiuto / elenco metriche (`pre_router`).
+3. Controlla la cache delle risposte (`answer_cache`).
+4. La passa a `classify_question.classify_question`.
+5. Passa il risultato a `llm_wrapper.format_answer_stream`.
+6. Stampa la risposta formattata.
+
+`main_stream(question)` espone la stessa pipeline come generatore di token
+(usato dalla UI Streamlit); `main(question)` restituisce la risposta intera.
+`main_stream_async` / `main_async` sono le versioni asyncio (classificazione,
+parsing, SQL, embedding e LLM non bloccanti; FAISS nel thread pool).
+
+Tracing per stage (durata, token, cache hit):
+    $ MARK_TRACE=jsonl MARK_TRACE_FILE=traces.jsonl python ask_mark.py "..."
+    (vedi `scripts/tracing.py`; MARK_TRACE=otel per il formato OTLP/JSON)
 
 Assumes:
 - OPENAI_API_KEY is defined in a .env file at project root.
@@ -26,13 +43,17 @@ from __future__ import annotations
 import json
 import os
 import sys
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Tuple
 
 from dotenv import load_dotenv
 
 # Local imports
-from scripts.classify_question import classify_question
-from scripts.llm_wrapper import format_answer
+from scripts.answer_cache import get_answer_cache, intent_key, normalize_question
+from scripts.answer_renderer import detect_language
+from scripts.classify_question import classify_question, classify_question_async
+from scripts.llm_wrapper import format_answer_stream, format_answer_stream_async
+from scripts.pre_router import pre_route
+from scripts.tracing import annotate, traced
 
 # --------------------------------------------------------------------------- #
 #  Environment
@@ -40,6 +61,8 @@ from scripts.llm_wrapper import format_answer
 
 load_dotenv()  # ensure OPENAI_API_KEY is available to any downstream module
 
+StageCallback = Callable[[str], None]
+
 # --------------------------------------------------------------------------- #
 #  Helpers
 # --------------------------------------------------------------------------- #
@@ -57,8 +80,9 @@ def _read_question_from_cli() -> str:
     str
         The user's question as a single string.
     """
-    if len(sys.argv) > 1:
-        return " ".join(sys.argv[1:]).strip()
+    args = [a for a in sys.argv[1:] if a != "--explain"]
+    if args:
+        return " ".join(args).strip()
 
     # Interactive prompt
     try:
@@ -73,12 +97,128 @@ def _pretty_dump(obj: Dict[str, Any]) -> str:
     return json.dumps(obj, indent=2, ensure_ascii=False)
 
 
+def _numerical_part(answer_type: str, payload: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Return the numerical payload (if any) of a classification result."""
+    if answer_type == "numerical":
+        return payload
+    if answer_type == "hybrid":
+        return payload.get("numerical")
+    return None
+
+
+def _intent_cache_key(
+    question: str, answer_type: str, payload: Dict[str, Any], explain: bool | None
+) -> Tuple[Tuple[Any, ...] | None, List[str]]:
+    """
+    Intent cache key and the SQL tables it depends on.
+    Only pure numerical answers are keyed: text/hybrid depend on the wording.
+    The answer language is part of the key, so an Italian question never
+    gets the cached English answer (and vice versa).
+    """
+    numerical = _numerical_part(answer_type, payload)
+    tables = [numerical["table"]] if numerical and numerical.get("table") else []
+    if answer_type == "comparison":
+        tables = sorted({metric["table"] for metric in payload.get("metrics", [])})
+    elif answer_type == "screen":
+        tables = ["info"]
+    key = intent_key(payload) if answer_type == "numerical" else None
+    return (key + (explain, detect_language(question)) if key else None), tables
+
+
+def _is_llm_error(answer: str) -> bool:
+    """Fallback answers must not be cached."""
+    return answer.startswith("(Errore LLM)") or "(Errore LLM:" in answer
+
+
+def _no_stage(stage: str) -> None:
+    """Default stage callback: nothing to report."""
+
+
 # --------------------------------------------------------------------------- #
 #  Main
 # --------------------------------------------------------------------------- #
 
 
-def main(question: str | None = None) -> str:
+@traced("ask_mark")
+def main_stream(
+    question: str,
+    explain: bool | None = None,
+    on_stage: StageCallback | None = None,
+) -> Iterator[str]:
+    """
+    Streaming orchestrator: same pipeline as `main`, but the final answer is
+    yielded chunk by chunk as the LLM produces it (cached answers are yielded
+    in one piece).  Used by the Streamlit UI.
+
+    `explain` is forwarded to `format_answer_stream`: numerical answers are
+    rendered from a template unless it is True (or MARK_NUMERICAL_MODE=explain).
+
+    `on_stage(name)` is called when a pipeline stage starts: 'cache',
+    'classify', 'numerical' / 'comparison' / 'screen' / 'text' / 'hybrid'
+    (data retrieval), 'answer'.
+    """
+    if not question:
+        yield "Nessuna domanda fornita."
+        return
+    print(f"Domanda ricevuta: {question}", file=sys.stderr)
+    on_stage = on_stage or _no_stage
+
+    # 0) Zero‑cost intents (identity, greeting, help, metric list): no LLM at all
+    routed = pre_route(question)
+    if routed is not None:
+        print(f"⚡ Pre‑routing: {routed.intent}", file=sys.stderr)
+        yield routed.answer
+        return
+
+    # 1) Exact‑question cache (skips every stage below)
+    on_stage("cache")
+    cache = get_answer_cache()
+    question_key = (normalize_question(question), explain)
+    cached = cache.get("question", question_key)
+    if cached is not None:
+        print(f"💾 Risposta dalla cache: {cached}", file=sys.stderr)
+        yield cached
+        return
+
+    # 2) Classify and retrieve raw result
+    classification_output = classify_question(question, on_stage=on_stage)
+    answer_type = classification_output["type"]
+    payload = classification_output["result"]
+    annotate(answer_type=answer_type)
+
+    # Debug (optional): uncomment next line
+    # print("DEBUG raw output:", _pretty_dump(classification_output), file=sys.stderr)
+
+    # 3) Intent‑level cache: same (company, table, column, period) → same answer.
+    key, tables = _intent_cache_key(question, answer_type, payload, explain)
+    final_answer = cache.get("intent", key)
+
+    # 4) Format human‑readable answer, streaming tokens as they arrive
+    on_stage("answer")
+    if final_answer is None:
+        parts = []
+        for token in format_answer_stream(
+            question=question,
+            answer_type=answer_type,
+            answer_payload=payload,
+            explain=explain,
+        ):
+            parts.append(token)
+            yield token
+        final_answer = "".join(parts).strip()
+        if _is_llm_error(final_answer):
+            return
+        cache.put("intent", key, final_answer, tables=tables)
+    else:
+        yield final_answer
+
+    cache.put("question", question_key, final_answer, tables=tables)
+
+    # 5) Print generated answer to stderr for debug
+    print(f"Risposta generata: {final_answer}", file=sys.stderr)
+
+
+def main(question: str | None = None, explain: bool | None = None) -> str:
     """
     Full orchestrator:
     - Collect question (from argument or CLI)
@@ -88,27 +228,77 @@ def main(question: str | None = None) -> str:
     """
     if question is None:
         question = _read_question_from_cli()
+        if "--explain" in sys.argv[1:]:
+            explain = True
+    return "".join(main_stream(question, explain=explain)).strip()
+
+
+# --------------------------------------------------------------------------- #
+#  Async
+# --------------------------------------------------------------------------- #
+
+
+@traced("ask_mark")
+async def main_stream_async(question: str, explain: bool | None = None) -> AsyncIterator[str]:
+    """
+    Async twin of `main_stream`: every network/DB stage awaits instead of
+    blocking, so one event loop can serve many questions concurrently.
+    Shares the answer cache with the sync pipeline.
+    """
     if not question:
-        return "Nessuna domanda fornita."
+        yield "Nessuna domanda fornita."
+        return
     print(f"Domanda ricevuta: {question}", file=sys.stderr)
 
-    # 1) Classify and retrieve raw result
-    classification_output = classify_question(question)
+    routed = pre_route(question)
+    if routed is not None:
+        yield routed.answer
+        return
 
-    # Debug (optional): uncomment next line
-    # print("DEBUG raw output:", _pretty_dump(classification_output), file=sys.stderr)
+    cache = get_answer_cache()
+    question_key = (normalize_question(question), explain)
+    cached = cache.get("question", question_key)
+    if cached is not None:
+        yield cached
+        return
 
-    # 2) Format human‑readable answer
-    final_answer: str = format_answer(
-        question=question,
-        answer_type=classification_output["type"],
-        answer_payload=classification_output["result"],
-    )
+    classification_output = await classify_question_async(question)
+    answer_type = classification_output["type"]
+    payload = classification_output["result"]
+    annotate(answer_type=answer_type)
 
-    # 3) Print generated answer to stderr for debug
-    print(f"Risposta generata: {final_answer}", file=sys.stderr)
-    return final_answer
+    key, tables = _intent_cache_key(question, answer_type, payload, explain)
+    final_answer = cache.get("intent", key)
+
+    if final_answer is None:
+        parts = []
+        async for token in format_answer_stream_async(
+            question=question,
+            answer_type=answer_type,
+            answer_payload=payload,
+            explain=explain,
+        ):
+            parts.append(token)
+            yield token
+        final_answer = "".join(parts).strip()
+        if _is_llm_error(final_answer):
+            return
+        cache.put("intent", key, final_answer, tables=tables)
+    else:
+        yield final_answer
+
+    cache.put("question", question_key, final_answer, tables=tables)
+
+
+async def main_async(question: str, explain: bool | None = None) -> str:
+    """Async twin of `main`: returns the full answer."""
+    parts = [token async for token in main_stream_async(question, explain=explain)]
+    return "".join(parts).strip()
 
 
 if __name__ == "__main__":
-    print(main())
\ No newline at end of file
+    if sys.argv[1:2] == ["--batch"]:
+        from scripts.ask_mark_batch import main as main_batch
+        main_batch(sys.argv[2:])
+    else:
+        print(main())
\ No newline at end of file
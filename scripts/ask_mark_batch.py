@@ -0,0 +1,401 @@
+"""
+ask_mark_batch.py
+
+Modalità batch di Mark: risponde a un file di domande (CSV o JSONL) e
+scrive le risposte, man mano che sono pronte, in un file di output.
+
+Rispetto a chiamare `ask_mark.main` riga per riga:
+
+1. **Dedup** – domande uguali a meno di maiuscole/punteggiatura
+   (`normalize_question`) vengono elaborate una volta sola.
+2. **Pianificazione concorrente** – pre‑routing, cache, classificazione,
+   parsing (`plan_question`) e retrieval FAISS girano in un thread pool.
+3. **SQL in blocco** – gli intenti numerici identici si fondono; quelli che
+   differiscono solo per l'azienda (stessa tabella, colonna e periodo)
+   diventano **una** query `symbol IN (...)`
+   (`answer_value_queries_bulk` / `answer_avg_queries_bulk`).
+4. **LLM a concorrenza limitata** – `format_answer` con al più
+   `--concurrency` chiamate in volo; le risposte vengono scritte appena
+   arrivano.
+
+Cache domanda / intento / valore sono le stesse di `ask_mark`.
+
+Formati
+-------
+Input:  .csv con colonna `question` (o la prima colonna) e `id` opzionale;
+        .jsonl con {"question": ..., "id": ...} oppure una stringa per riga.
+Output: .jsonl (default `<input>.answers.jsonl`) o .csv, un record per riga
+        di input con id, question, type, answer, status, duplicate_of e i
+        tempi plan_ms / sql_ms / answer_ms / total_ms (sql_ms è la quota
+        della query di gruppo).
+
+Uso
+---
+    $ python -m scripts.ask_mark_batch domande.csv
+    $ python -m scripts.ask_mark_batch domande.jsonl -o risposte.csv --concurrency 16 --explain
+    $ python ask_mark.py --batch domande.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple
+
+from scripts.answer_cache import get_answer_cache, intent_key, normalize_question
+from scripts.answer_num_query import _finalize, plan_question
+from scripts.answer_text_query import answer_question as answer_text_question
+from scripts.ask_mark import _intent_cache_key, _is_llm_error
+from scripts.classify_question import _ENGINES, _classify
+from scripts.db.aggregate_query import answer_aggregate_query
+from scripts.db.avg_query import answer_avg_queries_bulk, answer_avg_query
+from scripts.db.value_query import answer_value_queries_bulk, answer_value_query
+from scripts.llm_wrapper import format_answer
+from scripts.pre_router import pre_route
+
+DEFAULT_CONCURRENCY = int(os.getenv("MARK_BATCH_CONCURRENCY", 8))
+
+OUTPUT_FIELDS = ["id", "question", "type", "answer", "status", "duplicate_of",
+                 "plan_ms", "sql_ms", "answer_ms", "total_ms"]
+
+_BULK: Dict[str, Tuple[Optional[Callable[[list], dict]], Callable[[dict], Any]]] = {
+    "answer_value_query": (answer_value_queries_bulk, answer_value_query),
+    "answer_avg_query": (answer_avg_queries_bulk, answer_avg_query),
+    "answer_aggregate_query": (None, answer_aggregate_query),     # solo query singole
+}
+
+
+@dataclass
+class _Item:
+    """Una domanda del batch e il suo stato lungo le tre fasi."""
+
+    id: str
+    question: str
+    explain: Optional[bool]
+    duplicate_of: Optional[str] = None
+    type: str = ""
+    chosen: str = ""
+    parsed: Optional[Dict[str, Any]] = None
+    text: Optional[Dict[str, Any]] = None
+    result: Any = None
+    answer: Optional[str] = None
+    status: str = "ok"
+    timings: Dict[str, float] = field(default_factory=lambda: {"plan_ms": 0.0, "sql_ms": 0.0,
+                                                                "answer_ms": 0.0})
+
+    def fail(self, exc: BaseException) -> None:
+        self.status, self.answer = "error", f"{type(exc).__name__}: {exc}"
+
+    def record(self) -> Dict[str, Any]:
+        timings = {k: round(v, 1) for k, v in self.timings.items()}
+        return {"id": self.id, "question": self.question, "type": self.type,
+                "answer": self.answer, "status": self.status,
+                "duplicate_of": self.duplicate_of, **timings,
+                "total_ms": round(sum(self.timings.values()), 1)}
+
+
+# --------------------------------------------------------------------------- #
+#  Input / output
+# --------------------------------------------------------------------------- #
+
+def read_questions(path: str) -> List[Tuple[str, str]]:
+    """[(id, domanda)] da un file .csv o .jsonl; id di default = numero di riga."""
+    rows: List[Tuple[str, str]] = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.reader(f)
+            header = next(reader, [])
+            lowered = [h.strip().lower() for h in header]
+            if "question" in lowered:
+                q_col = lowered.index("question")
+                id_col = lowered.index("id") if "id" in lowered else None
+            else:
+                # nessuna intestazione: la prima riga è già una domanda
+                q_col, id_col = 0, None
+                reader = [header, *reader]
+            for n, row in enumerate(reader, 1):
+                if len(row) > q_col and row[q_col].strip():
+                    rows.append((row[id_col] if id_col is not None else str(n), row[q_col].strip()))
+        else:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                obj = json.loads(line)
+                if isinstance(obj, str):
+                    obj = {"question": obj}
+                rows.append((str(obj.get("id", n)), obj["question"].strip()))
+    return rows
+
+
+class _Writer:
+    """Scrive i record appena pronti (thread‑safe), in JSONL o CSV."""
+
+    def __init__(self, out: TextIO, as_csv: bool) -> None:
+        self._out = out
+        self._lock = threading.Lock()
+        self._csv = csv.DictWriter(out, fieldnames=OUTPUT_FIELDS) if as_csv else None
+        if self._csv:
+            self._csv.writeheader()
+
+    def write(self, item: _Item) -> None:
+        record = item.record()
+        with self._lock:
+            if self._csv:
+                self._csv.writerow(record)
+            else:
+                self._out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self._out.flush()
+
+
+# --------------------------------------------------------------------------- #
+#  Fasi
+# --------------------------------------------------------------------------- #
+
+def _plan(item: _Item) -> None:
+    """Fase 1: pre‑routing, cache domanda, classificazione, parsing, retrieval."""
+    t0 = time.perf_counter()
+    try:
+        routed = pre_route(item.question)
+        if routed is not None:
+            item.type, item.answer, item.status = "pre_route", routed.answer, routed.intent
+            return
+        cached = get_answer_cache().get("question", (normalize_question(item.question), item.explain))
+        if cached is not None:
+            item.type, item.answer, item.status = "cache", cached, "cached"
+            return
+
+        item.type = _classify(item.question)
+        if item.type in _ENGINES:
+            try:
+                item.result = _ENGINES[item.type][0](item.question)
+                return
+            except ValueError:
+                item.type = "numerical"         # come classify_question: ripiego sul numerico
+        if item.type in ("numerical", "hybrid"):
+            item.chosen, item.parsed = plan_question(item.question)
+        if item.type in ("text", "hybrid"):
+            item.text = answer_text_question(item.question)
+    except Exception as exc:  # noqa: BLE001
+        item.fail(exc)
+    finally:
+        item.timings["plan_ms"] = (time.perf_counter() - t0) * 1000
+
+
+def _run_group(chosen: str, intents: List[Tuple[Any, List[_Item]]]) -> Tuple[Dict[Any, Any], int]:
+    """
+    Una query per gruppo (stessa funzione/tabella/colonna/periodo); se la
+    query in blocco fallisce si ripiega sulle query singole.
+
+    Returns
+    -------
+    ({intent_key: valore}, numero di query eseguite)
+    """
+    bulk, single = _BULK[chosen.partition(":")[0]]     # "answer_aggregate_query:max"
+    parsed_list = [items[0].parsed for _, items in intents]
+    if bulk is not None and len(intents) > 1:
+        try:
+            by_symbol = bulk(parsed_list)
+            return {key: by_symbol.get(key[1]) for key, _ in intents}, 1
+        except Exception as exc:  # noqa: BLE001
+            print(f"⚠️ Query in blocco fallita ({exc}): ripiego sulle singole", file=sys.stderr)
+    values: Dict[Any, Any] = {}
+    for (key, _), parsed in zip(intents, parsed_list):
+        try:
+            values[key] = single(parsed)
+        except Exception as exc:  # noqa: BLE001
+            values[key] = exc
+    return values, len(intents)
+
+
+def _query(items: List[_Item]) -> Tuple[int, int]:
+    """
+    Fase 2: valori SQL per tutte le domande numeriche/ibride.
+
+    Returns
+    -------
+    (intenti distinti, query SQL eseguite)
+    """
+    cache = get_answer_cache()
+    by_intent: Dict[Any, List[_Item]] = {}
+    for item in items:
+        if item.parsed is not None and item.answer is None:
+            key = intent_key({**item.parsed, "function_used": item.chosen})
+            if key is None:
+                item.fail(ValueError("Azienda, tabella o colonna non riconosciuta nella domanda."))
+                continue
+            by_intent.setdefault(key, []).append(item)
+
+    # intenti che differiscono solo per l'azienda → stessa query in blocco
+    groups: Dict[Any, List[Tuple[Any, List[_Item]]]] = {}
+    for key, intent_items in by_intent.items():
+        value = cache.get("value", key)
+        if value is not None:
+            for item in intent_items:
+                item.result = value
+            continue
+        groups.setdefault((key[0],) + key[2:], []).append((key, intent_items))
+
+    queries = 0
+    for group_key, intents in groups.items():
+        t0 = time.perf_counter()
+        try:
+            values, executed = _run_group(group_key[0], intents)
+        except Exception as exc:  # noqa: BLE001 — un gruppo rotto non ferma il batch
+            values, executed = {key: exc for key, _ in intents}, 0
+        queries += executed
+        share = (time.perf_counter() - t0) * 1000 / len(intents)
+        for key, intent_items in intents:
+            value = values.get(key)
+            if not isinstance(value, Exception) and value is not None:
+                cache.put("value", key, value, tables=[intent_items[0].parsed.get("table", "")])
+            for item in intent_items:
+                item.timings["sql_ms"] = share
+                if isinstance(value, Exception):
+                    item.fail(value)
+                else:
+                    item.result = value
+    return len(by_intent), queries
+
+
+def _answer(item: _Item) -> _Item:
+    """Fase 3: payload come `classify_question` + `format_answer` (con cache)."""
+    if item.answer is not None:
+        return item
+    t0 = time.perf_counter()
+    try:
+        numerical = None
+        if item.parsed is not None:
+            numerical = _finalize(dict(item.parsed), item.chosen, item.result)
+        if item.type == "numerical":
+            payload = numerical
+        elif item.type in _ENGINES:
+            payload = item.result
+        elif item.type == "text":
+            payload = item.text
+        else:
+            payload = {"numerical": numerical, "text": item.text}
+
+        cache = get_answer_cache()
+        key, tables = _intent_cache_key(item.question, item.type, payload, item.explain)
+        answer = cache.get("intent", key)
+        if answer is None:
+            answer = format_answer(item.question, item.type, payload, explain=item.explain).strip()
+            if _is_llm_error(answer):
+                item.status = "llm_error"
+            else:
+                cache.put("intent", key, answer, tables=tables)
+        if item.status == "ok":
+            cache.put("question", (normalize_question(item.question), item.explain),
+                      answer, tables=tables)
+        item.answer = answer
+    except Exception as exc:  # noqa: BLE001
+        item.fail(exc)
+    finally:
+        item.timings["answer_ms"] = (time.perf_counter() - t0) * 1000
+    return item
+
+
+# --------------------------------------------------------------------------- #
+#  Orchestrazione
+# --------------------------------------------------------------------------- #
+
+def run_batch(
+    rows: List[Tuple[str, str]],
+    out: TextIO,
+    as_csv: bool = False,
+    explain: Optional[bool] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> Dict[str, Any]:
+    """
+    Risponde a `rows` = [(id, domanda)] scrivendo un record per riga su `out`.
+
+    Returns
+    -------
+    dict
+        Riepilogo: righe, domande uniche, intenti, query SQL, tempo, risposte/s.
+    """
+    started = time.perf_counter()
+    writer = _Writer(out, as_csv)
+
+    unique: Dict[str, _Item] = {}
+    duplicates: Dict[str, List[_Item]] = {}
+    for row_id, question in rows:
+        norm = normalize_question(question)
+        if norm in unique:
+            duplicates.setdefault(norm, []).append(
+                _Item(row_id, question, explain, duplicate_of=unique[norm].id))
+        else:
+            unique[norm] = _Item(row_id, question, explain)
+    items = list(unique.values())
+
+    def emit(item: _Item) -> None:
+        writer.write(item)
+        for dup in duplicates.get(normalize_question(item.question), []):
+            dup.type, dup.answer, dup.status = item.type, item.answer, item.status
+            writer.write(dup)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="mark-batch") as pool:
+        # risposte già pronte (pre‑routing, cache, errori) escono subito
+        list(pool.map(_plan, items))
+        pending = [item for item in items if item.answer is None]
+        for item in items:
+            if item.answer is not None:
+                emit(item)
+
+        try:
+            n_intents, n_queries = _query(pending)
+        except Exception as exc:  # noqa: BLE001
+            n_intents, n_queries = 0, 0
+            for item in pending:
+                if item.answer is None and item.parsed is not None:
+                    item.fail(exc)
+        for item in pending:
+            if item.answer is not None:
+                emit(item)
+
+        pending = [pool.submit(_answer, item) for item in pending if item.answer is None]
+        for future in as_completed(pending):
+            emit(future.result())
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": len(rows),
+        "unique_questions": len(items),
+        "unique_intents": n_intents,
+        "sql_queries": n_queries,
+        "errors": sum(item.status in ("error", "llm_error") for item in items),
+        "wall_s": round(elapsed, 2),
+        "answers_per_s": round(len(rows) / elapsed, 2) if elapsed else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Risponde a un file di domande (CSV o JSONL).")
+    ap.add_argument("input", help="file .csv o .jsonl di domande")
+    ap.add_argument("-o", "--output", help="file .jsonl o .csv (default: <input>.answers.jsonl)")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                    help="thread per parsing e chiamate LLM")
+    ap.add_argument("--explain", action="store_true", help="spiegazione LLM per le risposte numeriche")
+    args = ap.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.input)[0] + ".answers.jsonl"
+    rows = read_questions(args.input)
+    with open(output, "w", encoding="utf-8", newline="") as out:
+        summary = run_batch(rows, out, as_csv=output.lower().endswith(".csv"),
+                            explain=True if args.explain else None,
+                            concurrency=args.concurrency)
+
+    print(f"✅ {summary['rows']} righe → {output}", file=sys.stderr)
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
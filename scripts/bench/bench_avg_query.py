@@ -0,0 +1,162 @@
+"""
+bench_avg_query.py
+
+Medie su `history` con `LIKE '%2023%'` (forma usata prima da `avg_query`)
+contro i `BETWEEN` generati da `date_utils.period_ranges`, sul MySQL locale.
+
+1. **EXPLAIN** – per ogni periodo di prova verifica che la query nuova usi
+   la chiave primaria (company_id, date) con accesso `range`; con `--check`
+   esce con codice 1 se non è così (da usare in CI prima di un rilascio).
+2. **Benchmark** – tempo medio per media, vecchia e nuova forma.
+
+Di default lavora su una tabella di prova `bench_history_avg` con lo schema
+di `history` (PK company_id + date), riempita con `--years` anni di prezzi
+giornalieri per `--companies` aziende; `--table history` usa i dati reali.
+
+Uso
+---
+    $ python -m scripts.bench.bench_avg_query                 # 40 anni × 20 aziende
+    $ python -m scripts.bench.bench_avg_query --check         # solo EXPLAIN, exit 1 se manca l'indice
+    $ python -m scripts.bench.bench_avg_query --table history --repeat 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+from scripts.db.avg_query import _period_clause
+from scripts.db.db_pool import connection
+
+SCRATCH_TABLE = "bench_history_avg"
+
+
+# periodi come li produce parse_avg_query (anno finale = anno corrente - 1)
+def _periods(last_year: int) -> Dict[str, Any]:
+    return {
+        "ultimi 3 anni": [str(y) for y in range(last_year - 2, last_year + 1)],
+        "anni sparsi": [str(last_year - k) for k in (0, 4, 9, 19)],
+        "singolo anno": str(last_year - 10),
+        "mese": f"{last_year}-06",
+        "decennio": {"from": str(last_year - 9), "to": str(last_year)},
+    }
+
+
+def _legacy_clause(date_column: str, period: Any) -> Tuple[str, Tuple[Any, ...]]:
+    """La vecchia forma LIKE, solo per il confronto."""
+    if isinstance(period, dict):
+        years = [str(y) for y in range(int(period["from"]), int(period["to"]) + 1)]
+    else:
+        years = period if isinstance(period, list) else [period]
+    clause = " OR ".join([f"{date_column} LIKE %s" for _ in years])
+    return f"({clause})", tuple(f"%{y}%" for y in years)
+
+
+def _seed(companies: int, years: int) -> None:
+    """Crea e riempie la tabella di prova (una riga per giorno lavorativo)."""
+    end = datetime.date.today()
+    start = end.replace(year=end.year - years)
+    rng = random.Random(7)
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+        cursor.execute(f"""
+            CREATE TABLE {SCRATCH_TABLE} (
+                company_id INT NOT NULL,
+                date DATE NOT NULL,
+                close DOUBLE,
+                PRIMARY KEY (company_id, date)
+            )
+        """)
+        days = [start + datetime.timedelta(days=d) for d in range((end - start).days)]
+        days = [d for d in days if d.weekday() < 5]
+        for company_id in range(1, companies + 1):
+            price = rng.uniform(10, 200)
+            rows = []
+            for day in days:
+                price = max(1.0, price * (1 + rng.gauss(0.0003, 0.02)))
+                rows.append((company_id, day, round(price, 4)))
+            cursor.executemany(
+                f"INSERT INTO {SCRATCH_TABLE} (company_id, date, close) VALUES (%s, %s, %s)", rows
+            )
+        cursor.execute(f"ANALYZE TABLE {SCRATCH_TABLE}")
+        cursor.fetchall()
+    print(f"🌱 {SCRATCH_TABLE}: {companies} aziende × {len(days):,} giorni")
+
+
+def _explain(cursor: Any, sql: str, params: Sequence[Any]) -> Dict[str, Any]:
+    cursor.execute("EXPLAIN " + sql, params)
+    names = [d[0].lower() for d in cursor.description]
+    return dict(zip(names, cursor.fetchone()))
+
+
+def _time(cursor: Any, sql: str, params: Sequence[Any], repeat: int) -> float:
+    """Tempo medio (ms) della query."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.fmean(samples)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    ap.add_argument("--table", default=SCRATCH_TABLE, help="tabella con PK (company_id, date)")
+    ap.add_argument("--column", default="close")
+    ap.add_argument("--companies", type=int, default=20)
+    ap.add_argument("--years", type=int, default=40)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--reseed", action="store_true", help="ricrea la tabella di prova")
+    ap.add_argument("--check", action="store_true", help="solo EXPLAIN; exit 1 se l'indice non è usato")
+    args = ap.parse_args()
+
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SHOW TABLES LIKE %s", (args.table,))
+        missing = cursor.fetchone() is None
+    if args.table == SCRATCH_TABLE and (missing or args.reseed):
+        _seed(args.companies, args.years)
+
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"SELECT company_id, MAX(date) FROM {args.table} GROUP BY company_id")
+        companies = cursor.fetchall()
+    company_id, last_date = max(companies, key=lambda row: row[1])
+    periods = _periods(last_date.year)
+
+    failures: List[str] = []
+    print(f"{'periodo':<14} {'type':>6} {'key':>8} {'righe':>8} │ {'LIKE type':>9} {'righe':>8}"
+          + ("" if args.check else f" │ {'LIKE ms':>8} {'BETWEEN ms':>10} {'x':>6}"))
+    with connection() as conn, conn.cursor() as cursor:
+        for label, period in periods.items():
+            new_clause, new_params = _period_clause("date", period)
+            old_clause, old_params = _legacy_clause("date", period)
+            base = f"SELECT AVG({args.column}) FROM {args.table} WHERE company_id = %s AND "
+            new_sql, new_args = base + new_clause, (company_id, *new_params)
+            old_sql, old_args = base + old_clause, (company_id, *old_params)
+
+            new_plan = _explain(cursor, new_sql, new_args)
+            old_plan = _explain(cursor, old_sql, old_args)
+            if new_plan.get("key") != "PRIMARY" or new_plan.get("type") != "range":
+                failures.append(f"{label}: type={new_plan.get('type')} key={new_plan.get('key')}")
+
+            line = (f"{label:<14} {new_plan.get('type')!s:>6} {new_plan.get('key')!s:>8} "
+                    f"{new_plan.get('rows')!s:>8} │ {old_plan.get('type')!s:>9} {old_plan.get('rows')!s:>8}")
+            if not args.check:
+                old_ms = _time(cursor, old_sql, old_args, args.repeat)
+                new_ms = _time(cursor, new_sql, new_args, args.repeat)
+                line += f" │ {old_ms:>8.2f} {new_ms:>10.2f} {old_ms / new_ms:>6.1f}"
+            print(line)
+
+    if failures:
+        print("❌ Range scan sulla chiave primaria non usato:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("✅ Tutte le medie usano un range scan su (company_id, date).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+bench_company_id.py
+
+Benchmark del lookup company_id (`scripts/db/company_ids.py`) contro il
+MySQL locale: la stessa query di valore eseguita
+
+• con la sottoquery `company_id = (SELECT company_id FROM info WHERE symbol = %s)`
+  (forma usata prima da `value_query` / `avg_query`), e
+• con la mappa in memoria + predicato diretto `company_id = %s`
+  (tempo della mappa incluso),
+
+su simboli presi a caso dalla tabella `info`.  Entrambe passano dal pool
+(`db_pool`), quindi la differenza è solo nel lookup.
+
+Uso
+---
+    $ python -m scripts.bench.bench_company_id
+    $ python -m scripts.bench.bench_company_id -n 5000 --table balance_sheet --column Total_Assets
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, List
+
+from scripts.bench.load_test_async import _percentile
+from scripts.db.company_ids import get_company_id
+from scripts.db.db_pool import fetch_all, fetch_one
+
+
+def _measure(run: Callable[[str], None], symbols: List[str]) -> List[float]:
+    """Latenza (ms) di `run(symbol)` per ogni simbolo."""
+    latencies = []
+    for symbol in symbols:
+        t0 = time.perf_counter()
+        run(symbol)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    ap.add_argument("-n", type=int, default=2000, help="query per variante")
+    ap.add_argument("--table", default="financials")
+    ap.add_argument("--column", default="Net_Income")
+    ap.add_argument("--time-field", default="date")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    universe = [row[0] for row in fetch_all("SELECT symbol FROM info") if row[0]]
+    if not universe:
+        raise SystemExit("Tabella info vuota: eseguire prima update_mark_db.py")
+    rng = random.Random(args.seed)
+    symbols = [rng.choice(universe) for _ in range(args.n)]
+
+    subquery_sql = f"""
+        SELECT {args.column} FROM {args.table}
+        WHERE company_id = (SELECT company_id FROM info WHERE symbol = %s)
+        ORDER BY {args.time_field} DESC LIMIT 1
+    """
+    direct_sql = f"""
+        SELECT {args.column} FROM {args.table}
+        WHERE company_id = %s
+        ORDER BY {args.time_field} DESC LIMIT 1
+    """
+    variants = {
+        "subquery": lambda s: fetch_one(subquery_sql, (s,)),
+        "mappa": lambda s: fetch_one(direct_sql, (get_company_id(s),)),
+    }
+
+    t0 = time.perf_counter()
+    get_company_id(universe[0])
+    print(f"mappa caricata in {(time.perf_counter() - t0) * 1000:.1f} ms ({len(universe):,} simboli)")
+
+    for run in variants.values():                       # warm‑up (pool, cache InnoDB)
+        _measure(run, symbols[:50])
+
+    print(f"{'variante':>10} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'query/s':>9}")
+    for name, run in variants.items():
+        latencies = _measure(run, symbols)
+        mean = statistics.fmean(latencies)
+        print(f"{name:>10} {mean:>9.3f} {_percentile(latencies, 0.50):>8.3f} "
+              f"{_percentile(latencies, 0.95):>8.3f} {1000 / mean:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
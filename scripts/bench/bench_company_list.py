@@ -0,0 +1,133 @@
+"""
+bench_company_list.py
+
+Screening di `scripts/db/company_list.py` sull'intero universo di `info`
+nel MySQL locale: per alcuni screening tipici confronta la query con gli
+indici di screening e la stessa query con gli indici ignorati
+(`IGNORE INDEX`), poi scorre tutte le pagine di uno screening ampio.
+
+1. **EXPLAIN** – indice scelto, righe stimate e filesort; con `--check`
+   esce con codice 1 se uno screening scansiona tutta `info`.
+2. **Benchmark** – tempo medio (ms) con e senza indici, e con / senza
+   `COUNT(*) OVER ()` per il totale.
+3. **Paginazione** – tempo di ogni pagina fino all'ultima.
+
+Gli indici vanno creati prima (`--indexes` lo fa, idempotente).
+
+Uso
+---
+    $ python -m scripts.bench.bench_company_list --indexes
+    $ python -m scripts.bench.bench_company_list --check
+    $ python -m scripts.bench.bench_company_list --repeat 50 --page-size 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Sequence
+
+from scripts.db import company_list
+from scripts.db.db_pool import connection
+
+# nome → argomenti di build_screen_query
+SCREENS: Dict[str, Dict[str, Any]] = {
+    "large_caps": {"filters": {"marketcap": {">": 10e9}}},
+    "utilities_yield": {"filters": {"marketcap": {">": 10e9}, "dividendyield": {">": "3%"}},
+                        "sector": "Utilities"},
+    "cheap_tech": {"filters": {"trailingpe": {"between": [0, 15]}}, "sector": "Technology",
+                   "sort": "trailingpe"},
+    "high_yield": {"filters": {"dividendyield": {">": "6%"}}, "sort": "-dividendyield"},
+    "banks_by_pe": {"industry": "Banks", "sort": ["trailingpe", "-marketcap"]},
+}
+PAGINATED_SCREEN = {"filters": {"marketcap": {">": 0}}}
+
+
+def _explain(cursor: Any, sql: str, params: Sequence[Any]) -> Dict[str, Any]:
+    cursor.execute("EXPLAIN " + sql, params)
+    names = [d[0].lower() for d in cursor.description]
+    return dict(zip(names, cursor.fetchone()))
+
+
+def _time(cursor: Any, sql: str, params: Sequence[Any], repeat: int) -> float:
+    """Tempo medio (ms) della query."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.fmean(samples)
+
+
+def _without_indexes(sql: str) -> str:
+    """Stessa query con gli indici di screening ignorati."""
+    ignored = ", ".join(company_list.SCREEN_INDEXES)
+    return sql.replace("FROM info i", f"FROM info i IGNORE INDEX ({ignored})", 1)
+
+
+def _paginate(cursor: Any, page_size: int) -> None:
+    """Scorre tutte le pagine di PAGINATED_SCREEN e stampa i tempi."""
+    page, pages, samples = 1, 1, []
+    while page <= pages:
+        sql, params, _ = company_list.build_screen_query(**PAGINATED_SCREEN, page=page,
+                                                         page_size=page_size)
+        t0 = time.perf_counter()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        samples.append((time.perf_counter() - t0) * 1000)
+        if not rows:
+            break
+        pages = -(-rows[0][-1] // page_size)
+        page += 1
+    print(f"📄 {len(samples)} pagine da {page_size}: prima {samples[0]:.1f} ms, "
+          f"ultima {samples[-1]:.1f} ms, totale {sum(samples):.0f} ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    ap.add_argument("--screen", action="append", choices=sorted(SCREENS), help="screening (ripetibile)")
+    ap.add_argument("--page-size", type=int, default=company_list.DEFAULT_PAGE_SIZE)
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--indexes", action="store_true", help="crea prima gli indici di screening")
+    ap.add_argument("--check", action="store_true", help="solo EXPLAIN; exit 1 se uno screening scansiona info")
+    args = ap.parse_args()
+
+    if args.indexes:
+        company_list.ensure_indexes()
+
+    failures: List[str] = []
+    print(f"{'screening':<16} {'key':>26} {'rows':>7} {'filesort':>8}"
+          + ("" if args.check else f" │ {'no idx ms':>9} {'idx ms':>8} {'x':>5} {'no tot ms':>9}"))
+    with connection() as conn, conn.cursor() as cursor:
+        for name in args.screen or SCREENS:
+            query = dict(SCREENS[name], page_size=args.page_size)
+            sql, params, _ = company_list.build_screen_query(**query)
+
+            plan = _explain(cursor, sql, params)
+            filesort = "filesort" in str(plan.get("extra") or "").lower()
+            if plan.get("type") == "ALL":
+                failures.append(f"{name}: scansione completa di info (key={plan.get('key')})")
+
+            line = f"{name:<16} {plan.get('key')!s:>26} {plan.get('rows')!s:>7} {'sì' if filesort else 'no':>8}"
+            if not args.check:
+                plain_ms = _time(cursor, _without_indexes(sql), params, args.repeat)
+                index_ms = _time(cursor, sql, params, args.repeat)
+                page_sql, page_params, _ = company_list.build_screen_query(**query, with_total=False)
+                page_ms = _time(cursor, page_sql, page_params, args.repeat)
+                line += f" │ {plain_ms:>9.2f} {index_ms:>8.2f} {plain_ms / index_ms:>5.1f} {page_ms:>9.2f}"
+            print(line)
+
+        if not args.check:
+            _paginate(cursor, args.page_size)
+
+    if failures:
+        print("❌ Screening senza indice:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("✅ Tutti gli screening leggono un indice di info.")
+
+
+if __name__ == "__main__":
+    main()
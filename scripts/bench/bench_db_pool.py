@@ -0,0 +1,75 @@
+"""
+bench_db_pool.py
+
+Micro‑benchmark del pool di connessioni (`scripts/db/db_pool.py`): esegue
+la stessa query contro il MySQL locale (variabili MYSQL_* del .env) con e
+senza pool, a concorrenza crescente, e riporta query/s e latenza p50/p95.
+
+Senza pool ogni query paga connect + autenticazione + close, come facevano
+`value_query` e `avg_query` prima del pool.
+
+Uso
+---
+    $ python -m scripts.bench.bench_db_pool
+    $ python -m scripts.bench.bench_db_pool -n 2000 --concurrency 1,8,32 --symbol MSFT
+    $ python -m scripts.bench.bench_db_pool --sql "SELECT COUNT(*) FROM history"
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Sequence, Tuple
+
+from scripts.bench.load_test_async import _percentile
+from scripts.db import db_pool
+from scripts.db.value_query import build_value_query
+
+
+def _one(sql: str, params: Sequence[Any]) -> float:
+    """Una query: latenza in ms."""
+    t0 = time.perf_counter()
+    db_pool.fetch_one(sql, params)
+    return (time.perf_counter() - t0) * 1000
+
+
+def _run(sql: str, params: Sequence[Any], n: int, level: int) -> Tuple[float, List[float]]:
+    """n query con `level` thread: (query/s, latenze ms)."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        latencies = list(pool.map(lambda _: _one(sql, params), range(n)))
+    return n / (time.perf_counter() - started), latencies
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    ap.add_argument("-n", type=int, default=500, help="query per livello")
+    ap.add_argument("--concurrency", default="1,4,16")
+    ap.add_argument("--symbol", default="AAPL", help="azienda della query di default")
+    ap.add_argument("--sql", help="query alternativa (senza parametri)")
+    args = ap.parse_args()
+
+    if args.sql:
+        sql, params = args.sql, ()
+    else:
+        # stessa forma di una domanda numerica tipica ("net income di Apple")
+        sql, params = build_value_query({"company": args.symbol, "table": "financials",
+                                         "column": "Net_Income", "time_type": "latest"})
+
+    print(f"pool: size={db_pool.POOL_SIZE} overflow={db_pool.MAX_OVERFLOW} "
+          f"timeout={db_pool.POOL_TIMEOUT}s")
+    print(f"{'modo':>8} {'conc':>5} {'query/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for level in (int(c) for c in args.concurrency.split(",")):
+        for pooled in (False, True):
+            db_pool.POOL_ENABLED = pooled
+            _run(sql, params, min(args.n, 20), level)          # warm‑up (riempie il pool)
+            qps, latencies = _run(sql, params, args.n, level)
+            print(f"{'pool' if pooled else 'connect':>8} {level:>5} {qps:>9.1f} "
+                  f"{_percentile(latencies, 0.50):>8.2f} {_percentile(latencies, 0.95):>8.2f}")
+    print(db_pool.pool_status())
+    db_pool.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,595 @@
+"""
+bench_e2e.py
+
+Benchmark end‑to‑end di Mark: riesegue un set fisso di domande (numeriche,
+testuali, ibride, identità) attraverso `ask_mark.main` e misura latenza per
+stage e complessiva, token consumati, costo stimato e risposte al secondo.
+
+Ambiente riproducibile, senza rete né MySQL
+-------------------------------------------
+• **LLM** – risposte registrate in `fixtures/e2e_questions.json`, per
+  domanda e call site (`classify_question`, `answer_num_query`,
+  `parse_num_query`, `parse_avg_query`, `llm_wrapper`).  Il client OpenAI
+  di `llm_provider` viene sostituito da un client di replay, quindi retry,
+  metriche e tracing restano quelli reali.  I token prompt sono contati sui
+  messaggi effettivi (un prompt più lungo si vede subito), quelli di
+  completion sulla risposta registrata.  `--replay-latency` riproduce
+  anche la latenza registrata del provider.
+• **Embedding** – vettori deterministici dal testo (come lo stub OpenAI),
+  usati sia per l'indice sia per le query.
+• **FAISS** – indice piccolo costruito all'avvio da `fixtures/e2e_corpus.json`
+  (`MARK_INDEX_DIR`, `MARK_CHUNKS_DIR`).
+• **Database** – SQLite con lo schema di `METRIC_METADATA` e valori
+  pseudo‑casuali con seed fisso, al posto di `pymysql.connect`.
+
+Gli stage sono gli span di `scripts.tracing`.  Ogni esecuzione salva un JSON
+in `data/bench/e2e/` (commit git + dati) e lo confronta con il precedente,
+segnalando le regressioni oltre `--threshold`.
+
+Uso
+---
+    $ python -m scripts.bench.bench_e2e                      # replay, confronto con l'ultimo run
+    $ python -m scripts.bench.bench_e2e --repeat 10 --replay-latency
+    $ python -m scripts.bench.bench_e2e --baseline data/bench/e2e/<file>.json --fail-on-regression
+    $ python -m scripts.bench.bench_e2e --record             # ri‑registra le fixture con OpenAI
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+from scripts.bench.load_test_async import _percentile
+from scripts.bench.stub_openai_server import _call_site, _embedding, _reply
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+QUESTIONS_PATH = FIXTURES_DIR / "e2e_questions.json"
+CORPUS_PATH = FIXTURES_DIR / "e2e_corpus.json"
+RESULTS_DIR = ROOT_DIR / "data" / "bench" / "e2e"
+
+EMBED_DIM = 256
+SEED = 42
+YEARS = range(2014, 2025)
+
+_COMPANIES = [
+    ("AAPL", "Apple Inc.", "Apple Inc."),
+    ("MSFT", "Microsoft Corporation", "Microsoft Corporation"),
+    ("NVDA", "NVIDIA Corporation", "NVIDIA Corporation"),
+    ("KO", "Coca-Cola Company (The)", "The Coca-Cola Company"),
+    ("AMZN", "Amazon.com, Inc.", "Amazon.com, Inc."),
+]
+
+# Scala dei valori simulati per tipo di metrica (vedi number_format.metric_kind)
+_VALUE_RANGES = {
+    "percent": (0.005, 0.45),
+    "percent_points": (0.1, 12.0),
+    "ratio": (5.0, 45.0),
+    "per_share": (1.0, 350.0),
+    "count": (1e3, 5e6),
+    "money": (1e9, 4e11),
+    "number": (1.0, 1e4),
+    "date": (1.6e9, 1.75e9),
+    "text": (1.0, 1e4),
+}
+
+
+# --------------------------------------------------------------------------- #
+#  Database SQLite al posto di MySQL
+# --------------------------------------------------------------------------- #
+
+def _table_dates(table: str, time_field: Optional[str]) -> List[Optional[str]]:
+    if time_field is None:
+        return [None]
+    if table == "history":
+        return [f"{y}-{m:02d}-01" for y in YEARS for m in range(1, 13)]
+    if table == "dividends":
+        return [f"{y}-{m:02d}-15" for y in YEARS for m in (2, 5, 8, 11)]
+    return [f"{y}-12-31" for y in YEARS]
+
+
+def _seed_database(path: Path) -> None:
+    """Crea le tabelle di TABLE_METADATA con le colonne di METRIC_METADATA."""
+    from scripts.db.metric_metadata import METRIC_METADATA
+    from scripts.db.table_metadata import TABLE_METADATA
+    from scripts.number_format import metric_kind
+
+    columns: Dict[str, Dict[str, str]] = {t: {} for t in TABLE_METADATA}
+    for meta in METRIC_METADATA.values():
+        if meta.get("table") in columns:
+            columns[meta["table"]].setdefault(meta["column"].lower(), meta["column"])
+
+    conn = sqlite3.connect(path)
+    for table, meta in TABLE_METADATA.items():
+        time_field = meta.get("time_field")
+        cols = [c for k, c in columns[table].items()
+                if k not in {"company_id", "symbol", "shortname", "longname", (time_field or "").lower()}]
+        fixed = ["company_id INTEGER"]
+        if table == "info":
+            fixed += ["symbol TEXT", "shortName TEXT", "longName TEXT"]
+        if time_field:
+            fixed.append(f'"{time_field}" TEXT')
+        metric_cols = [f'"{c}" REAL' for c in cols]
+        conn.execute(f'CREATE TABLE "{table}" ({", ".join(fixed + metric_cols)})')
+
+        rows = []
+        for company_id, (symbol, short_name, long_name) in enumerate(_COMPANIES, 1):
+            for date in _table_dates(table, time_field):
+                rng = random.Random(f"{SEED}:{symbol}:{table}:{date}")
+                row: List[Any] = [company_id]
+                if table == "info":
+                    row += [symbol, short_name, long_name]
+                if time_field:
+                    row.append(date)
+                for col in cols:
+                    low, high = _VALUE_RANGES[metric_kind(table, col)]
+                    row.append(round(rng.uniform(low, high), 4))
+                rows.append(row)
+        conn.executemany(f'INSERT INTO "{table}" VALUES ({", ".join("?" * len(rows[0]))})', rows)
+    conn.commit()
+    conn.close()
+
+
+class _SqliteCursor:
+    """Cursore con l'interfaccia usata dai moduli SQL (pymysql)."""
+
+    def __init__(self, conn: sqlite3.Connection, latency_ms: float) -> None:
+        self._cursor = conn.cursor()
+        self._latency = latency_ms / 1000
+
+    def __enter__(self) -> "_SqliteCursor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._cursor.close()
+
+    def execute(self, sql: str, params: Any = ()) -> None:
+        if self._latency:
+            time.sleep(self._latency)
+        params = tuple(p.isoformat() if isinstance(p, (datetime.date, datetime.datetime)) else p
+                       for p in (params or ()))
+        self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def fetchone(self) -> Any:
+        return self._cursor.fetchone()
+
+    def fetchall(self) -> List[Any]:
+        return self._cursor.fetchall()
+
+
+class _SqliteConnection:
+    def __init__(self, path: Path, latency_ms: float) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._latency_ms = latency_ms
+
+    def cursor(self) -> _SqliteCursor:
+        return _SqliteCursor(self._conn, self._latency_ms)
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        self._conn.rollback()
+
+    def ping(self, reconnect: bool = False) -> None:
+        """Pre‑ping di `db_pool`: SQLite è sempre raggiungibile."""
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _patch_pymysql(path: Path, latency_ms: float) -> None:
+    import pymysql
+
+    pymysql.connect = lambda *args, **kwargs: _SqliteConnection(path, latency_ms)
+
+
+# --------------------------------------------------------------------------- #
+#  Indice FAISS ridotto
+# --------------------------------------------------------------------------- #
+
+def _build_index(index_dir: Path, chunks_dir: Path, dim: int) -> int:
+    import faiss
+    import numpy as np
+
+    with CORPUS_PATH.open(encoding="utf-8") as f:
+        corpus = json.load(f)["chunks"]
+    index_dir.mkdir(parents=True, exist_ok=True)
+    chunks_dir.mkdir(parents=True, exist_ok=True)
+
+    metadata = []
+    for chunk in corpus:
+        (chunks_dir / chunk["filename"]).write_text(chunk["text"], encoding="utf-8")
+        metadata.append({"filename": chunk["filename"], "length": len(chunk["text"]),
+                         "path": str(chunks_dir / chunk["filename"])})
+    vectors = np.asarray([_embedding(c["text"], dim) for c in corpus], dtype="float32")
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    faiss.write_index(index, str(index_dir / "company_index.faiss"))
+    with (index_dir / "metadata.json").open("w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False)
+    return len(corpus)
+
+
+# --------------------------------------------------------------------------- #
+#  Replay delle risposte LLM
+# --------------------------------------------------------------------------- #
+
+class _Fixtures:
+    """Risposte registrate per domanda (`current`) e call site."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open(encoding="utf-8") as f:
+            self.data = json.load(f)
+        self.by_id = {q["id"]: q for q in self.data["questions"]}
+        self.current: Optional[str] = None
+        self.misses: Dict[str, int] = {}
+
+    def lookup(self, site: str) -> Optional[Dict[str, Any]]:
+        entry = self.by_id.get(self.current, {}).get("llm", {}).get(site)
+        if entry is None:
+            key = f"{self.current}/{site}"
+            self.misses[key] = self.misses.get(key, 0) + 1
+        return entry
+
+    def record(self, site: str, entry: Dict[str, Any]) -> None:
+        self.by_id[self.current].setdefault("llm", {})[site] = entry
+
+    def save(self) -> None:
+        with self.path.open("w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+
+def _stream_chunks(content: str, usage: Any) -> Iterator[Any]:
+    for piece in re.findall(r"\S+\s*|\s+", content):
+        delta = SimpleNamespace(content=piece)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+    yield SimpleNamespace(choices=[], usage=usage)
+
+
+class _ReplayClient:
+    """Sostituto di `OpenAI` per `llm_provider.get_client()`."""
+
+    def __init__(self, fixtures: _Fixtures, replay_latency: bool, strict: bool, dim: int) -> None:
+        self.fixtures = fixtures
+        self.replay_latency = replay_latency
+        self.strict = strict
+        self.dim = dim
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    def with_options(self, **options: Any) -> "_ReplayClient":
+        return self
+
+    def _content(self, site: str, kwargs: Dict[str, Any]) -> str:
+        entry = self.fixtures.lookup(site)
+        if entry is None:
+            if self.strict:
+                raise KeyError(f"fixture mancante: {self.fixtures.current}/{site}")
+            return _reply(kwargs["messages"])
+        if self.replay_latency:
+            time.sleep(entry.get("latency_ms", 0) / 1000)
+        return entry["content"]
+
+    def _chat(self, **kwargs: Any) -> Any:
+        from scripts.tokens import count_tokens
+
+        messages = kwargs["messages"]
+        content = self._content(_call_site(messages), kwargs)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(count_tokens(m.get("content", "")) for m in messages),
+            completion_tokens=count_tokens(content),
+        )
+        if kwargs.get("stream"):
+            return _stream_chunks(content, usage)
+        message = SimpleNamespace(role="assistant", content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    def _embed(self, **kwargs: Any) -> Any:
+        from scripts.tokens import count_tokens
+
+        inputs = kwargs.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=_embedding(t, self.dim)) for t in inputs],
+            usage=SimpleNamespace(prompt_tokens=sum(map(count_tokens, inputs)), completion_tokens=0),
+        )
+
+
+class _RecordingClient(_ReplayClient):
+    """Chiama OpenAI per le chat e salva le risposte come nuove fixture."""
+
+    def __init__(self, real: Any, fixtures: _Fixtures, dim: int) -> None:
+        super().__init__(fixtures, replay_latency=False, strict=False, dim=dim)
+        self.real = real
+
+    def with_options(self, **options: Any) -> "_RecordingClient":
+        return _RecordingClient(self.real.with_options(**options), self.fixtures, self.dim)
+
+    def _content(self, site: str, kwargs: Dict[str, Any]) -> str:
+        started = time.perf_counter()
+        if kwargs.get("stream"):
+            request = {k: v for k, v in kwargs.items() if k not in {"stream", "stream_options"}}
+            response = self.real.chat.completions.create(**request)
+        else:
+            response = self.real.chat.completions.create(**kwargs)
+        content = response.choices[0].message.content
+        self.fixtures.record(site, {
+            "content": content,
+            "latency_ms": round((time.perf_counter() - started) * 1000),
+        })
+        return content
+
+
+# --------------------------------------------------------------------------- #
+#  Esecuzione e statistiche
+# --------------------------------------------------------------------------- #
+
+def _git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT_DIR, capture_output=True,
+                                  text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown",
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(_percentile(samples, 0.50), 2),
+        "p95_ms": round(_percentile(samples, 0.95), 2),
+        "mean_ms": round(statistics.fmean(samples), 2),
+    }
+
+
+def _run(questions: List[Dict[str, Any]], fixtures: _Fixtures, repeat: int, warmup: int,
+         explain: Optional[bool]) -> Dict[str, Any]:
+    from scripts import tracing
+    from scripts.ask_mark import main
+
+    sink = io.StringIO()
+    tracing.configure("jsonl", stream=sink)
+
+    runs: List[Dict[str, Any]] = []
+    wall = 0.0
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        for iteration in range(warmup + repeat):
+            for q in questions:
+                fixtures.current = q["id"]
+                sink.seek(0)
+                sink.truncate()
+                t0 = time.perf_counter()
+                answer = main(q["question"], explain=explain)
+                elapsed = time.perf_counter() - t0
+                if iteration < warmup:
+                    continue
+                wall += elapsed
+                runs.append({"question": q, "elapsed_ms": elapsed * 1000, "answer": answer,
+                             "spans": [json.loads(line) for line in sink.getvalue().splitlines()]})
+    tracing.configure("")
+    return {"runs": runs, "wall_s": wall}
+
+
+def _report(raw: Dict[str, Any], price_in: float, price_out: float) -> Dict[str, Any]:
+    runs = raw["runs"]
+    e2e = [r["elapsed_ms"] for r in runs]
+
+    categories: Dict[str, List[float]] = {}
+    stages: Dict[str, List[float]] = {}
+    per_question: Dict[str, Dict[str, Any]] = {}
+    prompt_total = completion_total = 0
+    for r in runs:
+        q = r["question"]
+        categories.setdefault(q["category"], []).append(r["elapsed_ms"])
+        prompt = sum(s["attributes"].get("prompt_tokens", 0) for s in r["spans"])
+        completion = sum(s["attributes"].get("completion_tokens", 0) for s in r["spans"])
+        prompt_total += prompt
+        completion_total += completion
+        for s in r["spans"]:
+            stages.setdefault(s["name"], []).append(s["duration_ms"])
+        entry = per_question.setdefault(q["id"], {"category": q["category"], "samples": []})
+        entry["samples"].append(r["elapsed_ms"])
+        entry.update(prompt_tokens=prompt, completion_tokens=completion,
+                     answer_sha1=hashlib.sha1(r["answer"].encode("utf-8")).hexdigest()[:12],
+                     answer=r["answer"][:200])
+
+    n = len(runs)
+    cost = (prompt_total * price_in + completion_total * price_out) / 1e6
+    return {
+        "e2e": {**_summary(e2e), "answers_per_s": round(n / raw["wall_s"], 2) if raw["wall_s"] else None},
+        "categories": {c: _summary(v) for c, v in sorted(categories.items())},
+        "stages": {
+            name: {"calls": len(v), **_summary(v), "total_ms": round(sum(v), 2)}
+            for name, v in sorted(stages.items(), key=lambda kv: -sum(kv[1]))
+        },
+        "tokens": {
+            "prompt_per_answer": round(prompt_total / n, 1),
+            "completion_per_answer": round(completion_total / n, 1),
+            "usd_per_1k_answers": round(cost / n * 1000, 4),
+        },
+        "questions": {
+            qid: {**{k: v for k, v in e.items() if k != "samples"}, **_summary(e["samples"])}
+            for qid, e in per_question.items()
+        },
+    }
+
+
+def _print_report(result: Dict[str, Any]) -> None:
+    e2e, tokens = result["e2e"], result["tokens"]
+    print(f"\nCommit {result['git']['commit']}{' (dirty)' if result['git']['dirty'] else ''} – "
+          f"{result['config']['answers']} risposte")
+    print(f"End‑to‑end   p50 {e2e['p50_ms']:>9.1f} ms   p95 {e2e['p95_ms']:>9.1f} ms   "
+          f"{e2e['answers_per_s']} risposte/s")
+    print(f"Token/risposta  prompt {tokens['prompt_per_answer']}  completion "
+          f"{tokens['completion_per_answer']}  (${tokens['usd_per_1k_answers']} / 1k risposte)")
+    print(f"\n{'categoria':<12} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, s in result["categories"].items():
+        print(f"{name:<12} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f}")
+    print(f"\n{'stage':<44} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'totale ms':>10}")
+    for name, s in result["stages"].items():
+        print(f"{name:<44} {s['calls']:>6} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['total_ms']:>10.1f}")
+    if result["fixture_misses"]:
+        print(f"\n⚠️ Fixture mancanti (risposta dello stub): {result['fixture_misses']}")
+
+
+def _latest_result(results_dir: Path, exclude: Optional[Path] = None) -> Optional[Path]:
+    files = sorted(p for p in results_dir.glob("*.json") if p != exclude)
+    return files[-1] if files else None
+
+
+def _compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Stampa le differenze e restituisce le regressioni oltre `threshold`."""
+    regressions: List[str] = []
+
+    def delta(label: str, new: Optional[float], old: Optional[float], higher_is_worse: bool = True) -> None:
+        if not new or not old:
+            return
+        change = (new - old) / old
+        worse = change > threshold if higher_is_worse else change < -threshold
+        flag = "  ⚠️" if worse else ""
+        print(f"  {label:<44} {old:>10.2f} → {new:>10.2f}  ({change:+.1%}){flag}")
+        if worse:
+            regressions.append(label)
+
+    print(f"\nConfronto con {baseline['git']['commit']} ({baseline['created']}):")
+    delta("e2e p50 ms", current["e2e"]["p50_ms"], baseline["e2e"]["p50_ms"])
+    delta("e2e p95 ms", current["e2e"]["p95_ms"], baseline["e2e"]["p95_ms"])
+    delta("risposte/s", current["e2e"]["answers_per_s"], baseline["e2e"]["answers_per_s"],
+          higher_is_worse=False)
+    delta("token prompt/risposta", current["tokens"]["prompt_per_answer"],
+          baseline["tokens"]["prompt_per_answer"])
+    delta("token completion/risposta", current["tokens"]["completion_per_answer"],
+          baseline["tokens"]["completion_per_answer"])
+    for name, s in current["stages"].items():
+        old = baseline["stages"].get(name)
+        if old:
+            delta(f"{name} p50 ms", s["p50_ms"], old["p50_ms"])
+
+    changed = [qid for qid, q in current["questions"].items()
+               if qid in baseline["questions"]
+               and q["answer_sha1"] != baseline["questions"][qid]["answer_sha1"]]
+    if changed:
+        print(f"  Risposte cambiate: {', '.join(changed)}")
+    return regressions
+
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark end‑to‑end di Mark con fixture registrate")
+    ap.add_argument("--repeat", type=int, default=5, help="ripetizioni misurate del set")
+    ap.add_argument("--warmup", type=int, default=1, help="ripetizioni iniziali non misurate")
+    ap.add_argument("--category", action="append",
+                    help="solo queste categorie (numerical, text, hybrid, identity)")
+    ap.add_argument("--explain", action="store_true", help="risposte numeriche spiegate dall'LLM")
+    ap.add_argument("--with-cache", action="store_true", help="lascia attiva la cache delle risposte")
+    ap.add_argument("--replay-latency", action="store_true", help="riproduce la latenza LLM registrata")
+    ap.add_argument("--db-latency-ms", type=float, default=0.0, help="latenza simulata per query SQL")
+    ap.add_argument("--strict", action="store_true", help="errore se manca una fixture (default: stub)")
+    ap.add_argument("--record", action="store_true", help="ri‑registra le fixture chat con OpenAI")
+    ap.add_argument("--price-in", type=float, default=2.50, help="USD per 1M token prompt")
+    ap.add_argument("--price-out", type=float, default=10.00, help="USD per 1M token completion")
+    ap.add_argument("--results-dir", type=Path, default=RESULTS_DIR)
+    ap.add_argument("--baseline", type=Path, help="risultato di confronto (default: l'ultimo salvato)")
+    ap.add_argument("--no-save", action="store_true")
+    ap.add_argument("--threshold", type=float, default=0.10, help="soglia di regressione (0.10 = +10%%)")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    # Ambiente isolato: va impostato prima di importare la pipeline
+    workdir = Path(tempfile.mkdtemp(prefix="mark-bench-"))
+    os.environ.update({
+        "MARK_INDEX_DIR": str(workdir / "index"),
+        "MARK_CHUNKS_DIR": str(workdir / "chunks"),
+        "MARK_VERSION_DIR": str(workdir / "table_versions"),
+    })
+    for key, value in (("MYSQL_USER", "bench"), ("MYSQL_PASSWORD", ""), ("MYSQL_HOST", "sqlite"),
+                       ("MYSQL_PORT", "0"), ("MYSQL_DB", "mark"), ("OPENAI_API_KEY", "replay")):
+        os.environ.setdefault(key, value)
+    if not args.with_cache:
+        os.environ["MARK_CACHE_MAX_ENTRIES"] = "0"
+
+    db_path = workdir / "mark.sqlite"
+    _seed_database(db_path)
+    _patch_pymysql(db_path, args.db_latency_ms)
+    n_chunks = _build_index(workdir / "index", workdir / "chunks", EMBED_DIM)
+
+    fixtures = _Fixtures(QUESTIONS_PATH)
+    from scripts import llm_provider
+
+    if args.record:
+        real = llm_provider.get_client()
+        client: _ReplayClient = _RecordingClient(real, fixtures, EMBED_DIM)
+    else:
+        client = _ReplayClient(fixtures, args.replay_latency, args.strict, EMBED_DIM)
+    llm_provider.get_client = lambda: client
+
+    questions = [q for q in fixtures.data["questions"]
+                 if not args.category or q["category"] in args.category]
+    if args.record:
+        # explain=True: registra anche le risposte LLM alle domande numeriche
+        _run(questions, fixtures, repeat=1, warmup=0, explain=True)
+        fixtures.save()
+        print(f"💾 Fixture aggiornate: {QUESTIONS_PATH}")
+        return 0
+
+    raw = _run(questions, fixtures, args.repeat, args.warmup, True if args.explain else None)
+    result = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_revision(),
+        "config": {
+            "answers": len(raw["runs"]), "questions": len(questions), "repeat": args.repeat,
+            "explain": args.explain, "with_cache": args.with_cache,
+            "replay_latency": args.replay_latency, "db_latency_ms": args.db_latency_ms,
+            "faiss_chunks": n_chunks, "python": sys.version.split()[0],
+        },
+        **_report(raw, args.price_in, args.price_out),
+        "fixture_misses": fixtures.misses,
+    }
+    _print_report(result)
+
+    saved = None
+    if not args.no_save:
+        args.results_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        saved = args.results_dir / f"{stamp}_{result['git']['commit']}.json"
+        with saved.open("w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Risultati salvati in {saved}")
+
+    baseline_path = args.baseline or _latest_result(args.results_dir, exclude=saved)
+    if baseline_path and baseline_path.exists():
+        with baseline_path.open(encoding="utf-8") as f:
+            regressions = _compare(result, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"\n❌ {len(regressions)} regressioni oltre il {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+bench_parse_prompts.py
+
+Micro‑benchmark della costruzione dei prompt di `parse_num_query` e
+`parse_avg_query`: confronta la versione senza cache (frammenti ricostruiti
+iterando `METRIC_METADATA` a ogni chiamata, come prima) con quella memoizzata.
+
+Con ``--live`` misura anche la latenza end‑to‑end del parsing chiamando
+davvero il modello (richiede OPENAI_API_KEY).
+
+Uso
+---
+    $ python -m scripts.bench.bench_parse_prompts -n 200
+    $ python -m scripts.bench.bench_parse_prompts --live "Net income di Apple nel 2023"
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from datetime import datetime
+from typing import Callable, List
+
+from scripts.db import parse_avg_query, parse_num_query
+
+
+def _timeit(fn: Callable[[], object], n: int) -> List[float]:
+    """Esegue `fn` n volte e restituisce le durate in millisecondi."""
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def _report(label: str, samples: List[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) > 1 else samples[0]
+    print(f"{label:<38} mean={statistics.mean(samples):8.3f} ms  "
+          f"p50={statistics.median(samples):8.3f} ms  p95={p95:8.3f} ms")
+
+
+def _num_prompt_uncached() -> str:
+    """Ricostruisce il prompt numerico da zero (comportamento pre‑cache)."""
+    parse_num_query.build_metric_options_string.__wrapped__()
+    parse_num_query.build_table_time_mapping.__wrapped__()
+    return parse_num_query.build_system_prompt.__wrapped__()
+
+
+def _avg_prompt_uncached() -> str:
+    """Ricostruisce il prompt delle medie da zero (comportamento pre‑cache)."""
+    parse_avg_query.build_metric_prompt.__wrapped__()
+    return parse_avg_query.build_system_prompt.__wrapped__(datetime.now().year)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("-n", type=int, default=200, help="iterazioni per misura")
+    ap.add_argument("--live", nargs="*", metavar="QUESTION",
+                    help="domande da parsare davvero con il modello")
+    args = ap.parse_args()
+
+    question = "Qual è il net income di Apple nel 2023?"
+    _report("parse_num prompt (uncached)", _timeit(_num_prompt_uncached, args.n))
+    _report("parse_num prompt (cached)",
+            _timeit(lambda: parse_num_query.build_messages(question), args.n))
+    _report("parse_avg prompt (uncached)", _timeit(_avg_prompt_uncached, args.n))
+    _report("parse_avg prompt (cached)",
+            _timeit(lambda: parse_avg_query.build_messages(question), args.n))
+
+    prefix = parse_num_query.build_system_prompt()
+    print(f"\nPrefisso statico parse_num: {len(prefix):,} caratteri "
+          f"(stabile: {prefix is parse_num_query.build_system_prompt()})")
+
+    for q in args.live or []:
+        _report(f"live parse_num ({q[:20]}…)",
+                _timeit(lambda: parse_num_query.parse_numerical_question(q), 1))
+        _report(f"live parse_avg ({q[:20]}…)",
+                _timeit(lambda: parse_avg_query.parse_avg_question(q), 1))
+
+
+if __name__ == "__main__":
+    main()
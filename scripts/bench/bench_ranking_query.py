@@ -0,0 +1,98 @@
+"""
+bench_ranking_query.py
+
+Classifiche di `scripts/db/ranking_query.py` sul MySQL locale: per alcune
+metriche confronta la lettura dalla tabella materializzata `metric_rankings`
+con il calcolo dal vivo sulla tabella sorgente.
+
+1. **EXPLAIN** – la query materializzata deve usare uno degli indici
+   `ix_rank*` senza filesort; con `--check` esce con codice 1 se non è così.
+2. **Benchmark** – tempo medio (ms) delle due forme.
+
+Le classifiche vanno materializzate prima (`--refresh` lo fa per le tabelle
+cambiate).
+
+Uso
+---
+    $ python -m scripts.bench.bench_ranking_query --refresh
+    $ python -m scripts.bench.bench_ranking_query --check
+    $ python -m scripts.bench.bench_ranking_query --metric close --sector Technology --repeat 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Sequence
+
+from scripts.db import ranking_query
+from scripts.db.db_pool import connection
+
+DEFAULT_METRICS = ("returnonequity", "marketcap", "total_revenue", "close")
+
+
+def _explain(cursor: Any, sql: str, params: Sequence[Any]) -> Dict[str, Any]:
+    cursor.execute("EXPLAIN " + sql, params)
+    names = [d[0].lower() for d in cursor.description]
+    return dict(zip(names, cursor.fetchone()))
+
+
+def _time(cursor: Any, sql: str, params: Sequence[Any], repeat: int) -> float:
+    """Tempo medio (ms) della query."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.fmean(samples)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    ap.add_argument("--metric", action="append", help="metrica (ripetibile)")
+    ap.add_argument("--sector")
+    ap.add_argument("--period", default="latest")
+    ap.add_argument("-n", type=int, default=10)
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--refresh", action="store_true", help="materializza prima le classifiche")
+    ap.add_argument("--check", action="store_true", help="solo EXPLAIN; exit 1 se l'indice non è usato")
+    args = ap.parse_args()
+
+    if args.refresh:
+        ranking_query.refresh_rankings()
+
+    failures: List[str] = []
+    print(f"{'metrica':<16} {'key':>18} {'extra':>24}"
+          + ("" if args.check else f" │ {'live ms':>9} {'tabella ms':>10} {'x':>7}"))
+    with connection() as conn, conn.cursor() as cursor:
+        for metric in args.metric or DEFAULT_METRICS:
+            query = (metric, args.n, "desc", args.sector, None, args.period)
+            sql, params, request = ranking_query.build_ranking_query(*query)
+            if request["source"] != "materialized":
+                failures.append(f"{metric}: classifica non materializzata (eseguire --refresh)")
+                continue
+            live_sql, live_params, _ = ranking_query.build_ranking_query(*query, live=True)
+
+            plan = _explain(cursor, sql, params)
+            extra = str(plan.get("extra") or "")
+            if not str(plan.get("key") or "").startswith("ix_rank") or "filesort" in extra.lower():
+                failures.append(f"{metric}: key={plan.get('key')} extra={extra}")
+
+            line = f"{metric:<16} {plan.get('key')!s:>18} {extra[:24]:>24}"
+            if not args.check:
+                live_ms = _time(cursor, live_sql, live_params, max(1, args.repeat // 5))
+                table_ms = _time(cursor, sql, params, args.repeat)
+                line += f" │ {live_ms:>9.1f} {table_ms:>10.2f} {live_ms / table_ms:>7.0f}"
+            print(line)
+
+    if failures:
+        print("❌ Classifiche non servite dall'indice:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("✅ Tutte le classifiche leggono l'indice ix_rank* già ordinato.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+load_test_async.py
+
+Load test della pipeline async (`ask_mark.main_async`): per ogni livello di
+concorrenza esegue N domande e riporta throughput e latenza p50/p95/p99.
+
+Pensato per girare contro stub locali:
+• `--start-stub` avvia in‑process lo stub OpenAI
+  (`scripts.bench.stub_openai_server`) e vi punta `OPENAI_BASE_URL`;
+• `--db-latency-ms` sostituisce la query MySQL async con un'attesa
+  simulata che restituisce un valore fisso (nessun database richiesto).
+
+La cache delle risposte è disattivata di default, altrimenti dalla seconda
+ripetizione in poi si misurerebbe solo la cache (`--with-cache` per tenerla).
+
+Uso
+---
+    $ python -m scripts.bench.load_test_async --start-stub --stub-latency-ms 200 \\
+          --db-latency-ms 5 --concurrency 1,4,16,64 -n 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from typing import Any, List, Sequence, Tuple
+
+_DEFAULT_QUESTIONS = [
+    "Qual è il net income di Apple nel 2023?",
+    "What was Microsoft's total revenue in 2022?",
+    "Average close price of NVDA between 2019 and 2023",
+    "Dividend yield di Coca-Cola",
+    "Total debt of Amazon in 2021",
+]
+
+
+def _percentile(samples: Sequence[float], q: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def _start_stub(port: int, latency_ms: float, token_ms: float) -> ThreadingHTTPServer:
+    from scripts.bench.stub_openai_server import _Handler
+
+    _Handler.latency_ms = latency_ms
+    _Handler.token_ms = token_ms
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    return server
+
+
+def _stub_database(latency_ms: float) -> None:
+    """Sostituisce `fetch_one` nei moduli SQL con un'attesa simulata."""
+    from scripts.db import avg_query, value_query
+
+    async def fake_fetch_one(sql: str, params: Sequence[Any] = ()) -> Tuple[float]:
+        await asyncio.sleep(latency_ms / 1000)
+        return (42.0,)
+
+    value_query.fetch_one = fake_fetch_one
+    avg_query.fetch_one = fake_fetch_one
+
+
+async def _run_level(questions: List[str], n: int, concurrency: int) -> Tuple[List[float], int, float]:
+    from scripts.ask_mark import main_async
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                answer = await main_async(questions[i % len(questions)])
+                if answer.startswith("(Errore LLM)"):
+                    errors += 1
+            except Exception:  # noqa: BLE001
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    ap.add_argument("-n", type=int, default=100, help="domande per livello di concorrenza")
+    ap.add_argument("--concurrency", default="1,4,16,64", help="livelli separati da virgola")
+    ap.add_argument("--questions", help="file con una domanda per riga")
+    ap.add_argument("--start-stub", action="store_true", help="avvia lo stub OpenAI in‑process")
+    ap.add_argument("--stub-port", type=int, default=8089)
+    ap.add_argument("--stub-latency-ms", type=float, default=200.0)
+    ap.add_argument("--stub-token-ms", type=float, default=0.0)
+    ap.add_argument("--db-latency-ms", type=float, help="simula MySQL con questa latenza")
+    ap.add_argument("--with-cache", action="store_true", help="lascia attiva la cache risposte")
+    args = ap.parse_args()
+
+    if args.start_stub:
+        _start_stub(args.stub_port, args.stub_latency_ms, args.stub_token_ms)
+    if args.db_latency_ms is not None:
+        _stub_database(args.db_latency_ms)
+    if not args.with_cache:
+        from scripts.answer_cache import get_answer_cache
+        get_answer_cache().max_entries = 0
+
+    questions = _DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    print(f"{'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'err':>5}")
+    for level in (int(c) for c in args.concurrency.split(",")):
+        latencies, errors, elapsed = asyncio.run(_run_level(questions, args.n, level))
+        print(f"{level:>5} {args.n / elapsed:>8.1f} "
+              f"{_percentile(latencies, 0.50):>9.1f} {_percentile(latencies, 0.95):>9.1f} "
+              f"{_percentile(latencies, 0.99):>9.1f} {statistics.mean(latencies):>9.1f} {errors:>5}")
+
+
+if __name__ == "__main__":
+    main()
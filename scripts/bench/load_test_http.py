@@ -0,0 +1,88 @@
+"""
+load_test_http.py
+
+Load generator per il server API di Mark (`web/mark_api_server.py`): a
+concorrenza crescente invia N richieste a `/ask` (o `/ask/stream`) e
+riporta throughput, latenza p50/p95/p99 e, per lo streaming, il
+time‑to‑first‑byte.
+
+Uso
+---
+    $ python -m scripts.bench.load_test_http --url http://127.0.0.1:8000 \\
+          --concurrency 1,4,16,64 -n 200
+    $ python -m scripts.bench.load_test_http --stream
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from scripts.bench.load_test_async import _DEFAULT_QUESTIONS, _percentile
+
+
+def _one(url: str, question: str, stream: bool, timeout: float) -> Tuple[float, Optional[float], bool]:
+    """Una richiesta: (latenza ms, ttfb ms | None, ok)."""
+    body = json.dumps({"question": question}).encode("utf-8")
+    req = urllib.request.Request(
+        url + ("/ask/stream" if stream else "/ask"),
+        data=body,
+        headers={"Content-Type": "application/json"},
+    )
+    t0 = time.perf_counter()
+    ttfb = None
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            if stream:
+                first = resp.read(1)
+                ttfb = (time.perf_counter() - t0) * 1000
+                ok = bool(first)
+                resp.read()
+            else:
+                ok = "answer" in json.loads(resp.read())
+    except Exception:  # noqa: BLE001
+        ok = False
+    return (time.perf_counter() - t0) * 1000, ttfb, ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("-n", type=int, default=100, help="richieste per livello")
+    ap.add_argument("--concurrency", default="1,4,16,64")
+    ap.add_argument("--questions", help="file con una domanda per riga")
+    ap.add_argument("--stream", action="store_true", help="usa /ask/stream")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    args = ap.parse_args()
+
+    questions = _DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    print(f"{'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'ttfb p50':>9} {'err':>5}")
+    for level in (int(c) for c in args.concurrency.split(",")):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            results = list(pool.map(
+                lambda i: _one(args.url, questions[i % len(questions)], args.stream, args.timeout),
+                range(args.n),
+            ))
+        elapsed = time.perf_counter() - started
+        latencies: List[float] = [r[0] for r in results]
+        ttfbs = [r[1] for r in results if r[1] is not None]
+        errors = sum(not r[2] for r in results)
+        ttfb = f"{statistics.median(ttfbs):>9.1f}" if ttfbs else f"{'-':>9}"
+        print(f"{level:>5} {args.n / elapsed:>8.1f} {_percentile(latencies, 0.50):>9.1f} "
+              f"{_percentile(latencies, 0.95):>9.1f} {_percentile(latencies, 0.99):>9.1f} "
+              f"{ttfb} {errors:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+stub_openai_server.py
+
+Server locale compatibile con l'API OpenAI, per eseguire e misurare l'intera
+pipeline di Mark senza rete né costi.
+
+Endpoint
+--------
+POST /v1/chat/completions   (anche stream=True, in Server‑Sent Events)
+POST /v1/embeddings         (vettori deterministici dal testo)
+
+Le risposte chat imitano i call site di Mark riconoscendone il prompt:
+classificazione, scelta value/avg, parsing (riusando il parser
+deterministico) e risposta finale.  La latenza è configurabile per simulare
+il provider reale.
+
+Uso
+---
+    $ python -m scripts.bench.stub_openai_server --port 8089 --latency-ms 300
+    $ OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub \\
+          python -m scripts.ask_mark "Qual è il net income di Apple nel 2023?"
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from scripts.db.fast_parse_num_query import fast_parse_numerical_question
+
+_TEXT_HINTS = ("risk", "rischi", "strategy", "strategia", "why", "perché", "describe",
+               "descrivi", "explain", "spiega", "10-k", "10-q", "management")
+_NUM_HINTS = ("how much", "quanto", "value", "valore", "revenue", "ricavi", "income",
+              "utile", "price", "prezzo", "debt", "debito", "margin", "average", "media")
+
+_ANSWER_TEXT = (
+    "Based on the data provided, the figure reflects the company's reported results "
+    "for the period and is consistent with the trend disclosed in its SEC filings."
+)
+
+
+# --------------------------------------------------------------------------- #
+#  Risposte simulate
+# --------------------------------------------------------------------------- #
+
+def _question(messages: List[Dict[str, str]]) -> str:
+    """Ultimo messaggio utente, senza i preamboli dei prompt di parsing."""
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    for marker in ('"""', '"'):
+        if user.count(marker) >= 2:
+            return user.split(marker)[1]
+    return user
+
+
+def _classify(question: str) -> str:
+    q = question.lower()
+    text = any(h in q for h in _TEXT_HINTS)
+    num = any(h in q for h in _NUM_HINTS) or any(c.isdigit() for c in q)
+    label = "hybrid" if text and num else "text" if text else "numerical"
+    return json.dumps({"type": label})
+
+
+def _parse(question: str, average: bool) -> str:
+    parsed = fast_parse_numerical_question(question) or {
+        "company": "AAPL", "table": "financials", "column": "Net_Income",
+        "time_type": "latest", "time_value": None,
+    }
+    if not average:
+        return json.dumps({k: parsed.get(k) for k in ("company", "table", "column",
+                                                      "time_type", "time_value")})
+    year = datetime.now().year
+    value = parsed.get("time_value")
+    if parsed.get("time_type") == "year":
+        period = [str(value)]
+    elif parsed.get("time_type") == "range" and isinstance(value, dict):
+        period = [str(y) for y in range(int(str(value["from"])[:4]), int(str(value["to"])[:4]) + 1)]
+    else:
+        period = [str(y) for y in range(year - 5, year)]
+    return repr({"company": parsed["company"], "table": parsed["table"],
+                 "column": parsed["column"], "period": period})
+
+
+def _call_site(messages: List[Dict[str, str]]) -> str:
+    """Call site di Mark (nome usato da `llm_provider`) riconosciuto dal prompt."""
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    first_user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+    if "Your ONLY task is to decide" in system:
+        return "classify_question"
+    if "answer_value_query" in system:
+        return "answer_num_query"
+    if first_user.startswith("Domanda dell'utente"):
+        return "parse_num_query"
+    if first_user.startswith("L'utente ha fatto la seguente domanda"):
+        return "parse_avg_query"
+    if "time_field" in first_user:
+        return "generate_table_metadata"
+    if '"description"' in first_user:
+        return "generate_metric_metadata"
+    return "llm_wrapper"
+
+
+def _reply(messages: List[Dict[str, str]]) -> str:
+    """Sceglie la risposta in base al call site riconosciuto dal prompt."""
+    site = _call_site(messages)
+    question = _question(messages)
+    if site == "classify_question":
+        return _classify(question)
+    if site == "answer_num_query":
+        avg = any(w in question.lower() for w in ("media", "average", "mean"))
+        return "answer_avg_query" if avg else "answer_value_query"
+    if site == "parse_num_query":
+        return _parse(question, average=False)
+    if site == "parse_avg_query":
+        return _parse(question, average=True)
+    if site == "generate_table_metadata":
+        return '{"time_field": None, "time_type": "none"}'
+    if site == "generate_metric_metadata":
+        return '{"description": "Stub description."}'
+    return _ANSWER_TEXT
+
+
+def _embedding(text: str, dim: int) -> List[float]:
+    """Vettore unitario pseudo‑casuale ma deterministico per `text`."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text.split()))
+
+
+# --------------------------------------------------------------------------- #
+#  HTTP
+# --------------------------------------------------------------------------- #
+
+class _Handler(BaseHTTPRequestHandler):
+    latency_ms: float = 0.0
+    token_ms: float = 0.0
+    embed_dim: int = 1536
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args: Any) -> None:  # silenzioso
+        pass
+
+    def _send_json(self, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length", 0))
+        req = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.latency_ms / 1000)
+
+        if self.path.endswith("/embeddings"):
+            inputs = req.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            dim = int(req.get("dimensions") or self.embed_dim)
+            self._send_json({
+                "object": "list",
+                "model": req.get("model", "stub"),
+                "data": [{"object": "embedding", "index": i, "embedding": _embedding(t, dim)}
+                         for i, t in enumerate(inputs)],
+                "usage": {"prompt_tokens": sum(map(_tokens, inputs)),
+                          "total_tokens": sum(map(_tokens, inputs))},
+            })
+            return
+
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        messages = req.get("messages", [])
+        content = _reply(messages)
+        usage = {
+            "prompt_tokens": sum(_tokens(m.get("content", "")) for m in messages),
+            "completion_tokens": _tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": req.get("model", "stub")}
+
+        if not req.get("stream"):
+            self._send_json({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def emit(payload: Dict[str, Any] | str) -> None:
+            line = payload if isinstance(payload, str) else json.dumps(payload)
+            data = f"data: {line}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        chunk = {**base, "object": "chat.completion.chunk"}
+        emit({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}}]})
+        for word in content.split(" "):
+            time.sleep(self.token_ms / 1000)
+            emit({**chunk, "choices": [{"index": 0, "delta": {"content": word + " "}}]})
+        emit({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (req.get("stream_options") or {}).get("include_usage"):
+            emit({**chunk, "choices": [], "usage": usage})
+        emit("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="ritardo per richiesta")
+    ap.add_argument("--token-ms", type=float, default=0.0, help="ritardo per token in streaming")
+    ap.add_argument("--embed-dim", type=int, default=1536, help="dimensione degli embedding")
+    args = ap.parse_args()
+
+    _Handler.latency_ms = args.latency_ms
+    _Handler.token_ms = args.token_ms
+    _Handler.embed_dim = args.embed_dim
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    print(f"🧪 Stub OpenAI in ascolto su http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,15 @@
 """
 classify_question.py
 
-Classifies an incoming user question as 'numerical', 'text', or 'hybrid'
-and routes it to the appropriate answer module.
+Classifies an incoming user question as 'numerical', 'comparison',
+'screen', 'text', or 'hybrid' and routes it to the appropriate answer module.
+Comparison / screen questions that cannot be parsed fall back to the
+numerical branch.
 
 Returned object schema
 ----------------------
 {
-    "type": "<numerical | text | hybrid>",
+    "type": "<numerical | comparison | screen | text | hybrid>",
     "result": {
         # for numerical
         "result": ...,
@@ -19,6 +21,9 @@ Returned object schema
         "period": ...,
         "function_used": ...,
 
+        # for comparison: `comaparison_query.compare` output
+        # for screen: `company_list.screen` output
+
         # for text
         "chunks": [...],
         "source_docs": [...],
@@ -32,21 +37,22 @@ Returned object schema
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import sys
-from typing import Dict, Any
-
-from dotenv import load_dotenv
-import os
-from openai import OpenAI         # ← nuova API
+from typing import Any, Callable, Dict, Optional
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from .llm_provider import achat, chat   # client OpenAI condiviso (pool, retry, timeout)
+from .tracing import annotate, traced
 
 # Local imports (package‑relative)
 from .answer_num_query import answer_question as answer_num_question
+from .answer_num_query import answer_question_async as answer_num_question_async
 from .answer_text_query import answer_question as answer_text_question
+from .answer_text_query import answer_question_async as answer_text_question_async
+from .db.comaparison_query import answer_comparison_question, answer_comparison_question_async
+from .db.company_list import answer_screen_question, answer_screen_question_async
 
 # --------------------------------------------------------------------------- #
 #  Configuration
@@ -64,10 +70,14 @@ _SYSTEM_PROMPT = (
     "You are an assistant that receives a user's financial question. "
     "Your ONLY task is to decide whether the question requires:\n"
     "• A **numerical** answer that must be fetched from a SQL database (label: numerical)\n"
+    "• A side‑by‑side **comparison** of one or more metrics across several named "
+    "companies (label: comparison)\n"
+    "• A **list of companies** matching criteria such as sector, market cap or "
+    "dividend yield, i.e. a stock screen (label: screen)\n"
     "• A **textual** answer that must be found in SEC filings such as 10‑K, 10‑Q (label: text)\n"
     "• **Both** a numerical value **and** textual context from SEC filings (label: hybrid)\n\n"
     "Respond ONLY with a JSON dictionary having exactly one key 'type' whose value "
-    "is either 'numerical', 'text', or 'hybrid'.\n"
+    "is one of 'numerical', 'comparison', 'screen', 'text', or 'hybrid'.\n"
     "Output example: {\"type\": \"numerical\"}\n\n"
     "Do NOT add any other keys. Do NOT add explanations."
 )
@@ -77,10 +87,42 @@ _SYSTEM_PROMPT = (
 #  Core function
 # --------------------------------------------------------------------------- #
 
+def _classify_request(question: str) -> Dict[str, Any]:
+    """ChatCompletion arguments for the classification prompt."""
+    return {
+        "model": MODEL_NAME,
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS,
+        "messages": [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "user", "content": question.strip()}
+        ],
+    }
+
+
+_LABELS = {"numerical", "comparison", "screen", "text", "hybrid"}
+
+# Labels answered by a dedicated engine: (sync, async) question → payload
+_ENGINES = {
+    "comparison": (answer_comparison_question, answer_comparison_question_async),
+    "screen": (answer_screen_question, answer_screen_question_async),
+}
+
+
+def _interpret_label(raw_content: str) -> str:
+    """Parse the model output into one of `_LABELS`."""
+    prediction: Dict[str, str] = json.loads(raw_content.strip())
+    label = prediction.get("type", "").lower()
+    if label not in _LABELS:
+        raise ValueError(f"Invalid label '{label}' returned by model.")
+    return label
+
+
+@traced()
 def _classify(question: str) -> str:
     """
     Runs the classification prompt and returns one of:
-    'numerical', 'text', or 'hybrid'.
+    'numerical', 'comparison', 'screen', 'text', or 'hybrid'.
 
     Parameters
     ----------
@@ -93,29 +135,30 @@ def _classify(question: str) -> str:
         The label predicted by the model.
     """
     try:
-        msgs = [
-            {"role": "system", "content": _SYSTEM_PROMPT},
-            {"role": "user", "content": question.strip()}
-        ]
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            messages=msgs
-        )
-        raw_content: str = response.choices[0].message.content.strip()
-        prediction: Dict[str, str] = json.loads(raw_content)
-        label = prediction.get("type", "").lower()
-        if label not in {"numerical", "text", "hybrid"}:
-            raise ValueError(f"Invalid label '{label}' returned by model.")
-        return label
+        response = chat("classify", site="classify_question", **_classify_request(question))
+        return _interpret_label(response.choices[0].message.content)
     except Exception as exc:  # noqa: BLE001
         logging.error("❌ Classification failed: %s", exc, exc_info=True)
         # Fallback to 'text' so we at least try retrieval
         return "text"
 
 
-def classify_question(question: str) -> Dict[str, Any]:
+@traced("classify_question._classify")
+async def _classify_async(question: str) -> str:
+    """Async twin of `_classify` (same prompt, same fallback)."""
+    try:
+        response = await achat("classify", site="classify_question", **_classify_request(question))
+        return _interpret_label(response.choices[0].message.content)
+    except Exception as exc:  # noqa: BLE001
+        logging.error("❌ Classification failed: %s", exc, exc_info=True)
+        return "text"
+
+
+@traced()
+def classify_question(
+    question: str,
+    on_stage: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
     """
     Classify the question and route it to the appropriate answer module.
 
@@ -123,14 +166,29 @@ def classify_question(question: str) -> Dict[str, Any]:
     ----------
     question : str
         The user question.
+    on_stage : callable | None
+        Progress hook: called with 'classify', then with the label once
+        data retrieval for that branch starts.
 
     Returns
     -------
     dict
         Structured result ready for downstream processing.
     """
+    if on_stage:
+        on_stage("classify")
     label = _classify(question)
     print(f"📊 Classificazione della domanda: {label}")
+    annotate(label=label)
+    if on_stage:
+        on_stage(label)
+
+    if label in _ENGINES:
+        try:
+            return {"type": label, "result": _ENGINES[label][0](question)}
+        except ValueError as exc:
+            logging.warning("⚠️ %s non risolto (%s): ripiego sul numerico", label, exc)
+            label = "numerical"
 
     if label == "numerical":
         numerical_result = answer_num_question(question)
@@ -154,6 +212,43 @@ def classify_question(question: str) -> Dict[str, Any]:
     }
 
 
+@traced("classify_question.classify_question")
+async def classify_question_async(question: str) -> Dict[str, Any]:
+    """
+    Async version of `classify_question`: same output schema.  For hybrid
+    questions the numerical and textual branches run concurrently.
+    """
+    label = await _classify_async(question)
+    print(f"📊 Classificazione della domanda: {label}")
+    annotate(label=label)
+
+    if label in _ENGINES:
+        try:
+            return {"type": label, "result": await _ENGINES[label][1](question)}
+        except ValueError as exc:
+            logging.warning("⚠️ %s non risolto (%s): ripiego sul numerico", label, exc)
+            label = "numerical"
+
+    if label == "numerical":
+        return {"type": "numerical", "result": await answer_num_question_async(question)}
+
+    if label == "text":
+        return {"type": "text", "result": await answer_text_question_async(question)}
+
+    numerical_result, text_result = await asyncio.gather(
+        answer_num_question_async(question),
+        answer_text_question_async(question),
+    )
+    print("🔀 Esecuzione combinata: numerico + testuale")
+    return {
+        "type": "hybrid",
+        "result": {
+            "numerical": numerical_result,
+            "text": text_result,
+        },
+    }
+
+
 # --------------------------------------------------------------------------- #
 #  CLI helper
 # --------------------------------------------------------------------------- #
@@ -0,0 +1,261 @@
+"""
+aggregate_query.py
+
+Aggregati di una metrica nel tempo per un'azienda: media, minimo, massimo,
+somma, conteggio, mediana, deviazione standard, percentili, primo / ultimo
+valore e CAGR, su qualsiasi tabella con campo temporale in `TABLE_METADATA`.
+
+• avg, min, max, sum, count, stddev → calcolati in SQL (una sola riga)
+• median, pNN, first, last, cagr    → una colonna (data, valore) letta con
+  una query e ridotta con NumPy (MySQL non ha MEDIAN / PERCENTILE_CONT)
+
+Il periodo segue lo schema di `parse_avg_query` (`period`: lista di anni,
+"latest" = tutti i dati disponibili) e diventa BETWEEN sargabili come in
+`avg_query`.
+
+Input
+-----
+{
+    "company":   "NVDA",
+    "table":     "history",
+    "column":    "close",
+    "period":    ["2021"],
+    "aggregate": "max"          # vedi AGGREGATES; default "avg"
+}
+
+API pubblico
+------------
+AGGREGATES                              nomi supportati (più "p1"…"p99")
+normalize_aggregate(name)  -> str | None    'massimo' → 'max', '90th percentile' → 'p90'
+detect_aggregate(question) -> str | None    parole chiave non ambigue nella domanda
+build_aggregate_query(parsed) -> (sql, params, mode) | None
+answer_aggregate_query(parsed) / answer_aggregate_query_async(parsed)
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .async_db import fetch_all as fetch_all_async
+from .async_db import fetch_one as fetch_one_async
+from .avg_query import _period_clause
+from .company_ids import get_company_id
+from .db_pool import fetch_all, fetch_one
+from .table_metadata import TABLE_METADATA
+from ..tracing import annotate, traced
+
+__all__ = [
+    "AGGREGATES",
+    "normalize_aggregate",
+    "detect_aggregate",
+    "build_aggregate_query",
+    "answer_aggregate_query",
+    "answer_aggregate_query_async",
+]
+
+# Aggregati calcolati direttamente da MySQL
+_SQL_AGGREGATES = {
+    "avg": "AVG({column})",
+    "min": "MIN({column})",
+    "max": "MAX({column})",
+    "sum": "SUM({column})",
+    "count": "COUNT({column})",
+    "stddev": "STDDEV_SAMP({column})",
+}
+# Aggregati calcolati con NumPy sulla serie ordinata per data
+_SERIES_AGGREGATES = ("median", "first", "last", "cagr")
+
+AGGREGATES = tuple(_SQL_AGGREGATES) + _SERIES_AGGREGATES
+
+_ALIASES = {
+    "average": "avg", "mean": "avg", "media": "avg", "medio": "avg",
+    "minimum": "min", "minimo": "min", "lowest": "min",
+    "maximum": "max", "massimo": "max", "highest": "max",
+    "total": "sum", "totale": "sum", "somma": "sum",
+    "conteggio": "count", "numero": "count",
+    "mediana": "median",
+    "std": "stddev", "standard deviation": "stddev", "deviazione standard": "stddev",
+    "primo": "first", "ultimo": "last",
+    "compound annual growth rate": "cagr", "crescita annua composta": "cagr",
+}
+
+_RE_PERCENTILE = re.compile(r"^(?:p|percentile\s*)(\d{1,2})$|^(\d{1,2})\s*(?:th|st|nd|rd|°|º)?\s*percentile$")
+
+# Solo parole che non compaiono nei nomi delle metriche ("total revenue",
+# "last 5 years" non devono cambiare l'aggregato)
+_DETECT = [
+    ("cagr", re.compile(r"\bcagr\b|compound annual growth|crescita (?:media )?annua composta")),
+    ("percentile", re.compile(r"\b(\d{1,2})\s*(?:th|st|nd|rd|°|º)?\s*percentile\b|\bpercentile\s*(\d{1,2})\b")),
+    ("median", re.compile(r"\bmedian[ao]?\b")),
+    ("stddev", re.compile(r"\bstandard deviation\b|\bdeviazione standard\b|\bstd ?dev\b")),
+    ("max", re.compile(r"\bmassim[oa]\b|\bmaximum\b|\bhighest\b|\bpiù alt[oa]\b|\bmax\b")),
+    ("min", re.compile(r"\bminim[oa]\b|\bminimum\b|\blowest\b|\bpiù bass[oa]\b|\bmin\b")),
+    ("sum", re.compile(r"\bsomma\b|\bsum of\b|\bcumulat[oaie]\w*\b|\bcumulative\b")),
+]
+
+
+def normalize_aggregate(name: Any) -> Optional[str]:
+    """Nome canonico dell'aggregato, None se non riconosciuto."""
+    if not name:
+        return None
+    text = str(name).strip().lower()
+    if text in AGGREGATES:
+        return text
+    if text in _ALIASES:
+        return _ALIASES[text]
+    match = _RE_PERCENTILE.match(text)
+    if match:
+        pct = int(match.group(1) or match.group(2))
+        return f"p{pct}" if 1 <= pct <= 99 else None
+    return None
+
+
+def detect_aggregate(question: str) -> Optional[str]:
+    """Aggregato esplicito nella domanda («massimo», «CAGR», «90th percentile»…)."""
+    text = question.lower()
+    for name, pattern in _DETECT:
+        match = pattern.search(text)
+        if match:
+            if name == "percentile":
+                return normalize_aggregate(f"p{match.group(1) or match.group(2)}")
+            return name
+    return None
+
+
+# --------------------------------------------------------------------------- #
+#  Query
+# --------------------------------------------------------------------------- #
+
+def build_aggregate_query(parsed: dict):
+    """
+    (sql, params, mode) per l'aggregato richiesto; mode = 'sql' (una riga
+    con il risultato) o 'series' (righe (data, valore) ordinate per data).
+
+    None se mancano dati; ValueError se la tabella non ha un campo temporale,
+    l'aggregato non è supportato o il periodo non è interpretabile
+    (`period_ranges`): i chiamanti (`answer_num_query`) lo propagano come
+    errore della domanda.
+    """
+    company = parsed.get("company")
+    table = parsed.get("table")
+    column = parsed.get("column")
+    period = parsed.get("period") or "latest"
+    aggregate = normalize_aggregate(parsed.get("aggregate") or "avg")
+
+    if not (company and table and column):
+        print("❌ Dati insufficienti per l'aggregato.")
+        return None
+    if aggregate is None:
+        raise ValueError(f"Aggregato non supportato: {parsed.get('aggregate')!r}")
+
+    time_field = TABLE_METADATA.get(table, {}).get("time_field")
+    if time_field is None:
+        raise ValueError(f"La tabella {table} non contiene dati storici: "
+                         "aggregati non disponibili.")
+
+    period_clause, period_params = _period_clause(time_field, period)
+    params = (get_company_id(company), *period_params)
+
+    if aggregate in _SQL_AGGREGATES:
+        sql = f"""
+            SELECT {_SQL_AGGREGATES[aggregate].format(column=column)}
+            FROM {table}
+            WHERE company_id = %s
+            AND {period_clause}
+        """
+        return sql, params, "sql"
+
+    sql = f"""
+        SELECT {time_field}, {column}
+        FROM {table}
+        WHERE company_id = %s
+        AND {period_clause}
+        AND {column} IS NOT NULL
+        ORDER BY {time_field}
+    """
+    return sql, params, "series"
+
+
+def _as_date(value: Any) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def _cagr(start: Any, first: float, end: Any, last: float) -> Optional[float]:
+    """Tasso di crescita annuo composto tra due osservazioni (None se non definito)."""
+    years = (_as_date(end) - _as_date(start)).days / 365.25
+    if years <= 0 or first <= 0 or last <= 0:
+        return None
+    return float((last / first) ** (1 / years) - 1)
+
+
+def _reduce(aggregate: str, rows: Sequence[Tuple[Any, Any]]) -> Optional[float]:
+    """Aggregato NumPy sulla serie (data, valore) già ordinata."""
+    if not rows:
+        return None
+    values = np.asarray([float(v) for _, v in rows], dtype=float)
+    if aggregate == "median":
+        return float(np.median(values))
+    if aggregate == "first":
+        return float(values[0])
+    if aggregate == "last":
+        return float(values[-1])
+    if aggregate == "cagr":
+        return _cagr(rows[0][0], values[0], rows[-1][0], values[-1])
+    return float(np.percentile(values, int(aggregate[1:])))
+
+
+def _result(aggregate: str, mode: str, rows: List[Tuple[Any, ...]]) -> Any:
+    annotate(aggregate=aggregate, mode=mode, rows=len(rows))
+    if mode == "series":
+        return _reduce(aggregate, rows)
+    return rows[0][0] if rows and rows[0][0] is not None else None
+
+
+@traced("aggregate_query.sql")
+def answer_aggregate_query(parsed: dict):
+    """Calcola l'aggregato di `parsed` (None se non ci sono dati)."""
+    query = build_aggregate_query(parsed)
+    if query is None:
+        return None
+    sql, params, mode = query
+    aggregate = normalize_aggregate(parsed.get("aggregate") or "avg")
+
+    try:
+        if mode == "series":
+            rows = fetch_all(sql, params)
+        else:
+            row = fetch_one(sql, params)
+            rows = [row] if row is not None else []
+    except Exception as e:
+        print("❌ Errore aggregato:", e)
+        return None
+    return _result(aggregate, mode, rows)
+
+
+@traced("aggregate_query.sql")
+async def answer_aggregate_query_async(parsed: dict):
+    """Versione async di `answer_aggregate_query` (vedi `async_db`)."""
+    query = build_aggregate_query(parsed)
+    if query is None:
+        return None
+    sql, params, mode = query
+    aggregate = normalize_aggregate(parsed.get("aggregate") or "avg")
+
+    try:
+        if mode == "series":
+            rows = await fetch_all_async(sql, params)
+        else:
+            row = await fetch_one_async(sql, params)
+            rows = [row] if row is not None else []
+    except Exception as e:
+        print("❌ Errore aggregato:", e)
+        return None
+    return _result(aggregate, mode, rows)
@@ -0,0 +1,95 @@
+"""
+async_db.py
+
+Accesso MySQL per la pipeline async (`ask_mark_async`).
+
+Con `aiomysql` installato le query passano da un pool async condiviso
+(`MARK_ASYNC_DB_MINSIZE` / `MARK_ASYNC_DB_MAXSIZE`, uno per event loop);
+altrimenti la stessa query gira nel thread pool di default sul pool
+sincrono di `db_pool`, così l'event loop non resta comunque bloccato.
+
+API pubblico
+------------
+fetch_one(sql, params) -> tuple | None      (coroutine)
+fetch_all(sql, params) -> list[tuple]       (coroutine)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import weakref
+from typing import Any, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from .db_pool import fetch_all as fetch_all_sync
+from .db_pool import fetch_one as fetch_one_sync
+
+try:
+    import aiomysql  # type: ignore
+except ImportError:  # pragma: no cover
+    aiomysql = None
+
+__all__ = ["fetch_one", "fetch_all"]
+
+load_dotenv()
+MYSQL_USER     = os.getenv("MYSQL_USER")
+MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
+MYSQL_HOST     = os.getenv("MYSQL_HOST")
+MYSQL_PORT     = int(os.getenv("MYSQL_PORT", 3306))
+MYSQL_DB       = os.getenv("MYSQL_DB")
+
+POOL_MINSIZE = int(os.getenv("MARK_ASYNC_DB_MINSIZE", 1))
+POOL_MAXSIZE = int(os.getenv("MARK_ASYNC_DB_MAXSIZE", 10))
+
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+_pool_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def _get_pool() -> Any:
+    """Pool aiomysql dell'event loop corrente (creato al primo uso)."""
+    loop = asyncio.get_running_loop()
+    lock = _pool_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        pool = _pools.get(loop)
+        if pool is None:
+            pool = _pools[loop] = await aiomysql.create_pool(
+                user=MYSQL_USER,
+                password=MYSQL_PASSWORD,
+                host=MYSQL_HOST,
+                port=MYSQL_PORT,
+                db=MYSQL_DB,
+                minsize=POOL_MINSIZE,
+                maxsize=POOL_MAXSIZE,
+                autocommit=True,
+            )
+    return pool
+
+
+async def fetch_one(sql: str, params: Sequence[Any] = ()) -> Optional[Tuple[Any, ...]]:
+    """Esegue `sql` e restituisce la prima riga (o None)."""
+    if aiomysql is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fetch_one_sync, sql, params)
+
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, tuple(params))
+            return await cursor.fetchone()
+
+
+async def fetch_all(sql: str, params: Sequence[Any] = ()) -> List[Tuple[Any, ...]]:
+    """Esegue `sql` e restituisce tutte le righe."""
+    if aiomysql is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fetch_all_sync, sql, params)
+
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, tuple(params))
+            return list(await cursor.fetchall())
@@ -1,20 +1,39 @@
-import os
-import pymysql
-from dotenv import load_dotenv
+from .async_db import fetch_one as fetch_one_async
+from .company_ids import get_company_id, get_company_ids
+from .date_utils import period_ranges
+from .db_pool import fetch_all, fetch_one
+from .table_metadata import TABLE_METADATA
+from ..tracing import traced
 
-load_dotenv()
+non_date_tables = {"info", "officers", "recommendations", "splits", "sustainability"}
 
-MYSQL_USER = os.getenv("MYSQL_USER")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-MYSQL_HOST = os.getenv("MYSQL_HOST")
-MYSQL_PORT = int(os.getenv("MYSQL_PORT"))
-MYSQL_DB = os.getenv("MYSQL_DB")
 
-non_date_tables = {"info", "officers", "recommendations", "splits", "sustainability"}
+def _date_column(table: str) -> str:
+    return TABLE_METADATA.get(table, {}).get("time_field") or (
+        "period" if table.strip().lower() == "cashflow" else "date"
+    )
 
-def answer_avg_query(parsed: dict):
+
+def _period_clause(date_column: str, period) -> tuple:
     """
-    Calcola la media della colonna specificata per una determinata azienda e periodo.
+    (clausola, params) per il periodo: un `BETWEEN` per ogni intervallo di
+    `period_ranges` (anni contigui fusi), così MySQL usa l'indice
+    (company_id, data) invece di scandire tutte le righe dell'azienda.
+    """
+    ranges = period_ranges(period)
+    if not ranges:
+        return f"{date_column} IS NOT NULL", ()
+    clause = " OR ".join([f"{date_column} BETWEEN %s AND %s" for _ in ranges])
+    params = tuple(bound for pair in ranges for bound in pair)
+    return (f"({clause})" if len(ranges) > 1 else clause), params
+
+
+def build_avg_query(parsed: dict):
+    """
+    Costruisce (sql, params) per la media della colonna specificata per una
+    determinata azienda e periodo.  None se la richiesta non è valida o il
+    periodo non è interpretabile da `period_ranges`.
+    L'azienda è risolta in `company_id` dalla mappa in memoria (`company_ids`).
     """
     company = parsed.get("company")
     table = parsed.get("table")
@@ -25,77 +44,101 @@ def answer_avg_query(parsed: dict):
         print("❌ Dati insufficienti per la media.")
         return None
 
+    if table.strip().lower() in non_date_tables:
+        print(f"❌ La tabella '{table}' non supporta query temporali.")
+        return None
+
+    try:
+        period_clause, period_params = _period_clause(_date_column(table), period)
+    except ValueError as e:
+        print("❌ Periodo non valido per la media:", e)
+        return None
+    query = f"""
+        SELECT AVG({column})
+        FROM {table}
+        WHERE company_id = %s
+        AND {period_clause}
+    """
+    return query, (get_company_id(company), *period_params)
+
+
+def build_bulk_avg_query(parsed_list: list):
+    """
+    Come `build_avg_query` per più aziende con stessa tabella, colonna e
+    periodo: una query con `company_id IN (...)` e `GROUP BY company_id`.
+    """
+    first = parsed_list[0]
+    table = first.get("table")
+    column = first.get("column")
+    period = first.get("period")
+    ids = sorted(get_company_ids(p["company"] for p in parsed_list if p.get("company")).values())
+
+    if not (ids and table and column and period):
+        print("❌ Dati insufficienti per la media.")
+        return None
+
+    if table.strip().lower() in non_date_tables:
+        print(f"❌ La tabella '{table}' non supporta query temporali.")
+        return None
+
+    in_clause = ", ".join(["%s"] * len(ids))
     try:
-        connection = pymysql.connect(
-            user=MYSQL_USER,
-            password=MYSQL_PASSWORD,
-            host=MYSQL_HOST,
-            port=MYSQL_PORT,
-            database=MYSQL_DB
-        )
-
-        with connection.cursor() as cursor:
-            if table.strip().lower() in non_date_tables:
-                print(f"❌ La tabella '{table}' non supporta query temporali.")
-                return None
-
-            date_column = "period" if table.strip().lower() == "cashflow" else "date"
-
-            if period == "latest":
-                query = f"""
-                    SELECT AVG({column})
-                    FROM {table}
-                    WHERE company_id = (
-                        SELECT company_id FROM info WHERE symbol = %s
-                    )
-                    AND {date_column} IS NOT NULL
-                """
-                cursor.execute(query, (company.upper(),))
-
-            elif isinstance(period, list):
-                if date_column == "date":
-                    like_clauses = " OR ".join([f"{date_column} LIKE %s" for _ in period])
-                    query = f"""
-                        SELECT AVG({column})
-                        FROM {table}
-                        WHERE company_id = (
-                            SELECT company_id FROM info WHERE symbol = %s
-                        )
-                        AND ({like_clauses})
-                    """
-                    like_values = [f"%{p}%" for p in period]
-                    cursor.execute(query, (company.upper(), *like_values))
-                else:
-                    like_clauses = " OR ".join([f"{date_column} LIKE %s" for _ in period])
-                    query = f"""
-                        SELECT AVG({column})
-                        FROM {table}
-                        WHERE company_id = (
-                            SELECT company_id FROM info WHERE symbol = %s
-                        )
-                        AND ({like_clauses})
-                    """
-                    like_values = [f"%{p}%" for p in period]
-                    cursor.execute(query, (company.upper(), *like_values))
-
-            else:
-                query = f"""
-                    SELECT AVG({column})
-                    FROM {table}
-                    WHERE company_id = (
-                        SELECT company_id FROM info WHERE symbol = %s
-                    )
-                    AND {date_column} LIKE %s
-                """
-                cursor.execute(query, (company.upper(), f"%{period}%"))
-
-            result = cursor.fetchone()
-            return result[0] if result and result[0] is not None else None
+        period_clause, period_params = _period_clause(f"t.{_date_column(table)}", period)
+    except ValueError as e:
+        print("❌ Periodo non valido per la media:", e)
+        return None
+
+    query = f"""
+        SELECT t.company_id, AVG(t.{column})
+        FROM {table} t
+        WHERE t.company_id IN ({in_clause})
+        AND {period_clause}
+        GROUP BY t.company_id
+    """
+    return query, (*ids, *period_params)
+
+
+@traced("avg_query.sql_bulk")
+def answer_avg_queries_bulk(parsed_list: list) -> dict:
+    """{symbol: media} per tutte le aziende di `parsed_list` (None se senza dati)."""
+    query = build_bulk_avg_query(parsed_list)
+    if query is None:
+        return {}
+    sql, params = query
+    symbol_by_id = {cid: symbol for symbol, cid in
+                    get_company_ids(p["company"] for p in parsed_list if p.get("company")).items()}
+    return {symbol_by_id[cid]: value for cid, value in fetch_all(sql, params)}
+
+
+@traced("avg_query.sql")
+def answer_avg_query(parsed: dict):
+    """
+    Calcola la media della colonna specificata per una determinata azienda e periodo.
+    """
+    query = build_avg_query(parsed)
+    if query is None:
+        return None
+    sql, params = query
 
+    try:
+        result = fetch_one(sql, params)
+        return result[0] if result and result[0] is not None else None
     except Exception as e:
         print("❌ Errore media query:", e)
         return None
 
-    finally:
-        if 'connection' in locals() and connection:
-            connection.close()
\ No newline at end of file
+
+@traced("avg_query.sql")
+async def answer_avg_query_async(parsed: dict):
+    """Versione async di `answer_avg_query` (vedi `async_db`)."""
+    query = build_avg_query(parsed)
+    if query is None:
+        return None
+    sql, params = query
+
+    try:
+        result = await fetch_one_async(sql, params)
+        return result[0] if result and result[0] is not None else None
+    except Exception as e:
+        print("❌ Errore media query:", e)
+        return None
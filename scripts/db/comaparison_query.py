@@ -0,0 +1,351 @@
+"""
+comaparison_query.py
+
+Confronti tra più aziende e più metriche in un solo giro: «AAPL vs MSFT vs
+GOOGL revenue 2020–2024» diventa una matrice aziende × metriche × periodi.
+
+Prima un confronto richiedeva un parsing LLM e una query per ogni coppia
+azienda/metrica.  Qui:
+
+• un solo parsing LLM estrae aziende, metriche e periodo (`parse_comparison_question`);
+• le metriche sono raggruppate per tabella e ogni tabella è letta con **una**
+  query set‑based (`company_id IN (...)`, una riga per azienda e anno:
+  l'ultima osservazione dell'anno, o la più recente per "latest");
+• sono ammesse solo metriche di `info` o di tabelle storiche: le altre
+  tabelle senza data (recommendations, officers, …) hanno più righe per
+  azienda e sono rifiutate con ValueError, come in `ranking_query`;
+• le righe sono ruotate con NumPy in una matrice allineata
+  [azienda][metrica][periodo] (None dove il dato manca); le metriche senza
+  storico (`info`) hanno solo il valore attuale, messo nell'ultimo periodo;
+• il payload risultante passa a `llm_wrapper` come tipo "comparison" e
+  `payload_compiler.compile_comparison` lo riduce a una tabella compatta.
+
+Input di `compare`
+------------------
+companies: ["AAPL", "MSFT"]                     ticker o nomi (risolti)
+metrics:   ["total_revenue", "net_income"]      chiavi di METRIC_METADATA o colonne
+periods:   "latest" | ["2022", "2023"] | "2023" | {"from": "2020", "to": "2024"}
+
+API pubblico
+------------
+compare(companies, metrics, periods="latest")        -> dict
+compare_async(companies, metrics, periods="latest")  -> dict
+parse_comparison_question(question)                  -> dict
+answer_comparison_question(question)                 -> dict
+answer_comparison_question_async(question)           stessa firma, versione async
+"""
+
+from __future__ import annotations
+
+import ast
+import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from ..llm_provider import achat, chat
+from ..tracing import annotate, traced
+from .async_db import fetch_all as fetch_all_async
+from .avg_query import _period_clause
+from .company_ids import get_company_ids
+from .company_resolver import get_resolver
+from .db_pool import fetch_all
+from .metadata_cache import cached_fragment, current_table_metadata
+from .parse_num_query import build_metric_options_string
+from .ranking_query import resolve_metric
+
+__all__ = [
+    "compare",
+    "compare_async",
+    "parse_comparison_question",
+    "answer_comparison_question",
+    "answer_comparison_question_async",
+]
+
+MAX_COMPANIES = 20
+MAX_METRICS = 10
+MAX_PERIODS = 15
+
+
+# --------------------------------------------------------------------------- #
+#  Normalizzazione dell'input
+# --------------------------------------------------------------------------- #
+
+def _normalize_periods(periods: Any) -> List[str]:
+    """['latest'] oppure lista ordinata di anni 'YYYY'."""
+    if periods in (None, "", "latest", []):
+        return ["latest"]
+    if isinstance(periods, dict):
+        years = range(int(periods["from"]), int(periods["to"]) + 1)
+    elif isinstance(periods, (list, tuple)):
+        years = [int(str(p).strip()[:4]) for p in periods]
+    else:
+        years = [int(str(periods).strip()[:4])]
+    labels = [str(y) for y in sorted(set(years))]
+    if len(labels) > MAX_PERIODS:
+        raise ValueError(f"Troppi periodi nel confronto ({len(labels)} > {MAX_PERIODS}).")
+    return labels
+
+
+def _normalize_companies(companies: Sequence[str]) -> List[str]:
+    """Ticker in ordine di citazione, senza duplicati."""
+    resolver = get_resolver()
+    symbols: List[str] = []
+    for name in companies:
+        symbol = (resolver.resolve(name) or name).upper()
+        if symbol not in symbols:
+            symbols.append(symbol)
+    if not symbols:
+        raise ValueError("Nessuna azienda da confrontare.")
+    if len(symbols) > MAX_COMPANIES:
+        raise ValueError(f"Troppe aziende nel confronto ({len(symbols)} > {MAX_COMPANIES}).")
+    return symbols
+
+
+def _comparable(table: str) -> bool:
+    """
+    Tabella confrontabile: `info` o una tabella storica (le altre tabelle
+    senza data hanno più righe per azienda e nessun criterio per sceglierne una).
+    """
+    has_time = current_table_metadata().get(table, {}).get("time_field") is not None
+    return table == "info" or has_time
+
+
+def _normalize_metrics(metrics: Sequence[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    resolved: List[Tuple[str, Dict[str, Any]]] = []
+    for metric in metrics:
+        key, meta = resolve_metric(metric)
+        if not _comparable(meta["table"]):
+            raise ValueError(f"La metrica {key} ha più valori per azienda: confronto non disponibile.")
+        if key not in [k for k, _ in resolved]:
+            resolved.append((key, meta))
+    if not resolved:
+        raise ValueError("Nessuna metrica da confrontare.")
+    if len(resolved) > MAX_METRICS:
+        raise ValueError(f"Troppe metriche nel confronto ({len(resolved)} > {MAX_METRICS}).")
+    return resolved
+
+
+# --------------------------------------------------------------------------- #
+#  Query per tabella
+# --------------------------------------------------------------------------- #
+
+def build_table_query(table: str, columns: Sequence[str], company_ids: Sequence[int],
+                      periods: Sequence[str]) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    (sql, params) che restituisce (company_id, data, col1, col2, ...): una
+    riga per azienda e per anno richiesto (l'ultima dell'anno), oppure la
+    riga più recente se `periods == ['latest']`.
+    """
+    selected = ", ".join(f"t.{c}" for c in columns)
+    placeholders = ", ".join(["%s"] * len(company_ids))
+    time_field = current_table_metadata().get(table, {}).get("time_field")
+
+    if time_field is None:
+        if table != "info":
+            raise ValueError(f"Tabella {table} senza data: una riga per azienda non è garantita.")
+        sql = f"""
+            SELECT t.company_id, NULL, {selected}
+            FROM {table} t
+            WHERE t.company_id IN ({placeholders})
+        """
+        return sql, tuple(company_ids)
+
+    if periods == ["latest"]:
+        period_filter, period_params, group_by = "", (), "company_id"
+    else:
+        clause, period_params = _period_clause(time_field, list(periods))
+        period_filter, group_by = f"AND {clause}", f"company_id, YEAR({time_field})"
+    sql = f"""
+        SELECT t.company_id, t.{time_field}, {selected}
+        FROM {table} t
+        JOIN (
+            SELECT company_id, MAX({time_field}) AS as_of
+            FROM {table}
+            WHERE company_id IN ({placeholders}) {period_filter}
+            GROUP BY {group_by}
+        ) last ON last.company_id = t.company_id AND last.as_of = t.{time_field}
+    """
+    return sql, (*company_ids, *period_params)
+
+
+def _plan(companies: Sequence[str], metrics: Sequence[str], periods: Any):
+    """Input normalizzato e una query per tabella."""
+    symbols = _normalize_companies(companies)
+    resolved = _normalize_metrics(metrics)
+    labels = _normalize_periods(periods)
+    ids = get_company_ids(symbols)
+
+    by_table: Dict[str, List[Tuple[int, str]]] = {}
+    for index, (_, meta) in enumerate(resolved):
+        by_table.setdefault(meta["table"], []).append((index, meta["column"]))
+
+    queries = []
+    if ids:
+        for table, columns in by_table.items():
+            time_field = current_table_metadata().get(table, {}).get("time_field")
+            table_periods = labels if time_field is not None else ["latest"]
+            sql, params = build_table_query(table, [c for _, c in columns],
+                                            list(ids.values()), table_periods)
+            queries.append((table, [i for i, _ in columns], sql, params))
+    return symbols, resolved, labels, ids, queries
+
+
+def _year(value: Any) -> str:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return str(value.year)
+    return str(value)[:4]
+
+
+def _pivot(symbols, resolved, labels, ids, results) -> Dict[str, Any]:
+    """Righe per tabella → matrice [azienda][metrica][periodo] e payload."""
+    matrix = np.full((len(symbols), len(resolved), len(labels)), np.nan)
+    as_of = np.full((len(symbols), len(resolved), len(labels)), None, dtype=object)
+    row_of = {cid: symbols.index(symbol) for symbol, cid in ids.items()}
+    period_of = {label: i for i, label in enumerate(labels)}
+    latest = labels == ["latest"]
+
+    for table, metric_indexes, rows in results:
+        for company_id, date, *values in rows:
+            ci = row_of[company_id]
+            # tabelle senza data (info): valore attuale, nell'ultimo periodo
+            if latest or date is None:
+                pi = len(labels) - 1
+            else:
+                pi = period_of.get(_year(date))
+                if pi is None:
+                    continue
+            for mi, value in zip(metric_indexes, values):
+                if value is not None:
+                    matrix[ci, mi, pi] = float(value)
+                    as_of[ci, mi, pi] = date.isoformat() if hasattr(date, "isoformat") else date
+
+    present = ~np.isnan(matrix)
+    annotate(companies=len(symbols), metrics=len(resolved), periods=len(labels),
+             filled=int(present.sum()))
+    values = np.where(present, matrix, None).tolist()
+    return {
+        "companies": symbols,
+        "metrics": [{"key": key, "table": meta["table"], "column": meta["column"],
+                     "historical": current_table_metadata().get(meta["table"], {})
+                                   .get("time_field") is not None}
+                    for key, meta in resolved],
+        "periods": labels,
+        "values": values,
+        "as_of": as_of.tolist(),
+        "missing_companies": [s for s in symbols if s not in ids],
+    }
+
+
+@traced("comparison_query.sql")
+def compare(companies: Sequence[str], metrics: Sequence[str], periods: Any = "latest") -> Dict[str, Any]:
+    """
+    Matrice di confronto aziende × metriche × periodi.
+
+    Returns
+    -------
+    dict
+        {"companies", "metrics", "periods", "values", "as_of",
+         "missing_companies"}; `values[i][j][k]` è il valore dell'azienda i,
+        metrica j, periodo k (None se assente).
+    """
+    symbols, resolved, labels, ids, queries = _plan(companies, metrics, periods)
+    results = [(table, indexes, fetch_all(sql, params)) for table, indexes, sql, params in queries]
+    return _pivot(symbols, resolved, labels, ids, results)
+
+
+@traced("comparison_query.sql")
+async def compare_async(companies: Sequence[str], metrics: Sequence[str],
+                        periods: Any = "latest") -> Dict[str, Any]:
+    """Versione async di `compare` (vedi `async_db`)."""
+    symbols, resolved, labels, ids, queries = _plan(companies, metrics, periods)
+    results = [(table, indexes, await fetch_all_async(sql, params))
+               for table, indexes, sql, params in queries]
+    return _pivot(symbols, resolved, labels, ids, results)
+
+
+# --------------------------------------------------------------------------- #
+#  Domanda in linguaggio naturale
+# --------------------------------------------------------------------------- #
+
+@cached_fragment
+def build_system_prompt() -> str:
+    """Prefisso statico del prompt (metriche disponibili), stabile tra le domande."""
+    return f"""Sei un assistente esperto di database finanziari.
+
+L'utente vuole **confrontare** una o più metriche tra più aziende.
+
+Metriche disponibili:
+{build_metric_options_string()}
+
+Restituisci un dizionario Python con:
+- "companies": lista di ticker o nomi delle aziende, nell'ordine della domanda
+- "metrics": lista di chiavi delle metriche (es. "total_revenue")
+- "period": "latest", una lista di anni stringa, oppure {{"from": "2020", "to": "2024"}}
+
+Restituisci solo un dizionario Python valido. Nessuna spiegazione, nessun testo extra."""
+
+
+def interpret_comparison_output(content: str) -> Dict[str, Any]:
+    """Converte l'output grezzo del modello nel dizionario per `compare`."""
+    print("🧾 Output grezzo GPT:", content)
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        print("❌ Nessun dizionario riconosciuto.")
+        return {}
+    parsed = ast.literal_eval(content[start:end + 1])
+    return {
+        "companies": list(parsed.get("companies") or []),
+        "metrics": list(parsed.get("metrics") or []),
+        "period": parsed.get("period") or "latest",
+    }
+
+
+def _gpt_request(question: str) -> Dict[str, Any]:
+    """Argomenti della chiamata di parsing (prefisso di sistema statico)."""
+    return {
+        "model": "gpt-4o",
+        "temperature": 0,
+        "messages": [
+            {"role": "system", "content": build_system_prompt()},
+            {"role": "user", "content": question.strip()},
+        ],
+    }
+
+
+@traced()
+def parse_comparison_question(question: str) -> Dict[str, Any]:
+    """Un solo parsing LLM per tutte le aziende e metriche della domanda."""
+    try:
+        response = chat("parse", site="comparison_query", **_gpt_request(question))
+        return interpret_comparison_output(response.choices[0].message.content)
+    except Exception as e:
+        print("❌ Errore nel parsing GPT:", e)
+        return {}
+
+
+@traced("comparison_query.parse_comparison_question")
+async def parse_comparison_question_async(question: str) -> Dict[str, Any]:
+    """Versione async di `parse_comparison_question`."""
+    try:
+        response = await achat("parse", site="comparison_query", **_gpt_request(question))
+        return interpret_comparison_output(response.choices[0].message.content)
+    except Exception as e:
+        print("❌ Errore nel parsing GPT:", e)
+        return {}
+
+
+def answer_comparison_question(question: str) -> Dict[str, Any]:
+    """Domanda di confronto → payload per `format_answer(question, "comparison", ...)`."""
+    parsed = parse_comparison_question(question)
+    if not (parsed.get("companies") and parsed.get("metrics")):
+        raise ValueError("Impossibile interpretare la domanda di confronto.")
+    return compare(parsed["companies"], parsed["metrics"], parsed["period"])
+
+
+async def answer_comparison_question_async(question: str) -> Dict[str, Any]:
+    """Versione async di `answer_comparison_question`."""
+    parsed = await parse_comparison_question_async(question)
+    if not (parsed.get("companies") and parsed.get("metrics")):
+        raise ValueError("Impossibile interpretare la domanda di confronto.")
+    return await compare_async(parsed["companies"], parsed["metrics"], parsed["period"])
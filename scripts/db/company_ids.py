@@ -0,0 +1,110 @@
+"""
+company_ids.py
+
+Mappa in‑process symbol → company_id condivisa da moduli di query ed ETL.
+
+Ogni query di `value_query` / `avg_query` conteneva la sottoquery
+`SELECT company_id FROM info WHERE symbol = %s` e ogni loader di
+`update_mark_db.py` faceva lo stesso lookup con un round‑trip a parte.
+Qui la tabella `info` (poche migliaia di righe) viene letta una volta e le
+query usano direttamente `company_id = %s`.
+
+Aggiornamento
+-------------
+La mappa ricorda la versione della tabella `info` (`data_version`): quando
+un altro processo scrive in `info` la versione cambia e la mappa viene
+ricaricata al lookup successivo (un `stat`, nessuna query).  Le scritture
+del processo stesso (l'ETL, un ticker alla volta) vengono invece registrate
+con `remember_company_id`, che aggiorna la mappa sul posto e adotta la nuova
+versione: niente ricarica completa a ogni ticker.  Un simbolo assente dalla
+mappa viene cercato con una query puntuale (ticker appena inserito da un
+altro worker ETL); se non esiste viene ricordato come assente fino alla
+prossima ricarica.
+
+API pubblico
+------------
+get_company_id(symbol)    -> int | None
+get_company_ids(symbols)  -> dict[str, int]   (solo i simboli trovati)
+remember_company_id(symbol, company_id) -> None   (scrittura propria in `info`)
+refresh()                 -> None             (forza la ricarica)
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+try:
+    from .data_version import table_version
+    from .db_pool import fetch_all, fetch_one
+except ImportError:  # executed as a plain script (cron ETL)
+    from data_version import table_version
+    from db_pool import fetch_all, fetch_one
+
+__all__ = ["get_company_id", "get_company_ids", "remember_company_id", "refresh"]
+
+_lock = threading.Lock()
+_ids: Dict[str, int] = {}
+_missing: Set[str] = set()          # simboli cercati e non trovati in `info`
+_loaded_version: Optional[int] = None
+
+
+def _current() -> Dict[str, int]:
+    """Mappa aggiornata alla versione corrente di `info` (ricaricata se serve)."""
+    global _ids, _missing, _loaded_version
+    version = table_version("info")
+    if version != _loaded_version:
+        with _lock:
+            if version != _loaded_version:
+                rows = fetch_all("SELECT symbol, company_id FROM info")
+                _ids = {symbol.upper(): cid for symbol, cid in rows if symbol}
+                _missing = set()
+                _loaded_version = version
+    return _ids
+
+
+def get_company_id(symbol: str) -> Optional[int]:
+    """company_id di `symbol` (maiuscole/minuscole indifferenti), None se non in `info`."""
+    if not symbol:
+        return None
+    symbol = symbol.upper()
+    ids = _current()
+    cid = ids.get(symbol)
+    if cid is None and symbol not in _missing:
+        row = fetch_one("SELECT company_id FROM info WHERE symbol = %s", (symbol,))
+        if row is not None:
+            cid = ids[symbol] = row[0]
+        else:
+            _missing.add(symbol)
+    return cid
+
+
+def get_company_ids(symbols: Iterable[str]) -> Dict[str, int]:
+    """{symbol: company_id} per i simboli presenti in `info`."""
+    found = {}
+    for symbol in symbols:
+        cid = get_company_id(symbol)
+        if cid is not None:
+            found[symbol.upper()] = cid
+    return found
+
+
+def remember_company_id(symbol: str, company_id: int) -> None:
+    """
+    Registra `symbol` appena scritto in `info` da questo processo e adotta la
+    versione corrente di `info`, così il bump dell'ETL non ricarica la mappa.
+    """
+    global _loaded_version
+    symbol = symbol.upper()
+    with _lock:
+        _ids[symbol] = company_id
+        _missing.discard(symbol)
+        if _loaded_version is not None:
+            _loaded_version = table_version("info")
+
+
+def refresh() -> None:
+    """Ricarica la mappa al prossimo lookup."""
+    global _loaded_version
+    with _lock:
+        _loaded_version = None
@@ -0,0 +1,515 @@
+"""
+company_list.py
+
+Screener sulle aziende di `info`: «aziende con market cap > 10 miliardi,
+dividend yield > 3%, nel settore Utilities» diventa **una** query SQL
+parametrica, con ordinamento e paginazione.
+
+Espressione di filtro
+---------------------
+`filters` è un dizionario metrica → condizione; le metriche sono chiavi di
+METRIC_METADATA o nomi di colonna di `info` (`ranking_query.resolve_metric`):
+
+    {"marketcap": {">": 10e9},                    # confronto
+     "dividendyield": {"between": ["3%", "8%"]},  # intervallo (estremi inclusi)
+     "trailingpe": {">": 0, "<=": 20},            # più condizioni in AND
+     "country": "United States",                  # uguaglianza
+     "exchange": ["NMS", "NYQ"]}                  # appartenenza (IN)
+
+Operatori: > >= < <= = != between in (anche gt, gte, lt, lte, eq, ne).
+I confronti d'ordine valgono solo per colonne numeriche.  Le soglie
+percentuali si scrivono come stringhe "3%": yfinance salva alcune
+percentuali come frazioni (profitMargins 0.25 = 25%) e altre già in punti
+(dividendYield 0.44 = 0.44%), quindi la soglia è convertita nell'unità
+della colonna con `number_format.percent_to_stored`; un numero senza "%"
+è confrontato così com'è.  `sector` e `industry` accettano un nome o una
+lista di nomi, anche parziali o italiani (`ranking_query.resolve_label`:
+'tech' → 'Technology').
+
+`sort` è una chiave o una lista di chiavi, '-' davanti per l'ordine
+decrescente (default "-marketcap"); le aziende senza il dato della prima
+chiave sono escluse, così l'ordinamento può leggere l'indice.
+
+Indici
+------
+`ensure_indexes()` aggiunge (una volta, idempotente) gli indici sulle
+colonne più filtrate: marketCap, dividendYield, trailingPE e le coppie
+(sector, marketCap), (industry, marketCap).  «Utilities per market cap»
+diventa così una lettura dell'indice già ordinata invece di una scansione
+di `info` con filesort.
+
+    $ python -m scripts.db.company_list --indexes
+
+Uso da riga di comando
+----------------------
+    $ python -m scripts.db.company_list --where "marketcap>10e9" --where "dividendyield>3%" --sector utilities
+    $ python -m scripts.db.company_list --sector tech --sort -trailingpe --page 2
+
+API pubblico
+------------
+screen(filters=None, sector=None, industry=None, sort="-marketcap", page=1, page_size=25, columns=()) -> dict
+screen_async(...)                          stessa firma, versione async
+build_screen_query(...)                    -> (sql, params, request)
+ensure_indexes()                           -> list[str]   (indici creati)
+parse_screen_question(question)            -> dict
+answer_screen_question(question)           -> dict
+answer_screen_question_async(question)     stessa firma, versione async
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from ..llm_provider import achat, chat
+from ..number_format import percent_to_stored
+from ..tracing import annotate, traced
+from .async_db import fetch_all as fetch_all_async
+from .db_pool import connection, fetch_all
+from .metadata_cache import cached_fragment, current_metric_metadata
+from .ranking_query import _numeric_columns, resolve_label, resolve_metric
+
+__all__ = [
+    "screen",
+    "screen_async",
+    "build_screen_query",
+    "ensure_indexes",
+    "parse_screen_question",
+    "answer_screen_question",
+    "answer_screen_question_async",
+]
+
+DEFAULT_SORT = "-marketcap"
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+MAX_CONDITIONS = 20
+
+# Indici di `info` per le colonne più filtrate / ordinate dagli screening
+SCREEN_INDEXES = {
+    "ix_info_marketcap": ("marketCap",),
+    "ix_info_dividendyield": ("dividendYield",),
+    "ix_info_trailingpe": ("trailingPE",),
+    "ix_info_sector_marketcap": ("sector", "marketCap"),
+    "ix_info_industry_marketcap": ("industry", "marketCap"),
+}
+
+_OPERATORS = {
+    ">": ">", "gt": ">",
+    ">=": ">=", "gte": ">=",
+    "<": "<", "lt": "<",
+    "<=": "<=", "lte": "<=",
+    "=": "=", "==": "=", "eq": "=",
+    "!=": "!=", "<>": "!=", "ne": "!=",
+    "between": "between",
+    "in": "in",
+}
+_ORDERED = (">", ">=", "<", "<=", "between")
+_LABEL_FIELDS = ("sector", "industry")
+
+_RE_WHERE = re.compile(r"^\s*([\w.]+)\s*(>=|<=|!=|<>|==|=|>|<)\s*(.+?)\s*$")
+
+Condition = Union[Any, List[Any], Dict[str, Any]]
+
+
+# --------------------------------------------------------------------------- #
+#  Indici
+# --------------------------------------------------------------------------- #
+
+def ensure_indexes() -> List[str]:
+    """
+    Crea gli indici di SCREEN_INDEXES che mancano su `info` (MySQL non ha
+    CREATE INDEX IF NOT EXISTS: si controlla information_schema).
+
+    Returns
+    -------
+    list[str]
+        Nomi degli indici creati (vuota se c'erano già tutti).
+    """
+    created: List[str] = []
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'info'"
+        )
+        existing = {row[0].lower() for row in cursor.fetchall()}
+        for name, columns in SCREEN_INDEXES.items():
+            if name in existing:
+                continue
+            cursor.execute(f"ALTER TABLE info ADD INDEX {name} ({', '.join(columns)})")
+            created.append(name)
+            print(f"✅ Indice {name} ({', '.join(columns)}) creato.")
+    return created
+
+
+# --------------------------------------------------------------------------- #
+#  Compilazione del filtro
+# --------------------------------------------------------------------------- #
+
+def _info_column(metric: str) -> Tuple[str, str]:
+    """(chiave, colonna) di una metrica di `info`; ValueError per le altre tabelle."""
+    key, meta = resolve_metric(metric)
+    if meta["table"] != "info":
+        raise ValueError(f"La metrica {key} non è in `info`: non utilizzabile nello screening.")
+    return key, meta["column"]
+
+
+def _is_numeric(column: str) -> bool:
+    return ("info", column.lower()) in _numeric_columns()
+
+
+def _labels(field: str, value: Any) -> List[str]:
+    """Nomi di settore / industry risolti, senza duplicati."""
+    texts = value if isinstance(value, (list, tuple, set)) else [value]
+    labels: List[str] = []
+    for text in texts:
+        label = resolve_label(field, text)
+        if label and label not in labels:
+            labels.append(label)
+    return labels
+
+
+def _scalar(value: Any, column: str, numeric: bool) -> Any:
+    """Valore nell'unità della colonna; '3%' è convertito con `percent_to_stored`."""
+    if not numeric:
+        return value
+    try:
+        if isinstance(value, str) and value.strip().endswith("%"):
+            return percent_to_stored(float(value.strip()[:-1]), "info", column)
+        return float(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Valore non valido per {column}: {value!r} ({e})") from None
+
+
+def _compile_condition(key: str, column: str,
+                       condition: Condition) -> Tuple[List[str], List[Any], List[Dict[str, Any]]]:
+    """Frammenti WHERE, parametri e forma risolta della condizione su una colonna."""
+    if isinstance(condition, dict):
+        items = list(condition.items())
+    elif isinstance(condition, (list, tuple, set)):
+        items = [("in", list(condition))]
+    else:
+        items = [("=", condition)]
+
+    numeric = _is_numeric(column)
+    clauses: List[str] = []
+    params: List[Any] = []
+    resolved: List[Dict[str, Any]] = []
+    for raw_op, value in items:
+        op = _OPERATORS.get(str(raw_op).strip().lower())
+        if op is None:
+            raise ValueError(f"Operatore non valido per {key}: {raw_op!r}")
+        if op in _ORDERED and not numeric:
+            raise ValueError(f"La metrica {key} non è numerica: operatore {op!r} non applicabile.")
+
+        if key in _LABEL_FIELDS and op in ("=", "in", "!="):
+            value = _labels(key, value)
+            if op != "!=":
+                op = "in"
+        if op == "between":
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                raise ValueError(f"'between' richiede [min, max] per {key}: {value!r}")
+            low, high = (_scalar(v, column, numeric) for v in value)
+            clauses.append(f"i.{column} BETWEEN %s AND %s")
+            params.extend((low, high))
+            value = [low, high]
+        elif op == "in" or (op == "!=" and isinstance(value, list)):
+            values = [_scalar(v, column, numeric) for v in (value if isinstance(value, list) else [value])]
+            if not values:
+                raise ValueError(f"Lista vuota per {key}.")
+            negate = "NOT " if op == "!=" else ""
+            clauses.append(f"i.{column} {negate}IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+            value = values
+        else:
+            value = _scalar(value, column, numeric)
+            clauses.append(f"i.{column} {op} %s")
+            params.append(value)
+        resolved.append({"metric": key, "column": column, "op": op, "value": value})
+    return clauses, params, resolved
+
+
+def _compile_sort(sort: Union[str, Sequence[str], None]) -> List[Tuple[str, str, str]]:
+    """[(chiave, colonna, 'ASC' | 'DESC'), ...] da '-marketcap' / ['sector', '-trailingpe']."""
+    keys = [sort or DEFAULT_SORT] if isinstance(sort, str) or not sort else list(sort)
+    order: List[Tuple[str, str, str]] = []
+    for item in keys:
+        text = str(item).strip()
+        direction = "ASC"
+        if text.startswith("-"):
+            text, direction = text[1:], "DESC"
+        elif text.startswith("+"):
+            text = text[1:]
+        parts = text.split()
+        if len(parts) == 2 and parts[1].lower() in ("asc", "desc"):
+            text, direction = parts[0], parts[1].upper()
+        key, column = _info_column(text)
+        order.append((key, column, direction))
+    return order
+
+
+def build_screen_query(filters: Optional[Dict[str, Condition]] = None,
+                       sector: Any = None, industry: Any = None,
+                       sort: Union[str, Sequence[str], None] = DEFAULT_SORT,
+                       page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+                       columns: Sequence[str] = (),
+                       with_total: bool = True) -> Tuple[str, Tuple[Any, ...], Dict[str, Any]]:
+    """
+    (sql, params, request) dello screening; `request` descrive il filtro
+    risolto e le colonne restituite, nell'ordine delle righe.
+
+    Con `with_total` la query porta anche `COUNT(*) OVER ()` (totale delle
+    aziende che passano il filtro, per la paginazione): MySQL deve allora
+    contare tutte le righe invece di fermarsi alla pagina.
+    """
+    conditions: Dict[str, Condition] = dict(filters or {})
+    if sector:
+        conditions["sector"] = sector
+    if industry:
+        conditions["industry"] = industry
+    if len(conditions) > MAX_CONDITIONS:
+        raise ValueError(f"Troppe condizioni nello screening ({len(conditions)} > {MAX_CONDITIONS}).")
+
+    where: List[str] = []
+    params: List[Any] = []
+    resolved: List[Dict[str, Any]] = []
+    for metric, condition in conditions.items():
+        key, column = _info_column(metric)
+        clauses, clause_params, clause_resolved = _compile_condition(key, column, condition)
+        where.extend(clauses)
+        params.extend(clause_params)
+        resolved.extend(clause_resolved)
+
+    order = _compile_sort(sort)
+    where.append(f"i.{order[0][1]} IS NOT NULL")
+    order_by = ", ".join(f"i.{column} {direction}" for _, column, direction in order)
+
+    shown: Dict[str, str] = {}
+    for key, column in ([(k, c) for k, c, _ in order]
+                        + [(r["metric"], r["column"]) for r in resolved]
+                        + [_info_column(c) for c in columns]):
+        if key not in ("symbol", "shortname", *_LABEL_FIELDS):
+            shown.setdefault(key, column)
+
+    page = max(1, int(page or 1))
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    selected = ", ".join(["i.symbol", "i.shortName", "i.sector", "i.industry"]
+                         + [f"i.{c}" for c in shown.values()]
+                         + (["COUNT(*) OVER ()"] if with_total else []))
+    sql = f"""
+        SELECT {selected}
+        FROM info i
+        WHERE {' AND '.join(where)}
+        ORDER BY {order_by}, i.company_id
+        LIMIT %s OFFSET %s
+    """
+    request = {
+        "filters": resolved,
+        "sort": [{"metric": k, "column": c, "order": d.lower()} for k, c, d in order],
+        "columns": shown,
+        "page": page,
+        "page_size": page_size,
+    }
+    return sql, (*params, page_size, (page - 1) * page_size), request
+
+
+def _result(request: Dict[str, Any], rows: Sequence[Tuple[Any, ...]], with_total: bool) -> Dict[str, Any]:
+    offset = (request["page"] - 1) * request["page_size"]
+    metrics = list(request["columns"])
+    request["rows"] = [
+        {"rank": offset + pos, "symbol": row[0], "name": row[1], "sector": row[2],
+         "industry": row[3], **dict(zip(metrics, row[4:4 + len(metrics)]))}
+        for pos, row in enumerate(rows, start=1)
+    ]
+    if with_total:
+        # pagina oltre l'ultima: nessuna riga da cui leggere il totale
+        total = rows[0][-1] if rows else (0 if request["page"] == 1 else None)
+        request["total"] = total
+        request["pages"] = None if total is None else math.ceil(total / request["page_size"])
+    annotate(conditions=len(request["filters"]), rows=len(rows), total=request.get("total"))
+    return request
+
+
+@traced("company_list.sql")
+def screen(filters: Optional[Dict[str, Condition]] = None,
+           sector: Any = None, industry: Any = None,
+           sort: Union[str, Sequence[str], None] = DEFAULT_SORT,
+           page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+           columns: Sequence[str] = (), with_total: bool = True) -> Dict[str, Any]:
+    """
+    Aziende di `info` che soddisfano tutti i filtri, ordinate e paginate.
+
+    Returns
+    -------
+    dict
+        La richiesta risolta ("filters", "sort", "columns" {chiave: colonna},
+        "page", "page_size") più "rows": [{"rank", "symbol", "name", "sector",
+        "industry", <metrica>: valore, ...}] e, con `with_total`, "total" e
+        "pages".
+    """
+    sql, params, request = build_screen_query(filters, sector, industry, sort,
+                                              page, page_size, columns, with_total)
+    return _result(request, fetch_all(sql, params), with_total)
+
+
+@traced("company_list.sql")
+async def screen_async(filters: Optional[Dict[str, Condition]] = None,
+                       sector: Any = None, industry: Any = None,
+                       sort: Union[str, Sequence[str], None] = DEFAULT_SORT,
+                       page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+                       columns: Sequence[str] = (), with_total: bool = True) -> Dict[str, Any]:
+    """Versione async di `screen` (vedi `async_db`)."""
+    sql, params, request = build_screen_query(filters, sector, industry, sort,
+                                              page, page_size, columns, with_total)
+    return _result(request, await fetch_all_async(sql, params), with_total)
+
+
+# --------------------------------------------------------------------------- #
+#  Domanda in linguaggio naturale
+# --------------------------------------------------------------------------- #
+
+@cached_fragment
+def build_system_prompt() -> str:
+    """Prefisso statico del prompt (metriche di `info`), stabile tra le domande."""
+    lines = []
+    for key, meta in current_metric_metadata().items():
+        if meta["table"] == "info":
+            description = meta.get("description", "")
+            lines.append(f"- {key}: {description}" if description else f"- {key}")
+    options = "\n".join(lines)
+    return f"""Sei un assistente esperto di database finanziari.
+
+L'utente vuole un **elenco di aziende** che soddisfano dei criteri (screening).
+
+Metriche disponibili (valori attuali):
+{options}
+
+Restituisci un dizionario Python con:
+- "filters": dizionario metrica → condizione; la condizione è un valore (uguaglianza),
+  una lista (uno tra) oppure un dizionario operatore → valore con operatori
+  ">", ">=", "<", "<=", "=", "!=", "between" (lista [min, max]); importi in unità
+  intere (10 miliardi = 10000000000), percentuali come stringhe con il simbolo %
+  (es. {">": "3%"})
+- "sector": nome del settore (o lista) se indicato, altrimenti null
+- "industry": nome dell'industry (o lista) se indicata, altrimenti null
+- "sort": chiave della metrica di ordinamento, con "-" davanti per l'ordine decrescente
+- "limit": numero di aziende richieste, se indicato
+
+Restituisci solo un dizionario Python valido. Nessuna spiegazione, nessun testo extra."""
+
+
+def interpret_screen_output(content: str) -> Dict[str, Any]:
+    """Converte l'output grezzo del modello negli argomenti di `screen`."""
+    print("🧾 Output grezzo GPT:", content)
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        print("❌ Nessun dizionario riconosciuto.")
+        return {}
+    parsed = ast.literal_eval(content[start:end + 1])
+    return {
+        "filters": dict(parsed.get("filters") or {}),
+        "sector": parsed.get("sector"),
+        "industry": parsed.get("industry"),
+        "sort": parsed.get("sort") or DEFAULT_SORT,
+        "page_size": parsed.get("limit") or DEFAULT_PAGE_SIZE,
+    }
+
+
+def _gpt_request(question: str) -> Dict[str, Any]:
+    """Argomenti della chiamata di parsing (prefisso di sistema statico)."""
+    return {
+        "model": "gpt-4o",
+        "temperature": 0,
+        "messages": [
+            {"role": "system", "content": build_system_prompt()},
+            {"role": "user", "content": question.strip()},
+        ],
+    }
+
+
+@traced()
+def parse_screen_question(question: str) -> Dict[str, Any]:
+    """Un solo parsing LLM per tutti i criteri della domanda."""
+    try:
+        response = chat("parse", site="company_list", **_gpt_request(question))
+        return interpret_screen_output(response.choices[0].message.content)
+    except Exception as e:
+        print("❌ Errore nel parsing GPT:", e)
+        return {}
+
+
+@traced("company_list.parse_screen_question")
+async def parse_screen_question_async(question: str) -> Dict[str, Any]:
+    """Versione async di `parse_screen_question`."""
+    try:
+        response = await achat("parse", site="company_list", **_gpt_request(question))
+        return interpret_screen_output(response.choices[0].message.content)
+    except Exception as e:
+        print("❌ Errore nel parsing GPT:", e)
+        return {}
+
+
+def answer_screen_question(question: str) -> Dict[str, Any]:
+    """Domanda di screening → payload per `format_answer(question, "screen", ...)`."""
+    parsed = parse_screen_question(question)
+    if not (parsed.get("filters") or parsed.get("sector") or parsed.get("industry")):
+        raise ValueError("Impossibile interpretare i criteri dello screening.")
+    return screen(**parsed)
+
+
+async def answer_screen_question_async(question: str) -> Dict[str, Any]:
+    """Versione async di `answer_screen_question`."""
+    parsed = await parse_screen_question_async(question)
+    if not (parsed.get("filters") or parsed.get("sector") or parsed.get("industry")):
+        raise ValueError("Impossibile interpretare i criteri dello screening.")
+    return await screen_async(**parsed)
+
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def _parse_where(items: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """['marketcap>10e9', 'country=Italy'] → {'marketcap': {'>': 10e9}, 'country': {'=': 'Italy'}}."""
+    filters: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        match = _RE_WHERE.match(item)
+        if not match:
+            raise ValueError(f"Condizione non valida: {item!r} (es. marketcap>10e9)")
+        metric, op, value = match.groups()
+        filters.setdefault(metric, {})[op] = value.strip("'\"")
+    return filters
+
+
+def main() -> None:
+    from ..number_format import format_value
+
+    ap = argparse.ArgumentParser(description="Screening delle aziende su `info`.")
+    ap.add_argument("--where", action="append", default=[],
+                    help="condizione, es. marketcap>10e9 (ripetibile)")
+    ap.add_argument("--sector", action="append", help="settore (ripetibile)")
+    ap.add_argument("--industry", action="append", help="industry (ripetibile)")
+    ap.add_argument("--sort", default=DEFAULT_SORT, help="metrica di ordinamento, '-' per decrescente")
+    ap.add_argument("--page", type=int, default=1)
+    ap.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    ap.add_argument("--indexes", action="store_true", help="crea gli indici di screening su info")
+    args = ap.parse_args()
+
+    if args.indexes:
+        created = ensure_indexes()
+        print(f"📊 Indici creati: {len(created)} (già presenti: {len(SCREEN_INDEXES) - len(created)})")
+        return
+
+    result = screen(_parse_where(args.where), args.sector, args.industry,
+                    args.sort.split(","), args.page, args.page_size)
+    print(f"🔎 {result['total']} aziende – pagina {result['page']}/{result['pages'] or 1}")
+    for row in result["rows"]:
+        values = "  ".join(f"{key}={format_value(row[key], 'info', column)}"
+                           for key, column in result["columns"].items() if row[key] is not None)
+        print(f"{row['rank']:>4}. {row['symbol']:<8} {(row['name'] or '')[:30]:<30} {values}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+company_resolver.py
+
+Risolutore in memoria nome azienda / alias → ticker.
+
+Carica simboli e nomi da `data/documents_raw/company_list_with_names.csv`
+(ticker, cik, name) e dalla tabella `info` (symbol, shortName, longName) e li
+indicizza in tre strutture:
+
+• dizionario esatto   ticker / nome normalizzato / alias  → ticker
+• trie per parola     "ford" → prefisso univoco di "ford motor" → F
+• indice a trigrammi  "microsft" → "microsoft" → MSFT (solo se richiesto)
+
+Nomi e alias di ticker che condividono lo stesso CIK (GOOGL/GOOG, F/F-PB, …)
+vengono ricondotti al primo che compare nel CSV, che è ordinato per
+capitalizzazione; un ticker scritto esplicitamente resta sé stesso
+(BRK-A non diventa BRK-B: sono prezzi diversi).
+
+L'istanza è unica per processo (`get_resolver()`) ed è condivisa dai parser
+numerici e dal filtro ticker del retriever.  Una risoluzione costa pochi
+microsecondi; il caricamento iniziale avviene una sola volta.
+
+API pubblico
+------------
+get_resolver() -> CompanyResolver
+CompanyResolver.resolve(name)                   -> str | None
+CompanyResolver.find_tickers(text, fuzzy=False) -> list[str]
+CompanyResolver.mentions_company(text)          -> bool
+CompanyResolver.match_words(words, text, fuzzy) -> (set[str], list[str])
+"""
+
+from __future__ import annotations
+
+import csv
+import functools
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pymysql
+
+from .db_pool import fetch_all
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+COMPANY_CSV_PATH = ROOT_DIR / "data" / "documents_raw" / "company_list_with_names.csv"
+
+__all__ = ["CompanyResolver", "get_resolver", "normalize_company_name"]
+
+# --------------------------------------------------------------------------- #
+#  Configurazione
+# --------------------------------------------------------------------------- #
+
+# Alias comuni che non derivano dal nome legale
+_ALIASES: Dict[str, str] = {
+    "google": "GOOGL",
+    "facebook": "META",
+    "berkshire": "BRK-B",
+    "berkshire hathaway": "BRK-B",
+    "jp morgan": "JPM",
+    "jpmorgan": "JPM",
+    "coca cola": "KO",
+    "coca-cola": "KO",
+    "exxon": "XOM",
+    "walmart": "WMT",
+    "disney": "DIS",
+    "p&g": "PG",
+    "procter & gamble": "PG",
+    "johnson & johnson": "JNJ",
+    "j&j": "JNJ",
+}
+
+# Parole che da sole non identificano mai un'azienda
+_IGNORED_WORDS = {
+    "a", "an", "and", "the", "of", "in", "on", "for", "to", "is", "was", "what",
+    "il", "lo", "la", "di", "del", "della", "e", "è", "nel", "per", "da", "dal",
+    "company", "group", "holdings", "international", "american", "national",
+    "first", "global", "new", "united", "general", "financial", "capital",
+    "income", "revenue", "price", "net", "total", "cash", "debt",
+}
+
+# Sigle maiuscole che nel testo non sono quasi mai ticker (AI = C3.ai, …)
+_NOT_TICKERS = {
+    "AI", "API", "CEO", "CFO", "COO", "CTO", "ESG", "EPS", "ETF", "EU", "EV",
+    "FCF", "FY", "GDP", "IPO", "IT", "OK", "PE", "ROA", "ROE", "SEC", "SEI",
+    "TTM", "UK", "US", "USA", "YTD", "Q1", "Q2", "Q3", "Q4",
+}
+
+# Parole comuni che a inizio frase hanno la maiuscola ma non sono nomi
+_COMMON_WORDS = {
+    # IT
+    "sei", "sono", "hai", "ha", "puoi", "può", "qual", "quale", "quali", "come",
+    "cosa", "chi", "perché", "quando", "dove", "quanto", "quanti", "dimmi",
+    "mostra", "mostrami", "elenca", "confronta", "spiega", "ci", "mi", "che",
+    "ciao", "grazie", "c'è", "esiste", "esistono",
+    # EN
+    "what", "what's", "which", "who", "why", "when", "where", "how", "is", "are",
+    "does", "do", "did", "can", "could", "should", "would", "will", "tell",
+    "show", "give", "list", "compare", "explain", "find", "please", "hi",
+    "hello", "thanks", "any", "all", "some", "there", "this", "these", "my",
+}
+
+_COMPANY_SUFFIXES = re.compile(
+    r"\b(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|llc|lp|"
+    r"holdings?|group|sa|nv|ag|se|the|class [a-c]|common stock)\b\.?",
+    re.IGNORECASE,
+)
+_RE_WORD = re.compile(r"[a-z0-9&/]+(?:[.'\-][a-z0-9]+)*")
+_RE_TICKER = re.compile(r"(?<![\w.&/\-])[A-Z][A-Z0-9]{1,5}(?:[.\-][A-Z]{1,2})?(?![\w&/\-])")
+_RE_SENTENCE_START = re.compile(r"(?:^|[.!?]\s+)[\"'«(]*([A-Za-zÀ-ÿ][\w'’]*)")
+
+_MAX_NGRAM = 5
+_FUZZY_MIN_LEN = 5
+_FUZZY_THRESHOLD = 0.5
+
+
+def _tokens(text: str) -> List[str]:
+    return _RE_WORD.findall(text.lower().replace("’", "'"))
+
+
+def normalize_company_name(name: str) -> str:
+    """'Apple Inc.' → 'apple', 'Amazon.com, Inc.' → 'amazon.com'."""
+    s = _COMPANY_SUFFIXES.sub(" ", name.replace(",", " "))
+    return " ".join(_tokens(s))
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# --------------------------------------------------------------------------- #
+#  Trie per parola
+# --------------------------------------------------------------------------- #
+
+class _TrieNode:
+    """Nodo del trie: figli per parola + (max 2) ticker nel sottoalbero."""
+
+    __slots__ = ("children", "symbols")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.symbols: Set[str] = set()
+
+    def add(self, words: List[str], symbol: str) -> None:
+        node = self
+        for word in words:
+            node = node.children.setdefault(word, _TrieNode())
+            if len(node.symbols) < 2:
+                node.symbols.add(symbol)
+
+    def unique_prefix(self, words: List[str]) -> Optional[str]:
+        """Ticker se `words` è prefisso di nomi di UNA sola azienda."""
+        node = self
+        for word in words:
+            node = node.children.get(word)
+            if node is None:
+                return None
+        if len(node.symbols) == 1:
+            return next(iter(node.symbols))
+        return None
+
+
+# --------------------------------------------------------------------------- #
+#  Resolver
+# --------------------------------------------------------------------------- #
+
+class CompanyResolver:
+    """Indice ticker / nomi / alias costruito una volta e interrogato in µs."""
+
+    def __init__(self, rows: Iterable[Tuple[str, Optional[str], Iterable[str]]]) -> None:
+        """
+        Parameters
+        ----------
+        rows : iterable di (ticker, cik | None, nomi)
+            In ordine di priorità: a parità di nome o CIK vince il primo.
+        """
+        self.symbols: Set[str] = set()
+        self._canonical: Dict[str, str] = {}     # ticker → ticker principale
+        self._names: Dict[str, str] = {}         # nome normalizzato → ticker
+        self._trie = _TrieNode()
+        self._grams: Dict[str, Set[str]] = {}    # trigramma → nomi
+        self._gram_count: Dict[str, int] = {}    # nome → n. trigrammi
+        cik_owner: Dict[str, str] = {}
+
+        for symbol, cik, names in rows:
+            symbol = symbol.strip().upper()
+            if not symbol:
+                continue
+            canonical = cik_owner.setdefault(cik, symbol) if cik else symbol
+            self.symbols.add(symbol)
+            self._canonical.setdefault(symbol, canonical)
+            for raw in names:
+                if raw:
+                    self._add_name(normalize_company_name(raw), canonical)
+
+        for alias, symbol in _ALIASES.items():
+            if symbol in self.symbols:
+                self._names[" ".join(_tokens(alias))] = self._canonical[symbol]
+
+    def _add_name(self, name: str, symbol: str) -> None:
+        if not name or name in _IGNORED_WORDS:
+            return
+        variants = {name, name.replace(".com", "")}
+        for variant in variants:
+            if variant in self._names:
+                continue
+            self._names[variant] = symbol
+            words = variant.split()
+            self._trie.add(words, symbol)
+            grams = _trigrams(variant)
+            self._gram_count[variant] = len(grams)
+            for gram in grams:
+                self._grams.setdefault(gram, set()).add(variant)
+
+    # ------------------------------------------------------------------ #
+    #  Lookup singolo
+    # ------------------------------------------------------------------ #
+
+    def _fuzzy(self, phrase: str) -> Optional[str]:
+        """Match a trigrammi (Jaccard) con vincitore unico sopra soglia."""
+        grams = _trigrams(phrase)
+        scores: Dict[str, int] = {}
+        for gram in grams:
+            for name in self._grams.get(gram, ()):
+                scores[name] = scores.get(name, 0) + 1
+        best: List[Tuple[float, str]] = []
+        for name, shared in scores.items():
+            jaccard = shared / (len(grams) + self._gram_count[name] - shared)
+            if jaccard >= _FUZZY_THRESHOLD:
+                best.append((jaccard, name))
+        if not best:
+            return None
+        best.sort(reverse=True)
+        symbols = {self._names[n] for s, n in best if s == best[0][0]}
+        return symbols.pop() if len(symbols) == 1 else None
+
+    def resolve(self, name: str, fuzzy: bool = True) -> Optional[str]:
+        """
+        Risolve un nome o un alias nel ticker principale; un ticker esatto
+        resta invariato.
+
+        >>> r = CompanyResolver([("GOOGL", "1652044", ["Alphabet Inc."]),
+        ...                      ("GOOG", "1652044", ["Alphabet Inc. Class C"])])
+        >>> r.resolve("GOOG"), r.resolve("Alphabet")
+        ('GOOG', 'GOOGL')
+
+        Parameters
+        ----------
+        name : str
+            Es. "AAPL", "Apple", "Apple Inc.", "google".
+        fuzzy : bool
+            Se True tenta anche il match a trigrammi (errori di battitura).
+        """
+        if not name:
+            return None
+        raw = name.strip()
+        upper = raw.upper()
+        # "FORD" è un ticker, "Ford" / "ford" un nome
+        if raw == upper and upper in self.symbols:
+            return upper
+        phrase = normalize_company_name(name)
+        if not phrase:
+            return None
+        symbol = self._names.get(phrase) or self._trie.unique_prefix(phrase.split())
+        if symbol is None and fuzzy and len(phrase) >= _FUZZY_MIN_LEN:
+            symbol = self._fuzzy(phrase)
+        if symbol is None and upper in self.symbols:
+            symbol = upper
+        return symbol
+
+    # ------------------------------------------------------------------ #
+    #  Ricerca nel testo
+    # ------------------------------------------------------------------ #
+
+    def match_words(
+        self,
+        words: List[str],
+        text: str,
+        fuzzy: bool = False,
+        capitalized_only: bool = False,
+    ) -> Tuple[Set[str], List[str]]:
+        """
+        Cerca aziende in una lista di token già normalizzati.
+
+        I ticker contano solo se scritti in maiuscolo in `text`, come parola
+        a sé di almeno due caratteri e fuori da `_NOT_TICKERS` (AI, ESG,
+        CEO…); i nomi vengono cercati per n‑gram dal più lungo al più corto.
+        Con `capitalized_only` un nome conta solo se la sua prima parola è
+        scritta con l'iniziale maiuscola in `text` (utile su testo libero,
+        dove parole come "risk" sarebbero prefissi di nomi reali); le parole
+        comuni a inizio frase ("Sei", "What") non contano come maiuscole.
+
+        Returns
+        -------
+        (ticker trovati, token non usati)
+        """
+        found: Set[str] = set()
+        used = [False] * len(words)
+
+        capitalized = {w.lower() for w in re.findall(r"\b[A-Z][\w.&'\-]*", text)
+                       if w not in _NOT_TICKERS}
+        initial = [w.lower().replace("’", "'") for w in _RE_SENTENCE_START.findall(text)]
+        capitalized -= {w for w in initial if w in _COMMON_WORDS}
+
+        for raw in _RE_TICKER.findall(text):
+            low = raw.lower()
+            if (raw in self.symbols and raw not in _NOT_TICKERS and low in words
+                    and low not in _IGNORED_WORDS):
+                found.add(raw)
+                used[words.index(low)] = True
+
+        for n in range(min(_MAX_NGRAM, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                if any(used[i:i + n]):
+                    continue
+                gram = words[i:i + n]
+                if n == 1 and (gram[0] in _IGNORED_WORDS or len(gram[0]) < 3
+                               or gram[0].upper() in _NOT_TICKERS):
+                    continue
+                if capitalized_only and gram[0] not in capitalized:
+                    continue
+                phrase = " ".join(gram)
+                symbol = self._names.get(phrase) or self._trie.unique_prefix(gram)
+                if symbol is None and fuzzy and len(phrase) >= _FUZZY_MIN_LEN:
+                    symbol = self._fuzzy(phrase)
+                if symbol:
+                    found.add(symbol)
+                    for j in range(i, i + n):
+                        used[j] = True
+
+        return found, [w for w, u in zip(words, used) if not u]
+
+    def find_tickers(self, text: str, fuzzy: bool = False) -> List[str]:
+        """
+        Ticker principali menzionati in `text` (nomi solo se maiuscoli).
+
+        Examples
+        --------
+        >>> r = CompanyResolver([("SEIC", None, ["SEI Investments Co"]),
+        ...                      ("MSFT", None, ["Microsoft Corp"]), ("AI", None, ["C3.ai Inc"])])
+        >>> r.find_tickers("Sei aggiornato?"), r.find_tickers("How does AI affect Microsoft?")
+        ([], ['MSFT'])
+        """
+        found, _ = self.match_words(_tokens(text), text, fuzzy=fuzzy, capitalized_only=True)
+        return sorted(found)
+
+
+    def mentions_company(self, text: str) -> bool:
+        """
+        True se `text` nomina un'azienda: un ticker come in `find_tickers`
+        oppure un nome / alias esatto anche in minuscolo («apple»).  Niente
+        prefissi né fuzzy: serve a dire "questa domanda riguarda dei dati"
+        senza scambiare parole comuni per aziende.
+
+        Examples
+        --------
+        >>> r = CompanyResolver([("AAPL", None, ["Apple Inc."]), ("MOMO", None, ["Hello Group"])])
+        >>> r.mentions_company("sei aggiornato su apple?"), r.mentions_company("hello")
+        (True, False)
+        """
+        if self.find_tickers(text):
+            return True
+        words = _tokens(text)
+        for n in range(min(_MAX_NGRAM, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                gram = words[i:i + n]
+                if n == 1 and (len(gram[0]) < 3 or gram[0] in _IGNORED_WORDS
+                               or gram[0] in _COMMON_WORDS or gram[0].upper() in _NOT_TICKERS):
+                    continue
+                if " ".join(gram) in self._names:
+                    return True
+        return False
+
+
+# --------------------------------------------------------------------------- #
+#  Caricamento
+# --------------------------------------------------------------------------- #
+
+def _csv_rows() -> List[Tuple[str, Optional[str], List[str]]]:
+    try:
+        with COMPANY_CSV_PATH.open(encoding="utf-8", newline="") as f:
+            return [
+                (r["ticker"], r.get("cik") or None, [r.get("name") or ""])
+                for r in csv.DictReader(f) if r.get("ticker")
+            ]
+    except FileNotFoundError:
+        logging.warning("⚠️ %s non trovato: resolver senza CSV.", COMPANY_CSV_PATH)
+        return []
+
+
+def _info_rows() -> List[Tuple[str, Optional[str], List[str]]]:
+    try:
+        rows = fetch_all("SELECT symbol, shortName, longName FROM info")
+    except pymysql.MySQLError as exc:
+        logging.warning("⚠️ Tabella info non disponibile per il resolver: %s", exc)
+        return []
+    return [(s, None, [sn, ln]) for s, sn, ln in rows if s]
+
+
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _build_resolver() -> CompanyResolver:
+    return CompanyResolver(_csv_rows() + _info_rows())
+
+
+def get_resolver(refresh: bool = False) -> CompanyResolver:
+    """
+    Istanza condivisa del resolver (costruita alla prima chiamata).
+
+    Parameters
+    ----------
+    refresh : bool
+        Forza il ricaricamento da CSV e `info` (es. dopo l'ETL).
+    """
+    with _lock:
+        if refresh:
+            _build_resolver.cache_clear()
+        return _build_resolver()
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    t0 = time.perf_counter()
+    resolver = get_resolver()
+    print(f"Caricato in {time.perf_counter() - t0:.2f}s "
+          f"({len(resolver.symbols):,} ticker)")
+    for arg in sys.argv[1:] or ["Apple", "google", "Microsft", "ford"]:
+        t0 = time.perf_counter()
+        hit = resolver.resolve(arg)
+        print(f"{arg!r:>14} → {hit}  ({(time.perf_counter() - t0) * 1e6:.1f} µs)")
@@ -0,0 +1,62 @@
+"""
+data_version.py
+
+Versioni per tabella dei dati scritti dall'ETL (`update_mark_db.py`).
+
+Ogni tabella ha un file "stamp" in `data/cache/table_versions/<tabella>`;
+l'ETL lo tocca ogni volta che inserisce o aggiorna righe e la sua mtime
+diventa la versione della tabella.  Le cache a valle (risposte, id aziende,
+statistiche…) salvano la versione al momento del calcolo e considerano il
+valore scaduto appena cambia.
+
+Si usano file e non una tabella SQL perché più worker ETL girano in
+parallelo (tmux) e i lettori devono poter controllare la versione con un
+semplice `stat`, senza round‑trip verso MySQL.
+
+API pubblico
+------------
+bump_table_version(table, version=None) -> None
+table_version(table)          -> int   (0 se mai scritta)
+tables_version(tables)        -> tuple[int, ...]
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+VERSION_DIR = Path(os.getenv("MARK_VERSION_DIR", ROOT_DIR / "data" / "cache" / "table_versions"))
+
+__all__ = ["bump_table_version", "table_version", "tables_version"]
+
+
+def bump_table_version(table: str, version: Optional[int] = None) -> None:
+    """
+    Segna `table` come modificata adesso, oppure alla `version` data (ns).
+
+    Le tabelle materializzate passano le versioni delle sorgenti lette
+    PRIMA del ricalcolo: una scrittura dell'ETL durante il ricalcolo resta
+    più recente dello stamp e il risultato viene considerato scaduto.
+    """
+    VERSION_DIR.mkdir(parents=True, exist_ok=True)
+    path = VERSION_DIR / table
+    path.touch(exist_ok=True)
+    if version is None:
+        os.utime(path)
+    else:
+        os.utime(path, ns=(version, version))
+
+
+def table_version(table: str) -> int:
+    """mtime (ns) dello stamp di `table`, 0 se l'ETL non l'ha mai scritta."""
+    try:
+        return os.stat(VERSION_DIR / table).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def tables_version(tables: Iterable[str]) -> Tuple[int, ...]:
+    """Versioni di più tabelle, nell'ordine dato."""
+    return tuple(table_version(t) for t in tables)
@@ -16,15 +16,20 @@ month      | "2023-12"                         | (2023‑12‑01, 2023‑12‑31
 date       | "2023-12-15"                      | (2023‑12‑15, 2023‑12‑15)
 range      | {"from":"2020","to":"2024"}       | (2020‑01‑01, 2024‑12‑31)
 
+`period_ranges(period)` fa lo stesso per il campo `period` di
+`parse_avg_query` (lista di anni / mesi / range): una lista di intervalli
+ordinati, con i periodi contigui fusi in un unico `BETWEEN`.
+
 Eccezioni sollevate:
 - ValueError se `time_type` non è riconosciuto o il formato `time_value` è invalido.
 """
 
 import datetime
 import calendar
-from typing import Tuple, Optional, Dict, Any
+import re
+from typing import Tuple, Optional, Dict, Any, List
 
-__all__ = ["bounds"]
+__all__ = ["bounds", "period_ranges"]
 
 DatePair = Tuple[Optional[datetime.date], Optional[datetime.date]]
 
@@ -91,4 +96,47 @@ def bounds(time_type: str, time_value: Any) -> DatePair:
         end = datetime.date(end_year, 12, 31)
         return start, end
 
-    raise ValueError(f"time_type sconosciuto: {time_type!r}")
\ No newline at end of file
+    raise ValueError(f"time_type sconosciuto: {time_type!r}")
+
+
+_RE_YEAR = re.compile(r"(?:fy\s*)?(\d{4})", re.IGNORECASE)
+_RE_MONTH = re.compile(r"\d{4}-\d{1,2}")
+_RE_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _period_bounds(value: Any) -> DatePair:
+    """Un elemento di `period`: "2023", "FY2023", "2023-05", "2023-05-31" o {"from","to"}."""
+    if isinstance(value, dict):
+        return bounds("range", value)
+    text = str(value).strip()
+    match = _RE_YEAR.fullmatch(text)
+    if match:
+        return bounds("year", match.group(1))
+    if _RE_MONTH.fullmatch(text):
+        return bounds("month", text)
+    if _RE_DATE.fullmatch(text):
+        return bounds("date", text)
+    raise ValueError(f"Periodo non valido: {value!r}")
+
+
+def period_ranges(period: Any) -> List[DatePair]:
+    """
+    Converte il `period` di una media in intervalli di date disgiunti.
+
+    ["2021", "2022", "2023"]  -> [(2021‑01‑01, 2023‑12‑31)]
+    ["2019", "2023-06"]       -> [(2019‑01‑01, 2019‑12‑31), (2023‑06‑01, 2023‑06‑30)]
+    "latest" / None           -> []   (nessun vincolo temporale)
+
+    Ogni intervallo diventa un `BETWEEN` sul campo data, che a differenza di
+    `LIKE '%2023%'` usa l'indice (company_id, data).
+    """
+    if period is None or period == "latest":
+        return []
+    items = period if isinstance(period, list) else [period]
+    merged: List[DatePair] = []
+    for start, end in sorted(_period_bounds(item) for item in items):
+        if merged and start <= merged[-1][1] + datetime.timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
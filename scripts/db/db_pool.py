@@ -0,0 +1,170 @@
+"""
+db_pool.py
+
+Pool di connessioni MySQL condiviso dai moduli di query sincroni
+(`value_query`, `avg_query`, `company_resolver`, fallback di `async_db`).
+
+Aprire un `pymysql.connect` per ogni query costa handshake TCP +
+autenticazione a ogni domanda numerica: qui le connessioni PyMySQL vivono in
+un `sqlalchemy.pool.QueuePool` e vengono riusate.
+
+• **pre‑ping** – al checkout la connessione viene verificata con `ping()`;
+  se il server l'ha chiusa (wait_timeout, riavvio) il pool ne apre un'altra.
+• **recycle** – le connessioni più vecchie di MARK_DB_POOL_RECYCLE secondi
+  vengono riaperte prima dell'uso.
+• **un pool per processo** – dopo un fork (worker gunicorn) il figlio crea
+  il proprio pool invece di condividere i socket del padre.
+
+Le connessioni sono in autocommit: ogni SELECT vede i dati appena scritti
+dall'ETL, anche su una connessione riusata.
+
+Configurazione
+--------------
+MARK_DB_POOL=0            nessun pool: una connessione per query (come prima)
+MARK_DB_POOL_SIZE         connessioni tenute aperte (default 5)
+MARK_DB_MAX_OVERFLOW      connessioni temporanee oltre il pool (default 10)
+MARK_DB_POOL_TIMEOUT      secondi di attesa per una connessione libera (default 30)
+MARK_DB_POOL_RECYCLE      età massima di una connessione, secondi (default 3600)
+MARK_DB_CONNECT_TIMEOUT   timeout di connessione PyMySQL, secondi (default 10)
+MARK_DB_READ_TIMEOUT      timeout di lettura PyMySQL, secondi (default 30)
+
+API pubblico
+------------
+connection()            context manager → connessione PyMySQL
+fetch_one(sql, params)  -> tuple | None
+fetch_all(sql, params)  -> list[tuple]
+pool_status()           -> str
+dispose()               chiude le connessioni inattive del pool
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+import pymysql
+from dotenv import load_dotenv
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+__all__ = ["connection", "fetch_one", "fetch_all", "pool_status", "dispose"]
+
+load_dotenv()
+MYSQL_USER     = os.getenv("MYSQL_USER")
+MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
+MYSQL_HOST     = os.getenv("MYSQL_HOST")
+MYSQL_PORT     = int(os.getenv("MYSQL_PORT", 3306))
+MYSQL_DB       = os.getenv("MYSQL_DB")
+
+POOL_ENABLED    = os.getenv("MARK_DB_POOL", "1") != "0"
+POOL_SIZE       = int(os.getenv("MARK_DB_POOL_SIZE", 5))
+MAX_OVERFLOW    = int(os.getenv("MARK_DB_MAX_OVERFLOW", 10))
+POOL_TIMEOUT    = float(os.getenv("MARK_DB_POOL_TIMEOUT", 30))
+POOL_RECYCLE    = int(os.getenv("MARK_DB_POOL_RECYCLE", 3600))
+CONNECT_TIMEOUT = int(os.getenv("MARK_DB_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT    = int(os.getenv("MARK_DB_READ_TIMEOUT", 30))
+
+_pool: Optional[QueuePool] = None
+_pool_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _connect() -> pymysql.connections.Connection:
+    """Nuova connessione PyMySQL (usata dal pool e senza pool)."""
+    return pymysql.connect(
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        host=MYSQL_HOST,
+        port=MYSQL_PORT,
+        database=MYSQL_DB,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT or None,
+        autocommit=True,
+    )
+
+
+def _ping(dbapi_connection: Any, connection_record: Any, connection_proxy: Any) -> None:
+    """Pre‑ping al checkout: una connessione morta viene sostituita dal pool."""
+    try:
+        dbapi_connection.ping(reconnect=False)
+    except Exception as e:  # noqa: BLE001
+        raise exc.DisconnectionError(f"connessione MySQL chiusa: {e}") from e
+
+
+def _get_pool() -> QueuePool:
+    """Pool del processo corrente (creato al primo uso, ricreato dopo un fork)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _lock:
+            if _pool is None or _pool_pid != pid:
+                # un pool ereditato dal padre non va chiuso: i socket sono suoi
+                pool = QueuePool(
+                    _connect,
+                    pool_size=POOL_SIZE,
+                    max_overflow=MAX_OVERFLOW,
+                    timeout=POOL_TIMEOUT,
+                    recycle=POOL_RECYCLE,
+                    reset_on_return="rollback",
+                )
+                event.listen(pool, "checkout", _ping)
+                _pool, _pool_pid = pool, pid
+    return _pool
+
+
+@contextlib.contextmanager
+def connection() -> Iterator[Any]:
+    """
+    Connessione PyMySQL dal pool, restituita al pool all'uscita.
+
+    Una connessione su cui la query fallisce per errore di rete viene
+    scartata invece di tornare nel pool.
+    """
+    if not POOL_ENABLED:
+        conn = _connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    conn = _get_pool().connect()
+    try:
+        yield conn
+    except pymysql.OperationalError:
+        conn.invalidate()
+        raise
+    finally:
+        conn.close()
+
+
+def fetch_one(sql: str, params: Sequence[Any] = ()) -> Optional[Tuple[Any, ...]]:
+    """Esegue `sql` e restituisce la prima riga (o None)."""
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(sql, tuple(params))
+        return cursor.fetchone()
+
+
+def fetch_all(sql: str, params: Sequence[Any] = ()) -> List[Tuple[Any, ...]]:
+    """Esegue `sql` e restituisce tutte le righe."""
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(sql, tuple(params))
+        return list(cursor.fetchall())
+
+
+def pool_status() -> str:
+    """Stato del pool (dimensione, connessioni in uso, overflow) per debug."""
+    if not POOL_ENABLED:
+        return "pool disattivato (MARK_DB_POOL=0)"
+    return _get_pool().status()
+
+
+def dispose() -> None:
+    """Chiude le connessioni inattive; il pool si ripopola al prossimo uso."""
+    global _pool
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.dispose()
+        _pool = None
@@ -0,0 +1,93 @@
+"""
+distribution_query.py
+
+Distribuzione di una metrica di `info` sull'universo o su un settore /
+industry: istogramma, quantili a scelta e code (aziende agli estremi).
+
+I valori vengono dalla cache a colonne di `stats_query` (array NumPy
+ricaricati solo quando l'ETL aggiorna `info`), quindi un istogramma non
+esegue SQL.  Le metriche finanziarie hanno code lunghissime (P/E di 5.000,
+margini di −300%): per default l'istogramma esclude i valori fuori dai
+percentili 1–99 e li riporta a parte come `below` / `above`.
+
+API pubblico
+------------
+histogram(metric, bins=20, sector=None, industry=None, clip=(1, 99), log_scale=False) -> dict
+quantiles(metric, qs=(5, 25, 50, 75, 95), sector=None, industry=None) -> dict[str, float]
+tails(metric, n=5, sector=None, industry=None)  -> {"lowest": [...], "highest": [...]}
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .stats_query import group_values
+
+__all__ = ["histogram", "quantiles", "tails"]
+
+
+def histogram(metric: str, bins: int = 20, sector: Optional[str] = None,
+              industry: Optional[str] = None, clip: Optional[Tuple[float, float]] = (1, 99),
+              log_scale: bool = False) -> Dict[str, Any]:
+    """
+    Istogramma della metrica.
+
+    Parameters
+    ----------
+    clip : (low, high) | None
+        Percentili oltre i quali i valori sono contati in `below` / `above`
+        invece che nei bin; None per usare tutto l'intervallo.
+    log_scale : bool
+        Bin equispaziati in log10 (solo valori > 0): utile per market cap,
+        ricavi, volumi.
+
+    Returns
+    -------
+    dict
+        {"edges": [...], "counts": [...], "count", "below", "above"}
+    """
+    _, values = group_values(metric, sector, industry)
+    excluded = 0
+    if log_scale:
+        excluded = int(np.sum(values <= 0))
+        values = values[values > 0]
+    if values.size == 0:
+        return {"edges": [], "counts": [], "count": 0, "below": 0, "above": 0}
+
+    low, high = (np.percentile(values, clip) if clip else (values.min(), values.max()))
+    inside = values[(values >= low) & (values <= high)]
+    if log_scale:
+        edges = np.logspace(np.log10(low), np.log10(high), bins + 1)
+    else:
+        edges = np.linspace(low, high, bins + 1)
+    counts, edges = np.histogram(inside, bins=edges)
+    return {
+        "edges": edges.tolist(),
+        "counts": counts.tolist(),
+        "count": int(values.size),
+        "below": int(np.sum(values < low)) + excluded,
+        "above": int(np.sum(values > high)),
+    }
+
+
+def quantiles(metric: str, qs: Sequence[float] = (5, 25, 50, 75, 95),
+              sector: Optional[str] = None, industry: Optional[str] = None) -> Dict[str, float]:
+    """{'p5': …, 'p50': …} per i percentili richiesti (vuoto se non ci sono dati)."""
+    _, values = group_values(metric, sector, industry)
+    if values.size == 0:
+        return {}
+    return {f"p{q:g}": float(v) for q, v in zip(qs, np.percentile(values, qs))}
+
+
+def tails(metric: str, n: int = 5, sector: Optional[str] = None,
+          industry: Optional[str] = None) -> Dict[str, Any]:
+    """Le `n` aziende con i valori più bassi e più alti nel gruppo."""
+    symbols, values = group_values(metric, sector, industry)
+    order = np.argsort(values, kind="stable")
+
+    def pick(indexes: np.ndarray) -> List[Dict[str, Any]]:
+        return [{"symbol": str(symbols[i]), "value": float(values[i])} for i in indexes]
+
+    return {"lowest": pick(order[:n]), "highest": pick(order[::-1][:n])}
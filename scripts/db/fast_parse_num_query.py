@@ -0,0 +1,407 @@
+"""
+fast_parse_num_query.py
+
+Parser deterministico ("fast path") per le domande numeriche più comuni,
+come «Apple net income 2023» o «MSFT trailing PE».  Non chiama alcun LLM:
+risolve azienda (via `company_resolver`), metrica e periodo con regole e
+tabelle di lookup e restituisce lo STESSO schema di `parse_num_query.parse_numerical_question`.
+
+Se anche uno solo dei tre elementi è ambiguo o assente la funzione
+restituisce ``None`` e il chiamante ripiega sul parsing via GPT.
+
+Schema di output
+----------------
+{
+    "company":    "AAPL",
+    "table":      "financials",
+    "column":     "Net_Income",
+    "time_field": "date",          # o None
+    "time_type":  "year",          # latest / year / month / date / range
+    "time_value": "2023"           # o None / "2023-12" / {"from":..,"to":..}
+}
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .company_resolver import get_resolver
+from .date_utils import bounds
+from .metadata_cache import cached_fragment, current_metric_metadata, current_table_metadata
+
+__all__ = ["fast_parse_numerical_question"]
+
+# --------------------------------------------------------------------------- #
+#  Configurazione
+# --------------------------------------------------------------------------- #
+
+_ALLOWED_TABLES = {"balance_sheet", "cashflow", "financials", "history", "info"}
+
+# Sinonimi "umani" → chiave di METRIC_METADATA (IT + EN).
+# Le voci la cui chiave non esiste nei metadati correnti vengono ignorate.
+_METRIC_SYNONYMS: Dict[str, str] = {
+    "net income": "net_income",
+    "net profit": "net_income",
+    "earnings": "net_income",
+    "utile netto": "net_income",
+    "utile": "net_income",
+    "revenue": "total_revenue",
+    "revenues": "total_revenue",
+    "sales": "total_revenue",
+    "ricavi": "total_revenue",
+    "fatturato": "total_revenue",
+    "eps": "diluted_eps",
+    "diluted eps": "diluted_eps",
+    "basic eps": "basic_eps",
+    "pe": "trailingpe",
+    "p/e": "trailingpe",
+    "pe ratio": "trailingpe",
+    "price to earnings": "trailingpe",
+    "trailing pe": "trailingpe",
+    "forward pe": "forwardpe",
+    "market cap": "marketcap",
+    "market capitalization": "marketcap",
+    "capitalizzazione": "marketcap",
+    "price to book": "pricetobook",
+    "p/b": "pricetobook",
+    "roe": "returnonequity",
+    "return on equity": "returnonequity",
+    "roa": "returnonassets",
+    "return on assets": "returnonassets",
+    "dividend yield": "dividendyield",
+    "rendimento del dividendo": "dividendyield",
+    "price": "currentprice",
+    "stock price": "currentprice",
+    "share price": "currentprice",
+    "prezzo": "currentprice",
+    "closing price": "close",
+    "close price": "close",
+    "prezzo di chiusura": "close",
+    "chiusura": "close",
+    "gross profit": "gross_profit",
+    "utile lordo": "gross_profit",
+    "operating income": "operating_income",
+    "reddito operativo": "operating_income",
+    "net debt": "net_debt",
+    "debito netto": "net_debt",
+    "total debt": "total_debt",
+    "debito totale": "total_debt",
+    "total assets": "total_assets",
+    "attivo totale": "total_assets",
+    "free cash flow": "free_cash_flow",
+    "fcf": "free_cash_flow",
+    "operating cash flow": "operating_cash_flow",
+    "cash": "cash_and_cash_equivalents",
+    "liquidità": "cash_and_cash_equivalents",
+    "capex": "capital_expenditure",
+    "r&d": "research_and_development",
+    "employees": "fulltimeemployees",
+    "dipendenti": "fulltimeemployees",
+    "shares outstanding": "sharesoutstanding",
+    "beta": "beta",
+}
+
+_STOPWORDS = {
+    # IT
+    "qual", "quale", "quali", "è", "e", "era", "stato", "stata", "il", "lo", "la",
+    "i", "gli", "le", "di", "del", "della", "dello", "dei", "degli", "delle", "da",
+    "dal", "dalla", "nel", "nella", "nei", "in", "a", "al", "alla", "per", "su",
+    "sul", "quanto", "quanta", "quanti", "mi", "dici", "dimmi", "valore", "anno",
+    "mese", "ultimo", "ultima", "attuale", "corrente", "oggi", "ha", "avuto",
+    "l", "dell", "all", "nell", "sull", "dall", "un", "esercizio",
+    # EN
+    "what", "whats", "was", "is", "are", "the", "of", "for", "in", "on", "at",
+    "a", "an", "and", "to", "how", "much", "did", "does", "do", "its", "s", "me",
+    "tell", "give", "value", "year", "month", "latest", "current", "today", "fy",
+    "show", "with", "as", "by", "has", "had", "have", "fiscal", "please",
+}
+
+_MONTHS = {
+    "gennaio": 1, "febbraio": 2, "marzo": 3, "aprile": 4, "maggio": 5, "giugno": 6,
+    "luglio": 7, "agosto": 8, "settembre": 9, "ottobre": 10, "novembre": 11,
+    "dicembre": 12,
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6,
+    "july": 7, "august": 8, "september": 9, "october": 10, "november": 11,
+    "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8,
+    "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+
+_YEAR = r"(?:19|20)\d{2}"
+_RE_DATE = re.compile(rf"\b({_YEAR})-(\d{{2}})-(\d{{2}})\b")
+_RE_MONTH_NUM = re.compile(rf"\b({_YEAR})-(\d{{2}})\b")
+_RE_MONTH_NAME = re.compile(
+    rf"\b({'|'.join(sorted(_MONTHS, key=len, reverse=True))})\.?\s+(?:del\s+|of\s+)?({_YEAR})\b",
+    re.IGNORECASE,
+)
+_RE_RANGE = re.compile(
+    rf"\b(?:(?:dal|from)\s+)?({_YEAR})\s*(?:-|–|—|al|to|until|fino al)\s*({_YEAR})\b"
+    rf"|\b(?:tra|fra|between)\s+({_YEAR})\s+(?:e|and)\s+({_YEAR})\b",
+    re.IGNORECASE,
+)
+_RE_SINCE = re.compile(rf"\b(?:dal|since|from)\s+({_YEAR})\b", re.IGNORECASE)
+_RE_YEAR = re.compile(rf"\b(?:fy\s?)?({_YEAR})\b", re.IGNORECASE)
+# Periodi che il fast path non sa risolvere: trimestri e riferimenti relativi
+_RE_UNSUPPORTED_PERIOD = re.compile(
+    r"\b(?:q[1-4]|h[12]|quarter(?:ly|s)?|trimestr[ei]\w*|semestr[ei]\w*|ytd|ttm"
+    r"|year[- ]to[- ]date|(?:last|previous|prior|past|next|this)\s+(?:year|month|fy|fiscal)"
+    r"|(?:anno|mese)\s+(?:scorso|precedente|prossimo)|(?:quest|l)'anno)\b",
+    re.IGNORECASE,
+)
+
+_RE_WORD = re.compile(r"[a-z0-9&/]+(?:[.'][a-z0-9]+)*")
+_MAX_NGRAM = 5
+
+
+# --------------------------------------------------------------------------- #
+#  Normalizzazione
+# --------------------------------------------------------------------------- #
+
+def _tokens(text: str) -> List[str]:
+    """Tokenizza in minuscolo mantenendo '&' e '/' (r&d, p/e)."""
+    return _RE_WORD.findall(text.lower().replace("’", "'"))
+
+
+def _split_identifier(name: str) -> str:
+    """'trailingPE' / 'Net_Income' → 'trailing pe' / 'net income'."""
+    s = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", name)
+    return " ".join(_tokens(s.replace("_", " ")))
+
+
+# --------------------------------------------------------------------------- #
+#  Indici di lookup
+# --------------------------------------------------------------------------- #
+
+@cached_fragment
+def _metric_phrase_index() -> Dict[str, str]:
+    """
+    Frase normalizzata → chiave METRIC_METADATA, solo tabelle numeriche.
+
+    Le frasi derivano da chiave, nome colonna e sinonimi curati; una frase
+    che punta a più metriche diverse è ambigua e viene scartata.
+    """
+    metadata = current_metric_metadata()
+    index: Dict[str, str] = {}
+    ambiguous: Set[str] = set()
+
+    def add(phrase: str, key: str) -> None:
+        if not phrase or phrase in ambiguous:
+            return
+        if phrase in index and index[phrase] != key:
+            ambiguous.add(phrase)
+            del index[phrase]
+            return
+        index[phrase] = key
+
+    for key, meta in metadata.items():
+        if meta["table"] not in _ALLOWED_TABLES:
+            continue
+        add(" ".join(_tokens(key.replace("_", " "))), key)
+        add(_split_identifier(meta["column"]), key)
+
+    # I sinonimi curati hanno priorità sulle frasi generate
+    for phrase, key in _METRIC_SYNONYMS.items():
+        meta = metadata.get(key)
+        if meta and meta["table"] in _ALLOWED_TABLES:
+            index[" ".join(_tokens(phrase))] = key
+    return index
+
+
+@cached_fragment
+def _metric_description_tokens() -> Dict[str, Set[str]]:
+    """Chiave → insieme di token di chiave + descrizione (fallback)."""
+    out: Dict[str, Set[str]] = {}
+    for key, meta in current_metric_metadata().items():
+        if meta["table"] not in _ALLOWED_TABLES:
+            continue
+        words = _tokens(key.replace("_", " ")) + _tokens(meta.get("description", ""))
+        out[key] = set(words)
+    return out
+
+
+# --------------------------------------------------------------------------- #
+#  Estrattori
+# --------------------------------------------------------------------------- #
+
+def _extract_period(question: str) -> Tuple[Optional[Tuple[str, Any]], str]:
+    """
+    Riconosce il riferimento temporale e lo rimuove dal testo.
+
+    Returns
+    -------
+    ((time_type, time_value) | None, testo_residuo)
+        None se il periodo è ambiguo (es. più anni sparsi).
+    """
+    m = _RE_DATE.search(question)
+    if m:
+        return ("date", m.group(0)), question.replace(m.group(0), " ")
+
+    m = _RE_MONTH_NAME.search(question)
+    if m:
+        month = _MONTHS[m.group(1).lower()]
+        return ("month", f"{m.group(2)}-{month:02d}"), question.replace(m.group(0), " ")
+
+    m = _RE_MONTH_NUM.search(question)
+    if m and 1 <= int(m.group(2)) <= 12:
+        return ("month", m.group(0)), question.replace(m.group(0), " ")
+
+    m = _RE_RANGE.search(question)
+    if m:
+        start, end = sorted(y for y in m.groups() if y)
+        return ("range", {"from": start, "to": end}), question.replace(m.group(0), " ")
+
+    m = _RE_SINCE.search(question)
+    if m:
+        this_year = str(datetime.date.today().year)
+        return ("range", {"from": m.group(1), "to": this_year}), question.replace(m.group(0), " ")
+
+    years = _RE_YEAR.findall(question)
+    if len(set(years)) > 1:
+        return None, question
+    if years:
+        return ("year", years[0]), _RE_YEAR.sub(" ", question)
+
+    return ("latest", None), question
+
+
+def _content_words(words: List[str]) -> List[str]:
+    """Token significativi: né stopword né elisioni («l'utile» → «utile»)."""
+    return [part for w in words for part in w.split("'") if part and part not in _STOPWORDS]
+
+
+def _extract_metric(words: List[str]) -> Tuple[Optional[str], List[str], bool]:
+    """
+    Trova la metrica con il match di frase più lungo e rimuove i token usati.
+
+    Returns
+    -------
+    (chiave | None, token_residui, ambiguo)
+    """
+    index = _metric_phrase_index()
+    found: Set[str] = set()
+    used = [False] * len(words)
+
+    for n in range(min(_MAX_NGRAM, len(words)), 0, -1):
+        for i in range(len(words) - n + 1):
+            if any(used[i:i + n]):
+                continue
+            key = index.get(" ".join(words[i:i + n]))
+            if key:
+                found.add(key)
+                for j in range(i, i + n):
+                    used[j] = True
+
+    rest = [w for w, u in zip(words, used) if not u]
+    if len(found) == 1:
+        return found.pop(), rest, False
+    return None, rest, len(found) > 1
+
+
+def _metric_from_descriptions(words: List[str]) -> Optional[str]:
+    """
+    Fallback sulle descrizioni: tutti i token significativi residui devono
+    comparire nella chiave/descrizione di UNA sola metrica.
+    """
+    content = [w for w in words if w not in _STOPWORDS and len(w) > 2]
+    if not content:
+        return None
+    candidates = [
+        key for key, vocab in _metric_description_tokens().items()
+        if all(w in vocab for w in content)
+    ]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _extract_company(question: str, words: List[str]) -> Tuple[Optional[str], List[str]]:
+    """
+    Risolve l'azienda con il resolver condiviso (ticker in maiuscolo, nomi,
+    alias, prefissi univoci e match fuzzy); più candidati diversi ⇒ None.
+
+    Returns
+    -------
+    (ticker | None, token_residui)
+    """
+    found, rest = get_resolver().match_words(words, question, fuzzy=True)
+    if len(found) == 1:
+        return found.pop(), rest
+    return None, rest
+
+
+# --------------------------------------------------------------------------- #
+#  API pubblica
+# --------------------------------------------------------------------------- #
+
+def fast_parse_numerical_question(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Prova a interpretare la domanda senza LLM.
+
+    Parameters
+    ----------
+    question : str
+        Domanda dell'utente.
+
+    Returns
+    -------
+    dict | None
+        Dizionario nello schema di `parse_numerical_question`, oppure None
+        se la domanda non è risolvibile in modo univoco oppure contiene
+    parole che le regole non spiegano (trimestri, periodi relativi,
+    qualificatori come «per share» accanto a «earnings»).
+
+    Examples
+    --------
+    >>> fast_parse_numerical_question("Apple total debt in Q3 2023") is None
+    True
+    >>> fast_parse_numerical_question("Apple net income last year") is None
+    True
+    """
+    if _RE_UNSUPPORTED_PERIOD.search(question):
+        return None
+    period, remainder = _extract_period(question)
+    if period is None:
+        return None
+    time_type, time_value = period
+
+    words = _tokens(remainder)
+    metric_key, rest, ambiguous = _extract_metric(words)
+    if ambiguous:
+        return None
+
+    company, rest = _extract_company(remainder, rest)
+    if company is None:
+        return None
+
+    if metric_key is None:
+        metric_key = _metric_from_descriptions(rest)
+        if metric_key is None:
+            return None
+    elif _content_words(rest):
+        return None         # parole non spiegate: meglio il parser LLM
+
+    meta = current_metric_metadata()[metric_key]
+    table = meta["table"]
+    time_field = current_table_metadata().get(table, {}).get("time_field")
+    if time_field is None and time_type != "latest":
+        return None
+
+    try:
+        bounds(time_type, time_value)
+    except ValueError:
+        return None
+
+    return {
+        "company": company,
+        "table": table,
+        "column": meta["column"],
+        "time_field": time_field,
+        "time_type": time_type,
+        "time_value": time_value,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    q = " ".join(sys.argv[1:]) or input("Domanda> ").strip()
+    print(fast_parse_numerical_question(q))
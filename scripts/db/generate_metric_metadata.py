@@ -1,11 +1,16 @@
 import os
 import pymysql
+import sys
 import time
-from openai import OpenAI
 from dotenv import load_dotenv
 
+try:
+    from scripts.llm_provider import chat
+except ImportError:  # eseguito come script: python scripts/db/<file>.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    from scripts.llm_provider import chat
+
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 MYSQL_USER = os.getenv("MYSQL_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
@@ -45,7 +50,9 @@ Return only a Python dictionary in this format:
     """.strip()
 
     try:
-        response = client.chat.completions.create(
+        response = chat(
+            "metadata",
+            site="generate_metric_metadata",
             model="gpt-4o",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3
@@ -1,12 +1,17 @@
 # scripts/db/generate_table_metadata.py
 import os
 import pymysql
+import sys
 import time
-from openai import OpenAI
 from dotenv import load_dotenv
 
+try:
+    from scripts.llm_provider import chat
+except ImportError:  # eseguito come script: python scripts/db/<file>.py
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    from scripts.llm_provider import chat
+
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 MYSQL_USER     = os.getenv("MYSQL_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
@@ -56,7 +61,9 @@ Return **only** a valid Python dictionary like:
     """.strip()
 
     try:
-        resp = client.chat.completions.create(
+        resp = chat(
+            "metadata",
+            site="generate_table_metadata",
             model="gpt-4o",
             temperature=0.2,
             messages=[{"role": "user", "content": prompt}]
@@ -0,0 +1,138 @@
+"""
+metadata_cache.py
+
+Cache in‑process dei frammenti di prompt derivati da `METRIC_METADATA` e
+`TABLE_METADATA`.
+
+I due dizionari sono file Python auto‑generati (`generate_metric_metadata.py`
+e `generate_table_metadata.py`) e contengono centinaia di voci: ricostruire
+le stringhe per il prompt a ogni domanda è lavoro sprecato.  Qui i frammenti
+vengono calcolati una sola volta per *versione* dei metadati, dove la versione
+è l'impronta (mtime + size) dei due file sorgente.  Quando uno dei file viene
+rigenerato la versione cambia, i moduli vengono ricaricati e i frammenti
+ricalcolati alla prima richiesta successiva.
+
+API pubblico
+------------
+metadata_version() -> tuple
+current_metric_metadata() -> dict
+current_table_metadata() -> dict
+metric_for_column(table, column) -> dict | None
+cached_fragment(func) -> func     # decorator
+"""
+
+from __future__ import annotations
+
+import functools
+import importlib
+import os
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+from . import metric_metadata as _metric_module
+from . import table_metadata as _table_module
+
+__all__ = [
+    "metadata_version",
+    "current_metric_metadata",
+    "current_table_metadata",
+    "metric_for_column",
+    "cached_fragment",
+]
+
+_MODULES = (_metric_module, _table_module)
+
+_lock = threading.Lock()
+_loaded_version: Tuple[Tuple[int, int], ...] | None = None
+
+
+def _file_fingerprint(module) -> Tuple[int, int]:
+    """(mtime_ns, size) del file sorgente del modulo; (0, 0) se non leggibile."""
+    try:
+        st = os.stat(module.__file__)
+    except (OSError, TypeError):
+        return 0, 0
+    return st.st_mtime_ns, st.st_size
+
+
+def metadata_version() -> Tuple[Tuple[int, int], ...]:
+    """
+    Restituisce la versione corrente dei metadati e, se i file sono stati
+    rigenerati dall'ultimo caricamento, ricarica i moduli.
+
+    Returns
+    -------
+    tuple
+        Impronta dei file `metric_metadata.py` e `table_metadata.py`.
+    """
+    global _loaded_version
+    version = tuple(_file_fingerprint(m) for m in _MODULES)
+    if version != _loaded_version:
+        with _lock:
+            if version != _loaded_version:
+                if _loaded_version is not None:
+                    for module in _MODULES:
+                        importlib.reload(module)
+                _loaded_version = version
+    return version
+
+
+def current_metric_metadata() -> Dict[str, Dict[str, Any]]:
+    """`METRIC_METADATA` aggiornato all'ultima versione su disco."""
+    metadata_version()
+    return _metric_module.METRIC_METADATA
+
+
+def current_table_metadata() -> Dict[str, Dict[str, Any]]:
+    """`TABLE_METADATA` aggiornato all'ultima versione su disco."""
+    metadata_version()
+    return _table_module.TABLE_METADATA
+
+
+def cached_fragment(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Memoizza una funzione che costruisce un frammento di prompt (o un indice
+    derivato dai metadati).
+
+    La chiave è (versione metadati, argomenti): finché i file non cambiano
+    il valore restituito è sempre lo stesso oggetto, byte per byte.
+    La funzione originale resta disponibile come ``func.__wrapped__``.
+    """
+    cache: Dict[Any, Any] = {}
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        key = (metadata_version(), args)
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        value = func(*args)
+        with _lock:
+            # Tieni solo la versione corrente: le vecchie non servono più
+            stale = [k for k in cache if k[0] != key[0]]
+            for k in stale:
+                del cache[k]
+            cache[key] = value
+        return value
+
+    wrapper.cache_clear = cache.clear  # type: ignore[attr-defined]
+    return wrapper
+
+
+@cached_fragment
+def _column_index() -> Dict[Tuple[str, str], Dict[str, Any]]:
+    return {
+        (meta["table"], meta["column"].lower()): {"key": key, **meta}
+        for key, meta in current_metric_metadata().items()
+    }
+
+
+def metric_for_column(table: str, column: str) -> Dict[str, Any] | None:
+    """
+    Voce di METRIC_METADATA (con la sua chiave in ``"key"``) per una coppia
+    tabella/colonna, indipendente da maiuscole/minuscole; None se assente.
+    """
+    if not (table and column):
+        return None
+    return _column_index().get((table, column.lower()))
@@ -1,16 +1,17 @@
-import os
 import ast
 from datetime import datetime
-from openai import OpenAI
-from dotenv import load_dotenv
-from .metric_metadata import METRIC_METADATA
-
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from typing import Any, Dict, List
+from ..llm_provider import achat, chat
+from ..tracing import traced
+from .metadata_cache import cached_fragment, current_metric_metadata
+from .company_resolver import get_resolver
+from .aggregate_query import normalize_aggregate
 
+@cached_fragment
 def build_metric_prompt() -> str:
+    """Elenco metriche per il prompt, calcolato una volta per versione dei metadati."""
     lines = []
-    for key, meta in METRIC_METADATA.items():
+    for key, meta in current_metric_metadata().items():
         if meta["table"] in {"balance_sheet", "cashflow", "financials", "history"}:
             lines.append(f"- {key}")
             lines.append(f"  table: {meta['table']}")
@@ -20,22 +21,28 @@ def build_metric_prompt() -> str:
             lines.append("")
     return "\n".join(lines)
 
-def parse_avg_question(question: str) -> dict:
-    CURRENT_YEAR = datetime.now().year
-    prompt = f"""
-L'utente ha fatto la seguente domanda in linguaggio naturale: "{question}"
+@cached_fragment
+def build_system_prompt(current_year: int) -> str:
+    """
+    Prefisso statico del prompt: cambia solo con i metadati o con l'anno,
+    quindi resta byte‑stabile tra le domande (prompt caching lato provider).
+    """
+    return f"""Sei un assistente esperto di finanza aziendale.
+
+Queste sono le metriche disponibili:
+{build_metric_prompt()}
 
-Il suo intento è calcolare la **media** di una certa metrica finanziaria per una specifica azienda, in un certo periodo.
+L'intento dell'utente è calcolare un **aggregato** (di solito la media) di una certa metrica finanziaria per una specifica azienda, in un certo periodo.
 
-L’anno attuale è: {CURRENT_YEAR}.
+L’anno attuale è: {current_year}.
 
 Quando l’utente usa espressioni temporali, comportati così:
 - “ultimi N anni” → restituisci N anni più recenti, prima dell’anno attuale (incluso l’anno precedente)
-  Esempio: N=3, anno attuale={CURRENT_YEAR} → ["{CURRENT_YEAR - 3}", "{CURRENT_YEAR - 2}", "{CURRENT_YEAR - 1}"]
+  Esempio: N=3, anno attuale={current_year} → ["{current_year - 3}", "{current_year - 2}", "{current_year - 1}"]
 - “negli ultimi anni” o “recenti anni” → interpreta come ultimi 3 anni
-- “quest’anno” o “anno corrente” → ["{CURRENT_YEAR - 1}"]
-- “anno scorso” → ["{CURRENT_YEAR - 2}"]
-- “dal 2020” → ["2020", ..., "{CURRENT_YEAR - 1}"]
+- “quest’anno” o “anno corrente” → ["{current_year - 1}"]
+- “anno scorso” → ["{current_year - 2}"]
+- “dal 2020” → ["2020", ..., "{current_year - 1}"]
 - “tra 2019 e 2022” → ["2019", "2020", "2021", "2022"]
 - Se non è presente alcun riferimento temporale, restituisci "latest"
 
@@ -43,47 +50,72 @@ Restituisci un dizionario Python con:
 - "company": il ticker (es. "AAPL")
 - "table": il nome della tabella SQL
 - "column": il nome della colonna
-- "period": una lista di anni stringa o "latest"
+- "period": una lista di anni stringa (es. "2023"), o di mesi "YYYY-MM" se l'utente indica dei mesi, oppure "latest"
+- "aggregate": "avg" (media, default), "min", "max", "sum", "count", "median",
+  "stddev", "pNN" (percentile, es. "p90"), "first", "last" o "cagr" (crescita annua composta)
 
-Queste sono le metriche disponibili:
-{build_metric_prompt()}
+Restituisci solo un dizionario Python valido. Nessuna spiegazione, nessun testo extra."""
 
-Restituisci solo un dizionario Python valido. Nessuna spiegazione, nessun testo extra.
-""".strip()
+def build_messages(question: str) -> List[Dict[str, str]]:
+    """Messaggi ChatCompletion: prefisso statico + domanda dell'utente."""
+    return [
+        {"role": "system", "content": build_system_prompt(datetime.now().year)},
+        {"role": "user", "content": f'L\'utente ha fatto la seguente domanda in linguaggio naturale: "{question}"'},
+    ]
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Sei un assistente esperto di finanza aziendale."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
-        content = response.choices[0].message.content
-        print("🧾 Output grezzo GPT:", content)
+def _gpt_request(question: str) -> Dict[str, Any]:
+    """Argomenti ChatCompletion per il parsing delle medie."""
+    return {"model": "gpt-4o", "messages": build_messages(question), "temperature": 0}
 
-        # Estrai il blocco di dizionario puro
-        lines = content.strip().splitlines()
-        start = next((i for i, line in enumerate(lines) if line.strip().startswith("{")), None)
-        end = next((i for i, line in reversed(list(enumerate(lines))) if line.strip().endswith("}")), None)
+def interpret_avg_output(content: str) -> dict:
+    """Converte l'output grezzo di GPT nel dizionario per avg_query."""
+    print("🧾 Output grezzo GPT:", content)
 
-        if start is not None and end is not None and start <= end:
-            cleaned = "\n".join(lines[start:end+1])
-            print("🔍 Dizionario estratto per parsing:", cleaned)
-            parsed_dict = ast.literal_eval(cleaned)
-            print("🔎 Dizionario dopo parsing:", parsed_dict)
-            if isinstance(parsed_dict.get("period"), list):
-                print("🕵️ Period originale:", parsed_dict["period"])
-                parsed_dict["period"] = [
-                    str(year).strip() for year in parsed_dict["period"]
-                    if str(year).strip().isdigit()
-                ]
-                print("✅ Period trasformato:", parsed_dict["period"])
-            return parsed_dict
-        else:
-            print("❌ Nessun dizionario riconosciuto.")
-            return {}
+    # Estrai il blocco di dizionario puro
+    lines = content.strip().splitlines()
+    start = next((i for i, line in enumerate(lines) if line.strip().startswith("{")), None)
+    end = next((i for i, line in reversed(list(enumerate(lines))) if line.strip().endswith("}")), None)
+
+    if start is not None and end is not None and start <= end:
+        cleaned = "\n".join(lines[start:end+1])
+        print("🔍 Dizionario estratto per parsing:", cleaned)
+        parsed_dict = ast.literal_eval(cleaned)
+        print("🔎 Dizionario dopo parsing:", parsed_dict)
+        if parsed_dict.get("company"):
+            parsed_dict["company"] = (
+                get_resolver().resolve(parsed_dict["company"]) or parsed_dict["company"]
+            )
+        if isinstance(parsed_dict.get("period"), list):
+            print("🕵️ Period originale:", parsed_dict["period"])
+            # Anni, mesi ("2023-06"), date e range {"from","to"} passano così
+            # come sono: li valida `date_utils.period_ranges` nella query.
+            parsed_dict["period"] = [
+                item if isinstance(item, dict) else str(item).strip()
+                for item in parsed_dict["period"]
+                if isinstance(item, dict) or str(item).strip()
+            ]
+            print("✅ Period trasformato:", parsed_dict["period"])
+        parsed_dict["aggregate"] = normalize_aggregate(parsed_dict.get("aggregate")) or "avg"
+        return parsed_dict
+    else:
+        print("❌ Nessun dizionario riconosciuto.")
+        return {}
+
+@traced()
+def parse_avg_question(question: str) -> dict:
+    try:
+        response = chat("parse", site="parse_avg_query", **_gpt_request(question))
+        return interpret_avg_output(response.choices[0].message.content)
+    except Exception as e:
+        print("❌ Errore nel parsing GPT:", e)
+        return {}
+
+@traced("parse_avg_query.parse_avg_question")
+async def parse_avg_question_async(question: str) -> dict:
+    """Versione async di `parse_avg_question`."""
+    try:
+        response = await achat("parse", site="parse_avg_query", **_gpt_request(question))
+        return interpret_avg_output(response.choices[0].message.content)
     except Exception as e:
         print("❌ Errore nel parsing GPT:", e)
         return {}
\ No newline at end of file
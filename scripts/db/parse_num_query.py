@@ -1,25 +1,23 @@
-import os
 import ast
 import json
 import re
-from typing import Dict, Any
-from openai import OpenAI
-from dotenv import load_dotenv
-from .metric_metadata import METRIC_METADATA
-from .table_metadata import TABLE_METADATA
-
-# Carica le variabili d'ambiente per l'API Key
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
+from typing import Dict, Any, List
+from ..llm_provider import achat, chat
+from ..tracing import annotate, traced
+from .metadata_cache import cached_fragment, current_metric_metadata, current_table_metadata
+from .fast_parse_num_query import fast_parse_numerical_question
+from .company_resolver import get_resolver
+
+@cached_fragment
 def build_metric_options_string() -> str:
     """
     Costruisce una lista dettagliata delle metriche disponibili in formato leggibile per GPT,
     includendo descrizioni, filtrando solo le tabelle numeriche compatibili.
+    Calcolata una sola volta per versione di `metric_metadata.py`.
     """
     lines = []
     allowed_tables = {"balance_sheet", "cashflow", "financials", "history", "info"}
-    for key, meta in METRIC_METADATA.items():
+    for key, meta in current_metric_metadata().items():
         if meta["table"] not in allowed_tables:
             continue
         table = meta["table"]
@@ -33,41 +31,36 @@ def build_metric_options_string() -> str:
         lines.append("")  # aggiunge una riga vuota tra blocchi
     return "\n".join(lines)
 
+@cached_fragment
 def build_table_time_mapping() -> str:
     """
     Restituisce una stringa con la mappatura tabella → campo temporale
     (o 'None' se la tabella non ha un campo data). Serve per il prompt LLM.
+    Calcolata una sola volta per versione di `table_metadata.py`.
     """
     lines = []
-    for table, meta in TABLE_METADATA.items():
+    for table, meta in current_table_metadata().items():
         time_field = meta.get("time_field")
         lines.append(f"- {table}: {time_field or 'None'}")
     return "\n".join(lines)
 
-def parse_numerical_question(question: str) -> Dict[str, Any]:
+@cached_fragment
+def build_system_prompt() -> str:
     """
-    Usa ChatGPT per interpretare una domanda e restituire una struttura pronta
-    per essere passata a value_query.py (company, table, column, period).
+    Prefisso statico del prompt (ruolo + istruzioni + metadati).
+
+    Non contiene nulla che dipenda dalla domanda: resta identico byte per byte
+    tra una chiamata e l'altra, così il provider può riusare la sua cache dei
+    prompt.  La domanda viene passata a parte nel messaggio utente.
     """
-    metric_options = build_metric_options_string()
-    time_mapping = build_table_time_mapping()
+    return f"""Sei un assistente esperto di database finanziari. Il tuo compito è selezionare con la massima accuratezza la colonna più rilevante tra quelle fornite, in base alla metrica richiesta. Non devi scegliere una colonna che contiene informazioni correlate, ma una che corrisponde direttamente e semanticamente al termine richiesto. Ad esempio, se la domanda riguarda il rapporto P/E, scegli solo colonne come 'trailingPE' o 'forwardPE', non 'Net_Income'. Il tuo obiettivo è minimizzare ambiguità e restituire un dizionario Python esatto e coerente con il contenuto del database.
 
-    prompt = f"""
-Sei un assistente che deve tradurre domande finanziarie in una struttura precisa
+Devi tradurre domande finanziarie in una struttura precisa
 per interrogare un database SQL.
 
-### Mappatura tabella → campo data
-{time_mapping}
-
-### Metriche disponibili
-{metric_options}
-
-L'utente ha scritto la seguente domanda:
-\"\"\"{question}\"\"\"
-
 Il tuo compito è:
 1. Identificare il ticker (es. AAPL, MSFT…).
-2. Scegliere la metrica più pertinente tra quelle sopra.
+2. Scegliere la metrica più pertinente tra quelle elencate sotto.
 3. Estrarre eventuali riferimenti temporali:
    • anno intero  → "time_type":"year",  "time_value":"2023"
    • mese/anno    → "time_type":"month", "time_value":"2023-12"
@@ -90,67 +83,113 @@ Il tuo compito è:
 
 Nota: se la tabella indicata non ha campo data (`time_field = null`) allora il
 periodo DEVE essere `"latest"`.
-"""
+
+### Mappatura tabella → campo data
+{build_table_time_mapping()}
+
+### Metriche disponibili
+{build_metric_options_string()}"""
+
+def build_messages(question: str) -> List[Dict[str, str]]:
+    """Messaggi ChatCompletion: prefisso statico + domanda dell'utente."""
+    return [
+        {"role": "system", "content": build_system_prompt()},
+        {"role": "user", "content": f'Domanda dell\'utente:\n"""{question}"""'},
+    ]
+
+def _gpt_request(question: str) -> Dict[str, Any]:
+    """Argomenti ChatCompletion per il parsing GPT."""
+    return {"model": "gpt-4o", "messages": build_messages(question), "temperature": 0}
+
+
+def interpret_parser_output(content: str) -> Dict[str, Any]:
+    """
+    Converte l'output grezzo di GPT nel dizionario per value_query
+    (estrazione del blocco {...}, normalizzazione company / time_field).
+    """
+    print("🧾 Output grezzo GPT:", content)
+    lines = content.strip().splitlines()
+
+    # Estrai solo il blocco che inizia con "{" e termina con "}"
+    start_index = next((i for i, line in enumerate(lines) if line.strip().startswith("{")), None)
+    end_index = next((i for i, line in reversed(list(enumerate(lines))) if line.strip().endswith("}")), None)
+
+    if start_index is not None and end_index is not None and start_index <= end_index:
+        cleaned = "\n".join(lines[start_index:end_index+1])
+
+        # Rimuovi eventuali backtick / code‑fence residui
+        cleaned = re.sub(r"^```[a-zA-Z]*\s*", "", cleaned)
+        cleaned = re.sub(r"\s*```$", "", cleaned)
+
+        # Prova prima a caricarlo come JSON puro
+        try:
+            parsed = json.loads(cleaned)
+        except json.JSONDecodeError:
+            # Fallback: sostituisci JSON null/true/false con Python None/True/False
+            cleaned_py = re.sub(r'\bnull\b', 'None', cleaned)
+            cleaned_py = re.sub(r'\btrue\b', 'True', cleaned_py, flags=re.IGNORECASE)
+            cleaned_py = re.sub(r'\bfalse\b', 'False', cleaned_py, flags=re.IGNORECASE)
+            parsed = ast.literal_eval(cleaned_py)
+
+        # parsed = ast.literal_eval(cleaned)
+
+        # Post‑processing aggiuntivo
+        # Il modello a volte restituisce il nome invece del ticker
+        if parsed.get("company"):
+            parsed["company"] = get_resolver().resolve(parsed["company"]) or parsed["company"]
+        table = parsed.get("table")
+        parsed["time_field"] = current_table_metadata().get(table, {}).get("time_field")
+
+        # Normalizza: se il parser non ha messo time_type/value li settiamo
+        parsed.setdefault("time_type", "latest")
+        if parsed["time_type"] == "latest":
+            parsed["time_value"] = None
+
+        # Coerenza tra table statica e periodo
+        if parsed["time_field"] is None and parsed["time_type"] != "latest":
+            raise ValueError(f"La tabella {table} non contiene dati storici: "
+                             "il periodo deve essere 'latest'.")
+        return parsed
+    else:
+        print("❌ Impossibile estrarre un dizionario valido dal testo GPT.")
+        return {}
+
+
+@traced()
+def parse_numerical_question(question: str) -> Dict[str, Any]:
+    """
+    Usa ChatGPT per interpretare una domanda e restituire una struttura pronta
+    per essere passata a value_query.py (company, table, column, period).
+
+    Le domande semplici vengono risolte dal parser deterministico
+    (`fast_parse_num_query`); solo quelle non risolte arrivano a GPT.
+    """
+    fast = fast_parse_numerical_question(question)
+    annotate(fast_path=bool(fast))
+    if fast:
+        print("⚡ Parsing deterministico:", fast)
+        return fast
+
+    try:
+        response = chat("parse", site="parse_num_query", **_gpt_request(question))
+        return interpret_parser_output(response.choices[0].message.content)
+    except Exception as e:
+        print("Errore nel parsing GPT:", e)
+        return {}
+
+
+@traced("parse_num_query.parse_numerical_question")
+async def parse_numerical_question_async(question: str) -> Dict[str, Any]:
+    """Versione async di `parse_numerical_question`."""
+    fast = fast_parse_numerical_question(question)
+    annotate(fast_path=bool(fast))
+    if fast:
+        print("⚡ Parsing deterministico:", fast)
+        return fast
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": (
-                 "Sei un assistente esperto di database finanziari. "
-                 "Il tuo compito è selezionare con la massima accuratezza la colonna più rilevante tra quelle fornite, in base alla metrica richiesta. "
-                 "Non devi scegliere una colonna che contiene informazioni correlate, ma una che corrisponde direttamente e semanticamente al termine richiesto. "
-                 "Ad esempio, se la domanda riguarda il rapporto P/E, scegli solo colonne come 'trailingPE' o 'forwardPE', non 'Net_Income'. "
-                 "Il tuo obiettivo è minimizzare ambiguità e restituire un dizionario Python esatto e coerente con il contenuto del database."
-                )},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
-        content = response.choices[0].message.content
-        print("🧾 Output grezzo GPT:", content)
-        lines = content.strip().splitlines()
-
-        # Estrai solo il blocco che inizia con "{" e termina con "}"
-        start_index = next((i for i, line in enumerate(lines) if line.strip().startswith("{")), None)
-        end_index = next((i for i, line in reversed(list(enumerate(lines))) if line.strip().endswith("}")), None)
-
-        if start_index is not None and end_index is not None and start_index <= end_index:
-            cleaned = "\n".join(lines[start_index:end_index+1])
-
-            # Rimuovi eventuali backtick / code‑fence residui
-            cleaned = re.sub(r"^```[a-zA-Z]*\s*", "", cleaned)
-            cleaned = re.sub(r"\s*```$", "", cleaned)
-
-            # Prova prima a caricarlo come JSON puro
-            try:
-                parsed = json.loads(cleaned)
-            except json.JSONDecodeError:
-                # Fallback: sostituisci JSON null/true/false con Python None/True/False
-                cleaned_py = re.sub(r'\bnull\b', 'None', cleaned)
-                cleaned_py = re.sub(r'\btrue\b', 'True', cleaned_py, flags=re.IGNORECASE)
-                cleaned_py = re.sub(r'\bfalse\b', 'False', cleaned_py, flags=re.IGNORECASE)
-                parsed = ast.literal_eval(cleaned_py)
-
-            # parsed = ast.literal_eval(cleaned)
-
-            # Post‑processing aggiuntivo
-            table = parsed.get("table")
-            parsed["time_field"] = TABLE_METADATA.get(table, {}).get("time_field")
-
-            # Normalizza: se il parser non ha messo time_type/value li settiamo
-            parsed.setdefault("time_type", "latest")
-            if parsed["time_type"] == "latest":
-                parsed["time_value"] = None
-
-            # Coerenza tra table statica e periodo
-            if parsed["time_field"] is None and parsed["time_type"] != "latest":
-                raise ValueError(f"La tabella {table} non contiene dati storici: "
-                                 "il periodo deve essere 'latest'.")
-            return parsed
-        else:
-            print("❌ Impossibile estrarre un dizionario valido dal testo GPT.")
-            return {}
+        response = await achat("parse", site="parse_num_query", **_gpt_request(question))
+        return interpret_parser_output(response.choices[0].message.content)
     except Exception as e:
         print("Errore nel parsing GPT:", e)
         return {}
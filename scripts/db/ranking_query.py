@@ -0,0 +1,476 @@
+"""
+ranking_query.py
+
+Classifiche top / bottom‑N delle aziende per qualsiasi metrica di
+`METRIC_METADATA` («quali aziende tech hanno il ROE più alto?»), con filtri
+opzionali su `info.sector` / `info.industry` e sul periodo.
+
+Tabella materializzata
+----------------------
+Ordinare ~10.000 aziende per "ultimo valore disponibile" richiede un
+GROUP BY sull'intera tabella sorgente (history ha milioni di righe), troppo
+per una domanda interattiva.  `refresh_rankings()` precalcola per ogni
+metrica e periodo ("latest" + gli ultimi MARK_RANKING_YEARS anni) una riga
+per azienda in `metric_rankings`:
+
+    (metric, period, company_id) → value, as_of, sector, industry
+
+con indici (metric, period, value), (metric, period, sector, value) e
+(metric, period, industry, value): la classifica è una lettura di N voci
+dell'indice, già ordinate, in pochi millisecondi.
+
+La tabella è aggiornata per tabella sorgente: lo stamp
+`metric_rankings.<tabella>` di `data_version` ricorda quando è stata
+ricalcolata.  Se l'ETL ha scritto la sorgente (o `info`) dopo l'ultimo
+refresh, o il periodo non è materializzato, la classifica viene calcolata
+dal vivo sulla sorgente — corretta ma più lenta — finché il cron non rilancia
+
+    $ python -m scripts.db.ranking_query --refresh          # solo tabelle cambiate
+    $ python -m scripts.db.ranking_query --refresh --all    # tutto
+
+Uso da riga di comando
+----------------------
+    $ python -m scripts.db.ranking_query returnonequity --sector tech -n 10
+    $ python -m scripts.db.ranking_query total_revenue --period 2023 --bottom
+
+API pubblico
+------------
+rank_companies(metric, n=10, order="desc", sector=None, industry=None, period="latest") -> dict
+rank_companies_async(...)                 stessa firma, versione async
+refresh_rankings(tables=None, only_stale=True) -> int   (righe scritte)
+resolve_metric(metric)                    -> (key, meta)
+resolve_label(field, text)                -> str | None   'tech' → 'Technology'
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import functools
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .async_db import fetch_all as fetch_all_async
+from .data_version import bump_table_version, table_version
+from .date_utils import period_ranges
+from .db_pool import connection, fetch_all
+from .metadata_cache import current_metric_metadata, current_table_metadata
+from ..tracing import annotate, traced
+
+__all__ = [
+    "rank_companies",
+    "rank_companies_async",
+    "refresh_rankings",
+    "resolve_metric",
+    "resolve_label",
+]
+
+RANKING_TABLE = "metric_rankings"
+RANKING_YEARS = int(os.getenv("MARK_RANKING_YEARS", 5))
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {RANKING_TABLE} (
+        metric VARCHAR(100) NOT NULL,
+        period VARCHAR(10) NOT NULL,
+        company_id INT NOT NULL,
+        value DOUBLE NOT NULL,
+        as_of DATE NULL,
+        sector VARCHAR(100) NULL,
+        industry VARCHAR(255) NULL,
+        PRIMARY KEY (metric, period, company_id),
+        KEY ix_rank (metric, period, value),
+        KEY ix_rank_sector (metric, period, sector, value),
+        KEY ix_rank_industry (metric, period, industry, value)
+    )
+"""
+
+# Nomi italiani dei settori Yahoo Finance (radici, confronto per prefisso)
+_LABEL_ALIASES = {
+    "tecnolog": "Technology",
+    "tech": "Technology",
+    "sanit": "Healthcare",
+    "salute": "Healthcare",
+    "farmac": "Healthcare",
+    "finanz": "Financial Services",
+    "banc": "Financial Services",
+    "energ": "Energy",
+    "immobil": "Real Estate",
+    "industria": "Industrials",
+    "utilit": "Utilities",
+    "servizi finanz": "Financial Services",
+    "servizi pubblic": "Utilities",
+    "comunicaz": "Communication Services",
+    "telecom": "Communication Services",
+    "material": "Basic Materials",
+    "beni di consumo": "Consumer Defensive",
+    "consumi di base": "Consumer Defensive",
+    "consumi discrezionali": "Consumer Cyclical",
+}
+
+_RE_YEAR = re.compile(r"^\d{4}$")
+
+# Tipi MySQL ordinabili come numeri
+_NUMERIC_TYPES = ("tinyint", "smallint", "mediumint", "int", "bigint", "float", "double", "decimal")
+
+_labels_lock = threading.Lock()
+_labels: Dict[str, List[str]] = {}
+_labels_version: Optional[int] = None
+
+
+# --------------------------------------------------------------------------- #
+#  Risoluzione di metrica, settore e periodo
+# --------------------------------------------------------------------------- #
+
+def resolve_metric(metric: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Chiave e metadati di `metric`: chiave di METRIC_METADATA o nome colonna
+    (maiuscole/minuscole indifferenti).  ValueError se sconosciuta.
+    """
+    metadata = current_metric_metadata()
+    wanted = (metric or "").strip().lower()
+    if wanted in metadata:
+        return wanted, metadata[wanted]
+    for key, meta in metadata.items():
+        if meta["column"].lower() == wanted or key.replace("_", "") == wanted.replace("_", ""):
+            return key, meta
+    raise ValueError(f"Metrica sconosciuta: {metric!r}")
+
+
+def _numeric_columns() -> frozenset:
+    """(tabella, colonna) numeriche dello schema, escluse chiavi e id tecnici."""
+    # l'ETL aggiunge colonne a `info` al volo: lo schema si rilegge quando cambia
+    return _numeric_columns_at(table_version("info"))
+
+
+@functools.lru_cache(maxsize=1)
+def _numeric_columns_at(version: int) -> frozenset:
+    rows = fetch_all(
+        "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND DATA_TYPE IN %s",
+        (_NUMERIC_TYPES,),
+    )
+    return frozenset((t.lower(), c.lower()) for t, c in rows
+                     if c.lower() != "company_id" and not c.lower().endswith("_id"))
+
+
+def _rankable(table: str, column: str) -> bool:
+    """
+    Metrica ordinabile: colonna numerica di `info` o di una tabella storica
+    (le altre tabelle senza data hanno più righe per azienda).
+    """
+    has_time = current_table_metadata().get(table, {}).get("time_field") is not None
+    return (table == "info" or has_time) and (table.lower(), column.lower()) in _numeric_columns()
+
+
+def _distinct_labels(field: str) -> List[str]:
+    """Valori distinti di info.sector / info.industry, ricaricati se `info` cambia."""
+    global _labels, _labels_version
+    version = table_version("info")
+    if version != _labels_version or field not in _labels:
+        with _labels_lock:
+            if version != _labels_version:
+                _labels, _labels_version = {}, version
+            if field not in _labels:
+                rows = fetch_all(f"SELECT DISTINCT {field} FROM info WHERE {field} IS NOT NULL")
+                _labels[field] = [row[0] for row in rows if row[0]]
+    return _labels[field]
+
+
+def resolve_label(field: str, text: Optional[str]) -> Optional[str]:
+    """
+    Valore di `info.<field>` ('sector' | 'industry') indicato da `text`:
+    uguaglianza, poi prefisso / contenuto, poi nomi italiani dei settori.
+    None se `text` è vuoto; ValueError se non corrisponde a nulla.
+    """
+    if not text:
+        return None
+    if field not in ("sector", "industry"):
+        raise ValueError(f"Campo di filtro non valido: {field!r}")
+    wanted = text.strip().lower()
+    labels = _distinct_labels(field)
+    for label in labels:
+        if label.lower() == wanted:
+            return label
+    for label in labels:
+        if label.lower().startswith(wanted) or wanted in label.lower():
+            return label
+    if field == "sector":
+        for stem, label in _LABEL_ALIASES.items():
+            if wanted.startswith(stem) and label in labels:
+                return label
+    raise ValueError(f"{field.capitalize()} non trovato: {text!r}")
+
+
+def _normalize_period(period: Any) -> str:
+    """'latest' oppure un anno 'YYYY' (un solo anno: la classifica è a una data)."""
+    if period in (None, "", "latest"):
+        return "latest"
+    if isinstance(period, list) and len(period) == 1:
+        period = period[0]
+    text = str(period).strip()
+    if not _RE_YEAR.match(text):
+        raise ValueError(f"Periodo non valido per una classifica: {period!r}")
+    return text
+
+
+def _materialized_periods() -> List[str]:
+    """Periodi precalcolati per le tabelle con campo temporale."""
+    year = datetime.date.today().year
+    return ["latest"] + [str(year - k) for k in range(RANKING_YEARS)]
+
+
+# --------------------------------------------------------------------------- #
+#  SQL
+# --------------------------------------------------------------------------- #
+
+def _source_query(table: str, column: str, period: str) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    (sql, params) che restituisce (company_id, value, as_of): il valore più
+    recente di ogni azienda, nel periodo se è un anno.
+    """
+    time_field = current_table_metadata().get(table, {}).get("time_field")
+    if time_field is None:
+        if period != "latest":
+            raise ValueError(f"La tabella {table} non ha dati storici: solo classifica 'latest'.")
+        sql = f"""
+            SELECT company_id, {column} AS value, NULL AS as_of
+            FROM {table}
+            WHERE {column} IS NOT NULL
+        """
+        return sql, ()
+
+    period_filter, params = "", ()
+    if period != "latest":
+        (start, end), = period_ranges(period)
+        period_filter, params = f"AND {time_field} BETWEEN %s AND %s", (start, end)
+    sql = f"""
+        SELECT t.company_id, t.{column} AS value, t.{time_field} AS as_of
+        FROM {table} t
+        JOIN (
+            SELECT company_id, MAX({time_field}) AS as_of
+            FROM {table}
+            WHERE {column} IS NOT NULL {period_filter}
+            GROUP BY company_id
+        ) last ON last.company_id = t.company_id AND last.as_of = t.{time_field}
+    """
+    return sql, params
+
+
+def _is_fresh(table: str) -> bool:
+    """True se `metric_rankings` è stata ricalcolata dopo l'ultima scrittura di `table` e `info`."""
+    stamp = table_version(f"{RANKING_TABLE}.{table}")
+    return stamp > 0 and stamp >= max(table_version(table), table_version("info"))
+
+
+def build_ranking_query(metric: str, n: int = DEFAULT_LIMIT, order: str = "desc",
+                        sector: Optional[str] = None, industry: Optional[str] = None,
+                        period: Any = "latest",
+                        live: bool = False) -> Tuple[str, Tuple[Any, ...], Dict[str, Any]]:
+    """
+    (sql, params, info) della classifica; `info` descrive la richiesta
+    risolta (metrica, periodo, filtri, sorgente 'materialized' | 'live').
+    `live=True` ignora la tabella materializzata (confronti, debug).
+    """
+    key, meta = resolve_metric(metric)
+    table, column = meta["table"], meta["column"]
+    if not _rankable(table, column):
+        raise ValueError(f"La metrica {key} non è numerica: classifica non disponibile.")
+    period = _normalize_period(period)
+    direction = "ASC" if str(order).lower() in ("asc", "bottom") else "DESC"
+    limit = max(1, min(int(n or DEFAULT_LIMIT), MAX_LIMIT))
+    sector = resolve_label("sector", sector)
+    industry = resolve_label("industry", industry)
+
+    filters, filter_params = [], []
+    if not live and _is_fresh(table) and period in _materialized_periods():
+        source = "materialized"
+        if sector:
+            filters.append("r.sector = %s")
+            filter_params.append(sector)
+        if industry:
+            filters.append("r.industry = %s")
+            filter_params.append(industry)
+        where = " AND ".join(["r.metric = %s", "r.period = %s"] + filters)
+        sql = f"""
+            SELECT i.symbol, i.shortName, r.value, r.as_of
+            FROM {RANKING_TABLE} r
+            JOIN info i ON i.company_id = r.company_id
+            WHERE {where}
+            ORDER BY r.value {direction}
+            LIMIT %s
+        """
+        params = (key, period, *filter_params, limit)
+    else:
+        source = "live"
+        inner_sql, inner_params = _source_query(table, column, period)
+        if sector:
+            filters.append("i.sector = %s")
+            filter_params.append(sector)
+        if industry:
+            filters.append("i.industry = %s")
+            filter_params.append(industry)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        sql = f"""
+            SELECT i.symbol, i.shortName, s.value, s.as_of
+            FROM ({inner_sql}) s
+            JOIN info i ON i.company_id = s.company_id
+            {where}
+            ORDER BY s.value {direction}
+            LIMIT %s
+        """
+        params = (*inner_params, *filter_params, limit)
+
+    request = {
+        "metric": key, "table": table, "column": column, "period": period,
+        "order": direction.lower(), "limit": limit,
+        "sector": sector, "industry": industry, "source": source,
+    }
+    return sql, params, request
+
+
+def _result(request: Dict[str, Any], rows: Sequence[Tuple[Any, ...]]) -> Dict[str, Any]:
+    annotate(metric=request["metric"], source=request["source"], rows=len(rows))
+    request["rows"] = [
+        {"rank": pos, "symbol": symbol, "name": name, "value": value,
+         "as_of": as_of.isoformat() if hasattr(as_of, "isoformat") else as_of}
+        for pos, (symbol, name, value, as_of) in enumerate(rows, start=1)
+    ]
+    return request
+
+
+@traced("ranking_query.sql")
+def rank_companies(metric: str, n: int = DEFAULT_LIMIT, order: str = "desc",
+                   sector: Optional[str] = None, industry: Optional[str] = None,
+                   period: Any = "latest") -> Dict[str, Any]:
+    """
+    Top (order='desc') o bottom (order='asc') N aziende per `metric`.
+
+    Returns
+    -------
+    dict
+        La richiesta risolta più `rows`: [{"rank", "symbol", "name",
+        "value", "as_of"}, ...] già ordinate.
+    """
+    sql, params, request = build_ranking_query(metric, n, order, sector, industry, period)
+    return _result(request, fetch_all(sql, params))
+
+
+@traced("ranking_query.sql")
+async def rank_companies_async(metric: str, n: int = DEFAULT_LIMIT, order: str = "desc",
+                               sector: Optional[str] = None, industry: Optional[str] = None,
+                               period: Any = "latest") -> Dict[str, Any]:
+    """Versione async di `rank_companies` (vedi `async_db`)."""
+    sql, params, request = build_ranking_query(metric, n, order, sector, industry, period)
+    return _result(request, await fetch_all_async(sql, params))
+
+
+# --------------------------------------------------------------------------- #
+#  Materializzazione
+# --------------------------------------------------------------------------- #
+
+def _refresh_metric(cursor: Any, key: str, table: str, column: str) -> int:
+    """Ricalcola tutte le righe di una metrica; restituisce le righe scritte."""
+    has_time = current_table_metadata().get(table, {}).get("time_field") is not None
+    periods = _materialized_periods() if has_time else ["latest"]
+    cursor.execute(f"DELETE FROM {RANKING_TABLE} WHERE metric = %s", (key,))
+    written = 0
+    for period in periods:
+        source_sql, source_params = _source_query(table, column, period)
+        written += cursor.execute(f"""
+            INSERT INTO {RANKING_TABLE} (metric, period, company_id, value, as_of, sector, industry)
+            SELECT %s, %s, s.company_id, s.value, s.as_of, i.sector, i.industry
+            FROM ({source_sql}) s
+            JOIN info i ON i.company_id = s.company_id
+        """, (key, period, *source_params))
+    return written
+
+
+def refresh_rankings(tables: Optional[Sequence[str]] = None, only_stale: bool = True) -> int:
+    """
+    Materializza le classifiche delle metriche di `tables` (default: tutte);
+    con `only_stale` salta le tabelle non cambiate dall'ultimo refresh.
+
+    Ogni metrica è sostituita in una transazione: durante il refresh le
+    domande vedono la versione precedente, mai una classifica parziale.
+    La tabella è segnata come aggiornata solo se tutte le sue metriche
+    sono andate a buon fine, con le versioni delle sorgenti lette all'inizio.
+    """
+    by_table: Dict[str, List[Tuple[str, str]]] = {}
+    for key, meta in current_metric_metadata().items():
+        if _rankable(meta["table"], meta["column"]):
+            by_table.setdefault(meta["table"], []).append((key, meta["column"]))
+    wanted = [t for t in (tables or sorted(by_table)) if t in by_table]
+    if only_stale:
+        wanted = [t for t in wanted if not _is_fresh(t)]
+
+    written = 0
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(_DDL)
+        for table in wanted:
+            started = datetime.datetime.now()
+            # lo stamp registra le versioni delle sorgenti lette ORA: una scrittura
+            # dell'ETL durante il refresh rende la classifica di nuovo "stale"
+            sources = max(table_version(table), table_version("info"), 1)
+            table_rows, failed = 0, []
+            for key, column in by_table[table]:
+                conn.begin()
+                try:
+                    table_rows += _refresh_metric(cursor, key, table, column)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    failed.append(key)
+                    print(f"❌ Classifica {key} non aggiornata:", e)
+            elapsed = (datetime.datetime.now() - started).total_seconds()
+            if failed:
+                # niente bump: la tabella resta "stale" e il prossimo refresh la riprova
+                print(f"⚠️ {table}: {len(failed)}/{len(by_table[table])} metriche non aggiornate, "
+                      f"{table_rows:,} righe in {elapsed:.1f}s")
+            else:
+                bump_table_version(f"{RANKING_TABLE}.{table}", sources)
+                print(f"✅ {table}: {len(by_table[table])} metriche, {table_rows:,} righe in {elapsed:.1f}s")
+            written += table_rows
+    return written
+
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def main() -> None:
+    from ..number_format import format_value
+
+    ap = argparse.ArgumentParser(description="Classifiche delle aziende per metrica.")
+    ap.add_argument("metric", nargs="?", help="chiave di METRIC_METADATA (es. returnonequity)")
+    ap.add_argument("-n", type=int, default=DEFAULT_LIMIT)
+    ap.add_argument("--bottom", action="store_true", help="valori più bassi")
+    ap.add_argument("--sector")
+    ap.add_argument("--industry")
+    ap.add_argument("--period", default="latest", help="'latest' o anno (es. 2023)")
+    ap.add_argument("--refresh", action="store_true", help="materializza le classifiche")
+    ap.add_argument("--all", action="store_true", help="con --refresh: anche le tabelle non cambiate")
+    ap.add_argument("--tables", help="con --refresh: tabelle sorgente separate da virgola")
+    args = ap.parse_args()
+
+    if args.refresh:
+        tables = args.tables.split(",") if args.tables else None
+        print(f"📊 Righe scritte: {refresh_rankings(tables, only_stale=not args.all):,}")
+        return
+    if not args.metric:
+        ap.error("indicare una metrica oppure --refresh")
+
+    ranking = rank_companies(args.metric, args.n, "asc" if args.bottom else "desc",
+                             args.sector, args.industry, args.period)
+    filters = ", ".join(f for f in (ranking["sector"], ranking["industry"]) if f) or "tutte"
+    print(f"🏆 {ranking['metric']} ({ranking['period']}, {filters}) – {ranking['source']}")
+    for row in ranking["rows"]:
+        value = format_value(row["value"], ranking["table"], ranking["column"])
+        print(f"{row['rank']:>3}. {row['symbol']:<8} {value:>14}  {row['name'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
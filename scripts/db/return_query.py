@@ -0,0 +1,399 @@
+"""
+return_query.py
+
+Rendimenti totali (dividendi reinvestiti, split) per uno o più ticker:
+punto‑punto, annualizzati e su finestre mobili.
+
+Base dei prezzi
+---------------
+`history.close` è scritto dall'ETL con `yf.Ticker.history()` e quindi con
+`auto_adjust=True`: il prezzo è già rettificato per dividendi e split
+(alla data del download).  Il rapporto tra due chiusure è perciò già un
+rendimento totale: i dividendi di `dividends` NON vanno sommati (sarebbero
+contati due volte) e dai soli prezzi rettificati non si ricava un
+rendimento di solo prezzo, che infatti non viene restituito.
+
+La rettifica vale però solo se tutte le righe condividono la stessa base:
+un dividendo (o split) successivo alle righe già salvate cambia la base di
+tutto lo storico.  Per questo l'ETL, quando le sedute nuove portano un
+dividendo o uno split, riscarica l'intero storico invece di accodare; qui
+un dividendo o uno split con data successiva all'ultima seduta della serie
+rettificata fa ricalcolare l'azienda da capo (le righe vecchie sono state
+riscritte nella nuova base).
+
+Serie rettificata
+-----------------
+Il rendimento lordo giornaliero è
+
+    g_t = s_t · close_t / close_{t-1}
+
+con s_t il rapporto di split (`splits`); split in giorni senza seduta
+valgono per la seduta successiva.  L'ETL aggiunge le sedute in modo
+incrementale senza riscaricare quelle vecchie, quindi uno split avvenuto
+dopo un download lascia un salto tra le righe vecchie (non rettificate) e
+le nuove; se invece lo storico è stato scaricato dopo lo split il salto non
+c'è.  Per questo s_t si applica solo se avvicina il rendimento a zero
+(resta per gli storici salvati prima che l'ETL riscaricasse tutto).
+L'indice total return è il prodotto cumulato `tr_t = tr_{t-1} · g_t`,
+calcolato con NumPy.
+
+Tabella incrementale
+--------------------
+`adjusted_history (company_id, date) → close, tr_index` conserva l'indice
+già calcolato; `refresh_adjusted()` aggiunge solo le sedute successive
+all'ultima salvata (`adjusted_history_state`).  Se nel frattempo sono
+comparsi split con data già coperta, o dividendi / split dopo l'ultima
+seduta (storico riscaricato in una nuova base), l'azienda viene ricalcolata
+da capo.  Il cron la aggiorna dopo l'ETL:
+
+    $ python -m scripts.db.return_query --refresh
+
+Se l'ETL ha scritto `history` / `splits` dopo l'ultimo refresh,
+le aziende richieste vengono aggiornate (in modo incrementale) prima della
+query.
+
+API pubblico
+------------
+returns(symbols, start, end=None, rolling=None)    -> dict[str, dict]
+returns_async(...)                                  stessa firma, versione async
+refresh_adjusted(symbols=None)                      -> int   (righe scritte)
+total_return_index(dates, close, splits, prev_close=None, prev_index=1.0) -> np.ndarray
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import threading
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..tracing import annotate, traced
+from .async_db import fetch_all as fetch_all_async
+from .company_ids import get_company_ids
+from .data_version import bump_table_version, table_version, tables_version
+from .db_pool import connection, fetch_all
+
+__all__ = ["returns", "returns_async", "refresh_adjusted", "total_return_index"]
+
+ADJUSTED_TABLE = "adjusted_history"
+STATE_TABLE = "adjusted_history_state"
+SOURCE_TABLES = ("history", "splits")
+
+_DDL = (
+    f"""
+    CREATE TABLE IF NOT EXISTS {ADJUSTED_TABLE} (
+        company_id INT NOT NULL,
+        date DATE NOT NULL,
+        close DOUBLE NOT NULL,
+        tr_index DOUBLE NOT NULL,
+        PRIMARY KEY (company_id, date)
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+        company_id INT NOT NULL PRIMARY KEY,
+        last_date DATE NOT NULL,
+        close DOUBLE NOT NULL,
+        tr_index DOUBLE NOT NULL,
+        split_count INT NOT NULL
+    )
+    """,
+)
+
+_lock = threading.Lock()
+# company_id → versioni delle sorgenti al momento dell'ultimo aggiornamento
+_fresh_for: Dict[int, Tuple[int, ...]] = {}
+
+Events = Tuple[Sequence[Any], Sequence[float]]
+
+
+# --------------------------------------------------------------------------- #
+#  Indice total return
+# --------------------------------------------------------------------------- #
+
+def _as_days(values: Iterable[Any]) -> np.ndarray:
+    return np.asarray([str(v)[:10] for v in values], dtype="datetime64[D]")
+
+
+def total_return_index(dates: Sequence[Any], close: Sequence[float], splits: Events = ((), ()),
+                       prev_close: Optional[float] = None, prev_index: float = 1.0) -> np.ndarray:
+    """
+    Indice total return per le sedute `dates` (ordinate) da chiusure già
+    rettificate per i dividendi (vedi "Base dei prezzi").
+
+    `splits` è una coppia (date, rapporti).  `prev_close` / `prev_index`
+    proseguono una serie già calcolata; senza, la prima seduta vale
+    `prev_index`.
+
+    >>> total_return_index(["2024-01-02", "2024-01-03", "2024-01-04"], [100.0, 100.0, 50.0],
+    ...                    splits=(["2024-01-04"], [2.0])).tolist()
+    [1.0, 1.0, 1.0]
+    """
+    days = _as_days(dates)
+    close = np.asarray(close, dtype=float)
+    if close.size == 0:
+        return close
+
+    split = np.ones(close.size)
+    event_dates, ratios = splits
+    if len(event_dates):
+        at = np.searchsorted(days, _as_days(event_dates), side="left")
+        keep = at < close.size
+        np.multiply.at(split, at[keep], np.asarray(ratios, dtype=float)[keep])
+
+    previous = np.concatenate(([prev_close if prev_close else close[0]], close[:-1]))
+    raw = close / previous
+    adjusted = raw * split
+    # split già incorporato nei prezzi: nessun salto, s_t non va applicato
+    use_split = np.abs(np.log(adjusted)) < np.abs(np.log(raw))
+    gross = np.where(use_split, adjusted, raw)
+    if prev_close is None:
+        gross[0] = 1.0
+    return prev_index * np.cumprod(gross)
+
+
+# --------------------------------------------------------------------------- #
+#  Aggiornamento incrementale
+# --------------------------------------------------------------------------- #
+
+def _events(cursor: Any, table: str, column: str, company_id: int,
+            after: Optional[datetime.date]) -> Events:
+    after_filter, params = ("AND date > %s", (company_id, after)) if after else ("", (company_id,))
+    cursor.execute(
+        f"SELECT date, {column} FROM {table} WHERE company_id = %s {after_filter} ORDER BY date", params
+    )
+    rows = cursor.fetchall()
+    return [r[0] for r in rows], [float(r[1]) for r in rows]
+
+
+def _update_company(cursor: Any, company_id: int) -> int:
+    """Estende (o ricalcola) la serie rettificata di un'azienda; righe scritte."""
+    cursor.execute(
+        f"SELECT last_date, close, tr_index, split_count FROM {STATE_TABLE} "
+        "WHERE company_id = %s", (company_id,)
+    )
+    state = cursor.fetchone()
+    if state is not None:
+        cursor.execute("SELECT COUNT(*) FROM splits WHERE company_id = %s AND date <= %s",
+                       (company_id, state[0]))
+        if cursor.fetchone()[0] != state[3]:
+            state = None                     # split retroattivi: ricalcolo completo
+    if state is not None:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM history WHERE company_id = %s AND date > %s "
+            "AND (dividends <> 0 OR stock_splits <> 0))", (company_id, state[0])
+        )
+        if cursor.fetchone()[0]:
+            state = None                     # storico riscaricato in una nuova base
+    if state is None:
+        cursor.execute(f"DELETE FROM {ADJUSTED_TABLE} WHERE company_id = %s", (company_id,))
+        last_date, prev_close, prev_index, split_count = None, None, 1.0, 0
+    else:
+        last_date, prev_close, prev_index, split_count = state
+
+    after_filter, params = ("AND date > %s", (company_id, last_date)) if last_date else ("", (company_id,))
+    cursor.execute(
+        f"SELECT date, close FROM history WHERE company_id = %s {after_filter} "
+        "AND close IS NOT NULL AND close > 0 ORDER BY date", params
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+    dates = [r[0] for r in rows]
+    close = [float(r[1]) for r in rows]
+    splits = _events(cursor, "splits", "split_ratio", company_id, last_date)
+    index = total_return_index(dates, close, splits, prev_close, prev_index)
+
+    cursor.executemany(
+        f"INSERT INTO {ADJUSTED_TABLE} (company_id, date, close, tr_index) VALUES (%s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE close = VALUES(close), tr_index = VALUES(tr_index)",
+        [(company_id, d, c, float(tr)) for d, c, tr in zip(dates, close, index)],
+    )
+
+    # split coperti dalla serie: quelli fino all'ultima seduta scritta
+    covered = sum(1 for d in splits[0] if str(d)[:10] <= str(dates[-1])[:10])
+    cursor.execute(
+        f"REPLACE INTO {STATE_TABLE} (company_id, last_date, close, tr_index, split_count) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        (company_id, dates[-1], close[-1], float(index[-1]), split_count + covered),
+    )
+    return len(rows)
+
+
+def refresh_adjusted(symbols: Optional[Sequence[str]] = None) -> int:
+    """
+    Aggiorna `adjusted_history` per `symbols` (default: tutte le aziende),
+    una transazione per azienda.  Restituisce le righe scritte.
+
+    Solo un refresh completo riuscito per tutte le aziende segna la tabella
+    come aggiornata, con le versioni delle sorgenti lette prima di iniziare.
+    """
+    versions = tables_version(SOURCE_TABLES)
+    if symbols is None:
+        company_ids = [row[0] for row in fetch_all("SELECT company_id FROM info")]
+    else:
+        company_ids = list(get_company_ids(symbols).values())
+
+    written, failed = 0, 0
+    with connection() as conn, conn.cursor() as cursor:
+        for statement in _DDL:
+            cursor.execute(statement)
+        for company_id in company_ids:
+            conn.begin()
+            try:
+                written += _update_company(cursor, company_id)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                failed += 1
+                print(f"❌ Serie rettificata non aggiornata (company_id={company_id}):", e)
+                continue
+            with _lock:
+                _fresh_for[company_id] = versions
+    if symbols is None and not failed:
+        bump_table_version(ADJUSTED_TABLE, max(versions))
+    elif failed:
+        print(f"⚠️ {failed} aziende non aggiornate: verranno riprovate alla prossima richiesta")
+    return written
+
+
+def _ensure_fresh(ids: Dict[str, int]) -> None:
+    """Aggiorna le aziende richieste se l'ETL ha scritto dopo l'ultimo refresh."""
+    versions = tables_version(SOURCE_TABLES)
+    if table_version(ADJUSTED_TABLE) >= max(versions):
+        return
+    stale = [symbol for symbol, cid in ids.items() if _fresh_for.get(cid) != versions]
+    if stale:
+        refresh_adjusted(stale)
+
+
+# --------------------------------------------------------------------------- #
+#  Query
+# --------------------------------------------------------------------------- #
+
+def build_returns_query(company_ids: Sequence[int], start: datetime.date,
+                        end: Optional[datetime.date]) -> Tuple[str, Tuple[Any, ...]]:
+    """(sql, params) per close e tr_index di più aziende tra `start` e `end`."""
+    placeholders = ", ".join(["%s"] * len(company_ids))
+    end_filter, params = ("AND date <= %s", (end,)) if end else ("", ())
+    sql = f"""
+        SELECT company_id, date, close, tr_index
+        FROM {ADJUSTED_TABLE}
+        WHERE company_id IN ({placeholders})
+        AND date >= %s {end_filter}
+        ORDER BY company_id, date
+    """
+    return sql, (*company_ids, start, *params)
+
+
+def _annualized(total: float, days: int) -> Optional[float]:
+    if days <= 0 or total <= -1:
+        return None
+    return float((1 + total) ** (365.25 / days) - 1)
+
+
+def _summary(dates: np.ndarray, index: np.ndarray, rolling: Optional[int]) -> Dict[str, Any]:
+    days = int((dates[-1] - dates[0]).astype(int))
+    total_return = float(index[-1] / index[0] - 1)
+    result: Dict[str, Any] = {
+        "start": str(dates[0]),
+        "end": str(dates[-1]),
+        "years": round(days / 365.25, 2),
+        "total_return": total_return,
+        "annualized_total_return": _annualized(total_return, days),
+    }
+    if rolling and index.size > rolling:
+        window = index[rolling:] / index[:-rolling] - 1
+        result["rolling"] = [[str(d), float(r)] for d, r in zip(dates[rolling:], window)]
+    return result
+
+
+def _results(symbols: Sequence[str], ids: Dict[str, int],
+             rows: Sequence[Tuple[Any, ...]], rolling: Optional[int]) -> Dict[str, Any]:
+    by_company: Dict[int, list] = {}
+    for company_id, date, close, index in rows:
+        by_company.setdefault(company_id, []).append((date, close, index))
+    results: Dict[str, Any] = {}
+    for symbol in symbols:
+        series = by_company.get(ids.get(symbol), [])
+        if len(series) < 2:
+            results[symbol] = {"error": "Storico prezzi insufficiente nel periodo."}
+            continue
+        dates = _as_days(r[0] for r in series)
+        index = np.asarray([r[2] for r in series], dtype=float)
+        results[symbol] = _summary(dates, index, rolling)
+    annotate(symbols=len(symbols), rows=len(rows))
+    return results
+
+
+def _prepare(symbols: Sequence[str], start: Any, end: Any):
+    symbols = [s.upper() for s in symbols]
+    start = datetime.date.fromisoformat(str(start)[:10])
+    end = datetime.date.fromisoformat(str(end)[:10]) if end else None
+    ids = get_company_ids(symbols)
+    return symbols, ids, (build_returns_query(sorted(set(ids.values())), start, end) if ids else None)
+
+
+@traced("return_query.sql")
+def returns(symbols: Sequence[str], start: Any, end: Any = None,
+            rolling: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Rendimenti tra la prima seduta da `start` e l'ultima fino a `end`.
+
+    Returns
+    -------
+    dict
+        {ticker: {"start", "end", "years", "total_return",
+        "annualized_total_return", ["rolling"]}}
+        (frazioni: 0.25 = 25%); `rolling` = [[data, rendimento totale sulle
+        ultime `rolling` sedute], ...].  {"error": ...} se mancano i prezzi.
+    """
+    symbols, ids, query = _prepare(symbols, start, end)
+    if query is None:
+        return _results(symbols, ids, [], rolling)
+    _ensure_fresh(ids)
+    return _results(symbols, ids, fetch_all(*query), rolling)
+
+
+@traced("return_query.sql")
+async def returns_async(symbols: Sequence[str], start: Any, end: Any = None,
+                        rolling: Optional[int] = None) -> Dict[str, Any]:
+    """Versione async di `returns` (vedi `async_db`)."""
+    symbols, ids, query = _prepare(symbols, start, end)
+    if query is None:
+        return _results(symbols, ids, [], rolling)
+    await asyncio.get_running_loop().run_in_executor(None, _ensure_fresh, ids)
+    return _results(symbols, ids, await fetch_all_async(*query), rolling)
+
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Rendimenti totali e serie rettificata.")
+    ap.add_argument("symbols", nargs="*", help="ticker (es. TSLA AAPL)")
+    ap.add_argument("--start", help="data iniziale YYYY-MM-DD")
+    ap.add_argument("--end", help="data finale YYYY-MM-DD (default: ultima seduta)")
+    ap.add_argument("--refresh", action="store_true", help="aggiorna adjusted_history (tutte le aziende)")
+    args = ap.parse_args()
+
+    if args.refresh:
+        print(f"📈 Righe rettificate scritte: {refresh_adjusted():,}")
+        return
+    if not (args.symbols and args.start):
+        ap.error("indicare i ticker e --start, oppure --refresh")
+    for symbol, result in returns(args.symbols, args.start, args.end).items():
+        if "error" in result:
+            print(f"{symbol:<8} ❌ {result['error']}")
+            continue
+        print(f"{symbol:<8} {result['start']} → {result['end']}  "
+              f"totale {result['total_return']:+.2%}  "
+              f"annuo {result['annualized_total_return'] or 0:+.2%}")
+
+
+if __name__ == "__main__":
+    main()
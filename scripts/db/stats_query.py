@@ -0,0 +1,223 @@
+"""
+stats_query.py
+
+Statistiche trasversali sull'intero universo di `info` (~10.000 aziende):
+«P/E mediano del settore Energy», «in che percentile è il margine di AAPL
+nella sua industry?».
+
+Cache a colonne
+---------------
+Le colonne richieste vengono lette una volta da `info` e tenute in memoria
+come array NumPy (float, NaN dove manca il dato) allineati per company_id,
+insieme a symbol / sector / industry.  Ogni colonna nuova costa una query
+(`SELECT company_id, <col> FROM info`), le successive statistiche nessuna.
+La cache ricorda la versione di `info` (`data_version`): quando l'ETL la
+aggiorna viene svuotata e le colonne ricaricate al primo uso.
+
+Gruppi
+------
+`sector` / `industry` accettano anche nomi parziali o italiani
+(`ranking_query.resolve_label`: 'tech' → 'Technology').
+
+API pubblico
+------------
+describe(metric, sector=None, industry=None)  -> dict   count, mean, std, min, p10…p90, max
+describe_by(metric, by="sector")              -> dict[str, dict]
+position(symbol, metric, by="industry")       -> dict   valore, percentile, z‑score nel gruppo
+group_values(metric, sector=None, industry=None) -> (symbols, values)   per distribution_query
+refresh()                                     -> None
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from ..tracing import annotate, traced
+from .data_version import table_version
+from .db_pool import fetch_all
+from .ranking_query import resolve_label, resolve_metric
+
+__all__ = ["describe", "describe_by", "position", "group_values", "refresh"]
+
+QUANTILES = (10, 25, 50, 75, 90)
+_GROUP_FIELDS = ("sector", "industry")
+
+
+class _InfoColumns:
+    """Colonne di `info` come array NumPy, invalidate quando cambia la versione della tabella."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.labels: Dict[str, np.ndarray] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def _check_version(self) -> None:
+        version = table_version("info")
+        if version != self._version:
+            rows = fetch_all("SELECT company_id, symbol, sector, industry FROM info ORDER BY company_id")
+            self.ids = np.asarray([r[0] for r in rows], dtype=np.int64)
+            self.labels = {
+                name: np.asarray([r[i] for r in rows], dtype=object)
+                for i, name in enumerate(("symbol", "sector", "industry"), start=1)
+            }
+            self._columns = {}
+            self._version = version
+
+    @traced("stats_query.load")
+    def _load(self, column: str) -> np.ndarray:
+        rows = fetch_all(f"SELECT company_id, {column} FROM info WHERE {column} IS NOT NULL")
+        values = np.full(self.ids.size, np.nan)
+        if rows:
+            ids = np.asarray([r[0] for r in rows], dtype=np.int64)
+            try:
+                data = np.asarray([float(r[1]) for r in rows])
+            except (TypeError, ValueError):
+                raise ValueError(f"La colonna {column} non è numerica.") from None
+            at = np.searchsorted(self.ids, ids)
+            known = (at < self.ids.size) & (self.ids[np.minimum(at, self.ids.size - 1)] == ids)
+            values[at[known]] = data[known]
+        annotate(column=column, rows=len(rows))
+        return values
+
+    def snapshot(self, column: str) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        (valori di `column`, etichette symbol/sector/industry) della STESSA
+        versione di `info`: un refresh concorrente non può mescolare array
+        di lunghezze o ordini diversi.
+        """
+        with self._lock:
+            self._check_version()
+            if column not in self._columns:
+                self._columns[column] = self._load(column)
+            return self._columns[column], self.labels
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version = None
+
+
+_cache = _InfoColumns()
+
+
+def refresh() -> None:
+    """Ricarica la cache al prossimo uso."""
+    _cache.clear()
+
+
+# --------------------------------------------------------------------------- #
+#  Selezione
+# --------------------------------------------------------------------------- #
+
+def _info_column(metric: str) -> Tuple[str, str]:
+    """(chiave, colonna) di una metrica di `info`; ValueError per le altre tabelle."""
+    key, meta = resolve_metric(metric)
+    if meta["table"] != "info":
+        raise ValueError(f"La metrica {key} non è in `info`: statistiche trasversali non disponibili.")
+    return key, meta["column"]
+
+
+def _mask(labels: Dict[str, np.ndarray], sector: Optional[str],
+          industry: Optional[str]) -> Tuple[np.ndarray, Dict[str, str]]:
+    """Maschera booleana delle aziende nel gruppo e filtri risolti."""
+    mask = np.ones(labels["symbol"].size, dtype=bool)
+    filters = {}
+    for field, text in (("sector", sector), ("industry", industry)):
+        label = resolve_label(field, text)
+        if label:
+            mask &= labels[field] == label
+            filters[field] = label
+    return mask, filters
+
+
+def group_values(metric: str, sector: Optional[str] = None,
+                 industry: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(symbols, valori) delle aziende del gruppo con il dato presente."""
+    _, column = _info_column(metric)
+    values, labels = _cache.snapshot(column)
+    mask, _ = _mask(labels, sector, industry)
+    mask &= ~np.isnan(values)
+    return labels["symbol"][mask], values[mask]
+
+
+# --------------------------------------------------------------------------- #
+#  Statistiche
+# --------------------------------------------------------------------------- #
+
+def _stats(values: np.ndarray) -> Dict[str, Any]:
+    if values.size == 0:
+        return {"count": 0}
+    qs = np.percentile(values, QUANTILES)
+    stats: Dict[str, Any] = {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "std": float(values.std(ddof=1)) if values.size > 1 else None,
+        "min": float(values.min()),
+    }
+    stats.update({("median" if q == 50 else f"p{q}"): float(v) for q, v in zip(QUANTILES, qs)})
+    stats["max"] = float(values.max())
+    return stats
+
+
+def describe(metric: str, sector: Optional[str] = None,
+             industry: Optional[str] = None) -> Dict[str, Any]:
+    """Statistiche descrittive della metrica sulle aziende del gruppo."""
+    key, column = _info_column(metric)
+    values, labels = _cache.snapshot(column)
+    mask, filters = _mask(labels, sector, industry)
+    return {"metric": key, "column": column, **filters,
+            **_stats(values[mask & ~np.isnan(values)])}
+
+
+def describe_by(metric: str, by: str = "sector") -> Dict[str, Dict[str, Any]]:
+    """Statistiche della metrica per ogni settore (o industry), gruppo per gruppo."""
+    if by not in _GROUP_FIELDS:
+        raise ValueError(f"Raggruppamento non valido: {by!r}")
+    _, column = _info_column(metric)
+    values, labels = _cache.snapshot(column)
+    groups = labels[by]
+    present = ~np.isnan(values) & (groups != None)  # noqa: E711 (confronto elemento per elemento)
+    names, inverse = np.unique(groups[present].astype(str), return_inverse=True)
+    data = values[present]
+    return {str(name): _stats(data[inverse == i]) for i, name in enumerate(names)}
+
+
+def position(symbol: str, metric: str, by: str = "industry") -> Dict[str, Any]:
+    """
+    Posizione di un'azienda nel proprio settore / industry per la metrica.
+
+    Returns
+    -------
+    dict
+        {"symbol", "metric", "value", "group", "count", "percentile_rank"
+        (0–100, pari merito a metà), "zscore", "group_median"}
+    """
+    if by not in _GROUP_FIELDS:
+        raise ValueError(f"Raggruppamento non valido: {by!r}")
+    key, column = _info_column(metric)
+    values, labels = _cache.snapshot(column)
+    symbols = labels["symbol"]
+    hits = np.flatnonzero(symbols == symbol.upper())
+    if hits.size == 0:
+        raise ValueError(f"Azienda non trovata: {symbol!r}")
+    row = hits[0]
+    value = values[row]
+    group = labels[by][row]
+    result: Dict[str, Any] = {"symbol": symbol.upper(), "metric": key, "group": group,
+                              "value": None if np.isnan(value) else float(value)}
+    if np.isnan(value) or group is None:
+        return result
+
+    peers = values[(labels[by] == group) & ~np.isnan(values)]
+    std = peers.std(ddof=1) if peers.size > 1 else 0.0
+    result.update({
+        "count": int(peers.size),
+        "percentile_rank": float((np.sum(peers < value) + 0.5 * np.sum(peers == value)) / peers.size * 100),
+        "zscore": float((value - peers.mean()) / std) if std else None,
+        "group_median": float(np.median(peers)),
+    })
+    return result
@@ -37,6 +37,17 @@ from sqlalchemy.types import Text, Boolean, Integer, Float, String
 import pandas as pd
 import re
 
+# Table version stamps: downstream caches expire when a table is written.
+# company_id lookups go through the shared in-process map (reloaded when
+# another process changes 'info'; our own writes are recorded in place)
+# instead of one SELECT per loader.
+try:
+    from .data_version import bump_table_version
+    from .company_ids import get_company_id, remember_company_id
+except ImportError:  # executed as a plain script (cron)
+    from data_version import bump_table_version
+    from company_ids import get_company_id, remember_company_id
+
 # Helper: normalize raw field names to snake_case (handles CamelCase and symbols)
 def normalize_name(raw: str) -> str:
     # Insert underscores before capitals (CamelCase → snake_case)
@@ -218,10 +229,12 @@ def insert_info_data(ticker):
                 )
                 conn.execute(update_stmt)
                 logging.info(f"🔁 1 row updated in 'info' for {ticker}")
+                bump_table_version("info")
             else:
                 stmt = mysql_insert(updated_table).values(**insert_data)
                 conn.execute(stmt)
                 logging.info(f"➕ 1 new row inserted into 'info' for {ticker}")
+                bump_table_version("info")
             
             # Recupera il company_id aggiornato
             company_id_row = conn.execute(
@@ -230,6 +243,7 @@ def insert_info_data(ticker):
             ).fetchone()
 
             if company_id_row:
+                remember_company_id(ticker, company_id_row[0])
                 insert_officers_data(ticker, company_id_row[0])
             else:
                 logging.warning(f"⚠️ Could not find company_id for {ticker} to insert officers")
@@ -310,8 +324,10 @@ def insert_officers_data(ticker, company_id):
 
     if inserted_count:
         logging.info(f"➕ {inserted_count} new rows inserted into 'officers' for {ticker}")
+        bump_table_version("officers")
     if updated_count:
         logging.info(f"🔁 {updated_count} rows updated in 'officers' for {ticker}")
+        bump_table_version("officers")
 
 
 
@@ -328,15 +344,10 @@ def insert_history_data(ticker: str):
             return None if pd.isna(v) else v
 
         # 1 ── Resolve company_id ────────────────────────────────────────────
-        with engine.begin() as conn:
-            row = conn.execute(
-                text("SELECT company_id FROM info WHERE symbol = :sym"),
-                {"sym": ticker},
-            ).fetchone()
-        if not row:
+        company_id = get_company_id(ticker)
+        if company_id is None:
             logging.warning(f"⚠️ {ticker} not found in 'info'. Skipping history.")
             return
-        company_id = row[0]
 
         # 2 ── Last 5 stored dates (indexed lookup) ──────────────────────────
         with engine.begin() as conn:
@@ -373,7 +384,15 @@ def insert_history_data(ticker: str):
                     f"⚠️ 'history' table: {ticker} failed to fetch from {max_past_date} onward or returned no data. Skipping."
                 )
                 return
-        else:
+            # Prices are adjusted (auto_adjust=True) as of the download date: a dividend
+            # or split after the stored rows re-bases the whole series, so the old rows
+            # must be downloaded again or the event is lost between old and new rows.
+            new_rows = df_raw["Date"].dt.date > max_past_date
+            if ((df_raw.loc[new_rows, "Dividends"] != 0) | (df_raw.loc[new_rows, "Stock Splits"] != 0)).any():
+                logging.info(f"🔄 'history' table: new dividend/split for {ticker}, reloading full history")
+                max_past_date = None
+
+        if not max_past_date:
             # Try 'max', then fall back to '10y', then '5y'
             for per in ("max", "10y", "5y"):
                 df_raw = _fetch_history(period=per)
@@ -464,8 +483,10 @@ def insert_history_data(ticker: str):
         # 7 ── Logging summary ───────────────────────────────────────────────
         if inserted_ct:
             logging.info(f"➕ {inserted_ct} new rows inserted into 'history' for {ticker}")
+            bump_table_version("history")
         if updated_ct:
             logging.info(f"🔁 {updated_ct} rows updated in 'history' for {ticker}")
+            bump_table_version("history")
 
     except Exception as e:
         logging.error(f"❌ Error while inserting history data for {ticker}: {e}")
@@ -495,15 +516,10 @@ def insert_balance_sheet_data(ticker):
     # ── 3. Fetch company_id ──────────────────────────────────────────────────
     metadata = MetaData()
     metadata.reflect(bind=engine)
-    with engine.begin() as conn:
-        row = conn.execute(
-            text("SELECT company_id FROM info WHERE symbol = :sym"),
-            {"sym": ticker},
-        ).fetchone()
-    if not row:
+    company_id = get_company_id(ticker)
+    if company_id is None:
         logging.warning(f"⚠️ No company_id found for {ticker}; skipping balance‑sheet insert")
         return
-    company_id = row[0]
 
     balance_table = metadata.tables["balance_sheet"]
     existing_cols = balance_table.columns.keys()
@@ -625,8 +641,10 @@ def insert_balance_sheet_data(ticker):
     # ── 5. Logging ───────────────────────────────────────────────────────────
     if inserted:
         logging.info(f"➕ {inserted} new rows inserted into 'balance_sheet' for {ticker}")
+        bump_table_version("balance_sheet")
     if updated:
         logging.info(f"🔁 {updated} rows updated in 'balance_sheet' for {ticker}")
+        bump_table_version("balance_sheet")
 
 
 # Function to insert or update annual cash‑flow data in the 'cashflow' table
@@ -655,15 +673,10 @@ def insert_cashflow_data(ticker):
     # ── 3. Retrieve company_id ───────────────────────────────────────────────
     metadata = MetaData()
     metadata.reflect(bind=engine)
-    with engine.begin() as conn:
-        row = conn.execute(
-            text("SELECT company_id FROM info WHERE symbol = :sym"),
-            {"sym": ticker},
-        ).fetchone()
-    if not row:
+    company_id = get_company_id(ticker)
+    if company_id is None:
         logging.warning(f"⚠️ No company_id found for {ticker}; skipping cash‑flow insert")
         return
-    company_id = row[0]
 
     cashflow_table = metadata.tables["cashflow"]
     existing_cols = cashflow_table.columns.keys()
@@ -777,8 +790,10 @@ def insert_cashflow_data(ticker):
     # ── 5. Logging summary ──────────────────────────────────────────────────
     if inserted:
         logging.info(f"➕ {inserted} new rows inserted into 'cashflow' for {ticker}")
+        bump_table_version("cashflow")
     if updated:
         logging.info(f"🔁 {updated} rows updated in 'cashflow' for {ticker}")
+        bump_table_version("cashflow")
 
 
 # Function to insert or update annual financial‑statement data in the 'financials' table
@@ -806,15 +821,10 @@ def insert_financials_data(ticker):
     # ── 3. Resolve company_id ────────────────────────────────────────────────
     metadata = MetaData()
     metadata.reflect(bind=engine)
-    with engine.begin() as conn:
-        row = conn.execute(
-            text("SELECT company_id FROM info WHERE symbol = :sym"),
-            {"sym": ticker},
-        ).fetchone()
-    if not row:
+    company_id = get_company_id(ticker)
+    if company_id is None:
         logging.warning(f"⚠️ No company_id found for {ticker}; skipping financials insert")
         return
-    company_id = row[0]
 
     financials_table = metadata.tables["financials"]
     existing_cols = financials_table.columns.keys()
@@ -928,8 +938,10 @@ def insert_financials_data(ticker):
     # ── 5. Logging summary ──────────────────────────────────────────────────
     if inserted:
         logging.info(f"➕ {inserted} new rows inserted into 'financials' for {ticker}")
+        bump_table_version("financials")
     if updated:
         logging.info(f"🔁 {updated} rows updated in 'financials' for {ticker}")
+        bump_table_version("financials")
 
 
 # Function to insert or update dividend data in the 'dividends' table
@@ -986,15 +998,10 @@ def insert_dividends_data(ticker):
     # 3 ── Resolve company_id ────────────────────────────────────────────────
     metadata = MetaData()
     metadata.reflect(bind=engine)
-    with engine.begin() as conn:
-        row = conn.execute(
-            text("SELECT company_id FROM info WHERE symbol = :sym"),
-            {"sym": ticker},
-        ).fetchone()
-    if not row:
+    company_id = get_company_id(ticker)
+    if company_id is None:
         logging.warning(f"⚠️ No company_id found for {ticker}; skipping dividends insert")
         return
-    company_id = row[0]
 
     div_table = metadata.tables["dividends"]
 
@@ -1071,8 +1078,10 @@ def insert_dividends_data(ticker):
 
     if inserted_count:
         logging.info(f"➕ {inserted_count} new rows inserted into 'dividends' for {ticker}")
+        bump_table_version("dividends")
     if updated_count:
         logging.info(f"🔁 {updated_count} rows updated in 'dividends' for {ticker}")
+        bump_table_version("dividends")
 
 
 # Function to insert or update recommendation‑summary data in the 'recommendations' table
@@ -1097,15 +1106,10 @@ def insert_recommendations_data(ticker):
     # 2. Resolve company_id
     metadata = MetaData()
     metadata.reflect(bind=engine)
-    with engine.begin() as conn:
-        row = conn.execute(
-            text("SELECT company_id FROM info WHERE symbol = :sym"),
-            {"sym": ticker},
-        ).fetchone()
-    if not row:
+    company_id = get_company_id(ticker)
+    if company_id is None:
         logging.warning(f"⚠️ No company_id found for {ticker}; skipping recommendations insert")
         return
-    company_id = row[0]
 
     rec_table = metadata.tables["recommendations"]
     existing_cols = rec_table.columns.keys()
@@ -1163,8 +1167,10 @@ def insert_recommendations_data(ticker):
         logging.warning(f"⚠️ {total_missing} fields ignored for {ticker} in 'recommendations' due to absent columns")
     if inserted:
         logging.info(f"➕ {inserted} new rows inserted into 'recommendations' for {ticker}")
+        bump_table_version("recommendations")
     if updated:
         logging.info(f"🔁 {updated} rows updated in 'recommendations' for {ticker}")
+        bump_table_version("recommendations")
 
 
 # Function to insert or update stock‑split data in the 'splits' table
@@ -1216,15 +1222,10 @@ def insert_splits_data(ticker):
     # 3 ── Resolve company_id ───────────────────────────────────────────────
     metadata = MetaData()
     metadata.reflect(bind=engine)
-    with engine.begin() as conn:
-        row = conn.execute(
-            text("SELECT company_id FROM info WHERE symbol = :sym"),
-            {"sym": ticker},
-        ).fetchone()
-    if not row:
+    company_id = get_company_id(ticker)
+    if company_id is None:
         logging.warning(f"⚠️ No company_id found for {ticker}; skipping splits insert")
         return
-    company_id = row[0]
 
     splits_table = metadata.tables["splits"]
 
@@ -1293,8 +1294,10 @@ def insert_splits_data(ticker):
     # 6 ── Logging summary ──────────────────────────────────────────────────
     if inserted_count:
         logging.info(f"➕ {inserted_count} new rows inserted into 'splits' for {ticker}")
+        bump_table_version("splits")
     if updated_count:
         logging.info(f"🔁 {updated_count} rows updated in 'splits' for {ticker}")
+        bump_table_version("splits")
 
 
 # Function to insert or update ESG sustainability data in the 'sustainability' table
@@ -1338,15 +1341,10 @@ def insert_sustainability_data(ticker):
     # 2. Resolve company_id
     metadata = MetaData()
     metadata.reflect(bind=engine)
-    with engine.begin() as conn:
-        row = conn.execute(
-            text("SELECT company_id FROM info WHERE symbol = :sym"),
-            {"sym": ticker},
-        ).fetchone()
-    if not row:
+    company_id = get_company_id(ticker)
+    if company_id is None:
         logging.warning(f"⚠️ No company_id found for {ticker}; skipping sustainability insert")
         return
-    company_id = row[0]
 
     sust_table = metadata.tables["sustainability"]
     existing_cols = sust_table.columns.keys()
@@ -1443,8 +1441,10 @@ def insert_sustainability_data(ticker):
     # 5. Logging
     if inserted:
         logging.info(f"➕ 1 new row inserted into 'sustainability' for {ticker}")
+        bump_table_version("sustainability")
     if updated:
         logging.info(f"🔁 1 row updated in 'sustainability' for {ticker}")
+        bump_table_version("sustainability")
 
 # Execute the update process for each ticker in the list
 from curl_cffi.requests.exceptions import HTTPError, Timeout
@@ -1487,12 +1487,7 @@ for i, ticker in enumerate(tickers, start=1):
             first_failure_time = None
 
             # ── verifica presenza in 'info' ────────────────────────────────
-            with engine.connect() as conn:
-                row = conn.execute(
-                    text("SELECT company_id FROM info WHERE symbol = :symbol"),
-                    {"symbol": ticker},
-                ).fetchone()
-            if row is None:
+            if get_company_id(ticker) is None:
                 logging.warning(f"⚠️ {ticker} not found in 'info' table. Skipping.")
                 break  # esce dal while → prossimo ticker
 
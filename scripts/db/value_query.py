@@ -1,23 +1,17 @@
-import pymysql
-import os
-from dotenv import load_dotenv
 from .table_metadata import TABLE_METADATA
 from .date_utils import bounds
+from .async_db import fetch_one as fetch_one_async
+from .company_ids import get_company_id, get_company_ids
+from .db_pool import fetch_all, fetch_one
+from ..tracing import traced
 import datetime
 
-load_dotenv()
-MYSQL_USER     = os.getenv("MYSQL_USER")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-MYSQL_HOST     = os.getenv("MYSQL_HOST")
-MYSQL_PORT     = int(os.getenv("MYSQL_PORT"))
-MYSQL_DB       = os.getenv("MYSQL_DB")
-
 class ValueNotInDatabase(Exception):
     pass
 
-def answer_value_query(parsed: dict):
+def build_value_query(parsed: dict):
     """
-    Esegue una query SQL a partire da:
+    Costruisce (sql, params) a partire da:
     {
         "company": "AAPL",
         "table": "financials",
@@ -26,6 +20,11 @@ def answer_value_query(parsed: dict):
         "time_type":  "year",
         "time_value": "2023"        # può essere None se latest
     }
+
+    Restituisce None se mancano dati; ValueError se il periodo non è
+    compatibile con la tabella.  L'azienda è risolta in `company_id` dalla
+    mappa in memoria (`company_ids`): un simbolo sconosciuto dà `= NULL`,
+    cioè nessuna riga.
     """
     company    = parsed.get("company")
     table      = parsed.get("table")
@@ -43,66 +42,139 @@ def answer_value_query(parsed: dict):
         raise ValueError(f"La tabella {table} non contiene dati storici: "
                          "il periodo deve essere 'latest'.")
 
-    try:
-        connection = pymysql.connect(
-            user=MYSQL_USER,
-            password=MYSQL_PASSWORD,
-            host=MYSQL_HOST,
-            port=MYSQL_PORT,
-            database=MYSQL_DB
-        )
-
-        with connection.cursor() as cursor:
-            if time_field is None:
-                # Tabella statica (info, recommendations, splits, sustainability)
-                sql = f"""
-                    SELECT {column}
-                    FROM {table}
-                    WHERE company_id = (
-                        SELECT company_id FROM info WHERE symbol = %s
-                    )
-                """
-                cursor.execute(sql, (company.upper(),))
-
-            else:
-                start, end = bounds(time_type, time_value)
-                if start is None:
-                    # Caso 'latest'
-                    sql = f"""
-                        SELECT {column}
-                        FROM {table}
-                        WHERE company_id = (
-                            SELECT company_id FROM info WHERE symbol = %s
-                        )
-                        ORDER BY {time_field} DESC
-                        LIMIT 1
-                    """
-                    cursor.execute(sql, (company.upper(),))
-                else:
-                    sql = f"""
-                        SELECT {column}
-                        FROM {table}
-                        WHERE company_id = (
-                            SELECT company_id FROM info WHERE symbol = %s
-                        )
-                          AND {time_field} BETWEEN %s AND %s
-                        ORDER BY {time_field} DESC
-                        LIMIT 1
-                    """
-                    # PyMySQL converte automaticamente datetime.date in stringa
-                    cursor.execute(sql, (company.upper(), start, end))
-
-            result = cursor.fetchone()
-            if result is None:
-                raise ValueNotInDatabase("No data found in the database.")
-            return result[0]
+    if time_field is None:
+        # Tabella statica (info, recommendations, splits, sustainability)
+        sql = f"""
+            SELECT {column}
+            FROM {table}
+            WHERE company_id = %s
+        """
+        return sql, (get_company_id(company),)
+
+    start, end = bounds(time_type, time_value)
+    if start is None:
+        # Caso 'latest'
+        sql = f"""
+            SELECT {column}
+            FROM {table}
+            WHERE company_id = %s
+            ORDER BY {time_field} DESC
+            LIMIT 1
+        """
+        return sql, (get_company_id(company),)
 
+    sql = f"""
+        SELECT {column}
+        FROM {table}
+        WHERE company_id = %s
+          AND {time_field} BETWEEN %s AND %s
+        ORDER BY {time_field} DESC
+        LIMIT 1
+    """
+    # PyMySQL converte automaticamente datetime.date in stringa
+    return sql, (get_company_id(company), start, end)
+
+
+def build_bulk_value_query(parsed_list: list):
+    """
+    Come `build_value_query`, ma per più aziende con stessa tabella, colonna
+    e periodo: una sola query con `company_id IN (...)`.
+
+    Le righe tornano come (company_id, valore), ordinate per data
+    decrescente dentro ogni azienda: la prima per azienda è quella da usare.
+    Le aziende assenti da `info` vengono escluse.
+    """
+    first = parsed_list[0]
+    table      = first.get("table")
+    column     = first.get("column")
+    time_field = first.get("time_field") or TABLE_METADATA.get(table, {}).get("time_field")
+    time_type  = first.get("time_type", "latest")
+    ids        = sorted(get_company_ids(p["company"] for p in parsed_list if p.get("company")).values())
+
+    if not (ids and table and column):
+        return None
+    if time_field is None and time_type != "latest":
+        raise ValueError(f"La tabella {table} non contiene dati storici: "
+                         "il periodo deve essere 'latest'.")
+
+    in_clause = ", ".join(["%s"] * len(ids))
+    base = f"""
+        SELECT t.company_id, t.{column}
+        FROM {table} t
+        WHERE t.company_id IN ({in_clause})
+    """
+    if time_field is None:
+        return base, tuple(ids)
+
+    start, end = bounds(time_type, first.get("time_value"))
+    if start is None:
+        # 'latest' per ogni azienda
+        sql = base + f"""
+          AND t.{time_field} = (
+              SELECT MAX(t2.{time_field}) FROM {table} t2 WHERE t2.company_id = t.company_id
+          )
+        """
+        return sql, tuple(ids)
+
+    sql = base + f"""
+          AND t.{time_field} BETWEEN %s AND %s
+        ORDER BY t.company_id, t.{time_field} DESC
+    """
+    return sql, (*ids, start, end)
+
+
+@traced("value_query.sql_bulk")
+def answer_value_queries_bulk(parsed_list: list) -> dict:
+    """
+    Esegue `build_bulk_value_query` e restituisce {symbol: valore}.
+    Le aziende senza righe non compaiono nel dizionario.
+    """
+    query = build_bulk_value_query(parsed_list)
+    if query is None:
+        return {}
+    sql, params = query
+
+    symbol_by_id = {cid: symbol for symbol, cid in
+                    get_company_ids(p["company"] for p in parsed_list if p.get("company")).items()}
+    results = {}
+    for cid, value in fetch_all(sql, params):
+        results.setdefault(symbol_by_id[cid], value)
+    return results
+
+
+@traced("value_query.sql")
+def answer_value_query(parsed: dict):
+    """
+    Esegue la query di `build_value_query` e restituisce il valore.
+    """
+    query = build_value_query(parsed)
+    if query is None:
+        return None
+    sql, params = query
+
+    try:
+        result = fetch_one(sql, params)
     except Exception as e:
-        if isinstance(e, ValueNotInDatabase):
-            raise
         print("❌ Errore durante l'esecuzione della query:", e)
         return None
+    if result is None:
+        raise ValueNotInDatabase("No data found in the database.")
+    return result[0]
+
+
+@traced("value_query.sql")
+async def answer_value_query_async(parsed: dict):
+    """Versione async di `answer_value_query` (vedi `async_db`)."""
+    query = build_value_query(parsed)
+    if query is None:
+        return None
+    sql, params = query
 
-    finally:
-        if "connection" in locals() and connection:
-            connection.close()
\ No newline at end of file
+    try:
+        result = await fetch_one_async(sql, params)
+    except Exception as e:
+        print("❌ Errore durante l'esecuzione della query:", e)
+        return None
+    if result is None:
+        raise ValueNotInDatabase("No data found in the database.")
+    return result[0]
@@ -0,0 +1,341 @@
+"""
+volatility_query.py
+
+Volatilità realizzata e metriche di rischio dai prezzi giornalieri di
+`history`, calcolate con NumPy sugli array di prezzi letti in una sola query
+per tutte le aziende richieste.
+
+Stime (annualizzate su TRADING_DAYS sedute)
+-------------------------------------------
+• close_to_close – deviazione standard dei rendimenti logaritmici di chiusura
+• parkinson      – range high/low:  σ² = mean(ln(H/L)²) / (4 ln 2)
+• garman_klass   – OHLC:  σ² = mean(½ ln(H/L)² − (2 ln 2 − 1) ln(C/O)²)
+
+più volatilità su finestra mobile (`rolling`), drawdown massimo (picco,
+minimo, recupero) e drawdown corrente, beta e correlazione rispetto a un
+ticker di riferimento (MARK_BENCHMARK, default SPY).
+
+Split
+-----
+Le righe di `history` accodate dall'ETL prima di uno split non sono
+rettificate: uno split 4:1 comparirebbe come un drawdown del −75% e un
+rendimento giornaliero enorme.  I prezzi vengono quindi riportati a una
+base comune con la stessa regola di `return_query.total_return_index`
+(il rapporto di `splits` si applica solo se avvicina il rendimento a zero);
+O/H/L della seduta seguono il fattore della chiusura, quindi gli stimatori
+intraday non cambiano.
+
+Cache
+-----
+I risultati finiscono nella cache condivisa (`answer_cache`, namespace
+"volatility") con chiave (ticker, finestra, data di riferimento, benchmark,
+rolling) e dipendenza dalle tabelle `history` e `splits`: restano validi
+finché l'ETL non scrive nuove righe di prezzo o nuovi split.
+
+API pubblico
+------------
+volatility(symbols, window=252, as_of=None, benchmark=BENCHMARK, rolling=None) -> dict[str, dict]
+volatility_async(...)                     stessa firma, versione async
+realized_volatility(open_, high, low, close) -> dict   (stime sugli array)
+rolling_volatility(close, window)         -> np.ndarray
+drawdowns(dates, close)                   -> dict
+beta(dates, close, bench_dates, bench_close) -> (beta, correlazione)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import math
+import os
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ..answer_cache import get_answer_cache
+from ..tracing import annotate, traced
+from .async_db import fetch_all as fetch_all_async
+from .company_ids import get_company_ids
+from .db_pool import fetch_all
+from .return_query import total_return_index
+
+__all__ = [
+    "volatility",
+    "volatility_async",
+    "realized_volatility",
+    "rolling_volatility",
+    "drawdowns",
+    "beta",
+]
+
+TRADING_DAYS = 252
+BENCHMARK = os.getenv("MARK_BENCHMARK", "SPY")
+DEFAULT_WINDOW = 252
+
+_LN2 = math.log(2)
+
+# Serie di prezzi: date (datetime64[D]) e colonne OHLC (float, NaN se assenti)
+Prices = Dict[str, np.ndarray]
+
+
+# --------------------------------------------------------------------------- #
+#  Stime sugli array
+# --------------------------------------------------------------------------- #
+
+def _annualize(variance: float) -> Optional[float]:
+    if variance is None or not np.isfinite(variance) or variance < 0:
+        return None
+    return float(np.sqrt(variance * TRADING_DAYS))
+
+
+def realized_volatility(open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                        close: np.ndarray) -> Dict[str, Optional[float]]:
+    """Volatilità annualizzata con i tre stimatori (None se i dati non bastano)."""
+    returns = np.diff(np.log(close))
+    returns = returns[np.isfinite(returns)]
+    c2c = _annualize(np.var(returns, ddof=1)) if returns.size > 1 else None
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hl = np.log(high / low) ** 2
+        co = np.log(close / open_) ** 2
+    valid = np.isfinite(hl) & np.isfinite(co)
+    if valid.any():
+        parkinson = _annualize(np.mean(hl[valid]) / (4 * _LN2))
+        garman_klass = _annualize(np.mean(0.5 * hl[valid] - (2 * _LN2 - 1) * co[valid]))
+    else:
+        parkinson = garman_klass = None
+    return {"close_to_close": c2c, "parkinson": parkinson, "garman_klass": garman_klass}
+
+
+def rolling_volatility(close: np.ndarray, window: int) -> np.ndarray:
+    """
+    Volatilità close‑to‑close annualizzata su finestre mobili di `window`
+    rendimenti; l'elemento i corrisponde alla chiusura `close[i + window]`.
+    """
+    returns = np.diff(np.log(close))
+    if returns.size < window or window < 2:
+        return np.empty(0)
+    windows = sliding_window_view(returns, window)
+    return np.nanstd(windows, axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+
+
+def drawdowns(dates: np.ndarray, close: np.ndarray) -> Dict[str, Any]:
+    """Drawdown massimo (con date di picco, minimo e recupero) e drawdown corrente."""
+    if close.size == 0:
+        return {}
+    peaks = np.maximum.accumulate(close)
+    dd = close / peaks - 1
+    trough = int(np.argmin(dd))
+    peak = int(np.argmax(close[:trough + 1]))
+    recovered = np.nonzero(close[trough:] >= close[peak])[0]
+    return {
+        "max_drawdown": float(dd[trough]),
+        "drawdown_peak": str(dates[peak]),
+        "drawdown_trough": str(dates[trough]),
+        "drawdown_recovery": str(dates[trough + recovered[0]]) if recovered.size and dd[trough] < 0 else None,
+        "current_drawdown": float(dd[-1]),
+    }
+
+
+def beta(dates: np.ndarray, close: np.ndarray,
+         bench_dates: np.ndarray, bench_close: np.ndarray) -> Tuple[Optional[float], Optional[float]]:
+    """Beta e correlazione dei rendimenti giornalieri sulle date comuni."""
+    common, i, j = np.intersect1d(dates, bench_dates, return_indices=True)
+    if common.size < 3:
+        return None, None
+    r = np.diff(np.log(close[i]))
+    b = np.diff(np.log(bench_close[j]))
+    valid = np.isfinite(r) & np.isfinite(b)
+    r, b = r[valid], b[valid]
+    if r.size < 2 or np.var(b, ddof=1) == 0:
+        return None, None
+    cov = np.cov(r, b, ddof=1)
+    return float(cov[0, 1] / cov[1, 1]), float(np.corrcoef(r, b)[0, 1])
+
+
+# --------------------------------------------------------------------------- #
+#  Query
+# --------------------------------------------------------------------------- #
+
+def _start_date(end: datetime.date, sessions: int) -> datetime.date:
+    """Data di inizio che copre `sessions` sedute prima di `end` (con margine per le festività)."""
+    return end - datetime.timedelta(days=int(sessions * 7 / 5) + 14)
+
+
+def build_history_query(company_ids: Sequence[int], start: datetime.date,
+                        end: Optional[datetime.date]) -> Tuple[str, Tuple[Any, ...]]:
+    """(sql, params) per i prezzi OHLC di più aziende, ordinati per azienda e data."""
+    placeholders = ", ".join(["%s"] * len(company_ids))
+    end_filter, params = ("AND date <= %s", (end,)) if end else ("", ())
+    sql = f"""
+        SELECT company_id, date, open, high, low, close
+        FROM history
+        WHERE company_id IN ({placeholders})
+        AND date >= %s {end_filter}
+        AND close IS NOT NULL AND close > 0
+        ORDER BY company_id, date
+    """
+    return sql, (*company_ids, start, *params)
+
+
+def build_splits_query(company_ids: Sequence[int], start: datetime.date,
+                       end: Optional[datetime.date]) -> Tuple[str, Tuple[Any, ...]]:
+    """(sql, params) per gli split di più aziende nello stesso intervallo dei prezzi."""
+    placeholders = ", ".join(["%s"] * len(company_ids))
+    end_filter, params = ("AND date <= %s", (end,)) if end else ("", ())
+    sql = f"""
+        SELECT company_id, date, split_ratio
+        FROM splits
+        WHERE company_id IN ({placeholders})
+        AND date >= %s {end_filter}
+        ORDER BY company_id, date
+    """
+    return sql, (*company_ids, start, *params)
+
+
+def _adjust_splits(prices: Prices, events: Tuple[list, list]) -> None:
+    """Riporta OHLC alla base dell'ultima seduta per gli split non incorporati."""
+    close = prices["close"]
+    index = total_return_index(prices["date"], close, events)
+    factor = index * (close[-1] / index[-1]) / close
+    for column in ("open", "high", "low", "close"):
+        prices[column] = prices[column] * factor
+
+
+def _split_series(rows: Sequence[Tuple[Any, ...]],
+                  split_rows: Sequence[Tuple[Any, ...]] = ()) -> Dict[int, Prices]:
+    """Righe (company_id, date, o, h, l, c) → array NumPy per azienda, split rettificati."""
+    series: Dict[int, Prices] = {}
+    if not rows:
+        return series
+    ids = np.asarray([r[0] for r in rows])
+    dates = np.asarray([str(r[1])[:10] for r in rows], dtype="datetime64[D]")
+    ohlc = np.asarray([[np.nan if v is None else float(v) for v in r[2:6]] for r in rows])
+    bounds = np.flatnonzero(np.diff(ids)) + 1
+    for chunk in np.split(np.arange(len(rows)), bounds):
+        series[int(ids[chunk[0]])] = {
+            "date": dates[chunk], "open": ohlc[chunk, 0], "high": ohlc[chunk, 1],
+            "low": ohlc[chunk, 2], "close": ohlc[chunk, 3],
+        }
+    events: Dict[int, Tuple[list, list]] = {}
+    for company_id, date, ratio in split_rows:
+        dates, ratios = events.setdefault(int(company_id), ([], []))
+        dates.append(date)
+        ratios.append(float(ratio))
+    for company_id, split_events in events.items():
+        if company_id in series:
+            _adjust_splits(series[company_id], split_events)
+    return series
+
+
+def _metrics(prices: Prices, window: int, rolling: Optional[int],
+             bench: Optional[Prices]) -> Dict[str, Any]:
+    """Tutte le metriche sulle ultime `window` sedute della serie."""
+    take = slice(-(window + 1), None)
+    dates, close = prices["date"][take], prices["close"][take]
+    result: Dict[str, Any] = {
+        "as_of": str(dates[-1]),
+        "start": str(dates[0]),
+        "observations": int(close.size),
+        **realized_volatility(prices["open"][take], prices["high"][take],
+                              prices["low"][take], close),
+        **drawdowns(dates, close),
+    }
+    if bench is not None:
+        result["beta"], result["correlation"] = beta(dates, close, bench["date"], bench["close"])
+    if rolling:
+        full_close = prices["close"][-(window + rolling + 1):]
+        full_dates = prices["date"][-(window + rolling + 1):]
+        vols = rolling_volatility(full_close, rolling)
+        result["rolling"] = [[str(d), float(v)] for d, v in zip(full_dates[rolling + 1:], vols[1:])]
+    return result
+
+
+def _plan(symbols: Sequence[str], window: int, as_of: Any, benchmark: Optional[str],
+          rolling: Optional[int]):
+    """Chiavi di cache, risultati già in cache e query (prezzi, split) per i ticker mancanti."""
+    symbols = [s.upper() for s in symbols]
+    benchmark = benchmark.upper() if benchmark else None
+    end = datetime.date.fromisoformat(str(as_of)[:10]) if as_of else None
+    cache = get_answer_cache()
+
+    keys = {s: (s, window, str(end) if end else "latest", benchmark, rolling) for s in symbols}
+    results = {s: cache.get("volatility", keys[s]) for s in symbols}
+    missing = [s for s in symbols if results[s] is None]
+    if not missing:
+        return symbols, keys, results, None, {}
+
+    ids = get_company_ids(missing + ([benchmark] if benchmark else []))
+    if not ids:
+        return symbols, keys, results, None, ids
+    # senza data di riferimento la finestra termina all'ultima seduta in tabella,
+    # che può precedere oggi di qualche settimana: margine di 30 sedute
+    sessions = window + (rolling or 0) + 1 + (0 if end else 30)
+    start = _start_date(end or datetime.date.today(), sessions)
+    company_ids = sorted(set(ids.values()))
+    queries = (build_history_query(company_ids, start, end), build_splits_query(company_ids, start, end))
+    return symbols, keys, results, queries, ids
+
+
+def _finish(symbols, keys, results, ids, rows, split_rows, window, benchmark, rolling) -> Dict[str, Any]:
+    series = _split_series(rows, split_rows)
+    benchmark = benchmark.upper() if benchmark else None
+    bench = series.get(ids.get(benchmark)) if benchmark else None
+    cache = get_answer_cache()
+    for symbol in symbols:
+        if results[symbol] is not None:
+            continue
+        prices = series.get(ids.get(symbol))
+        if prices is None or prices["close"].size < 3:
+            results[symbol] = {"error": "Storico prezzi insufficiente."}
+            continue
+        results[symbol] = _metrics(prices, window, rolling, bench if symbol != benchmark else None)
+        if benchmark and bench is None:
+            results[symbol]["beta"] = results[symbol]["correlation"] = None
+        cache.put("volatility", keys[symbol], results[symbol], tables=["history", "splits"])
+    annotate(symbols=len(symbols), rows=len(rows))
+    return results
+
+
+@traced("volatility_query.sql")
+def volatility(symbols: Sequence[str], window: int = DEFAULT_WINDOW, as_of: Any = None,
+               benchmark: Optional[str] = BENCHMARK, rolling: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Metriche di volatilità e rischio per ogni ticker.
+
+    Parameters
+    ----------
+    symbols : list[str]
+        Ticker (una sola query per tutti, benchmark incluso).
+    window : int
+        Sedute su cui calcolare le stime (252 ≈ un anno).
+    as_of : str | date | None
+        Ultima data inclusa; None → ultima seduta disponibile.
+    benchmark : str | None
+        Ticker per beta e correlazione; None per non calcolarli.
+    rolling : int | None
+        Se dato, aggiunge la serie [[data, vol], ...] su finestre mobili di
+        `rolling` sedute.
+
+    Returns
+    -------
+    dict
+        {ticker: {"as_of", "start", "observations", "close_to_close",
+        "parkinson", "garman_klass", "max_drawdown", "drawdown_peak",
+        "drawdown_trough", "drawdown_recovery", "current_drawdown", "beta",
+        "correlation", ["rolling"]}} oppure {"error": ...} per il ticker.
+    """
+    symbols, keys, results, queries, ids = _plan(symbols, window, as_of, benchmark, rolling)
+    rows, split_rows = (fetch_all(*q) for q in queries) if queries else ([], [])
+    return _finish(symbols, keys, results, ids, rows, split_rows, window, benchmark, rolling)
+
+
+@traced("volatility_query.sql")
+async def volatility_async(symbols: Sequence[str], window: int = DEFAULT_WINDOW, as_of: Any = None,
+                           benchmark: Optional[str] = BENCHMARK,
+                           rolling: Optional[int] = None) -> Dict[str, Any]:
+    """Versione async di `volatility` (vedi `async_db`)."""
+    symbols, keys, results, queries, ids = _plan(symbols, window, as_of, benchmark, rolling)
+    rows, split_rows = await asyncio.gather(*(fetch_all_async(*q) for q in queries)) if queries else ([], [])
+    return _finish(symbols, keys, results, ids, rows, split_rows, window, benchmark, rolling)
@@ -0,0 +1,466 @@
+"""
+llm_provider.py
+
+Client OpenAI condiviso da tutta la pipeline di Mark.
+
+Prima ogni modulo (classify_question, answer_num_query, parse_num_query,
+parse_avg_query, llm_wrapper, retriever, generate_*_metadata) creava il
+proprio `OpenAI()` all'import, con timeout di default e nessuna policy di
+retry.  Qui c'è un solo client con pool HTTP keep‑alive e, per ogni
+chiamata:
+
+• **deadline per stage** – `classify`, `choose`, `parse`, `answer`, `embed`,
+  `metadata`; override con `MARK_LLM_TIMEOUT_<STAGE>` (secondi).  La
+  deadline copre anche i retry;
+• **retry con jitter** – backoff esponenziale "full jitter" sugli errori
+  transitori (timeout, connessione, 429, 5xx); `MARK_LLM_RETRIES`;
+• **circuit breaker** – dopo `MARK_LLM_BREAKER_THRESHOLD` errori consecutivi
+  le chiamate falliscono subito con `CircuitOpenError` per
+  `MARK_LLM_BREAKER_COOLDOWN` secondi, poi una chiamata di prova;
+• **istogrammi** – latenza (e time‑to‑first‑token per lo streaming) e token
+  prompt/completion per call site, leggibili con `stats()`.
+
+`OPENAI_BASE_URL` punta il client a un endpoint compatibile, ad es. lo stub
+locale `scripts/bench/stub_openai_server.py` per benchmark offline.
+
+API pubblico
+------------
+get_client() -> OpenAI
+chat(stage, site=None, **kwargs) -> ChatCompletion
+chat_stream(stage, site=None, **kwargs) -> Iterator[ChatCompletionChunk]
+embed(stage, site=None, **kwargs) -> CreateEmbeddingResponse
+achat / achat_stream / aembed      stesse funzioni per asyncio (AsyncOpenAI)
+stats() -> dict
+CircuitOpenError
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+from scripts.tracing import add_tokens, annotate, span
+
+__all__ = [
+    "get_client", "chat", "chat_stream", "embed",
+    "get_async_client", "achat", "achat_stream", "aembed",
+    "stats", "CircuitOpenError",
+]
+
+load_dotenv()
+
+# --------------------------------------------------------------------------- #
+#  Configurazione
+# --------------------------------------------------------------------------- #
+
+_DEFAULT_TIMEOUTS = {
+    "classify": 10.0,
+    "choose": 8.0,
+    "parse": 20.0,
+    "answer": 45.0,
+    "embed": 10.0,
+    "metadata": 60.0,
+}
+
+MAX_RETRIES = int(os.getenv("MARK_LLM_RETRIES", 2))
+BACKOFF_BASE = float(os.getenv("MARK_LLM_BACKOFF_BASE", 0.25))
+BACKOFF_CAP = float(os.getenv("MARK_LLM_BACKOFF_CAP", 4.0))
+BREAKER_THRESHOLD = int(os.getenv("MARK_LLM_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.getenv("MARK_LLM_BREAKER_COOLDOWN", 30.0))
+POOL_SIZE = int(os.getenv("MARK_LLM_POOL_SIZE", 20))
+
+
+def stage_timeout(stage: str) -> float:
+    """Deadline in secondi per `stage` (env `MARK_LLM_TIMEOUT_<STAGE>`)."""
+    env = os.getenv(f"MARK_LLM_TIMEOUT_{stage.upper()}")
+    return float(env) if env else _DEFAULT_TIMEOUTS.get(stage, 30.0)
+
+
+# --------------------------------------------------------------------------- #
+#  Client
+# --------------------------------------------------------------------------- #
+
+@lru_cache(maxsize=1)
+def get_client() -> OpenAI:
+    """Unico client del processo, con pool di connessioni keep‑alive."""
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        timeout=httpx.Timeout(max(_DEFAULT_TIMEOUTS.values()), connect=5.0),
+    )
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        http_client=http_client,
+        max_retries=0,          # i retry li gestiamo noi, entro la deadline
+    )
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Client async con pool proprio, uno per event loop: le connessioni httpx
+    non possono essere condivise tra loop diversi.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            timeout=httpx.Timeout(max(_DEFAULT_TIMEOUTS.values()), connect=5.0),
+        )
+        client = _async_clients[loop] = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=http_client,
+            max_retries=0,
+        )
+    return client
+
+
+# --------------------------------------------------------------------------- #
+#  Circuit breaker
+# --------------------------------------------------------------------------- #
+
+class CircuitOpenError(RuntimeError):
+    """Il provider ha fallito troppe volte di fila: chiamata non eseguita."""
+
+
+class _CircuitBreaker:
+    """closed → open (dopo N errori) → half‑open (una prova) → closed."""
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                raise CircuitOpenError("LLM provider temporaneamente disabilitato (circuit open)")
+            self._probing = True            # half‑open: lascia passare una chiamata
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logging.warning("⚡ LLM circuit breaker aperto dopo %d errori", self._failures)
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._probing else "open"
+
+
+_breaker = _CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+
+# --------------------------------------------------------------------------- #
+#  Istogrammi
+# --------------------------------------------------------------------------- #
+
+_LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+_TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384)
+
+
+class _Histogram:
+    """Istogramma a bucket fissi con stima dei percentili (limite superiore)."""
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.n += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.n:
+            return None
+        target, seen = q * self.n, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.n,
+            "mean": round(self.total / self.n, 2) if self.n else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(zip([*map(str, self.bounds), "inf"], self.counts)),
+        }
+
+
+_metrics: Dict[str, Dict[str, Any]] = {}
+_metrics_lock = threading.Lock()
+
+
+def _site_metrics(site: str) -> Dict[str, Any]:
+    m = _metrics.get(site)
+    if m is None:
+        m = _metrics[site] = {
+            "latency_ms": _Histogram(_LATENCY_BUCKETS_MS),
+            "ttft_ms": _Histogram(_LATENCY_BUCKETS_MS),
+            "prompt_tokens": _Histogram(_TOKEN_BUCKETS),
+            "completion_tokens": _Histogram(_TOKEN_BUCKETS),
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+        }
+    return m
+
+
+def _record(site: str, **observations: float) -> None:
+    with _metrics_lock:
+        m = _site_metrics(site)
+        for name, value in observations.items():
+            if isinstance(m.get(name), _Histogram):
+                m[name].observe(value)
+            else:
+                m[name] += value
+
+
+def _record_usage(site: str, usage: Any) -> None:
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    _record(site, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    add_tokens(prompt_tokens, completion_tokens)   # sullo span di tracing corrente
+
+
+def stats() -> Dict[str, Any]:
+    """Metriche per call site + stato del circuit breaker."""
+    with _metrics_lock:
+        sites = {
+            site: {k: (v.as_dict() if isinstance(v, _Histogram) else v) for k, v in m.items()}
+            for site, m in _metrics.items()
+        }
+    return {"breaker": _breaker.state, "sites": sites}
+
+
+# --------------------------------------------------------------------------- #
+#  Retry
+# --------------------------------------------------------------------------- #
+
+_RETRYABLE = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def _retry_pause(site: str, attempt: int, deadline: float, exc: Exception) -> Optional[float]:
+    """
+    Dopo un errore transitorio: secondi da attendere, o None se non si ritenta.
+
+    Full jitter: pausa ∈ [0, min(cap, base·2^attempt)], entro la deadline.
+    """
+    _breaker.record_failure()
+    _record(site, calls=1, errors=1)
+    pause = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    if attempt >= MAX_RETRIES or time.monotonic() + pause >= deadline:
+        return None
+    _record(site, retries=1)
+    logging.warning("🔁 %s: %s, retry %d tra %.2fs", site, type(exc).__name__, attempt + 1, pause)
+    return pause
+
+
+def _on_fatal(site: str) -> None:
+    """Errori non transitori (400, auth…): il provider risponde, quindi il
+    breaker resta chiuso, ma non ha senso ritentare."""
+    _breaker.record_success()
+    _record(site, calls=1, errors=1)
+
+
+def _on_success(site: str, started: float, timed: bool) -> None:
+    _breaker.record_success()
+    if timed:
+        _record(site, calls=1, latency_ms=(time.perf_counter() - started) * 1000)
+    else:
+        _record(site, calls=1)
+
+
+def _call(stage: str, site: str, fn: Callable[[Any], Any], timed: bool = True) -> Any:
+    """
+    Esegue `fn(client)` con deadline, retry jitterati e circuit breaker.
+
+    `fn` riceve un client già configurato con il timeout residuo.  Con
+    `timed=False` la latenza non viene registrata (la misura il chiamante).
+    """
+    deadline = time.monotonic() + stage_timeout(stage)
+    attempt = 0
+    while True:
+        _breaker.before_call()
+        remaining = deadline - time.monotonic()
+        started = time.perf_counter()
+        try:
+            result = fn(get_client().with_options(timeout=max(remaining, 0.1)))
+        except _RETRYABLE as exc:
+            pause = _retry_pause(site, attempt, deadline, exc)
+            if pause is None:
+                raise
+            attempt += 1
+            time.sleep(pause)
+            continue
+        except Exception:
+            _on_fatal(site)
+            raise
+        _on_success(site, started, timed)
+        return result
+
+
+async def _acall(stage: str, site: str, fn: Callable[[Any], Awaitable[Any]], timed: bool = True) -> Any:
+    """Come `_call`, con il client async e `asyncio.sleep` tra i retry."""
+    deadline = time.monotonic() + stage_timeout(stage)
+    attempt = 0
+    while True:
+        _breaker.before_call()
+        remaining = deadline - time.monotonic()
+        started = time.perf_counter()
+        try:
+            result = await fn(get_async_client().with_options(timeout=max(remaining, 0.1)))
+        except _RETRYABLE as exc:
+            pause = _retry_pause(site, attempt, deadline, exc)
+            if pause is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(pause)
+            continue
+        except Exception:
+            _on_fatal(site)
+            raise
+        _on_success(site, started, timed)
+        return result
+
+
+# --------------------------------------------------------------------------- #
+#  Public API
+# --------------------------------------------------------------------------- #
+
+def chat(stage: str, site: Optional[str] = None, **kwargs: Any) -> Any:
+    """
+    `chat.completions.create(**kwargs)` con la policy dello `stage`.
+
+    Parameters
+    ----------
+    stage : str
+        'classify' | 'choose' | 'parse' | 'answer' | 'metadata'.
+    site : str | None
+        Nome del call site per le metriche (default = stage).
+    """
+    site = site or stage
+    with span(f"llm.{site}", model=kwargs.get("model")):
+        response = _call(stage, site, lambda c: c.chat.completions.create(**kwargs))
+        _record_usage(site, getattr(response, "usage", None))
+    return response
+
+
+def chat_stream(stage: str, site: Optional[str] = None, **kwargs: Any) -> Iterator[Any]:
+    """
+    Variante in streaming di `chat`.
+
+    I retry valgono solo per l'apertura dello stream: un errore a metà
+    risposta viene propagato al chiamante.  Registra time‑to‑first‑token,
+    durata totale e token (via `stream_options.include_usage`).
+    """
+    site = site or stage
+    kwargs.setdefault("stream_options", {"include_usage": True})
+    started = time.perf_counter()
+    stream = _call(stage, site, lambda c: c.chat.completions.create(stream=True, **kwargs),
+                   timed=False)
+    first = True
+    for chunk in stream:
+        if first and chunk.choices:
+            ttft_ms = (time.perf_counter() - started) * 1000
+            _record(site, ttft_ms=ttft_ms)
+            annotate(ttft_ms=round(ttft_ms, 1))
+            first = False
+        _record_usage(site, getattr(chunk, "usage", None))
+        yield chunk
+    _record(site, latency_ms=(time.perf_counter() - started) * 1000)
+
+
+def embed(stage: str = "embed", site: Optional[str] = None, **kwargs: Any) -> Any:
+    """`embeddings.create(**kwargs)` con la policy dello `stage`."""
+    site = site or stage
+    with span(f"llm.{site}", model=kwargs.get("model")):
+        response = _call(stage, site, lambda c: c.embeddings.create(**kwargs))
+        _record_usage(site, getattr(response, "usage", None))
+    return response
+
+
+async def achat(stage: str, site: Optional[str] = None, **kwargs: Any) -> Any:
+    """Versione async di `chat`."""
+    site = site or stage
+    with span(f"llm.{site}", model=kwargs.get("model")):
+        response = await _acall(stage, site, lambda c: c.chat.completions.create(**kwargs))
+        _record_usage(site, getattr(response, "usage", None))
+    return response
+
+
+async def achat_stream(stage: str, site: Optional[str] = None, **kwargs: Any) -> AsyncIterator[Any]:
+    """Versione async di `chat_stream`."""
+    site = site or stage
+    kwargs.setdefault("stream_options", {"include_usage": True})
+    started = time.perf_counter()
+    stream = await _acall(stage, site, lambda c: c.chat.completions.create(stream=True, **kwargs),
+                          timed=False)
+    first = True
+    async for chunk in stream:
+        if first and chunk.choices:
+            ttft_ms = (time.perf_counter() - started) * 1000
+            _record(site, ttft_ms=ttft_ms)
+            annotate(ttft_ms=round(ttft_ms, 1))
+            first = False
+        _record_usage(site, getattr(chunk, "usage", None))
+        yield chunk
+    _record(site, latency_ms=(time.perf_counter() - started) * 1000)
+
+
+async def aembed(stage: str = "embed", site: Optional[str] = None, **kwargs: Any) -> Any:
+    """Versione async di `embed`."""
+    site = site or stage
+    with span(f"llm.{site}", model=kwargs.get("model")):
+        response = await _acall(stage, site, lambda c: c.embeddings.create(**kwargs))
+        _record_usage(site, getattr(response, "usage", None))
+    return response
@@ -1,14 +1,26 @@
 """
 llm_wrapper.py
 
-Converte un payload (numerical, text o hybrid) in una risposta
+Converte un payload (numerical, comparison, screen, text o hybrid) in una risposta
 chiara e professionale usando GPT-4o.
 
-Funzione principale
+Funzioni principali
 -------------------
 format_answer(question: str,
               answer_type: str,
               answer_payload: dict) -> str
+
+format_answer_stream(question: str,
+                     answer_type: str,
+                     answer_payload: dict) -> Iterator[str]
+    Stessa risposta, ma i token vengono restituiti man mano che arrivano.
+
+format_answer_stream_async(...) -> AsyncIterator[str]
+    Come sopra, per la pipeline async.
+
+Le risposte `numerical` sono rese a template (`answer_renderer`) senza
+chiamare l'LLM; `explain=True` o `MARK_NUMERICAL_MODE=explain` riattivano
+la spiegazione generata da GPT.
 """
 
 from __future__ import annotations
@@ -16,22 +28,25 @@ from __future__ import annotations
 import json
 import logging
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional
 
-from openai import OpenAI 
-from dotenv import load_dotenv
+from scripts.answer_renderer import render_numerical
+from scripts.llm_provider import achat_stream, chat, chat_stream
+from scripts.payload_compiler import compile_payload
+from scripts.tokens import count_tokens
+from scripts.tracing import annotate, traced
 
 # --------------------------------------------------------------------------- #
 #  Environment
 # --------------------------------------------------------------------------- #
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 MODEL_NAME = "gpt-4o-mini"
 TEMPERATURE = 0.2
 MAX_TOKENS = 512
 
+# "template" (default): numeriche senza LLM; "explain": spiegazione GPT
+NUMERICAL_MODE = os.getenv("MARK_NUMERICAL_MODE", "template").lower()
+
 # --------------------------------------------------------------------------- #
 #  Prompt helpers
 # --------------------------------------------------------------------------- #
@@ -45,10 +60,30 @@ def _numerical_system() -> str:
     )
 
 
+def _comparison_system() -> str:
+    return (
+        "Sei un analista finanziario. Devi confrontare più aziende usando solo la "
+        "tabella fornita: 'rows' contiene per ogni azienda i valori di ogni metrica, "
+        "allineati a 'periods' (null = dato mancante). Evidenzia differenze e "
+        "andamenti principali; se utile includi una tabella markdown."
+    )
+
+
+def _screen_system() -> str:
+    return (
+        "Sei un analista finanziario. Devi presentare l'elenco di aziende che "
+        "soddisfano i criteri di screening indicati in 'criteria', usando solo i "
+        "dati forniti: 'rows' è già ordinato secondo 'sort' e 'total' è il numero "
+        "complessivo di aziende trovate. Riporta i criteri, una tabella markdown "
+        "delle aziende e, se 'pages' > 1, che l'elenco prosegue."
+    )
+
+
 def _text_system() -> str:
     return (
         "Sei un analista finanziario. Puoi rispondere solo usando i contenuti testuali forniti dall’utente, che provengono da documenti SEC (10-K, 10-Q). "
-        "Non devi aggiungere informazioni inventate o che non sono presenti nei testi forniti. Se l’informazione non è nei chunk, devi dirlo esplicitamente."
+        "Non devi aggiungere informazioni inventate o che non sono presenti nei testi forniti. Se l’informazione non è nei chunk, devi dirlo esplicitamente. "
+        "Ogni chunk indica in 's' l'indice del documento in 'sources'."
     )
 
 
@@ -56,45 +91,38 @@ def _hybrid_system() -> str:
     return (
         "Sei un analista finanziario senior. Devi integrare un valore numerico "
         "e un estratto testuale in un'unica risposta chiara e coesa. "
-        "Spiega prima il dato numerico, poi aggiungi il contesto testuale."
+        "Spiega prima il dato numerico, poi aggiungi il contesto testuale. "
+        "Ogni chunk indica in 's' l'indice del documento in 'sources'."
     )
 
 
 def _build_messages(question: str, answer_type: str, payload: Dict[str, Any]) -> List[Dict[str, str]]:
-    """Costruisce la lista di messaggi per ChatCompletion."""
+    """
+    Costruisce la lista di messaggi per ChatCompletion.
+
+    Il contenuto utente è compilato da `payload_compiler` (JSON compatto,
+    valori formattati, fonti deduplicate, budget di token).
+    """
     if answer_type == "numerical":
         system_prompt = _numerical_system()
-        user_content = json.dumps(
-            {
-                "question": question,
-                "numerical_result": payload
-            },
-            ensure_ascii=False,
-            indent=2
-        )
-
+    elif answer_type == "comparison":
+        system_prompt = _comparison_system()
+    elif answer_type == "screen":
+        system_prompt = _screen_system()
     elif answer_type == "text":
         system_prompt = _text_system()
-        user_content = json.dumps(
-            {
-                "question": question,
-                "text_chunks": payload
-            },
-            ensure_ascii=False,
-            indent=2
-        )
-
     else:  # hybrid
         system_prompt = _hybrid_system()
-        user_content = json.dumps(
-            {
-                "question": question,
-                "numerical_result": payload["numerical"],
-                "text_chunks": payload["text"]
-            },
-            ensure_ascii=False,
-            indent=2
-        )
+
+    user_content, user_tokens = compile_payload(question, answer_type, payload)
+    annotate(mode="llm", payload_tokens=user_tokens)
+    logging.info(
+        "📏 llm_wrapper input tokens [%s]: %d (system %d + user %d)",
+        answer_type,
+        count_tokens(system_prompt) + user_tokens,
+        count_tokens(system_prompt),
+        user_tokens,
+    )
 
     return [
         {"role": "system", "content": system_prompt},
@@ -107,10 +135,26 @@ def _build_messages(question: str, answer_type: str, payload: Dict[str, Any]) ->
 # --------------------------------------------------------------------------- #
 
 
+def _use_template(answer_type: str, explain: Optional[bool]) -> bool:
+    """True se la risposta va resa a template invece che con l'LLM."""
+    if answer_type != "numerical":
+        return False
+    if explain is None:
+        explain = NUMERICAL_MODE == "explain"
+    return not explain
+
+
+def _fallback_answer(answer_payload: Dict[str, Any]) -> str:
+    """Risposta di emergenza quando l'LLM non risponde: payload grezzo."""
+    return f"(Errore LLM)\n\n{json.dumps(answer_payload, ensure_ascii=False, indent=2)}"
+
+
+@traced()
 def format_answer(
     question: str,
     answer_type: str,
-    answer_payload: Dict[str, Any]
+    answer_payload: Dict[str, Any],
+    explain: Optional[bool] = None
 ) -> str:
     """
     Converte il risultato grezzo in risposta umana.
@@ -120,19 +164,28 @@ def format_answer(
     question : str
         La domanda originale dell’utente.
     answer_type : str
-        'numerical', 'text' o 'hybrid'.
+        'numerical', 'comparison', 'screen', 'text' o 'hybrid'.
     answer_payload : dict
         I dati ritornati dagli answer module.
+    explain : bool | None
+        Solo per 'numerical': True → spiegazione LLM, False → template,
+        None → `MARK_NUMERICAL_MODE`.
 
     Returns
     -------
     str
-        La risposta generata da GPT-4o.
+        La risposta generata da GPT-4o (o dal template).
     """
+    if _use_template(answer_type, explain):
+        annotate(mode="template")
+        return render_numerical(question, answer_payload)
+
     try:
         msgs = _build_messages(question, answer_type, answer_payload)
 
-        response = client.chat.completions.create(
+        response = chat(
+            "answer",
+            site="llm_wrapper",
             model=MODEL_NAME,
             temperature=TEMPERATURE,
             max_tokens=MAX_TOKENS,
@@ -143,7 +196,108 @@ def format_answer(
     except Exception as exc:  # noqa: BLE001
         logging.error("❌ llm_wrapper failure: %s", exc, exc_info=True)
         # Fallback: restituisce payload grezzo
-        return f"(Errore LLM)\n\n{json.dumps(answer_payload, ensure_ascii=False, indent=2)}"
+        return _fallback_answer(answer_payload)
+
+
+@traced("llm_wrapper.format_answer")
+def format_answer_stream(
+    question: str,
+    answer_type: str,
+    answer_payload: Dict[str, Any],
+    explain: Optional[bool] = None
+) -> Iterator[str]:
+    """
+    Variante in streaming di `format_answer`: restituisce i frammenti di
+    testo appena il modello li produce, così la latenza percepita è il
+    time‑to‑first‑token e non il tempo di generazione completo.
+
+    Yields
+    ------
+    str
+        Frammenti consecutivi della risposta.  In caso di errore prima del
+        primo token viene emesso il fallback di `format_answer`.
+    """
+    if _use_template(answer_type, explain):
+        annotate(mode="template")
+        yield render_numerical(question, answer_payload)
+        return
+
+    emitted = False
+    try:
+        msgs = _build_messages(question, answer_type, answer_payload)
+
+        stream = chat_stream(
+            "answer",
+            site="llm_wrapper",
+            model=MODEL_NAME,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            messages=msgs
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                # Come format_answer: niente spazi iniziali
+                if not emitted:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                emitted = True
+                yield delta
+
+    except Exception as exc:  # noqa: BLE001
+        logging.error("❌ llm_wrapper stream failure: %s", exc, exc_info=True)
+        if emitted:
+            yield "\n\n(Errore LLM: risposta interrotta)"
+        else:
+            yield _fallback_answer(answer_payload)
+
+
+@traced("llm_wrapper.format_answer")
+async def format_answer_stream_async(
+    question: str,
+    answer_type: str,
+    answer_payload: Dict[str, Any],
+    explain: Optional[bool] = None
+) -> AsyncIterator[str]:
+    """Versione async di `format_answer_stream` (stessi frammenti, stesso fallback)."""
+    if _use_template(answer_type, explain):
+        annotate(mode="template")
+        yield render_numerical(question, answer_payload)
+        return
+
+    emitted = False
+    try:
+        msgs = _build_messages(question, answer_type, answer_payload)
+
+        stream = achat_stream(
+            "answer",
+            site="llm_wrapper",
+            model=MODEL_NAME,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            messages=msgs
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not emitted:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                emitted = True
+                yield delta
+
+    except Exception as exc:  # noqa: BLE001
+        logging.error("❌ llm_wrapper stream failure: %s", exc, exc_info=True)
+        if emitted:
+            yield "\n\n(Errore LLM: risposta interrotta)"
+        else:
+            yield _fallback_answer(answer_payload)
 
 
 # --------------------------------------------------------------------------- #
@@ -0,0 +1,318 @@
+"""
+number_format.py
+
+Formattazione dei valori numerici restituiti dal database: unità (valuta,
+percentuali, multipli, conteggi), scala (K / M / B / T) e periodo.
+
+`METRIC_METADATA` non contiene le unità di misura: sono dichiarate in
+`_COLUMN_KINDS` per le colonne yfinance note (in particolare quali
+percentuali sono frazioni e quali già in punti percentuali); per le altre
+il tipo è dedotto dalle parole del nome della colonna.
+
+API pubblico
+------------
+metric_kind(table, column)           -> str
+aggregate_kind(aggregate)            -> str | None
+format_value(value, table, column, locale="en", kind=None) -> str
+format_period(payload)               -> str
+percent_to_stored(percent, table, column) -> float   3 (%) → 0.03 o 3.0
+"""
+
+from __future__ import annotations
+
+import datetime
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+__all__ = ["metric_kind", "aggregate_kind", "format_value", "format_period", "percent_to_stored"]
+
+# --------------------------------------------------------------------------- #
+#  Classificazione delle colonne
+# --------------------------------------------------------------------------- #
+
+# Unità dichiarate colonna per colonna (nome in minuscolo).  yfinance non è
+# coerente: la maggior parte delle percentuali sono frazioni (0.25 = 25%),
+# ma alcune colonne sono già in punti percentuali (dividendYield = 0.44
+# significa 0.44%) e i percentili ESG vanno da 0 a 100.
+_COLUMN_KINDS: Dict[str, str] = {
+    # frazioni
+    **dict.fromkeys((
+        "52weekchange", "sandp52weekchange", "earningsgrowth", "earningsquarterlygrowth",
+        "revenuegrowth", "ebitdamargins", "grossmargins", "operatingmargins", "profitmargins",
+        "heldpercentinsiders", "heldpercentinstitutions", "payoutratio", "returnonassets",
+        "returnonequity", "sharespercentsharesout", "shortpercentoffloat",
+        "trailingannualdividendyield", "fiftydayaveragechangepercent",
+        "twohundreddayaveragechangepercent", "fiftytwoweekhighchangepercent",
+        "fiftytwoweeklowchangepercent", "tax_rate_for_calcs",
+    ), "percent"),
+    # già in punti percentuali
+    **dict.fromkeys((
+        "dividendyield", "fiveyearavgdividendyield", "regularmarketchangepercent",
+        "postmarketchangepercent", "fiftytwoweekchangepercent", "debttoequity",
+        "percentile", "environmentpercentile", "socialpercentile", "governancepercentile",
+    ), "percent_points"),
+    # multipli
+    **dict.fromkeys((
+        "trailingpe", "forwardpe", "priceepscurrentyear", "trailingpegratio", "pricetobook",
+        "pricetosalestrailing12months", "enterprisetoebitda", "enterprisetorevenue",
+        "currentratio", "quickratio", "shortratio", "beta", "recommendationmean", "split_ratio",
+    ), "ratio"),
+    # prezzi e importi per azione
+    **dict.fromkeys((
+        "open", "high", "low", "close", "bid", "ask", "dividend", "dividends", "bookvalue",
+        "dividendrate", "trailingannualdividendrate", "lastdividendvalue", "revenuepershare",
+        "totalcashpershare", "regularmarketchange", "postmarketchange", "fiftydayaverage",
+        "twohundreddayaverage", "fiftydayaveragechange", "twohundreddayaveragechange",
+    ), "per_share"),
+    # conteggi
+    **dict.fromkeys((
+        "volume", "regularmarketvolume", "averagevolume", "averagevolume10days",
+        "averagedailyvolume10day", "averagedailyvolume3month", "asksize", "bidsize",
+        "fulltimeemployees", "numberofanalystopinions", "peercount", "sharesshort",
+        "sharesshortpriormonth", "share_issued", "strongbuy", "buy", "hold", "sell", "strongsell",
+    ), "count"),
+    # importi
+    **dict.fromkeys((
+        "marketcap", "enterprisevalue", "ebitda", "freecashflow", "grossprofits",
+        "netincometocommon", "operatingcashflow", "totalcash", "totaldebt", "totalrevenue",
+        "totalassets",
+    ), "money"),
+    # numeri senza unità
+    **dict.fromkeys((
+        "pricehint", "stock_splits", "exchangedatadelayedby", "gmtoffsetmilliseconds",
+        "maxage", "ratingyear", "ratingmonth", "auditrisk", "boardrisk", "compensationrisk",
+        "shareholderrightsrisk", "overallrisk", "totalesg",
+        "environmentscore", "socialscore", "governancescore", "highestcontroversy",
+    ), "number"),
+    # testo, booleani e identificativi: nessuna formattazione numerica
+    **dict.fromkeys((
+        "symbol", "shortname", "longname", "displayname", "prevname", "address1", "city",
+        "state", "zip", "country", "region", "phone", "website", "irwebsite", "industry",
+        "industrykey", "industrydisp", "sector", "sectorkey", "sectordisp", "currency",
+        "financialcurrency", "exchange", "fullexchangename", "exchangetimezonename",
+        "exchangetimezoneshortname", "market", "marketstate", "quotetype", "typedisp",
+        "quotesourcename", "language", "messageboardid", "recommendationkey",
+        "averageanalystrating", "lastsplitfactor", "fiftytwoweekrange", "regularmarketdayrange",
+        "longbusinesssummary", "custompricealertconfidence", "esgperformance", "peergroup",
+        "tradeable", "triggerable", "cryptotradeable", "esgpopulated", "hasprepostmarketdata",
+        "isearningsdateestimate", "adult", "alcoholic", "animaltesting", "catholic",
+        "controversialweapons", "smallarms", "furleather", "gambling", "gmo",
+        "militarycontract", "nuclear", "pesticides", "palmoil", "coal", "tobacco",
+        "tz_offset", "dividend_id", "split_id", "recommendation_id",
+    ), "text"),
+    # date (epoch in secondi o DATE)
+    **dict.fromkeys(("mostrecentquarter", "lastfiscalyearend", "nextfiscalyearend"), "date"),
+}
+
+# Fallback per colonne non elencate: parole intere del nome, non sottostringhe
+# ("country" non è un conteggio, "operations" non è un "ratio").
+_DATE_TOKENS = {"date", "datetime", "time", "timestamp", "epoch", "period"}
+_PERCENT_TOKENS = {"margin", "margins", "yield", "growth", "percent"}
+_RATIO_TOKENS = {"ratio"}
+_COUNT_TOKENS = {"volume", "employees", "shares", "count", "size"}
+_PER_SHARE_TOKENS = {"price", "eps", "close", "open", "high", "low", "bid", "ask"}
+_MONEY_TOKENS = {"revenue", "profit", "profits", "cashflow", "cash", "debt", "ebitda", "income",
+                 "assets", "liabilities", "equity", "expense", "expenses"}
+
+_MONEY_TABLES = {"balance_sheet", "cashflow", "financials"}
+
+_RE_TOKEN = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+_SCALES = ((1e12, "T"), (1e9, "B"), (1e6, "M"), (1e3, "K"))
+
+# Suffissi di scala per locale (l'inglese usa quelli di _SCALES)
+_LOCALE_SUFFIXES = {
+    "it": {"T": " bln", "B": " mld", "M": " mln", "K": " mila"},
+}
+
+
+def _tokens(column: str) -> set:
+    """'sharesShortPreviousMonthDate' → {'shares', 'short', 'previous', 'month', 'date'}."""
+    return {t.lower() for t in _RE_TOKEN.findall(column or "")}
+
+
+def metric_kind(table: str, column: str) -> str:
+    """
+    'percent' | 'percent_points' | 'ratio' | 'per_share' | 'count' | 'money'
+    | 'number' | 'date' | 'text'.
+
+    'percent' sono frazioni (0.25 = 25%), 'percent_points' valori già in
+    punti percentuali (0.44 = 0.44%).  Per‑share: prezzi, EPS, dividendi per
+    azione.  Money: importi di bilancio.  'date' e 'text' non sono numeri da
+    scalare (date epoch, nomi, flag).
+
+    Prima `_COLUMN_KINDS`, poi le parole intere del nome della colonna.
+
+    >>> metric_kind("info", "dividendYield"), metric_kind("info", "country")
+    ('percent_points', 'text')
+    """
+    kind = _COLUMN_KINDS.get((column or "").lower())
+    if kind:
+        return kind
+    tokens = _tokens(column)
+    if tokens & _DATE_TOKENS:
+        return "date"
+    if tokens & _PERCENT_TOKENS or {"return", "on"} <= tokens:
+        return "percent"
+    if tokens & _RATIO_TOKENS:
+        return "ratio"
+    if tokens & _COUNT_TOKENS or {"number", "of"} <= tokens:
+        return "count"
+    if tokens & _PER_SHARE_TOKENS or {"per", "share"} <= tokens:
+        return "per_share"
+    if table in _MONEY_TABLES or tokens & _MONEY_TOKENS:
+        return "money"
+    return "number"
+
+
+def aggregate_kind(aggregate: Optional[str]) -> Optional[str]:
+    """
+    Unità imposta dall'aggregato, None se resta quella della metrica:
+    il CAGR è sempre una percentuale, il conteggio un numero di righe.
+    """
+    return {"cagr": "percent", "count": "count"}.get(aggregate)
+
+
+# --------------------------------------------------------------------------- #
+#  Valori
+# --------------------------------------------------------------------------- #
+
+def _scaled(value: float) -> str:
+    """394_328_000_000 → '394.33B'."""
+    magnitude = abs(value)
+    for factor, suffix in _SCALES:
+        if magnitude >= factor:
+            return f"{value / factor:.2f}{suffix}"
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def _localize(text: str, locale: str) -> str:
+    """'$1,234.56B' → '$1.234,56 mld' per locale='it'."""
+    suffixes = _LOCALE_SUFFIXES.get(locale)
+    if not suffixes:
+        return text
+    text = text.translate(str.maketrans({",": ".", ".": ","}))
+    if text and text[-1] in suffixes:
+        text = text[:-1] + suffixes[text[-1]]
+    return text
+
+
+def _format_date(value: Any) -> str:
+    """DATE / DATETIME o epoch (secondi, millisecondi) → 'YYYY-MM-DD'."""
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    if seconds > 1e11:                    # millisecondi
+        seconds /= 1000
+    return datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc).date().isoformat()
+
+
+def percent_to_stored(percent: float, table: str, column: str) -> float:
+    """
+    Soglia espressa in punti percentuali → unità della colonna: frazione per
+    le colonne 'percent', invariata per 'percent_points'.
+
+    >>> percent_to_stored(3, "info", "profitMargins"), percent_to_stored(3, "info", "dividendYield")
+    (0.03, 3.0)
+    """
+    kind = metric_kind(table, column)
+    if kind == "percent":
+        return float(percent) / 100
+    if kind == "percent_points":
+        return float(percent)
+    raise ValueError(f"La colonna {column} non è una percentuale.")
+
+
+def format_value(value: Any, table: str, column: str, locale: str = "en",
+                 kind: Optional[str] = None) -> str:
+    """
+    Rende un valore leggibile con unità e scala.
+
+    `locale` ('en' | 'it') sceglie separatori decimali e suffissi di scala;
+    `kind` forza l'unità (vedi `aggregate_kind`) invece di `metric_kind`.
+
+    Examples
+    --------
+    >>> format_value(394328000000, "financials", "Total_Revenue")
+    '$394.33B'
+    >>> format_value(0.2531, "info", "profitMargins")
+    '25.31%'
+    >>> format_value(28.4512, "info", "trailingPE")
+    '28.45x'
+    >>> format_value("United States", "info", "country")
+    'United States'
+    >>> format_value(1700000000, "info", "sharesShortPreviousMonthDate")
+    '2023-11-14'
+    """
+    if value is None:
+        return "n/a"
+    kind = kind or metric_kind(table, column)
+    if kind == "text":
+        return str(value)
+    if kind == "date":
+        return _format_date(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        try:
+            value = float(value)          # Decimal da PyMySQL
+        except (TypeError, ValueError):
+            return str(value)
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return "n/a"
+
+    sign = "-" if value < 0 else ""
+    if kind == "percent":
+        text = f"{value * 100:.2f}%"
+    elif kind == "percent_points":
+        text = f"{value:.2f}%"
+    elif kind == "ratio":
+        text = f"{value:.2f}x"
+    elif kind == "per_share":
+        text = f"{sign}${abs(value):,.2f}"
+    elif kind == "money":
+        text = f"{sign}${_scaled(abs(value))}"
+    elif kind == "count":
+        text = _scaled(value) if abs(value) >= 1e6 else f"{value:,.0f}"
+    else:
+        text = _scaled(value) if abs(value) >= 1e6 else f"{value:,.4g}"
+    return _localize(text, locale)
+
+
+# --------------------------------------------------------------------------- #
+#  Periodi
+# --------------------------------------------------------------------------- #
+
+def _years_label(years: List[str]) -> str:
+    """['2019','2020','2021'] → '2019–2021'; ['2019','2021'] → '2019, 2021'."""
+    ys = sorted({int(y) for y in years})
+    if len(ys) > 1 and ys == list(range(ys[0], ys[-1] + 1)):
+        return f"{ys[0]}–{ys[-1]}"
+    return ", ".join(str(y) for y in ys)
+
+
+def format_period(payload: Dict[str, Any]) -> str:
+    """
+    Etichetta del periodo per un payload di value_query / avg_query.
+
+    time_type/time_value (value_query) oppure period (avg_query).
+    """
+    if "time_type" in payload:
+        time_type = payload.get("time_type") or "latest"
+        time_value = payload.get("time_value")
+        if time_type == "latest" or time_value is None:
+            return "latest"
+        if time_type == "range" and isinstance(time_value, dict):
+            return f"{time_value.get('from')}–{time_value.get('to')}"
+        return str(time_value)
+
+    period = payload.get("period")
+    if isinstance(period, list) and period:
+        return _years_label([str(p) for p in period])
+    if period in (None, "latest", []):
+        return "all available"
+    return str(period)
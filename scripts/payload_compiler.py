@@ -0,0 +1,262 @@
+"""
+payload_compiler.py
+
+Compila il payload degli answer module nel messaggio utente per
+`llm_wrapper`: JSON compatto e deterministico, solo i campi utili alla
+risposta, numeri già formattati e un budget di token complessivo.
+
+Cosa cambia rispetto al dump grezzo
+-----------------------------------
+• niente `indent`, separatori minimi, chiavi ordinate → prompt più corto e
+  byte‑identico a parità di dati;
+• il risultato numerico diventa `{"company","metric","definition","value",
+  "period","calc"}`: il valore porta unità e scala ("$394.33B", "25.31%"),
+  i campi di debug (table, function_used, time_field…) spariscono;
+• i chunk testuali citano la fonte con un indice in `sources`, quindi il
+  nome del documento compare una volta sola;
+• numerico + testo restano entro `MARK_PAYLOAD_TOKEN_BUDGET` token: il
+  numerico è sempre incluso, i chunk entrano in ordine di rilevanza e
+  l'ultimo viene troncato.
+
+API pubblico
+------------
+compile_payload(question, answer_type, payload, budget=TOKEN_BUDGET) -> (str, int)
+compile_numerical(payload) -> dict
+compile_comparison(payload) -> dict
+compile_screen(payload) -> dict
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+from scripts.db.metadata_cache import metric_for_column
+from scripts.number_format import aggregate_kind, format_period, format_value
+from scripts.tokens import count_tokens
+
+__all__ = ["compile_payload", "compile_numerical", "compile_comparison", "compile_screen", "TOKEN_BUDGET"]
+
+TOKEN_BUDGET = int(os.getenv("MARK_PAYLOAD_TOKEN_BUDGET", 2500))
+
+_RE_CHUNK_SUFFIX = re.compile(r"(?:_chunk\d+|_part-\d+)?\.txt$", re.IGNORECASE)
+_RE_SPACES = re.compile(r"\s+")
+
+
+def _dumps(obj: Any) -> str:
+    """Serializzazione compatta e stabile."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str)
+
+
+# --------------------------------------------------------------------------- #
+#  Numerico
+# --------------------------------------------------------------------------- #
+
+def _calc(payload: Dict[str, Any]) -> str:
+    """'point', 'average' o il nome dell'aggregato ('max', 'cagr', 'p90'…)."""
+    function_used = payload.get("function_used")
+    if function_used == "answer_aggregate_query":
+        return payload.get("aggregate") or "average"
+    return "average" if function_used == "answer_avg_query" else "point"
+
+
+def compile_numerical(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Riduce il payload di `answer_num_query` ai campi che l'LLM deve citare.
+
+    Examples
+    --------
+    >>> compiled = compile_numerical({"result": 96995000000, "company": "AAPL",
+    ...                               "table": "financials", "column": "Net_Income",
+    ...                               "time_type": "year", "time_value": "2023"})
+    >>> compiled["metric"], compiled["value"], compiled["period"], compiled["calc"]
+    ('net_income', '$97.00B', '2023', 'point')
+    """
+    table = payload.get("table", "")
+    column = payload.get("column", "")
+    meta = metric_for_column(table, column) or {}
+    compiled = {
+        "company": payload.get("company"),
+        "metric": meta.get("key", column),
+        "definition": meta.get("description"),
+        "value": format_value(payload.get("result"), table, column,
+                              kind=aggregate_kind(payload.get("aggregate"))),
+        "period": format_period(payload),
+        "calc": _calc(payload),
+    }
+    return {k: v for k, v in compiled.items() if v is not None}
+
+
+def compile_comparison(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Matrice di `comaparison_query.compare` come tabella compatta: una riga
+    per azienda, per ogni metrica la lista dei valori formattati allineata
+    a `periods` (null dove manca il dato); `current_only` elenca le metriche
+    senza storico, il cui valore attuale sta nell'ultimo periodo.
+
+    Examples
+    --------
+    >>> compiled = compile_comparison({
+    ...     "companies": ["AAPL", "MSFT"], "periods": ["2022", "2023"],
+    ...     "metrics": [{"key": "total_revenue", "table": "financials", "column": "Total_Revenue"}],
+    ...     "values": [[[394328000000.0, 383285000000.0]], [[198270000000.0, None]]]})
+    >>> compiled["rows"]
+    {'AAPL': {'total_revenue': ['$394.33B', '$383.29B']}, 'MSFT': {'total_revenue': ['$198.27B', None]}}
+    """
+    metrics = payload.get("metrics", [])
+    rows: Dict[str, Dict[str, List[Any]]] = {}
+    for company, company_values in zip(payload.get("companies", []), payload.get("values", [])):
+        rows[company] = {
+            metric["key"]: [
+                None if v is None else format_value(v, metric["table"], metric["column"])
+                for v in metric_values
+            ]
+            for metric, metric_values in zip(metrics, company_values)
+        }
+    definitions = {}
+    for metric in metrics:
+        meta = metric_for_column(metric["table"], metric["column"]) or {}
+        definitions[metric["key"]] = meta.get("description")
+    compiled = {
+        "periods": payload.get("periods"),
+        "metrics": definitions,
+        "rows": rows,
+        "current_only": [m["key"] for m in metrics if not m.get("historical", True)] or None,
+        "missing": payload.get("missing_companies") or None,
+    }
+    return {k: v for k, v in compiled.items() if v is not None}
+
+
+def compile_screen(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Risultato di `company_list.screen`: criteri in forma leggibile, una riga
+    per azienda con i valori formattati delle metriche filtrate / ordinate,
+    totale delle aziende che passano il filtro.
+
+    Examples
+    --------
+    >>> compile_screen({
+    ...     "filters": [{"metric": "dividendyield", "column": "dividendYield", "op": ">", "value": 3.0}],
+    ...     "columns": {"dividendyield": "dividendYield"},
+    ...     "sort": [{"metric": "marketcap", "order": "desc"}],
+    ...     "rows": [{"symbol": "NEE", "name": "NextEra Energy", "dividendyield": 3.1}],
+    ...     "total": 1, "page": 1, "pages": 1})  # doctest: +NORMALIZE_WHITESPACE
+    {'criteria': ['dividendyield > 3.00%'], 'sort': ['-marketcap'],
+     'rows': [{'symbol': 'NEE', 'name': 'NextEra Energy', 'dividendyield': '3.10%'}],
+     'total': 1, 'page': 1, 'pages': 1}
+    """
+    criteria = []
+    for f in payload.get("filters", []):
+        values = f["value"] if isinstance(f["value"], list) else [f["value"]]
+        shown = [format_value(v, "info", f["column"]) if isinstance(v, float) else str(v) for v in values]
+        joined = " and ".join(shown) if f["op"] == "between" else ", ".join(shown)
+        criteria.append(f"{f['metric']} {f['op']} {joined}")
+    columns = payload.get("columns", {})
+    rows = []
+    for row in payload.get("rows", []):
+        compiled_row = {"symbol": row["symbol"], "name": row.get("name"), "sector": row.get("sector")}
+        compiled_row.update({key: format_value(row[key], "info", column)
+                             for key, column in columns.items() if row.get(key) is not None})
+        rows.append({k: v for k, v in compiled_row.items() if v is not None})
+    compiled = {
+        "criteria": criteria,
+        "sort": [("-" if s["order"] == "desc" else "") + s["metric"] for s in payload.get("sort", [])],
+        "rows": rows,
+        "total": payload.get("total"),
+        "page": payload.get("page"),
+        "pages": payload.get("pages"),
+    }
+    return {k: v for k, v in compiled.items() if v is not None}
+
+
+# --------------------------------------------------------------------------- #
+#  Testo
+# --------------------------------------------------------------------------- #
+
+def _source_id(filename: str) -> str:
+    """'AAPL_10-K_0000320193-23-000106_chunk12.txt' → 'AAPL_10-K_0000320193-23-000106'."""
+    return _RE_CHUNK_SUFFIX.sub("", filename)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Taglia `text` per parole finché non sta in `max_tokens`."""
+    words = text.split()
+    # stima iniziale ~0.75 parole per token, poi rifinisce
+    keep = min(len(words), int(max_tokens * 0.75))
+    while keep > 0 and count_tokens(" ".join(words[:keep])) > max_tokens:
+        keep = int(keep * 0.9)
+    return " ".join(words[:keep]) + " …" if keep else ""
+
+
+def _compile_text(payload: Dict[str, Any], budget: int) -> Dict[str, Any]:
+    """
+    Chunk con fonti deduplicate, entro `budget` token.
+
+    Returns
+    -------
+    dict
+        {"sources": [...], "chunks": [{"s": idx, "t": testo}, ...]}
+    """
+    sources: List[str] = []
+    index: Dict[str, int] = {}
+    chunks: List[Dict[str, Any]] = []
+    remaining = budget
+
+    for chunk in payload.get("chunks", []):
+        text = _RE_SPACES.sub(" ", chunk.get("text", "")).strip()
+        if not text or remaining <= 0:
+            continue
+        cost = count_tokens(text) + 8          # 8 ≈ overhead JSON per chunk
+        if cost > remaining:
+            text = _truncate(text, remaining - 8)
+            if not text:
+                break
+            cost = remaining
+        src = _source_id(chunk.get("filename", ""))
+        if src not in index:
+            index[src] = len(sources)
+            sources.append(src)
+        chunks.append({"s": index[src], "t": text})
+        remaining -= cost
+
+    return {"sources": sources, "chunks": chunks}
+
+
+# --------------------------------------------------------------------------- #
+#  Entry point
+# --------------------------------------------------------------------------- #
+
+def compile_payload(
+    question: str,
+    answer_type: str,
+    payload: Dict[str, Any],
+    budget: int = TOKEN_BUDGET,
+) -> Tuple[str, int]:
+    """
+    Messaggio utente compatto per `format_answer`.
+
+    Returns
+    -------
+    tuple[str, int]
+        (contenuto JSON, token stimati del contenuto)
+    """
+    body: Dict[str, Any] = {"question": question.strip()}
+
+    if answer_type == "numerical":
+        body["numerical_result"] = compile_numerical(payload)
+    elif answer_type == "comparison":
+        body["comparison"] = compile_comparison(payload)
+    elif answer_type == "screen":
+        body["screen"] = compile_screen(payload)
+    elif answer_type == "text":
+        remaining = budget - count_tokens(_dumps(body))
+        body["text"] = _compile_text(payload, remaining)
+    else:  # hybrid
+        body["numerical_result"] = compile_numerical(payload["numerical"])
+        remaining = budget - count_tokens(_dumps(body))
+        body["text"] = _compile_text(payload["text"], remaining)
+
+    content = _dumps(body)
+    return content, count_tokens(content)
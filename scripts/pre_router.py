@@ -0,0 +1,242 @@
+"""
+pre_router.py
+
+Pre‑routing a costo zero, prima di cache, classificazione e LLM.
+
+Domande come «Chi sei?», «ciao», «aiuto» o «quali metriche conosci?» non
+hanno bisogno di `_classify`, embedding, FAISS né `format_answer`: qui i
+pattern di tutti gli intenti registrati sono compilati in **un'unica regex**
+(un gruppo con nome per pattern), quindi riconoscere l'intento costa una
+sola scansione della domanda, nell'ordine dei microsecondi.
+
+Intenti predefiniti
+-------------------
+identity       pattern di `answer_identity_question._KNOWN_PATTERNS`
+greeting       saluti e ringraziamenti senza altra richiesta
+help           «aiuto», «help», «cosa posso chiederti»
+list_metrics   elenco delle metriche disponibili (da `METRIC_METADATA`)
+
+Se la domanda nomina un'azienda (ticker o nome, anche in minuscolo) o
+contiene numeri non viene mai pre‑instradata (salvo `allow_data=True`):
+«il dato è aggiornato per apple?» deve arrivare alla pipeline normale.
+
+API pubblico
+------------
+pre_route(question) -> PreRoute | None
+register_intent(name, patterns, handler, allow_data=False)
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from scripts.answer_identity_question import IDENTITY_PATTERN, answer_question as answer_identity
+from scripts.answer_renderer import detect_language
+from scripts.db.company_resolver import get_resolver
+from scripts.db.metadata_cache import cached_fragment, current_metric_metadata
+from scripts.tracing import annotate, traced
+
+__all__ = ["PreRoute", "pre_route", "register_intent"]
+
+# Oltre questa lunghezza una domanda non è mai un saluto o una richiesta d'aiuto
+MAX_CHARS = 160
+
+_RE_DATA = re.compile(r"\d")
+
+
+@dataclass(frozen=True)
+class PreRoute:
+    """Risposta già pronta per un intento riconosciuto."""
+
+    intent: str
+    answer: str
+
+
+@dataclass(frozen=True)
+class _Intent:
+    name: str
+    patterns: Tuple[str, ...]
+    handler: Callable[[str], str]
+    allow_data: bool
+
+
+# --------------------------------------------------------------------------- #
+#  Registro e regex combinata
+# --------------------------------------------------------------------------- #
+
+_intents: Dict[str, _Intent] = {}
+_lock = threading.Lock()
+_compiled: Optional[Tuple["re.Pattern[str]", List[str]]] = None
+
+
+def register_intent(
+    name: str,
+    patterns: Sequence[str],
+    handler: Callable[[str], str],
+    allow_data: bool = False,
+) -> None:
+    """
+    Aggiunge (o sostituisce) un intento a costo zero.
+
+    Parameters
+    ----------
+    name : str
+        Nome dell'intento (finisce negli span di tracing).
+    patterns : sequence[str]
+        Regex applicate alla domanda in minuscolo.  Ancorarle con ^…$ se
+        l'intento vale solo quando la domanda è *solo* quella frase.
+    handler : callable
+        `handler(question) -> str`, la risposta da restituire.
+    allow_data : bool
+        Se False l'intento viene ignorato quando la domanda nomina
+        un'azienda o contiene numeri.
+    """
+    global _compiled
+    with _lock:
+        _intents[name] = _Intent(name, tuple(patterns), handler, allow_data)
+        _compiled = None
+
+
+def _combined() -> Tuple["re.Pattern[str]", List[str]]:
+    """Regex unica `(?P<g0>…)|(?P<g1>…)|…` e mappa gruppo → intento."""
+    global _compiled
+    compiled = _compiled
+    if compiled is None:
+        with _lock:
+            owners = [i.name for i in _intents.values() for _ in i.patterns]
+            alternatives = [p for i in _intents.values() for p in i.patterns]
+            pattern = re.compile("|".join(f"(?P<g{n}>{p})" for n, p in enumerate(alternatives)))
+            compiled = _compiled = (pattern, owners)
+    return compiled
+
+
+def _mentions_data(question: str) -> bool:
+    """True se la domanda contiene numeri o nomina un'azienda (anche in minuscolo)."""
+    return bool(_RE_DATA.search(question)) or get_resolver().mentions_company(question)
+
+
+@traced()
+def pre_route(question: str) -> Optional[PreRoute]:
+    """
+    Risposta immediata se la domanda corrisponde a un intento registrato,
+    altrimenti None (la domanda prosegue nella pipeline normale).
+    """
+    text = question.strip().lower()
+    if not text or len(text) > MAX_CHARS:
+        return None
+    pattern, owners = _combined()
+    match = pattern.search(text)
+    if match is None:
+        return None
+    intent = _intents[owners[int(match.lastgroup[1:])]]
+    if not intent.allow_data and _mentions_data(question):
+        return None
+    annotate(intent=intent.name)
+    return PreRoute(intent.name, intent.handler(question))
+
+
+# --------------------------------------------------------------------------- #
+#  Intenti predefiniti
+# --------------------------------------------------------------------------- #
+
+_GREETING = {
+    "it": "Ciao! Sono Mark, il tuo assistente per l'analisi finanziaria. "
+          "Chiedimi un dato di bilancio o cosa dicono i documenti SEC di un'azienda.",
+    "en": "Hi! I'm Mark, your financial analysis assistant. "
+          "Ask me for a company's financial figures or what its SEC filings say.",
+}
+
+_HELP = {
+    "it": (
+        "Puoi chiedermi:\n"
+        "• un valore puntuale – «Qual è il net income di Apple nel 2023?»\n"
+        "• una media su più anni – «Free cash flow medio di Microsoft negli ultimi 3 anni»\n"
+        "• informazioni dai 10‑K / 10‑Q – «Quali rischi descrive NVIDIA nel 10‑K?»\n"
+        "• entrambe le cose – «Utile di Apple nel 2023 e cosa dice il 10‑K in merito?»\n"
+        "Scrivi «quali metriche conosci?» per l'elenco delle metriche disponibili."
+    ),
+    "en": (
+        "You can ask me for:\n"
+        "• a single value – \"What was Apple's net income in 2023?\"\n"
+        "• a multi‑year average – \"Average free cash flow of Microsoft over the last 3 years\"\n"
+        "• information from 10‑K / 10‑Q filings – \"What risks does NVIDIA describe in its 10‑K?\"\n"
+        "• both – \"Apple's net income in 2023 and what does the 10‑K say about it?\"\n"
+        "Type \"which metrics are supported?\" for the list of available metrics."
+    ),
+}
+
+_METRICS_INTRO = {
+    "it": "Metriche disponibili ({count}), per tabella:",
+    "en": "Available metrics ({count}), by table:",
+}
+_METRICS_PER_TABLE = 10
+
+# Saluti e richieste d'aiuto sono spesso una parola sola: detect_language
+# non ha parole funzionali su cui decidere
+_RE_IT_HINTS = re.compile(r"\b(ciao|salve|buongiorno|buonasera|grazie|aiuto|istruzioni|chiederti)\b")
+
+
+def _language(question: str) -> str:
+    return "it" if _RE_IT_HINTS.search(question.lower()) else detect_language(question)
+
+
+def _greeting(question: str) -> str:
+    return _GREETING[_language(question)]
+
+
+def _help(question: str) -> str:
+    return _HELP[_language(question)]
+
+
+@cached_fragment
+def _metrics_by_table() -> Tuple[int, List[Tuple[str, List[str]]]]:
+    """(totale, [(tabella, [metriche…])]) dai metadati correnti."""
+    tables: Dict[str, List[str]] = {}
+    metadata = current_metric_metadata()
+    for key, meta in metadata.items():
+        tables.setdefault(meta.get("table", "?"), []).append(key)
+    return len(metadata), sorted((t, sorted(keys)) for t, keys in tables.items())
+
+
+def _list_metrics(question: str) -> str:
+    lang = _language(question)
+    count, tables = _metrics_by_table()
+    lines = [_METRICS_INTRO[lang].format(count=count)]
+    for table, keys in tables:
+        shown = ", ".join(keys[:_METRICS_PER_TABLE])
+        more = f" (+{len(keys) - _METRICS_PER_TABLE})" if len(keys) > _METRICS_PER_TABLE else ""
+        lines.append(f"• **{table}**: {shown}{more}")
+    return "\n".join(lines)
+
+
+register_intent(
+    "list_metrics",
+    [
+        r"\b(quali|che)\s+metriche\b",
+        r"\belenco\s+(delle\s+)?metriche\b",
+        r"^\W*(which|what)\s+(metrics|kpis)(\s+(are|do\s+you|can\s+i))?"
+        r"(\s+(supported|available|there|know|have|support|track|cover|ask(\s+about)?))?\W*$",
+        r"\blist\s+(of\s+)?(the\s+)?(supported\s+|available\s+)?metrics\b",
+    ],
+    _list_metrics,
+)
+register_intent("identity", [IDENTITY_PATTERN.pattern], answer_identity)
+register_intent(
+    "help",
+    [
+        r"^\W*(aiuto|help|istruzioni)\W*$",
+        r"\bcosa\s+(posso|si\s+può)\s+chiederti\b",
+        r"\bwhat\s+can\s+i\s+ask\b",
+        r"\bhow\s+do\s+i\s+use\s+(you|mark)\b",
+    ],
+    _help,
+)
+register_intent(
+    "greeting",
+    [r"^\W*(ciao|salve|buongiorno|buonasera|hello|hi|hey|grazie|thanks|thank\s+you)"
+     r"(\s+(mille|tante|a\s+lot|so\s+much))?(\s+mark)?\W*$"],
+    _greeting,
+)
@@ -9,9 +9,12 @@ API principale
 --------------
 retrieve_chunks_by_company(query, tickers=None, total_k=8, per_company_k=2)
     → List[dict]  # metadati + score
+retrieve_chunks_by_company_async(...)   # stessa firma, coroutine
 """
 from __future__ import annotations
 
+import asyncio
+import contextvars
 import os
 import json
 from pathlib import Path
@@ -19,8 +22,9 @@ from typing import List, Dict, Any
 
 import faiss
 import numpy as np
-from dotenv import load_dotenv
-from openai import OpenAI
+
+from .llm_provider import aembed, embed
+from .tracing import span, traced
 
 # --------------------------------------------------------------------------- #
 #  Percorsi
@@ -29,21 +33,35 @@ from openai import OpenAI
 BASE_DIR = Path(__file__).resolve().parent
 ROOT_DIR = BASE_DIR.parent
 
-INDEX_PATH = ROOT_DIR / "data" / "index" / "company_index.faiss"
-METADATA_PATH = ROOT_DIR / "data" / "index" / "metadata.json"
+# Override per indici alternativi (es. l'indice ridotto del benchmark e2e)
+INDEX_DIR = Path(os.getenv("MARK_INDEX_DIR", ROOT_DIR / "data" / "index"))
+
+INDEX_PATH = INDEX_DIR / "company_index.faiss"
+METADATA_PATH = INDEX_DIR / "metadata.json"
 
 # Modello embedding: override con variabile d’ambiente se serve
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 
 # --------------------------------------------------------------------------- #
-#  Inizializzazione OpenAI e caricamento FAISS + metadati
+#  Caricamento FAISS + metadati
 # --------------------------------------------------------------------------- #
 
-load_dotenv()  # carica eventuale .env a livello progetto
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Memory‑map dell'indice: più processi (worker del server API) condividono
+# le stesse pagine tramite page cache invece di caricarne una copia ciascuno
+FAISS_MMAP = os.getenv("MARK_FAISS_MMAP", "1") == "1"
+
+
+def _read_index(path: Path) -> "faiss.Index":
+    if FAISS_MMAP:
+        try:
+            return faiss.read_index(str(path), faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            pass  # tipo di indice senza supporto mmap: lettura normale
+    return faiss.read_index(str(path))
+
 
 # Carica index e metadati una sola volta (module-level cache)
-_index = faiss.read_index(str(INDEX_PATH))
+_index = _read_index(INDEX_PATH)
 with METADATA_PATH.open(encoding="utf-8") as f:
     _metadata: list[dict[str, Any]] = json.load(f)
 
@@ -52,15 +70,57 @@ with METADATA_PATH.open(encoding="utf-8") as f:
 #  Helper
 # --------------------------------------------------------------------------- #
 
+@traced("retriever.embed")
 def _get_query_embedding(query: str) -> np.ndarray:
     """Restituisce l’embedding (np.ndarray shape 1×d) della query."""
-    resp = client.embeddings.create(
+    resp = embed(
+        "embed",
+        site="retriever",
         input=[query],
         model=EMBEDDING_MODEL,
     )
     return np.asarray(resp.data[0].embedding, dtype="float32").reshape(1, -1)
 
 
+def _search(
+    query_vec: np.ndarray,
+    tickers: list[str] | None,
+    total_k: int,
+    per_company_k: int,
+) -> List[Dict[str, Any]]:
+    """Ricerca FAISS + filtro ticker (CPU‑bound, nessuna chiamata di rete)."""
+    with span("retriever.faiss", ntotal=_index.ntotal) as faiss_span:
+        distances, indices = _index.search(query_vec, 50)
+
+        results: list[dict[str, Any]] = []
+        tickers_found = {t.upper(): 0 for t in tickers} if tickers else {}
+
+        for dist, idx in zip(distances[0], indices[0]):
+            if idx >= len(_metadata):
+                continue
+
+            meta = _metadata[idx]
+            fname = meta["filename"]
+            score = float(dist)
+
+            # Filtro ticker: il filename inizia con "<TICKER>_" (es. AAPL_10-K_…)
+            if tickers:
+                file_ticker = fname.split("_", 1)[0].upper()
+                if file_ticker not in tickers_found:
+                    continue
+                if tickers_found[file_ticker] < per_company_k:
+                    results.append({**meta, "score": score})
+                    tickers_found[file_ticker] += 1
+            else:
+                results.append({**meta, "score": score})
+
+            if len(results) >= total_k:
+                break
+
+        faiss_span.set(chunks=len(results))
+    return results
+
+
 # --------------------------------------------------------------------------- #
 #  API pubblica
 # --------------------------------------------------------------------------- #
@@ -80,8 +140,8 @@ def retrieve_chunks_by_company(
     query : str
         Testo della domanda dell’utente.
     tickers : list[str] | None
-        Se fornito, limita i risultati ai file che contengono
-        uno dei ticker indicati nel filename.
+        Se fornito, limita i risultati ai file il cui nome inizia con
+        uno dei ticker indicati (vedi `company_resolver.find_tickers`).
     total_k : int
         Numero massimo di chunk totali che verranno ritornati.
     per_company_k : int
@@ -96,34 +156,27 @@ def retrieve_chunks_by_company(
         ``score`` (distanza FAISS; più bassa ⇒ match migliore).
     """
     query_vec = _get_query_embedding(query)
-    distances, indices = _index.search(query_vec, 50)
-
-    results: list[dict[str, Any]] = []
-    tickers_found = {t.upper(): 0 for t in tickers} if tickers else {}
+    return _search(query_vec, tickers, total_k, per_company_k)
 
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx >= len(_metadata):
-            continue
 
-        meta = _metadata[idx]
-        fname = meta["filename"]
-        score = float(dist)
-
-        # Filtro ticker (case-insensitive)
-        if tickers and not any(t.upper() in fname.upper() for t in tickers):
-            continue
-
-        if tickers:
-            for t in tickers:
-                up = t.upper()
-                if up in fname.upper() and tickers_found[up] < per_company_k:
-                    results.append({**meta, "score": score})
-                    tickers_found[up] += 1
-                    break
-        else:
-            results.append({**meta, "score": score})
-
-        if len(results) >= total_k:
-            break
-
-    return results
\ No newline at end of file
+async def retrieve_chunks_by_company_async(
+    query: str,
+    tickers: list[str] | None = None,
+    total_k: int = 8,
+    per_company_k: int = 2,
+) -> List[Dict[str, Any]]:
+    """
+    Versione async di `retrieve_chunks_by_company`: embedding con il client
+    async, ricerca FAISS nel thread pool per non bloccare l'event loop.
+    """
+    with span("retriever.embed"):
+        resp = await aembed(
+            "embed",
+            site="retriever",
+            input=[query],
+            model=EMBEDDING_MODEL,
+        )
+    query_vec = np.asarray(resp.data[0].embedding, dtype="float32").reshape(1, -1)
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()   # lo span FAISS resta figlio della trace corrente
+    return await loop.run_in_executor(None, ctx.run, _search, query_vec, tickers, total_k, per_company_k)
@@ -0,0 +1,23 @@
+"""
+tokens.py
+
+Conteggio dei token condiviso da retrieval e prompt building.
+Usa tiktoken se disponibile, altrimenti ripiega sul numero di parole.
+"""
+
+from __future__ import annotations
+
+try:
+    import tiktoken
+
+    _enc = tiktoken.encoding_for_model("gpt-4")
+
+    def count_tokens(text: str) -> int:  # noqa: D401
+        """Conta token con tiktoken."""
+        return len(_enc.encode(text))
+
+except ImportError:  # pragma: no cover
+
+    def count_tokens(text: str) -> int:  # noqa: D401
+        """Fallback: conta parole."""
+        return len(text.split())
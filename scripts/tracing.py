@@ -0,0 +1,307 @@
+"""
+tracing.py
+
+Tracing leggero per la pipeline di Mark: quanto tempo (e quanti token, e
+quali cache hit) spende ogni stage di una domanda.
+
+Attivazione
+-----------
+MARK_TRACE=jsonl   una riga JSON per span (trace_id, span_id, parent_id,
+                   name, start, duration_ms, attributi)
+MARK_TRACE=otel    una riga per trace in formato OTLP/JSON
+                   (`resourceSpans`), importabile da un collector
+                   OpenTelemetry o da Jaeger
+MARK_TRACE_FILE    file di output (default: stderr)
+
+Senza MARK_TRACE il decoratore chiama direttamente la funzione e `span()`
+restituisce uno span nullo condiviso: overhead di un controllo booleano.
+
+API pubblico
+------------
+span(name, **attrs)            context manager → Span
+traced(name=None)              decoratore (funzioni, coroutine, generatori)
+annotate(**attrs)              attributi sullo span corrente
+add_tokens(prompt, completion) somma i token sullo span corrente
+configure(mode, path=None, stream=None)  (ri)configura l'export a runtime
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+__all__ = ["span", "traced", "annotate", "add_tokens", "configure", "Span"]
+
+# --------------------------------------------------------------------------- #
+#  Configurazione
+# --------------------------------------------------------------------------- #
+
+_mode: str = ""
+_out: Optional[TextIO] = None
+_write_lock = threading.Lock()
+
+
+def configure(mode: str, path: Optional[str] = None, stream: Optional[TextIO] = None) -> None:
+    """
+    mode: '' (disattivo) | 'jsonl' | 'otel'; path: file in append, oppure
+    `stream` già aperto (es. io.StringIO nel benchmark); default stderr.
+    """
+    global _mode, _out
+    mode = (mode or "").lower()
+    if mode not in {"", "jsonl", "otel"}:
+        raise ValueError(f"MARK_TRACE non valido: {mode!r}")
+    _mode = mode
+    if stream is not None:
+        _out = stream
+    else:
+        _out = open(path, "a", encoding="utf-8") if (mode and path) else sys.stderr
+
+
+configure(os.getenv("MARK_TRACE", ""), os.getenv("MARK_TRACE_FILE"))
+
+# --------------------------------------------------------------------------- #
+#  Span
+# --------------------------------------------------------------------------- #
+
+
+class Span:
+    """Uno stage misurato; i figli condividono `trace_id`."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs",
+                 "start_ns", "end_ns", "_t0", "_collected", "_token")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self._collected: List["Span"] = parent._collected if parent else []
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._t0 = time.perf_counter_ns()
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def add(self, key: str, value: float) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._t0)
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # generatore chiuso in un altro contesto: ripristina il padre
+            _current.set(None)
+        self._collected.append(self)
+        if self.parent_id is None:
+            _export(self._collected)
+
+
+class _NullSpan:
+    """Span nullo usato quando il tracing è disattivo."""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def add(self, key: str, value: float) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+_NULL = _NullSpan()
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("mark_span", default=None)
+
+
+def span(name: str, **attrs: Any) -> Any:
+    """Context manager che misura il blocco come span `name`."""
+    if not _mode:
+        return _NULL
+    return Span(name, _current.get(), attrs)
+
+
+def annotate(**attrs: Any) -> None:
+    """Aggiunge attributi allo span corrente (no‑op se disattivo)."""
+    if _mode:
+        current = _current.get()
+        if current is not None:
+            current.set(**attrs)
+
+
+def add_tokens(prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    """Somma i token di una chiamata LLM sullo span corrente."""
+    if _mode:
+        current = _current.get()
+        if current is not None:
+            current.add("prompt_tokens", prompt_tokens)
+            current.add("completion_tokens", completion_tokens)
+
+
+# --------------------------------------------------------------------------- #
+#  Decoratore
+# --------------------------------------------------------------------------- #
+
+def traced(name: Optional[str] = None) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Misura ogni chiamata come span (default: `modulo.funzione`).
+
+    Per generatori e async generator lo span copre l'intera iterazione ma è
+    corrente solo mentre il generatore esegue: a ogni `yield` il contextvar
+    torna allo span del chiamante, così gli span aperti da chi consuma lo
+    stream non diventano figli del generatore.
+    """
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def agen_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not _mode:
+                    async for item in fn(*args, **kwargs):
+                        yield item
+                    return
+                caller = _current.get()
+                with span(span_name) as current:
+                    agen = fn(*args, **kwargs)
+                    try:
+                        async for item in agen:
+                            _current.set(caller)
+                            try:
+                                yield item
+                            finally:
+                                caller = _current.get()
+                                _current.set(current)
+                    finally:
+                        await agen.aclose()
+            return agen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def coro_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not _mode:
+                    return await fn(*args, **kwargs)
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return coro_wrapper
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not _mode:
+                    yield from fn(*args, **kwargs)
+                    return
+                caller = _current.get()
+                with span(span_name) as current:
+                    gen = fn(*args, **kwargs)
+                    try:
+                        for item in gen:
+                            _current.set(caller)
+                            try:
+                                yield item
+                            finally:
+                                caller = _current.get()
+                                _current.set(current)
+                    finally:
+                        gen.close()
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _mode:
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+# --------------------------------------------------------------------------- #
+#  Export
+# --------------------------------------------------------------------------- #
+
+def _otel_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _as_jsonl(spans: List[Span]) -> str:
+    return "".join(
+        json.dumps({
+            "trace_id": s.trace_id,
+            "span_id": s.span_id,
+            "parent_id": s.parent_id,
+            "name": s.name,
+            "start": s.start_ns / 1e9,
+            "duration_ms": round(s.duration_ms, 3),
+            "attributes": s.attrs,
+        }, ensure_ascii=False, default=str) + "\n"
+        for s in spans
+    )
+
+
+def _as_otlp(spans: List[Span]) -> str:
+    otel_spans = [
+        {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+            "name": s.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otel_value(v)} for k, v in s.attrs.items()],
+            **({"status": {"code": 2, "message": s.attrs["error"]}} if "error" in s.attrs else {}),
+        }
+        for s in spans
+    ]
+    payload = {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "mark"}}]},
+            "scopeSpans": [{"scope": {"name": "scripts.tracing"}, "spans": otel_spans}],
+        }]
+    }
+    return json.dumps(payload, ensure_ascii=False, default=str) + "\n"
+
+
+def _export(spans: List[Span]) -> None:
+    """Scrive una trace completa (chiamato alla chiusura dello span radice)."""
+    if not _mode or _out is None:
+        return
+    text = _as_jsonl(spans) if _mode == "jsonl" else _as_otlp(spans)
+    with _write_lock:
+        _out.write(text)
+        _out.flush()
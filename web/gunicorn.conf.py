@@ -0,0 +1,30 @@
+"""
+gunicorn.conf.py
+
+Configurazione gunicorn per `web/mark_api_server.py`.
+
+    $ gunicorn -c web/gunicorn.conf.py "web.mark_api_server:create_app()"
+
+Ogni worker esegue `create_app()` → `warm_up()` una volta sola; l'indice
+FAISS è aperto in mmap, quindi i worker ne condividono le pagine in memoria.
+I thread per worker coprono le attese di rete verso OpenAI / MySQL.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("MARK_API_BIND", "127.0.0.1:8000")
+workers = int(os.getenv("MARK_API_WORKERS", min(4, multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("MARK_API_THREADS", 8))
+
+# Lo streaming di /ask/stream può durare quanto la generazione LLM
+timeout = int(os.getenv("MARK_API_TIMEOUT", 120))
+keepalive = 5
+
+# Riavvio periodico dei worker per contenere la crescita di memoria
+max_requests = int(os.getenv("MARK_API_MAX_REQUESTS", 2000))
+max_requests_jitter = 200
+
+chdir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+accesslog = "-"
@@ -0,0 +1,137 @@
+"""
+mark_api_server.py
+
+Servizio HTTP persistente per Mark (Flask).
+
+Endpoint
+--------
+POST /ask          {"question": "...", "explain": false} → {"answer": "...", "elapsed_ms": ...}
+POST /ask/stream   stessa richiesta, risposta in streaming (text/plain, token per token)
+GET  /health       stato dei componenti caricati
+
+Stato caldo
+-----------
+Indice FAISS (memory‑mapped, vedi `retriever.FAISS_MMAP`), metadati,
+prompt delle metriche, resolver delle aziende e client OpenAI vengono
+caricati una volta per processo in `warm_up()`, non a ogni domanda.  Con
+più worker gunicorn l'indice mmappato è condiviso via page cache.
+
+Uso
+---
+Sviluppo (un processo):
+    $ python web/mark_api_server.py --port 8000
+
+Produzione (più worker, vedi web/gunicorn.conf.py):
+    $ gunicorn -c web/gunicorn.conf.py "web.mark_api_server:create_app()"
+
+Benchmark:
+    $ python -m scripts.bench.load_test_http --url http://127.0.0.1:8000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+# Add the project root to the path to allow importing scripts.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from scripts.answer_cache import get_answer_cache
+from scripts.ask_mark import main as ask_mark, main_stream as ask_mark_stream
+from scripts.db.company_resolver import get_resolver
+from scripts.db.metadata_cache import metadata_version
+from scripts.db.parse_avg_query import build_system_prompt as build_avg_prompt
+from scripts.db.parse_num_query import build_system_prompt as build_num_prompt
+from scripts.llm_provider import get_client, stats as llm_stats
+
+_started_at = time.time()
+_warm_ms: float | None = None
+
+
+def warm_up() -> float:
+    """Carica una volta per processo tutto lo stato condiviso; ritorna i ms impiegati."""
+    global _warm_ms
+    t0 = time.perf_counter()
+    from scripts import retriever              # indice FAISS + metadata.json
+    from datetime import datetime
+
+    build_num_prompt()
+    build_avg_prompt(datetime.now().year)
+    get_resolver()
+    get_client()
+    _warm_ms = (time.perf_counter() - t0) * 1000
+    logging.info("🔥 Mark API pronto in %.0f ms (pid %d, %d vettori FAISS)",
+                 _warm_ms, os.getpid(), retriever._index.ntotal)
+    return _warm_ms
+
+
+def _question_from_request():
+    body = request.get_json(silent=True) or {}
+    question = (body.get("question") or request.args.get("q") or "").strip()
+    explain = body.get("explain")
+    return question, explain if isinstance(explain, bool) else None
+
+
+def create_app() -> Flask:
+    """Factory dell'app Flask (usata anche da gunicorn)."""
+    app = Flask(__name__)
+    warm_up()
+
+    @app.post("/ask")
+    def ask():
+        question, explain = _question_from_request()
+        if not question:
+            return jsonify({"error": "Campo 'question' mancante."}), 400
+        t0 = time.perf_counter()
+        try:
+            answer = ask_mark(question, explain=explain)
+        except Exception as exc:  # noqa: BLE001
+            logging.error("❌ /ask failure: %s", exc, exc_info=True)
+            return jsonify({"error": str(exc)}), 500
+        return jsonify({
+            "question": question,
+            "answer": answer,
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+        })
+
+    @app.post("/ask/stream")
+    def ask_stream():
+        question, explain = _question_from_request()
+        if not question:
+            return jsonify({"error": "Campo 'question' mancante."}), 400
+        return Response(
+            stream_with_context(ask_mark_stream(question, explain=explain)),
+            mimetype="text/plain; charset=utf-8",
+            headers={"X-Accel-Buffering": "no"},   # niente buffering dietro nginx
+        )
+
+    @app.get("/health")
+    def health():
+        from scripts import retriever
+        return jsonify({
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - _started_at, 1),
+            "warm_ms": round(_warm_ms or 0, 1),
+            "faiss_vectors": retriever._index.ntotal,
+            "faiss_mmap": retriever.FAISS_MMAP,
+            "metadata_version": list(metadata_version()),
+            "llm": llm_stats(),
+            "cache": get_answer_cache().stats(),
+        })
+
+    return app
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Mark API server (sviluppo, un processo)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    create_app().run(host=args.host, port=args.port, threaded=True)
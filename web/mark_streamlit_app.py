@@ -1,13 +1,140 @@
 import streamlit as st
 import sys
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the project root to the path to allow importing ask_mark
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from scripts.ask_mark import main as ask_mark_main  # Assumiamo che ask_mark.py abbia una funzione main(question)
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+ANSWER_TTL = int(os.getenv("MARK_UI_ANSWER_TTL", 3600))   # seconds
+POLL_INTERVAL = 0.1
+
+STAGE_LABELS = {
+    "queued": "⏳ Waiting for a worker...",
+    "cache": "💾 Checking cached answers...",
+    "classify": "🧭 Classifying the question...",
+    "numerical": "🔢 Parsing and querying the database...",
+    "comparison": "📊 Comparing companies in the database...",
+    "screen": "🔎 Screening companies in the database...",
+    "text": "📄 Searching SEC filings...",
+    "hybrid": "🔀 Querying the database and SEC filings...",
+    "answer": "✍️ Writing the answer...",
+}
+
+
+# --------------------------------------------------------------------------- #
+#  Shared resources (one per server process, shared by every session)
+# --------------------------------------------------------------------------- #
+
+@st.cache_resource(show_spinner="Loading Mark (index, metadata, models)...")
+def load_pipeline():
+    """Import the pipeline once: FAISS index, metadata, prompts, resolver, client."""
+    from datetime import datetime
+    from scripts import ask_mark, retriever  # noqa: F401  (loads the FAISS index)
+    from scripts.db.company_resolver import get_resolver
+    from scripts.db.parse_avg_query import build_system_prompt as build_avg_prompt
+    from scripts.db.parse_num_query import build_system_prompt as build_num_prompt
+    from scripts.llm_provider import get_client
+
+    build_num_prompt()
+    build_avg_prompt(datetime.now().year)
+    get_resolver()
+    get_client()
+    return ask_mark
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Background workers running questions off the script thread."""
+    return ThreadPoolExecutor(max_workers=int(os.getenv("MARK_UI_WORKERS", 4)),
+                              thread_name_prefix="mark-ui")
+
+
+class Progress:
+    """Stage and partial answer shared between the worker and the UI thread."""
+
+    def __init__(self):
+        self.stage = "queued"
+        self.parts = []
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage):
+        self.stage = stage
+
+    def add(self, token):
+        with self._lock:
+            self.parts.append(token)
+
+    def text(self):
+        with self._lock:
+            return "".join(self.parts)
+
+
+class UncachedAnswer(Exception):
+    """LLM fallback answers are shown but must not enter st.cache_data."""
+
+    def __init__(self, answer):
+        super().__init__(answer)
+        self.answer = answer
+
+
+@st.cache_data(ttl=ANSWER_TTL, show_spinner=False, max_entries=512)
+def answer_question(question, explain, _progress=None):
+    """Full answer for (question, explain); `_progress` is not part of the key."""
+    ask_mark = load_pipeline()
+    parts = []
+    for token in ask_mark.main_stream(question, explain=explain,
+                                      on_stage=_progress.set_stage if _progress else None):
+        parts.append(token)
+        if _progress:
+            _progress.add(token)
+    answer = "".join(parts).strip()
+    if ask_mark._is_llm_error(answer):
+        raise UncachedAnswer(answer)
+    return answer
+
+
+def run_in_background(question, explain):
+    """Submit the question to the executor and render stage + tokens while it runs."""
+    progress = Progress()
+    ctx = get_script_run_ctx()
+
+    def task():
+        # st.cache_data needs the script context inside the worker thread
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return answer_question(question, explain, _progress=progress)
+
+    future = get_executor().submit(task)
+
+    status = st.status(STAGE_LABELS["queued"], expanded=False)
+    placeholder = st.empty()
+    while not future.done():
+        status.update(label=STAGE_LABELS.get(progress.stage, progress.stage))
+        partial = progress.text()
+        if partial:
+            placeholder.markdown(partial)
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        answer = future.result()
+    except UncachedAnswer as exc:
+        status.update(label="⚠️ The language model did not answer.", state="error")
+        placeholder.markdown(exc.answer)
+        return None
+    status.update(label="✅ Answer generated.", state="complete")
+    placeholder.markdown(answer)
+    return answer
+
+
+# --------------------------------------------------------------------------- #
+#  Page
+# --------------------------------------------------------------------------- #
 
 # Page configuration
 st.set_page_config(page_title="Mark – AI Investment Assistant")
@@ -16,16 +143,24 @@ st.set_page_config(page_title="Mark – AI Investment Assistant")
 st.title("💼 Mark – AI Investment Assistant")
 st.markdown("Ask anything about a publicly listed company.")
 
+load_pipeline()
+
 # User input
 user_input = st.text_input("📨 Enter your question:")
+explain = st.checkbox("🧠 Explain numerical answers with the LLM (slower)")
 
 # Question processing
 if user_input:
-    st.markdown("⏳ Processing your question...")
+    request = (user_input.strip(), explain)
+    last = st.session_state.get("last_answer")
     try:
-        result = ask_mark_main(user_input)
-        st.success("✅ Answer generated:")
-        st.write(result)
+        if last and last[0] == request:
+            # Plain rerun (widget interaction, same question): nothing to recompute
+            st.markdown(last[1])
+        else:
+            answer = run_in_background(*request)
+            if answer is not None:
+                st.session_state["last_answer"] = (request, answer)
     except Exception as e:
         st.error("❌ Error while processing the question.")
-        st.exception(e)
\ No newline at end of file
+        st.exception(e)